@@ -126,9 +126,8 @@ def run_ingest_now():
 @router.post("/translation/backfill")
 def translation_backfill(full: bool = True):
     """
-    Догоняющий перевод событий без EN.
-    full=True (по умолчанию): переводим title, description, location_name (качественный EN).
-    full=False: только заголовки батчем (быстрее).
+    Догоняющий перевод событий без EN через очередь translation_service
+    (названия и описания пачками, с памятью переводов). full оставлен для совместимости.
     """
     from utils.backfill_translation import run_backfill
 
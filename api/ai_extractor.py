@@ -46,7 +46,7 @@ def extract_main_text(html: str) -> str:
     return text[:120_000]
 
 
-def _extract_json_from_text(s: str) -> list[dict]:
+def _extract_json_from_text(s: str) -> list[dict] | None:
     try:
         start = s.find("[")
         end = s.rfind("]")
@@ -54,17 +54,18 @@ def _extract_json_from_text(s: str) -> list[dict]:
             return json.loads(s[start : end + 1])
     except Exception:
         log.exception("Failed to parse JSON from model output")
-    return []
+    return None
 
 
-def call_openai_for_events(text: str, *, source_url: str | None = None, model: str | None = None) -> list[dict]:
+def call_openai_for_events(text: str, *, source_url: str | None = None, model: str | None = None) -> list[dict] | None:
     """
-    Call OpenAI to extract events. If no OPENAI_API_KEY is set, returns [] so CI doesn't fail.
+    Call OpenAI to extract events. Returns None if extraction failed (no OPENAI_API_KEY,
+    API error, unparsable output) — unlike [], which means the page has no events.
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        log.warning("OPENAI_API_KEY is not set; returning empty result.")
-        return []
+        log.warning("OPENAI_API_KEY is not set; skipping extraction.")
+        return None
 
     try:
         from openai import OpenAI
@@ -91,4 +92,4 @@ def call_openai_for_events(text: str, *, source_url: str | None = None, model: s
         return _extract_json_from_text(content)
     except Exception as e:
         log.exception("OpenAI extraction failed: %s", e)
-        return []
+        return None
@@ -8,6 +8,7 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 
 from config import load_settings
+from utils.metrics import instrument_engine
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +36,7 @@ def get_engine() -> Engine:
         except Exception as e:
             logger.warning("API get_engine: could not parse URL for log: %s", e)
         _engine = create_engine(settings.database_url, future=True, pool_pre_ping=True)
+        instrument_engine(_engine)
         try:
             logger.info(
                 "API Connected DB (engine.url): host=%r port=%r database=%r",
@@ -71,6 +73,11 @@ def create_app() -> FastAPI:
     app.include_router(admin_router, prefix="/admin", tags=["admin"])
     logger.info("✅ Admin router mounted")
 
+    # /metrics (Prometheus) и /health/kudago
+    from web.health import router as health_router
+
+    app.include_router(health_router, tags=["health"])
+
     from api.telegram_ingest_internal import router as telegram_ingest_internal_router
 
     app.include_router(telegram_ingest_internal_router, prefix="/internal", tags=["internal"])
@@ -154,6 +161,27 @@ def create_app() -> FastAPI:
 
     # /health уже зарегистрирован в начале create_app() (до импорта webhook/aiogram)
 
+    # Клики пишутся пачками в фоне: запуск на старте, дозапись очереди при остановке
+    app.state.participation_writer = None
+
+    @app.on_event("startup")
+    async def start_participation_writer():
+        from utils.user_participation_analytics import ParticipationAnalyticsWriter
+
+        try:
+            writer = ParticipationAnalyticsWriter(get_engine())
+        except Exception as e:
+            logger.warning(f"⚠️ Аналитика кликов отключена: {e}")
+            return
+        writer.start()
+        app.state.participation_writer = writer
+
+    @app.on_event("shutdown")
+    async def stop_participation_writer():
+        writer = app.state.participation_writer
+        if writer is not None:
+            await writer.close()
+
     @app.get("/click")
     async def track_click(
         user_id: int = Query(..., description="ID пользователя Telegram"),
@@ -169,8 +197,6 @@ def create_app() -> FastAPI:
 
         from fastapi.responses import RedirectResponse
 
-        from utils.user_participation_analytics import UserParticipationAnalytics
-
         try:
             # Декодируем target_url
             decoded_url = unquote(target_url)
@@ -181,11 +207,11 @@ def create_app() -> FastAPI:
                 # Все равно редиректим, но не логируем
                 return RedirectResponse(url=decoded_url, status_code=302)
 
-            # Логируем клик в базу данных
-            engine = get_engine()
-            analytics = UserParticipationAnalytics(engine)
-
-            if click_type == "source":
+            # Логируем клик в базу данных (в фоне, пачкой)
+            analytics = app.state.participation_writer
+            if analytics is None:
+                logger.warning(f"⚠️ Аналитика кликов недоступна: user_id={user_id}, event_id={event_id}")
+            elif click_type == "source":
                 analytics.record_click_source(user_id, event_id)
                 logger.info(f"✅ Записан click_source: user_id={user_id}, event_id={event_id}")
             elif click_type == "route":
@@ -284,7 +310,7 @@ def create_app() -> FastAPI:
 
         @app.post("/events/sources/meetup/sync")
         async def sync_meetup(lat: float, lng: float, radius_km: float = 5.0):
-            """Синхронизация событий из Meetup API. Использует ingest.upsert.upsert_event с переводом RU→EN."""
+            """Синхронизация событий из Meetup API. Пакетный upsert через ingest.upsert_events (перевод RU→EN)."""
             if not (-90 <= lat <= 90):
                 raise HTTPException(status_code=400, detail="lat must be between -90 and 90")
             if not (-180 <= lng <= 180):
@@ -308,7 +334,7 @@ def create_app() -> FastAPI:
 
         @app.post("/events/sources/baliforum/sync")
         async def sync_baliforum(lat: float, lng: float, radius_km: float = 5.0):
-            """Синхронизация событий из BaliForum. Использует ingest.upsert.upsert_event с переводом RU→EN."""
+            """Синхронизация событий из BaliForum. Пакетный upsert через ingest.upsert_events (перевод RU→EN)."""
             if not (-90 <= lat <= 90):
                 raise HTTPException(status_code=400, detail="lat must be between -90 and 90")
             if not (-180 <= lng <= 180):
@@ -320,7 +346,7 @@ def create_app() -> FastAPI:
                 import sources.baliforum
                 from ingest import upsert_events
 
-                events = sources.baliforum.fetch(limit=100)
+                events = await sources.baliforum.fetch_async(limit=100)
                 engine = get_engine()
                 inserted_count = upsert_events(events, engine)
                 return {"inserted": inserted_count}
@@ -1,55 +1,59 @@
 #!/usr/bin/env python3
 """
 AI-пайплайн для парсинга событий и загрузки в БД
+
+URL из seeds/ai_sources.json обрабатываются асинхронно: одновременно не больше AI_INGEST_CONCURRENCY
+запросов и не больше AI_INGEST_PER_HOST к одному хосту. Страница запрашивается условно
+(If-None-Match / If-Modified-Since); если сервер ответил 304 или хэш основного текста не изменился
+с прошлого запуска, OpenAI не вызывается и БД не трогается. Геокодинг идет через geo_cache,
+события одного URL пишутся одним многострочным upsert в своей транзакции.
 """
 
 import argparse
+import asyncio
 import hashlib
 import json
 import os
+import time
+from collections import defaultdict
+from functools import cache
 from typing import Any
 
+import httpx
 from sqlalchemy import create_engine, text
 
-from api.ai_extractor import call_openai_for_events, extract_main_text, fetch_html
+from api.ai_extractor import _UA, call_openai_for_events, extract_main_text
 from api.normalize import geocode_one, to_utc_iso
 from config import load_settings
+from utils.geo_cache import GeoCache, geocode_key
+from utils.http_clients import new_async_client
+from utils.state_store import create_state_backend, pack_state, unpack_state
 
-settings = load_settings()
 MAX_URLS = int(os.getenv("AI_INGEST_MAX_URLS", "20"))
 MAX_EVENTS_PER_URL = int(os.getenv("AI_INGEST_MAX_EVENTS_PER_URL", "20"))
 SOURCE_TAG = os.getenv("AI_INGEST_SOURCE_TAG", "ai")
-
-engine = create_engine(settings.database_url, pool_pre_ping=True, future=True)
+CONCURRENCY = int(os.getenv("AI_INGEST_CONCURRENCY", "8"))
+PER_HOST = int(os.getenv("AI_INGEST_PER_HOST", "2"))
+FETCH_TIMEOUT_S = float(os.getenv("AI_INGEST_FETCH_TIMEOUT_S", "30"))
+SOURCE_CACHE_TTL_S = int(os.getenv("AI_INGEST_SOURCE_CACHE_TTL_S", str(14 * 86400)))
+# Nominatim разрешает не больше одного запроса в секунду
+NOMINATIM_INTERVAL_S = 1.0
 
 
-def canonical_key(e: dict[str, Any]) -> str:
-    """Создает канонический ключ для дедупликации."""
-    title = (e.get("title") or "").strip().lower()
-    start = (e.get("start") or "").strip()
-    venue = (e.get("venue_name") or "").strip().lower()
-    base = f"{title}|{start}|{venue}"
-    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+@cache
+def get_engine():
+    return create_engine(load_settings().database_url, pool_pre_ping=True, future=True)
 
 
-def upsert_event(conn, e: dict[str, Any], url: str):
-    """Upsert события в БД."""
-    start_utc = to_utc_iso(e.get("start"))
-    to_utc_iso(e.get("end"))
-
-    # геокодинг при необходимости
-    lat = e.get("lat")
-    lon = e.get("lon")
-    if not lat or not lon:
-        q = " ".join(filter(None, [e.get("venue_name"), e.get("address"), e.get("city"), e.get("country")]))
-        lat, lon = geocode_one(q)
-
-    conn.execute(
-        text("""
+_UPSERT_SQL = text("""
     INSERT INTO events
       (title, description, starts_at, time_utc, location_name, lat, lng, source, url, city, country)
-    VALUES
-      (:title, :description, :starts_at, :time_utc, :location_name, :lat, :lng, :source, :url, :city, :country)
+    SELECT r.title, r.description, r.starts_at, r.starts_at, r.location_name, r.lat, r.lng,
+           :source, r.url, r.city, r.country
+    FROM jsonb_to_recordset(CAST(:rows AS JSONB)) AS r(
+      title text, description text, starts_at timestamptz, location_name text,
+      lat double precision, lng double precision, url text, city text, country text
+    )
     ON CONFLICT (title, starts_at, location_name) DO UPDATE SET
       description = EXCLUDED.description,
       time_utc = EXCLUDED.time_utc,
@@ -58,46 +62,236 @@ def upsert_event(conn, e: dict[str, Any], url: str):
       url = EXCLUDED.url,
       city = EXCLUDED.city,
       country = EXCLUDED.country
-    """),
-        dict(
-            title=e.get("title"),
-            description=e.get("description"),
-            starts_at=start_utc,
-            time_utc=start_utc,
-            location_name=e.get("venue_name"),
-            lat=lat,
-            lon=lon,
-            source=SOURCE_TAG,
-            url=url,
-            city=e.get("city"),
-            country=e.get("country", "Indonesia"),
-        ),
-    )
+""")
 
 
-def process_url(conn, url: str, city_hint: str | None):
-    """Обрабатывает один URL."""
-    html = fetch_html(url)
-    text = extract_main_text(html)
-    events = call_openai_for_events(text, url, city_hint, MAX_EVENTS_PER_URL)
+def canonical_key(e: dict[str, Any]) -> str:
+    """Создает канонический ключ для дедупликации."""
+    title = (e.get("title") or "").strip().lower()
+    start = (e.get("start") or "").strip()
+    venue = (e.get("venue_name") or "").strip().lower()
+    base = f"{title}|{start}|{venue}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
 
-    seen = set()
-    inserted = 0
 
-    for e in events:
+def text_hash(main_text: str) -> str:
+    return hashlib.sha256(main_text.encode("utf-8")).hexdigest()
+
+
+def normalize_extracted(events: list[dict], city_hint: str | None) -> list[dict]:
+    """
+    События из ответа модели: start_datetime -> start, город из сида по умолчанию,
+    без названия/даты и повторы (canonical_key) отбрасываются, не больше MAX_EVENTS_PER_URL.
+    """
+    result = []
+    seen = set()
+    for raw in events:
+        e = dict(raw)
+        e["start"] = e.get("start") or e.get("start_datetime")
+        e["city"] = e.get("city") or city_hint
         if not e.get("title") or not e.get("start"):
             continue
         key = canonical_key(e)
         if key in seen:
             continue
         seen.add(key)
-        upsert_event(conn, e, url)
-        inserted += 1
-    return inserted
+        result.append(e)
+        if len(result) >= MAX_EVENTS_PER_URL:
+            break
+    return result
 
 
-def run_from_seed(seed_path="seeds/ai_sources.json", limit=None, dry_run=False):
-    """Запускает пайплайн из файла источников."""
+def geocode_query(e: dict[str, Any]) -> str:
+    return " ".join(filter(None, [e.get("venue_name"), e.get("address"), e.get("city"), e.get("country")]))
+
+
+class SourceCache:
+    """
+    Между запусками для каждого URL: валидаторы (ETag/Last-Modified) и хэш основного текста.
+    Хранится в state_store (namespace ai_ingest_source, таблица bot_state).
+    """
+
+    namespace = "ai_ingest_source"
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, url: str) -> dict | None:
+        try:
+            data = self.backend.get(self.namespace, url)
+        except Exception as e:
+            print(f"[WARN] кэш источников недоступен: {e}")
+            return None
+        return unpack_state(data) if data is not None else None
+
+    def set(self, url: str, entry: dict) -> None:
+        try:
+            self.backend.set(self.namespace, url, pack_state(entry, self.backend.compress), SOURCE_CACHE_TTL_S)
+        except Exception as e:
+            print(f"[WARN] не удалось записать кэш источника {url}: {e}")
+
+
+class AiIngestPipeline:
+    """Один запуск инжеста: общий пул соединений, лимиты по хостам, тайминги по стадиям."""
+
+    def __init__(self, client: httpx.AsyncClient, cache: SourceCache, geo: GeoCache, *, dry_run: bool = False):
+        self.client = client
+        self.cache = cache
+        self.geo = geo
+        self.dry_run = dry_run
+        self._semaphore = asyncio.Semaphore(max(1, CONCURRENCY))
+        self._host_semaphores: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(max(1, PER_HOST)))
+        self._geocode_lock = asyncio.Lock()
+        self._geocoded: dict[str, tuple[float | None, float | None]] = {}
+        self.timings: dict[str, float] = defaultdict(float)
+        self.counters: dict[str, int] = defaultdict(int)
+
+    def _timed(self, stage: str, started: float) -> None:
+        self.timings[stage] += time.perf_counter() - started
+
+    async def fetch(self, url: str, cached: dict | None) -> httpx.Response:
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        started = time.perf_counter()
+        async with self._semaphore, self._host_semaphores[httpx.URL(url).host]:
+            response = await self.client.get(url, headers=headers or None)
+        self._timed("fetch", started)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def geocode(self, query: str) -> tuple[float | None, float | None]:
+        """geocode_one через geo_cache; один и тот же адрес за запуск геокодируется один раз."""
+        if not query:
+            return (None, None)
+        if query in self._geocoded:
+            return self._geocoded[query]
+        started = time.perf_counter()
+        key = geocode_key(query)
+        cached = await self.geo.get("nominatim", key)
+        if cached is not None:
+            coords = (float(cached[0]), float(cached[1]))
+        else:
+            async with self._geocode_lock:
+                coords = await asyncio.to_thread(geocode_one, query)
+                await asyncio.sleep(NOMINATIM_INTERVAL_S)
+            self.geo.record_api_call()
+            if coords[0] is not None and coords[1] is not None:
+                await self.geo.set("nominatim", key, list(coords))
+        self._geocoded[query] = coords
+        self._timed("geocode", started)
+        return coords
+
+    async def to_rows(self, events: list[dict], url: str) -> list[dict]:
+        """Строки для upsert; события без координат (не нашлись и геокодингом) пропускаются."""
+        rows = {}
+        for e in events:
+            start_utc = to_utc_iso(e.get("start"))
+            if not start_utc:
+                continue
+            lat, lng = e.get("lat"), e.get("lon") or e.get("lng")
+            if not lat or not lng:
+                lat, lng = await self.geocode(geocode_query(e))
+            if lat is None or lng is None:
+                self.counters["no_coords"] += 1
+                continue
+            row = {
+                "title": e.get("title"),
+                "description": e.get("description"),
+                "starts_at": start_utc,
+                "location_name": e.get("venue_name"),
+                "lat": lat,
+                "lng": lng,
+                "url": e.get("url") or url,
+                "city": e.get("city"),
+                "country": e.get("country") or "Indonesia",
+            }
+            # ON CONFLICT не может обновить одну строку дважды в одном запросе
+            rows[(row["title"], row["starts_at"], row["location_name"])] = row
+        return list(rows.values())
+
+    async def write(self, rows: list[dict]) -> None:
+        started = time.perf_counter()
+
+        def _write():
+            with get_engine().begin() as conn:
+                conn.execute(_UPSERT_SQL, {"rows": json.dumps(rows, ensure_ascii=False), "source": SOURCE_TAG})
+
+        await asyncio.to_thread(_write)
+        self._timed("db", started)
+
+    async def process_url(self, url: str, city_hint: str | None) -> int:
+        """Обрабатывает один URL. Возвращает число записанных событий (0 — страница не изменилась)."""
+        cached = await asyncio.to_thread(self.cache.get, url)
+        response = await self.fetch(url, cached)
+        self.counters["fetched"] += 1
+        if response.status_code == 304 and cached:
+            self.counters["not_modified"] += 1
+            return 0
+
+        started = time.perf_counter()
+        main_text = await asyncio.to_thread(extract_main_text, response.text)
+        self._timed("extract", started)
+        main_hash = text_hash(main_text)
+        entry = {
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "text_hash": main_hash,
+        }
+        if cached and cached.get("text_hash") == main_hash:
+            self.counters["text_unchanged"] += 1
+            if not self.dry_run:
+                await asyncio.to_thread(self.cache.set, url, {**cached, **entry})
+            return 0
+        if self.dry_run:
+            # Кэш не пишем: иначе реальный запуск счел бы страницу уже обработанной
+            print(f"[DRY-RUN] {url}: текст изменился ({len(main_text)} символов), OpenAI не вызываем")
+            return 0
+
+        started = time.perf_counter()
+        extracted = await asyncio.to_thread(call_openai_for_events, main_text, source_url=url)
+        self._timed("llm", started)
+        self.counters["llm_calls"] += 1
+        if extracted is None:
+            # Кэш не пишем: иначе сбой LLM скрыл бы источник на SOURCE_CACHE_TTL_S
+            self.counters["llm_failed"] += 1
+            return 0
+
+        rows = await self.to_rows(normalize_extracted(extracted, city_hint), url)
+        if rows:
+            await self.write(rows)
+        # Кэш — только после успешной записи, иначе следующий запуск пропустил бы эти события
+        await asyncio.to_thread(self.cache.set, url, entry)
+        return len(rows)
+
+    async def run(self, sources: list[dict]) -> int:
+        async def handle(src: dict) -> int:
+            url = src["url"]
+            try:
+                n = await self.process_url(url, src.get("city"))
+                print(f"[OK] {url} -> {n} events")
+                return n
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"[ERR] {url}: {e}")
+                return 0
+
+        return sum(await asyncio.gather(*(handle(src) for src in sources)))
+
+    def report(self, total: int, wall_s: float) -> None:
+        stages = " ".join(
+            f"{stage}={self.timings[stage]:.1f}s" for stage in ("fetch", "extract", "llm", "geocode", "db")
+        )
+        counters = " ".join(f"{name}={value}" for name, value in sorted(self.counters.items()))
+        print(f"[TIMINGS] wall={wall_s:.1f}s {stages} (сумма по URL, стадии идут параллельно)")
+        print(f"[STATS] {counters} geo_cache={self.geo.stats()}")
+
+
+async def run_from_seed_async(seed_path="seeds/ai_sources.json", limit=None, dry_run=False) -> int:
     with open(seed_path, encoding="utf-8") as f:
         sources = json.load(f)
 
@@ -107,38 +301,37 @@ def run_from_seed(seed_path="seeds/ai_sources.json", limit=None, dry_run=False):
         print(f"[INFO] Ограничение: обрабатываем только {limit} URL")
 
     if dry_run:
-        print("[DRY-RUN] Режим тестирования - записи в БД не производится")
+        print("[DRY-RUN] Режим тестирования - OpenAI не вызывается, записи в БД не производится")
 
-    total = 0
-
-    if dry_run:
-        # В dry-run режиме не используем соединение с БД
-        for i, src in enumerate(sources):
-            url = src["url"]
-            city = src.get("city")
-            try:
-                print(f"[DRY-RUN] Обрабатываем: {url}")
-                # Здесь можно добавить логику для тестирования без записи
-                total += 1  # Просто считаем обработанные URL
-            except Exception as e:
-                print(f"[ERR] {url}: {e}")
-    else:
-        # Обычный режим с записью в БД
-        with engine.begin() as conn:
-            for i, src in enumerate(sources):
-                url = src["url"]
-                city = src.get("city")
-                try:
-                    n = process_url(conn, url, city)
-                    print(f"[OK] {url} -> {n} events")
-                    total += n
-                except Exception as e:
-                    print(f"[ERR] {url}: {e}")
+    started = time.perf_counter()
+    async with new_async_client(
+        "ai_ingest",
+        headers={
+            "User-Agent": _UA,
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en",
+        },
+        timeout=FETCH_TIMEOUT_S,
+        limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+    ) as client:
+        pipeline = AiIngestPipeline(
+            client,
+            SourceCache(create_state_backend("memory" if dry_run else "postgres", engine=get_engine())),
+            GeoCache(engine_getter=get_engine),
+            dry_run=dry_run,
+        )
+        total = await pipeline.run(sources)
+    pipeline.report(total, time.perf_counter() - started)
 
     print(f"TOTAL INSERTED: {total}")
     return total
 
 
+def run_from_seed(seed_path="seeds/ai_sources.json", limit=None, dry_run=False):
+    """Запускает пайплайн из файла источников."""
+    return asyncio.run(run_from_seed_async(seed_path, limit, dry_run))
+
+
 def main():
     parser = argparse.ArgumentParser(description="AI-пайплайн для парсинга событий")
     parser.add_argument("--limit", type=int, help="Ограничить количество обрабатываемых URL")
@@ -4,10 +4,11 @@
 import os
 from functools import lru_cache
 
-import requests
 from dateutil import parser as dateparser
 from dateutil import tz
 
+from utils.http_clients import get_sync_client
+
 DEFAULT_TZ = tz.gettz(os.getenv("DEFAULT_TZ", "Asia/Makassar"))
 GEOCODE_URL = os.getenv("GEOCODE_URL", "https://nominatim.openstreetmap.org/search")
 GEOCODE_EMAIL = os.getenv("GEOCODE_EMAIL", "dev@local")
@@ -20,7 +21,7 @@ def reverse_geocode(lat: float, lon: float) -> dict[str, str | None]:
     """
     try:
         email = os.getenv("GEOCODE_EMAIL") or "noreply@example.com"
-        r = requests.get(
+        r = get_sync_client("nominatim").get(
             "https://nominatim.openstreetmap.org/reverse",
             params={"format": "jsonv2", "lat": lat, "lon": lon},
             headers={"User-Agent": f"event-bot/1 ({email})"},
@@ -78,7 +79,7 @@ def geocode_one(
         params["lon"] = lon
 
     try:
-        r = requests.get(
+        r = get_sync_client("nominatim").get(
             "https://nominatim.openstreetmap.org/search",
             params=params,
             headers=headers,
@@ -11,8 +11,9 @@ from zoneinfo import ZoneInfo
 
 from sqlalchemy import text
 
-from database import get_session
+from database import get_engine, get_session
 from utils.geo_utils import bbox_around, haversine_km, validate_coordinates
+from utils.unified_events_service import UnifiedEventsService
 
 logger = logging.getLogger(__name__)
 
@@ -149,60 +150,22 @@ def get_events_nearby_today(
     start, end = start_end_of_today()
 
     try:
-        with get_session() as session:
-            # 1) Первичный отбор по рамке и времени (быстро и дешево)
-            min_lat, max_lat, min_lon, max_lon = bbox_around(lat, lon, radius_km)
-
-            rows = (
-                session.execute(
-                    text("""
-                SELECT id, title, description, title_en, description_en, location_name_en,
-                       time_utc, starts_at, lat, lng, location_name, source, url,
-                       status, created_at_utc, updated_at_utc, city, country
-                FROM events
-                WHERE lat IS NOT NULL AND lng IS NOT NULL
-                  AND lat BETWEEN :min_lat AND :max_lat
-                  AND lng BETWEEN :min_lon AND :max_lon
-                  AND time_utc >= :start_utc AND time_utc < :end_utc
-                  AND (
-                      starts_at >= NOW() - INTERVAL '3 hours'
-                      OR (starts_at IS NULL AND time_utc >= NOW() - INTERVAL '3 hours')
-                  )
-                ORDER BY time_utc ASC
-                LIMIT :lim
-                """),
-                    dict(
-                        min_lat=min_lat,
-                        max_lat=max_lat,
-                        min_lon=min_lon,
-                        max_lon=max_lon,
-                        start_utc=start.astimezone(ZoneInfo("UTC")),
-                        end_utc=end.astimezone(ZoneInfo("UTC")),
-                        lim=limit * 10,
-                    ),  # Берем больше для фильтрации
-                )
-                .mappings()
-                .all()
-            )
-
-            # 2) Точная фильтрация по радиусу и сортировка
-            filtered = []
-            for row in rows:
-                distance = haversine_km(lat, lon, row["lat"], row["lng"])
-                if distance <= radius_km:
-                    event_dict = dict(row)
-                    event_dict["distance_km"] = round(distance, 2)
-                    filtered.append((event_dict, distance))
-
-            # Сортировка по времени, затем по расстоянию
-            filtered.sort(key=lambda x: (x[0]["time_utc"], x[1]))
-
-            # Пагинация
-            total = len(filtered)
-            page = filtered[offset : offset + limit]
-
-            logger.info(f"Найдено {total} событий на сегодня в радиусе {radius_km} км от ({lat}, {lon})")
-            return [event for event, _ in page], total
+        # Общая реализация с ботом: bbox по индексу lat/lng + точная дистанция в SQL,
+        # сортировка по времени, затем по расстоянию
+        events = UnifiedEventsService(get_engine()).search_events_nearby(
+            user_lat=lat,
+            user_lng=lon,
+            radius_km=radius_km,
+            start_utc=start.astimezone(ZoneInfo("UTC")),
+            end_utc=end.astimezone(ZoneInfo("UTC")),
+        )
+
+        # Пагинация
+        total = len(events)
+        page = [event.to_dict() for event in events[offset : offset + limit]]
+
+        logger.info(f"Найдено {total} событий на сегодня в радиусе {radius_km} км от ({lat}, {lon})")
+        return page, total
 
     except Exception as e:
         logger.error(f"Ошибка при поиске событий на сегодня: {e}")
@@ -26,7 +26,6 @@ from aiogram import Bot, Dispatcher, F, types
 from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.types import (
     BufferedInputFile,
     ChatMemberUpdated,
@@ -38,7 +37,7 @@ from aiogram.types import (
 )
 
 from config import load_settings
-from database import Event, User, create_all, get_session, init_engine
+from database import Event, User, create_all, get_async_engine, get_engine, get_session, init_engine
 from rockets_service import award_rockets_for_activity
 from simple_status_manager import (
     auto_close_events,
@@ -54,19 +53,39 @@ from tasks_service import (
     create_task_from_place,
     get_user_active_tasks,
 )
+from utils.auto_delete import auto_deleter
+from utils.ban_service import BanService, ban_cache
+from utils.cache import TTLCache
+from utils.chat_admins import chat_admins
 from utils.event_category_manager import format_source_display_tags
 from utils.event_translation import ensure_bilingual
-from utils.geo_utils import get_timezone, haversine_km
+from utils.events_snapshot import events_snapshot
+from utils.feed_prepare import (
+    enrich_venue_name,
+    get_source_url,
+    prepare_events_for_feed,
+    sanitize_url,
+)
+from utils.geo_cache import geo_cache
+from utils.geo_utils import close_google_http, get_timezone, haversine_km
+from utils.http_clients import upstream_stats
 from utils.i18n import format_translation, get_bot_username, t
+from utils.metrics import aiohttp_metrics_handler
 from utils.place_tags import format_place_categories_line_html
+from utils.send_scheduler import install_send_scheduler
+from utils.state_store import StateStoreFSMStorage, UserStateStore, create_state_backend
 from utils.static_map import build_static_map_url, fetch_static_map
-from utils.unified_events_service import UnifiedEventsService
+from utils.structured_logging import HotPathLog
+from utils.tracing import HandlerTracingMiddleware, TracingMiddleware, format_trace, slow_updates, traced_middleware
+from utils.translation_service import translation_service
+from utils.unified_events_service import AsyncUnifiedEventsService, UnifiedEventsService
 from utils.user_language import (
     get_user_language_or_default,
     needs_language_selection,
     set_user_language,
 )
-from utils.user_participation_analytics import UserParticipationAnalytics
+from utils.user_participation_analytics import ParticipationAnalyticsWriter
+from utils.user_upsert import UserUpsertBatcher
 
 # Тексты кнопок на обоих языках для сопоставления в обработчиках (reply-клавиатура)
 _MAIN_MENU_BUTTON_TEXTS = (t("myevents.button.main_menu", "ru"), t("myevents.button.main_menu", "en"))
@@ -249,41 +268,6 @@ def sort_events_by_time(events: list) -> list:
     return sorted(events, key=get_event_time)
 
 
-def enrich_venue_name(e: dict) -> dict:
-    """
-    Обогащает событие названием места, если его нет
-    НЕ извлекает из названия события - использует только данные из БД (геокодирование)
-    """
-    # Проверяем venue_name из БД (должен быть из геокодирования)
-    if e.get("venue_name") and e.get("venue_name") not in [
-        "",
-        "Место проведения",
-        "Место не указано",
-    ]:
-        return e
-
-    # Проверяем location_name из БД (альтернативный источник)
-    if e.get("location_name") and e.get("location_name") not in [
-        "",
-        "Место проведения",
-        "Место не указано",
-        "Место по ссылке",
-    ]:
-        e["venue_name"] = e.get("location_name")
-        return e
-
-    # Если всё ещё пустое, используем fallback
-    # НЕ извлекаем из названия события - это неправильно!
-    if not e.get("venue_name") or e.get("venue_name") in [
-        "",
-        "Место проведения",
-        "Место не указано",
-    ]:
-        e["venue_name"] = "Локация"
-
-    return e
-
-
 def get_venue_name(event: dict) -> str:
     """
     Возвращает название места для события
@@ -360,250 +344,6 @@ def is_m垃圾_url(url: str) -> bool:
     return sanitize_url(url) is None
 
 
-def is_blacklisted_url(url: str) -> bool:
-    """
-    Проверяет, является ли URL в черном списке доменов
-    """
-    if not url:
-        return True
-    try:
-        from urllib.parse import urlparse
-
-        p = urlparse(url)
-        host = p.netloc.lower()
-        return any(host == d or host.endswith("." + d) for d in BLACKLIST_DOMAINS)
-    except Exception:
-        return True
-
-
-def prepare_events_for_feed(
-    events: list[dict],
-    user_point: tuple[float, float] = None,
-    radius_km: float = None,
-    with_diag: bool = False,
-) -> tuple[list[dict], dict] | list[dict]:
-    """
-    Фильтрует события для показа в ленте с улучшенной диагностикой
-    Поддерживает три типа событий: source, user, ai_parsed
-    """
-    from config import load_settings
-    from logging_helpers import DropStats
-    from utils.telegram_source_visibility import is_public_telegram_event
-    from venue_enrich import enrich_venue_from_text
-
-    settings = load_settings()
-    drop = DropStats()
-    kept = []
-    kept_by_type = {"source": 0, "user": 0, "community": 0, "ai_parsed": 0}
-
-    logger.debug(f"🔍 PROCESSING {len(events)} events for filtering")
-    for e in events:
-        # 0) Сначала обогащаем локацию из текста
-        e = enrich_venue_from_text(e)
-        logger.debug(
-            f"🔍 EVENT: {e.get('title')}, coords: {e.get('lat')}, {e.get('lng')}, type: {e.get('type')}, source: {e.get('source')}"
-        )
-
-        # Определяем тип события согласно ТЗ
-        source = e.get("source", "")
-        input_type = e.get("type", "")
-        event_type = "source"  # по умолчанию
-
-        # Проверяем, является ли это событием от группы (community)
-        if source == "community" or input_type == "community":
-            event_type = "community"
-        # Проверяем, является ли это событием от пользователя (но не от группы)
-        elif input_type == "user" or source in ["user_created", "user"]:
-            event_type = "user"
-        # Проверяем, является ли это AI-парсингом
-        elif input_type in ["ai", "ai_parsed", "ai_generated"] or e.get("ai_parsed") or source == "ai_parsed":
-            event_type = input_type if input_type in ["ai", "ai_parsed", "ai_generated"] else "ai_parsed"
-        # Все остальное - источники
-        else:
-            event_type = "source"
-
-        # Добавляем поле type в событие
-        e["type"] = event_type
-
-        title = (e.get("title") or "").strip() or "—"
-
-        # 1) Проверяем URL согласно ТЗ
-        url = get_source_url(e)
-
-        # Для ai_parsed URL обязателен
-        if event_type == "ai_parsed" and not url:
-            drop.add("no_url", title)
-            continue
-
-        # Для user и community URL не обязателен
-        if event_type in ["user", "community"] and not url:
-            # Пользовательские события и события от групп могут не иметь URL
-            pass
-
-        # 2) Проверяем наличие локации (venue_name ИЛИ address ИЛИ coords)
-        venue = e.get("venue", {})
-        has_loc = any(
-            [
-                venue.get("name"),
-                venue.get("address"),
-                (venue.get("lat") is not None and venue.get("lon") is not None),
-                e.get("venue_name"),
-                e.get("address"),
-                (e.get("lat") is not None and e.get("lng") is not None),
-            ]
-        )
-
-        # Для source и ai*: пропускать события без URL И без локации
-        has_telegram_author = (
-            e.get("source") == "telegram"
-            and not is_public_telegram_event(e)
-            and (e.get("organizer_id") or e.get("organizer_username"))
-        )
-        if (
-            event_type in ["source", "ai_parsed", "ai", "ai_generated"]
-            and not url
-            and not has_loc
-            and not has_telegram_author
-        ):
-            drop.add("source_without_url_and_location", title)
-            continue
-
-        if not has_loc:
-            drop.add("no_venue_or_location", title)
-            continue
-
-        # 3) Специальные проверки для моментов пользователей
-        if event_type == "user":
-            # Проверяем TTL для моментов
-            from datetime import UTC, datetime
-
-            expires_utc = e.get("expires_utc")
-            if expires_utc:
-                if isinstance(expires_utc, str):
-                    try:
-                        expires_utc = datetime.fromisoformat(expires_utc.replace("Z", "+00:00"))
-                    except Exception:
-                        drop.add("invalid_expires_time", title)
-                        continue
-
-                if expires_utc < datetime.now(UTC):
-                    drop.add("event_expired", title)
-                    continue
-
-            # Для пользовательских событий используем радиус пользователя
-            user_radius = radius_km
-            logger.debug(f"🔍 FILTERING USER EVENTS: user_radius={user_radius}, user_point={user_point}")
-            if user_point and user_radius is not None:
-                # Получаем координаты события
-                event_lat = None
-                event_lng = None
-
-                # Проверяем новую структуру venue
-                venue = e.get("venue", {})
-                if venue.get("lat") is not None and venue.get("lon") is not None:
-                    event_lat = venue.get("lat")
-                    event_lng = venue.get("lon")
-                    logger.debug(f"🔍 COORDS FROM VENUE: {event_lat}, {event_lng}")
-                # Проверяем старую структуру
-                elif e.get("lat") is not None and e.get("lng") is not None:
-                    event_lat = e.get("lat")
-                    event_lng = e.get("lng")
-                    logger.debug(f"🔍 COORDS FROM EVENT: {event_lat}, {event_lng}")
-
-                if event_lat is not None and event_lng is not None:
-                    # Вычисляем расстояние
-                    from utils.geo_utils import haversine_km
-
-                    distance = haversine_km(user_point[0], user_point[1], event_lat, event_lng)
-                    logger.debug(
-                        f"🔍 FILTER CHECK: event='{title}', event_coords=({event_lat},{event_lng}), user_coords=({user_point[0]},{user_point[1]}), distance={distance:.2f}km, user_radius={user_radius}km"
-                    )
-                    if distance > user_radius:
-                        logger.warning(
-                            f"❌ FILTERED OUT: '{title}' - distance {distance:.2f}km > radius {user_radius}km"
-                        )
-                        drop.add("user_event_out_of_radius", title)
-                        continue
-                    else:
-                        logger.debug(f"✅ KEPT: '{title}' - distance {distance:.2f}km <= radius {user_radius}km")
-                    # Добавляем расстояние к событию
-                    e["distance_km"] = round(distance, 2)
-
-        # 4) Проверяем радиус для обычных событий (если указан user_point и radius_km)
-        elif user_point and radius_km is not None:
-            # Получаем координаты события
-            event_lat = None
-            event_lng = None
-
-            # Проверяем новую структуру venue
-            venue = e.get("venue", {})
-            if venue.get("lat") is not None and venue.get("lon") is not None:
-                event_lat = venue.get("lat")
-                event_lng = venue.get("lon")
-            # Проверяем старую структуру
-            elif e.get("lat") is not None and e.get("lng") is not None:
-                event_lat = e.get("lat")
-                event_lng = e.get("lng")
-
-            if event_lat is not None and event_lng is not None:
-                # Вычисляем расстояние
-                from utils.geo_utils import haversine_km
-
-                distance = haversine_km(user_point[0], user_point[1], event_lat, event_lng)
-                if distance > radius_km:
-                    drop.add("out_of_radius", title)
-                    continue
-                # Добавляем расстояние к событию
-                e["distance_km"] = round(distance, 2)
-
-        # 5) Проверяем доменные/спам-правила (только для событий с URL)
-        if url and is_blacklisted_url(url):
-            drop.add("blacklist_domain", title)
-            continue
-
-        # 6) Проверяем AI_GENERATE_SYNTHETIC флаг
-        if event_type == "ai_parsed" and not settings.ai_generate_synthetic:
-            # Если AI генерация запрещена, проверяем что у события есть валидный URL
-            if not url or not sanitize_url(url):
-                drop.add("ai_synthetic_blocked", title)
-                continue
-
-        # OK — оставляем событие
-        e = enrich_venue_name(e)
-
-        # Логируем пользовательские события
-        if event_type == "user":
-            logger.info(
-                f"🔍 PREPARE: title='{title}', organizer_id={e.get('organizer_id')}, organizer_username='{e.get('organizer_username')}'"
-            )
-
-        kept.append(e)
-        kept_by_type[event_type] = kept_by_type.get(event_type, 0) + 1
-
-    # Логируем сводку
-    radius_info = (
-        f"radius_km={radius_km}, user_point=({user_point[0]:.4f},{user_point[1]:.4f})"
-        if user_point and radius_km is not None
-        else "no_radius_filter"
-    )
-    logger.info(f"{drop.summary(kept_by_type=kept_by_type, total=len(events))} | {radius_info}")
-
-    diag = {
-        "in": len(events),
-        "kept": len(kept),
-        "dropped": sum(drop.reasons.values()),
-        "found_by_stream": {
-            "source": kept_by_type["source"],
-            "ai_parsed": kept_by_type["ai_parsed"],
-        },
-        "kept_by_type": kept_by_type,
-        "reasons": list(drop.reasons.keys()),
-        "reasons_top3": [f"{r}({n})" for r, n in drop.reasons.most_common(3)],
-    }
-
-    return (kept, diag) if with_diag else kept
-
-
 def create_events_summary(events: list) -> str:
     """
     Создает сводку по типам событий согласно ТЗ
@@ -666,18 +406,20 @@ async def send_compact_events_list_prepared(
         region = "bali"
 
     # Сохраняем состояние для пагинации и расширения радиуса
-    update_user_state_timestamp(message.chat.id)
-    user_state[message.chat.id] = {
-        "prepared": prepared_events,
-        "counts": counts,
-        "lat": user_lat,
-        "lng": user_lng,
-        "radius": int(radius),
-        "page": 1,
-        "date_filter": "today",  # По умолчанию показываем события на сегодня
-        "diag": {"kept": len(prepared_events), "dropped": 0, "reasons_top3": []},
-        "region": region,
-    }
+    await user_state.set(
+        message.chat.id,
+        {
+            "prepared": prepared_events,
+            "counts": counts,
+            "lat": user_lat,
+            "lng": user_lng,
+            "radius": int(radius),
+            "page": 1,
+            "date_filter": "today",  # По умолчанию показываем события на сегодня
+            "diag": {"kept": len(prepared_events), "dropped": 0, "reasons_top3": []},
+            "region": region,
+        },
+    )
 
     # Рендерим страницу
     user_lang = get_user_language_or_default(message.from_user.id)
@@ -754,18 +496,20 @@ async def send_compact_events_list(
         region = "bali"
 
     # 4) Сохраняем состояние для пагинации и расширения радиуса
-    update_user_state_timestamp(message.chat.id)
-    user_state[message.chat.id] = {
-        "prepared": prepared,
-        "counts": counts,
-        "lat": user_lat,
-        "lng": user_lng,
-        "radius": int(radius),
-        "page": 1,
-        "date_filter": "today",  # По умолчанию показываем события на сегодня
-        "diag": diag,
-        "region": region,  # Добавляем регион
-    }
+    await user_state.set(
+        message.chat.id,
+        {
+            "prepared": prepared,
+            "counts": counts,
+            "lat": user_lat,
+            "lng": user_lng,
+            "radius": int(radius),
+            "page": 1,
+            "date_filter": "today",  # По умолчанию показываем события на сегодня
+            "diag": diag,
+            "region": region,  # Добавляем регион
+        },
+    )
 
     # Данные из БД уже с location_name (ingest). Enrich в хендлере не вызываем.
     # 6) Рендерим страницу
@@ -966,51 +710,6 @@ def build_maps_url(e: dict) -> str:
     return "https://www.google.com/maps"
 
 
-def get_source_url(e: dict) -> str | None:
-    """Единая точка истины для получения URL источника согласно ТЗ"""
-    from utils.telegram_source_visibility import is_public_telegram_event
-
-    t = e.get("type")
-    candidates: list[str | None] = []
-
-    if t == "source":
-        # Закрытая telegram-группа: в ленте контакт автора, не ссылка на пост
-        if e.get("source") == "telegram" and not is_public_telegram_event(e):
-            return None
-        # Для источников: url > booking_url > ticket_url > source_url
-        candidates = [
-            e.get("url"),
-            e.get("booking_url"),
-            e.get("ticket_url"),
-            e.get("source_url"),
-            e.get("link"),
-            e.get("community_link") if e.get("source") == "telegram" else None,
-        ]
-    elif t in ("ai", "ai_parsed", "ai_generated"):
-        # Для AI-парсинга: source_url > url > original_url > location_url
-        candidates = [e.get("source_url"), e.get("url"), e.get("original_url"), e.get("location_url")]
-    elif t == "user":
-        # Для пользовательских событий URL не обязателен
-        candidates = [e.get("author_url"), e.get("chat_url")]
-    else:
-        # Fallback для неизвестных типов
-        candidates = [e.get("source_url"), e.get("url"), e.get("link")]
-
-    for u in candidates:
-        if u:
-            sanitized = sanitize_url(u)
-            if sanitized:
-                # Если есть реферальный код, добавляем его к URL
-                referral_code = e.get("referral_code")
-                if referral_code:
-                    from utils.referral_url import add_referral_to_url
-
-                    referral_param = e.get("referral_param", "ref")
-                    return add_referral_to_url(sanitized, referral_code, referral_param)
-                return sanitized
-    return None  # нет реального источника — лучше не показывать ссылку
-
-
 def truncate_html_safely(html_text: str, max_length: int) -> str:
     """
     Безопасно обрезает HTML-текст, используя BeautifulSoup для правильной обработки тегов
@@ -1530,6 +1229,7 @@ async def enrich_events_with_reverse_geocoding(events: list[dict], user_id: int
     import logging
 
     logger = logging.getLogger(__name__)
+    hot = HotPathLog(logger, "reverse_geocoding")
     geo_lang = get_user_language_or_default(user_id) if user_id else None
 
     # Временные/календарные паттерны, которые не являются названиями мест
@@ -1609,20 +1309,17 @@ async def enrich_events_with_reverse_geocoding(events: list[dict], user_id: int
 
                     if not is_address:
                         event["location_name"] = reverse_name
-                        logger.info(
-                            f"✅ Обогащено через reverse geocoding: location_name={reverse_name} для события '{event.get('title', 'Без названия')[:30]}'"
-                        )
+                        hot.event("enriched", "location_name=%s для '%s'", reverse_name, event.get("title"))
                     else:
-                        logger.debug(f"⚠️ Reverse geocoding вернул адрес, пропускаем: {reverse_name}")
+                        hot.event("address_skipped", "%s", reverse_name)
             except Exception as e:
-                logger.debug(f"⚠️ Ошибка reverse geocoding: {e}")
+                hot.event("error", "%s", e)
 
         return event
 
     # Выполняем обогащение параллельно, но с ограничением для защиты от OOM
     import asyncio
 
-    logger.info(f"🔄 Начинаем обогащение {len(events)} событий через reverse geocoding")
     # ОГРАНИЧЕНИЕ: обрабатываем максимум 10 событий параллельно для защиты от OOM
     MAX_PARALLEL_GEOCODE = 10
     enriched_events = []
@@ -1635,7 +1332,7 @@ async def enrich_events_with_reverse_geocoding(events: list[dict], user_id: int
     enriched_count = sum(
         1 for e in enriched_events if e.get("location_name") and e.get("location_name") not in generic_venues
     )
-    logger.info(f"✅ Обогащение завершено: {enriched_count} из {len(events)} событий получили location_name")
+    hot.summary("%s из %s событий с location_name", enriched_count, len(events))
 
     return list(enriched_events)
 
@@ -1817,11 +1514,9 @@ def _events_date_label(date_filter: str, lang: str) -> str:
     return t(key, lang)
 
 
-def _reset_search_date_filter(chat_id: int) -> str:
+async def _reset_search_date_filter(chat_id: int) -> str:
     """Новый поиск по геолокации всегда начинается с «сегодня»."""
-    state = user_state.get(chat_id)
-    if state is not None:
-        state["date_filter"] = "today"
+    await user_state.update(chat_id, date_filter="today")
     return "today"
 
 
@@ -1847,79 +1542,6 @@ def render_header(counts, radius_km: int = None, lang: str = "ru") -> str:
 # Для бота — токен обязателен
 settings = load_settings(require_bot=True)
 
-# Хранилище состояния для сохранения prepared событий по chat_id
-# ВАЖНО: Очищаем старые записи для предотвращения утечек памяти
-#
-# АРХИТЕКТУРНОЕ ПРАВИЛО:
-# - PostgreSQL является единственным источником правды (source of truth)
-# - user_state - временный кэш для UI/навигации, может быть очищен в любой момент
-# - ВАЖНО: Все критичные данные (события, пользователи) сохраняются в PostgreSQL СРАЗУ
-# - Порядок операций: 1) Сохранение в PostgreSQL, 2) Обновление user_state
-# - В user_state хранятся ТОЛЬКО простые типы: dict, list, int, str, float
-# - ЗАПРЕЩЕНО хранить функции, замыкания, объекты с методами
-user_state = {}
-_user_state_timestamps = {}  # Время последнего использования для каждого chat_id
-# СНИЖЕНО для более агрессивной защиты от OOM
-USER_STATE_MAX_SIZE = 200  # Максимальное количество пользователей в памяти (было 500)
-USER_STATE_TTL_SECONDS = 900  # Время жизни состояния: 15 минут (было 30 минут)
-
-
-def cleanup_user_state():
-    """Очищает старые записи из user_state для предотвращения утечек памяти"""
-    global user_state, _user_state_timestamps
-    current_time = time.time()
-    expired_chat_ids = []
-
-    # Находим устаревшие записи
-    for chat_id, timestamp in _user_state_timestamps.items():
-        if current_time - timestamp > USER_STATE_TTL_SECONDS:
-            expired_chat_ids.append(chat_id)
-
-    # Удаляем устаревшие записи
-    for chat_id in expired_chat_ids:
-        user_state.pop(chat_id, None)
-        _user_state_timestamps.pop(chat_id, None)
-
-    # Если все еще слишком много записей, удаляем самые старые
-    if len(user_state) > USER_STATE_MAX_SIZE:
-        # Сортируем по времени последнего использования
-        sorted_chats = sorted(_user_state_timestamps.items(), key=lambda x: x[1])
-        # Удаляем самые старые
-        to_remove = len(user_state) - USER_STATE_MAX_SIZE
-        for chat_id, _ in sorted_chats[:to_remove]:
-            user_state.pop(chat_id, None)
-            _user_state_timestamps.pop(chat_id, None)
-
-    if expired_chat_ids or len(user_state) > USER_STATE_MAX_SIZE:
-        logger.debug(
-            f"🧹 Очистка user_state: удалено {len(expired_chat_ids)} устаревших, осталось {len(user_state)} записей"
-        )
-
-
-def update_user_state_timestamp(chat_id: int):
-    """Обновляет время последнего использования для chat_id"""
-    _user_state_timestamps[chat_id] = time.time()
-    # Периодически очищаем старые записи (каждые 100 обновлений)
-    if len(_user_state_timestamps) % 100 == 0:
-        cleanup_user_state()
-
-
-def cleanup_large_prepared_events():
-    """Очищает большие списки prepared_events из user_state для экономии памяти"""
-    global user_state
-    MAX_PREPARED_EVENTS = 20  # Агрессивный лимит против OOM (было 50)
-
-    for chat_id, state in list(user_state.items()):
-        if "prepared" in state and isinstance(state["prepared"], list):
-            if len(state["prepared"]) > MAX_PREPARED_EVENTS:
-                # Оставляем только последние MAX_PREPARED_EVENTS событий
-                original_count = len(state["prepared"])
-                state["prepared"] = state["prepared"][-MAX_PREPARED_EVENTS:]
-                logger.debug(
-                    f"🧹 Очищены prepared_events для chat_id {chat_id}: "
-                    f"оставлено {MAX_PREPARED_EVENTS} из {original_count}"
-                )
-
 
 def get_memory_usage_mb() -> float:
     """Возвращает текущее использование памяти процесса в МБ"""
@@ -1934,109 +1556,46 @@ def get_memory_usage_mb() -> float:
 
 def get_memory_stats() -> dict:
     """Возвращает статистику использования памяти"""
-    stats = {
+    return {
+        "state_backend": state_backend.name,
         "user_state_size": len(user_state),
-        "user_state_timestamps_size": len(_user_state_timestamps),
-        "prepared_events_total": 0,
         "memory_mb": get_memory_usage_mb(),
     }
 
-    # Подсчитываем общее количество prepared событий
-    for state in user_state.values():
-        if "prepared" in state and isinstance(state["prepared"], list):
-            stats["prepared_events_total"] += len(state["prepared"])
-
-    return stats
-
 
 def log_memory_stats():
     """Логирует статистику использования памяти"""
     stats = get_memory_stats()
     logger.info(
         f"📊 MEMORY STATS: "
-        f"user_state={stats['user_state_size']}, "
-        f"prepared_events={stats['prepared_events_total']}, "
+        f"user_state={stats['user_state_size']} ({stats['state_backend']}), "
         f"memory={stats['memory_mb']:.1f}MB"
     )
 
 
-# Порог памяти для принудительной очистки (в МБ). 256 МБ — агрессивная защита от OOM.
-MEMORY_THRESHOLD_MB = 256
-
-
-def force_memory_cleanup():
-    """Принудительная очистка памяти при превышении порога"""
-    global user_state, _user_state_timestamps
-
-    if not PSUTIL_AVAILABLE:
-        return
-
-    memory_mb = get_memory_usage_mb()
-    if memory_mb < MEMORY_THRESHOLD_MB:
-        return
-
-    logger.warning(
-        f"⚠️ MEMORY GUARD: Память превысила порог ({memory_mb:.1f}MB > {MEMORY_THRESHOLD_MB}MB), "
-        f"выполняю принудительную очистку"
-    )
-
-    # Агрессивная очистка user_state (удаляем 70% самых старых для более радикальной очистки)
-    if len(user_state) > 0:
-        sorted_chats = sorted(_user_state_timestamps.items(), key=lambda x: x[1])
-        to_remove = max(1, int(len(user_state) * 0.7))  # Удаляем 70% самых старых
-        removed_count = 0
-        for chat_id, _ in sorted_chats[:to_remove]:
-            if chat_id in user_state:
-                user_state.pop(chat_id, None)
-                _user_state_timestamps.pop(chat_id, None)
-                removed_count += 1
-
-        logger.warning(f"🧹 MEMORY GUARD: Удалено {removed_count} записей из user_state")
-
-    # Очистка prepared_events (оставляем только последние 10 вместо 20)
-    for chat_id, state in list(user_state.items()):
-        if "prepared" in state and isinstance(state["prepared"], list):
-            if len(state["prepared"]) > 10:
-                state["prepared"] = state["prepared"][-10:]
-
-    # Очистка _processed_callbacks через middleware (если доступен)
-    # Это будет сделано в самом middleware
-
-    # Логируем результат
-    new_memory_mb = get_memory_usage_mb()
-    logger.warning(
-        f"✅ MEMORY GUARD: Очистка завершена, память: {new_memory_mb:.1f}MB "
-        f"(освобождено {memory_mb - new_memory_mb:.1f}MB)"
-    )
-
-
 async def periodic_cleanup_user_state():
-    """Периодическая очистка user_state каждые 5 минут + логирование памяти каждые 2 минуты"""
-    memory_log_interval = 120  # 2 минуты для логирования памяти (было 5)
-    cleanup_interval = 300  # 5 минут для очистки (было 15)
+    """Удаление просроченных user_state/FSM каждые 5 минут + логирование памяти каждые 2 минуты"""
+    memory_log_interval = 120  # 2 минуты для логирования памяти
+    cleanup_interval = 300  # 5 минут для очистки
     last_memory_log = time.time()
     last_cleanup = time.time()
 
     while True:
-        await asyncio.sleep(30)  # Проверяем каждые 30 секунд для более частой проверки
+        await asyncio.sleep(30)
         current_time = time.time()
 
         try:
             # Логирование памяти каждые 2 минуты
             if current_time - last_memory_log >= memory_log_interval:
-                log_memory_stats()
+                await asyncio.to_thread(log_memory_stats)
                 last_memory_log = current_time
 
             # Очистка каждые 5 минут
             if current_time - last_cleanup >= cleanup_interval:
-                cleanup_user_state()
-                cleanup_large_prepared_events()
-                logger.debug("🧹 Периодическая очистка user_state выполнена")
+                removed = await asyncio.to_thread(state_backend.purge_expired)
+                logger.debug(f"🧹 Удалено просроченных записей состояния: {removed}")
                 last_cleanup = current_time
 
-            # Memory guard: проверка и принудительная очистка при превышении порога
-            force_memory_cleanup()
-
         except Exception as e:
             logger.error(f"Ошибка при периодической очистке user_state: {e}")
 
@@ -2105,6 +1664,30 @@ def build_test_locations_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+async def save_user_location(user_id: int, lat: float, lng: float) -> None:
+    """Сохраняет последнюю геолокацию и timezone пользователя через async-сессию (не блокирует event loop)."""
+    from database import async_session_maker
+
+    tz_name = None
+    try:
+        tz_name = await get_timezone(lat, lng)
+        if not tz_name:
+            logger.warning(f"⚠️ Не удалось получить timezone для координат ({lat}, {lng})")
+    except Exception as e:
+        logger.error(f"❌ Ошибка при получении timezone: {e}")
+
+    async with async_session_maker() as session:
+        user_row = await session.get(User, user_id)
+        if user_row:
+            user_row.last_lat = lat
+            user_row.last_lng = lng
+            user_row.last_geo_at_utc = datetime.now(UTC)
+            if tz_name:
+                user_row.user_tz = tz_name
+                logger.info(f"🕒 Timezone обновлен для пользователя {user_id}: {tz_name}")
+            await session.commit()
+
+
 async def perform_nearby_search(
     message: types.Message,
     state: FSMContext,
@@ -2115,8 +1698,7 @@ async def perform_nearby_search(
     """Универсальный обработчик поиска событий рядом по координатам."""
     user_id = message.from_user.id
     user_lang = get_user_language_or_default(user_id)
-    date_filter = _reset_search_date_filter(message.chat.id)
-    logger.info(f"📍 perform_nearby_search: user_id={user_id}, lat={lat}, lng={lng}, source={source}")
+    date_filter = await _reset_search_date_filter(message.chat.id)
 
     loading_message = await message.answer(
         t("search.loading", user_lang),
@@ -2125,31 +1707,21 @@ async def perform_nearby_search(
 
     try:
         radius = get_user_radius(user_id, settings.default_radius_km)
-        with get_session() as session:
-            user_row = session.get(User, user_id)
-            if user_row:
-                user_row.last_lat = lat
-                user_row.last_lng = lng
-                user_row.last_geo_at_utc = datetime.now(UTC)
-                try:
-                    tz_name = await get_timezone(lat, lng)
-                    if tz_name:
-                        user_row.user_tz = tz_name
-                        logger.info(f"🕒 Timezone обновлен для пользователя {user_id}: {tz_name}")
-                    else:
-                        logger.warning(f"⚠️ Не удалось получить timezone для координат ({lat}, {lng})")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при получении timezone: {e}")
-                session.commit()
+        await save_user_location(user_id, lat, lng)
 
-        logger.info(f"🔎 Поиск с координатами=({lat}, {lng}) радиус={radius}км источник={source}")
+        logger.info(
+            "🔎 perform_nearby_search: user_id=%s, coords=(%s, %s), radius=%sкм, source=%s",
+            user_id,
+            lat,
+            lng,
+            radius,
+            source,
+        )
 
         try:
-            from database import get_engine
             from utils.simple_timezone import get_city_from_coordinates
 
-            engine = get_engine()
-            events_service = UnifiedEventsService(engine)
+            events_service = AsyncUnifiedEventsService(get_async_engine(), snapshot=events_snapshot)
 
             city = get_city_from_coordinates(lat, lng)
             if not city:
@@ -2158,44 +1730,11 @@ async def perform_nearby_search(
             logger.debug("🌍 Поиск событий: координаты=(%s, %s), радиус=%s км, регион=%s", lat, lng, radius, city)
 
             # Только SELECT из БД; парсинг (BaliForum, KudaGo, AI) не вызывается — данные обновляются по расписанию.
-            events = events_service.search_events_today(city=city, user_lat=lat, user_lng=lng, radius_km=int(radius))
-
-            formatted_events = []
-            logger.debug("🕐 Получили %s событий из UnifiedEventsService", len(events))
-            for event in events:
-                formatted_event = {
-                    "id": event.get("id"),
-                    "title": event["title"],
-                    "title_en": event.get("title_en"),
-                    "description": event["description"],
-                    "description_en": event.get("description_en"),
-                    "time_local": event["starts_at"].strftime("%Y-%m-%d %H:%M") if event["starts_at"] else None,
-                    "starts_at": event["starts_at"],
-                    "ends_at": event.get("ends_at"),
-                    "time_mode": event.get("time_mode"),
-                    "city": event.get("city"),
-                    "location_name": event["location_name"],
-                    "location_name_en": event.get("location_name_en"),
-                    "location_url": event["location_url"],
-                    "lat": event["lat"],
-                    "lng": event["lng"],
-                    "source": event.get("source", ""),
-                    "source_type": event.get("source_type", ""),
-                    "url": event.get("event_url", ""),
-                    "community_name": event.get("community_name") or "",
-                    "community_link": event.get("community_link") or "",
-                    "venue_name": event.get("venue_name"),
-                    "address": event.get("address"),
-                    "organizer_id": event.get("organizer_id"),
-                    "organizer_username": event.get("organizer_username"),
-                    "tags": event.get("tags") or [],
-                    "raw_category": event.get("raw_category"),
-                    "place_id": event.get("place_id"),
-                    "categories": event.get("categories"),
-                }
-                formatted_events.append(formatted_event)
+            events = await events_service.search_events_today(
+                city=city, user_lat=lat, user_lng=lng, radius_km=int(radius)
+            )
 
-            events = sort_events_by_time(formatted_events)
+            events = sort_events_by_time(events)
             logger.debug("📅 События отсортированы по времени")
         except Exception:
             logger.exception("❌ Ошибка при поиске событий")
@@ -2278,17 +1817,20 @@ async def perform_nearby_search(
                 elif -9.0 <= lat <= -8.0 and 114.0 <= lng <= 116.0:
                     region = "bali"
 
-                user_state[message.chat.id] = {
-                    "prepared": [],
-                    "counts": {},
-                    "lat": lat,
-                    "lng": lng,
-                    "radius": current_radius,
-                    "page": 1,
-                    "date_filter": "today",
-                    "diag": diag,
-                    "region": region,
-                }
+                await user_state.set(
+                    message.chat.id,
+                    {
+                        "prepared": [],
+                        "counts": {},
+                        "lat": lat,
+                        "lng": lng,
+                        "radius": current_radius,
+                        "page": 1,
+                        "date_filter": "today",
+                        "diag": diag,
+                        "region": region,
+                    },
+                )
 
                 higher_options = [r for r in RADIUS_OPTIONS if r > current_radius]
                 suggested_radius = (
@@ -2317,17 +1859,19 @@ async def perform_nearby_search(
                 await state.clear()
                 return
 
-            update_user_state_timestamp(message.chat.id)
-            user_state[message.chat.id] = {
-                "prepared": prepared,
-                "counts": counts,
-                "lat": lat,
-                "lng": lng,
-                "radius": int(radius),
-                "page": 1,
-                "date_filter": "today",
-                "diag": diag,
-            }
+            await user_state.set(
+                message.chat.id,
+                {
+                    "prepared": prepared,
+                    "counts": counts,
+                    "lat": lat,
+                    "lng": lng,
+                    "radius": int(radius),
+                    "page": 1,
+                    "date_filter": "today",
+                    "diag": diag,
+                },
+            )
 
             header_html = render_header(counts, radius_km=int(radius), lang=user_lang)
             # Данные из БД уже с location_name (заполняется при ingest). Enrich в хендлере не вызываем.
@@ -2362,9 +1906,6 @@ async def perform_nearby_search(
             except Exception:
                 pass
 
-            engine = get_engine()
-            participation_analytics = UserParticipationAnalytics(engine)
-
             group_chat_id = None
             if message.chat.type != "private":
                 group_chat_id = message.chat.id
@@ -2382,7 +1923,7 @@ async def perform_nearby_search(
                     event_id,
                     group_chat_id,
                 )
-                participation_analytics.record_list_view(
+                participation_writer.record_list_view(
                     user_id=user_id,
                     event_id=event_id,
                     group_chat_id=group_chat_id,
@@ -2407,9 +1948,7 @@ async def perform_nearby_search(
                 del map_file
 
                 # Сохраняем message_id карты в состоянии для последующего редактирования
-                if message.chat.id in user_state:
-                    update_user_state_timestamp(message.chat.id)
-                    user_state[message.chat.id]["map_message_id"] = map_message.message_id
+                await user_state.update(message.chat.id, map_message_id=map_message.message_id)
 
                 # Отправляем список событий отдельным текстовым сообщением
                 list_message = await message.answer(
@@ -2420,9 +1959,7 @@ async def perform_nearby_search(
                 logger.debug("✅ Список событий отправлен отдельным сообщением (send_compact_events_list)")
 
                 # Сохраняем message_id списка событий в состоянии для последующего редактирования
-                if message.chat.id in user_state:
-                    update_user_state_timestamp(message.chat.id)
-                    user_state[message.chat.id]["list_message_id"] = list_message.message_id
+                await user_state.update(message.chat.id, list_message_id=list_message.message_id)
             else:
                 await message.answer(
                     short_caption,
@@ -2478,41 +2015,39 @@ def set_user_radius(user_id: int, radius_km: int, tg_user=None) -> None:
 
 
 # ---------- URL helpers ----------
-BLACKLIST_DOMAINS = {"example.com", "example.org", "example.net"}
-
-
-def sanitize_url(u: str | None) -> str | None:
-    """Фильтрует мусорные URL включая example.com"""
-    if not u:
-        return None
-    try:
-        p = urlparse(u)
-    except Exception:
-        return None
-    if p.scheme not in ("http", "https") or not p.netloc:
-        return None
-    host = p.netloc.lower()
-    if any(host == d or host.endswith("." + d) for d in BLACKLIST_DOMAINS):
-        return None
-    # Разрешаем Google Calendar ссылки с параметрами события
-    if "calendar.google.com" in host:
-        # Проверяем наличие параметров события
-        if any(param in u for param in ["eid=", "event=", "cid="]):
-            return u
-        # Отбрасываем пустые календарные ссылки
-        return None
-    return u
 
 
 # Инициализация базы данных
 init_engine(settings.database_url)
 create_all()
 
+# Состояние бота (результаты поиска по chat_id и FSM) хранится вне памяти процесса:
+# объем не зависит от числа пользователей, состояние переживает рестарты и деплои (utils/state_store.py).
+#
+# АРХИТЕКТУРНОЕ ПРАВИЛО:
+# - PostgreSQL (основные таблицы) является единственным источником правды (source of truth)
+# - user_state - временный кэш для UI/навигации с TTL, может быть очищен в любой момент
+# - ВАЖНО: Все критичные данные (события, пользователи) сохраняются в PostgreSQL СРАЗУ
+# - Порядок операций: 1) Сохранение в PostgreSQL, 2) Обновление user_state
+# - user_state.get() возвращает копию: изменения сохраняются только через user_state.set()/update()
+# - В user_state хранятся ТОЛЬКО простые типы: dict, list, int, str, float, datetime
+state_backend = create_state_backend(engine=get_engine())
+user_state = UserStateStore(state_backend)
+logger.info(f"💾 Хранилище состояния: {state_backend.name}")
+
+# Аналитика показов/кликов пишется пачками в фоне (запуск в main(), дозапись при остановке)
+participation_writer = ParticipationAnalyticsWriter(get_engine())
+
+# Регистрация пользователей: кэш недавно виденных + пакетный upsert (запуск в main(), дозапись при остановке)
+user_upserter = UserUpsertBatcher(get_engine())
+
 # Health check сервер будет запущен в main() вместе с webhook
 
 # Создание бота и диспетчера
 bot = Bot(token=settings.telegram_token)
-storage = MemoryStorage()
+# Все отправки сообщений — через общий планировщик с лимитами Telegram (utils/send_scheduler.py)
+install_send_scheduler(bot)
+storage = StateStoreFSMStorage(state_backend)
 dp = Dispatcher(storage=storage)
 
 # Кеш для bot_info (не меняется часто, можно кешировать)
@@ -2530,40 +2065,21 @@ class DuplicateCallbackMiddleware(BaseMiddleware):
     """Middleware для защиты от дублирования обработки callback_query"""
 
     def __init__(self):
-        # Храним обработанные callback_query ID (очищаем старые периодически)
-        self._processed_callbacks: set[str] = set()
-        # СНИЖЕНО для более агрессивной защиты от OOM
-        self._max_size = 5000  # Максимальное количество хранимых ID (было 10000)
+        # Обработанные callback_query ID: повторы Telegram приходят в пределах минут, храним час (LRU, 5000 ID)
+        self._processed_callbacks = TTLCache("processed_callbacks", maxsize=5000, ttl_s=3600)
 
     async def __call__(
         self, handler: Callable[[Any, dict[str, Any]], Awaitable[Any]], event: Any, data: dict[str, Any]
     ) -> Any:
-        # Проверяем только callback_query
-        if isinstance(event, types.CallbackQuery):
-            callback_id = event.id
-            if callback_id in self._processed_callbacks:
-                # Этот callback уже обработан - игнорируем
-                logger.warning(f"⚠️ Дублирование callback_query {callback_id}, пропускаем")
-                try:
-                    await event.answer("⏳ Уже обрабатывается...", show_alert=False)
-                except Exception:
-                    pass  # Игнорируем ошибки ответа
-                return  # Прерываем обработку
-
-            # Помечаем как обработанный
-            self._processed_callbacks.add(callback_id)
-
-            # Очищаем старые записи, если слишком много (in-place, без создания списка)
-            if len(self._processed_callbacks) > self._max_size:
-                # Удаляем первые 2500 элементов (старые записи) - более агрессивная очистка
-                # Используем итератор для более эффективной очистки
-                removed_count = 0
-                for item in list(self._processed_callbacks):  # Создаем список только один раз
-                    if removed_count >= 2500:  # Было 5000
-                        break
-                    self._processed_callbacks.discard(item)
-                    removed_count += 1
-                logger.debug(f"🧹 Очищено {removed_count} старых callback ID из _processed_callbacks")
+        # Проверяем только callback_query; add() — проверка и пометка одной операцией
+        if isinstance(event, types.CallbackQuery) and not self._processed_callbacks.add(event.id):
+            # Этот callback уже обработан - игнорируем
+            logger.warning(f"⚠️ Дублирование callback_query {event.id}, пропускаем")
+            try:
+                await event.answer("⏳ Уже обрабатывается...", show_alert=False)
+            except Exception:
+                pass  # Игнорируем ошибки ответа
+            return  # Прерываем обработку
 
         return await handler(event, data)
 
@@ -2581,30 +2097,26 @@ class BanCheckMiddleware(BaseMiddleware):
         elif hasattr(event, "message") and event.message and event.message.from_user:
             user_id = event.message.from_user.id
 
-        # Проверяем бан только для обычных пользователей (не админов)
-        if user_id:
-            from config import load_settings
-
-            settings = load_settings()
-            # Админы не проверяются на бан
-            if user_id not in settings.admin_ids:
-                from database import get_engine
-                from utils.ban_service import BanService
-
-                engine = get_engine()
-                ban_service = BanService(engine)
-                if ban_service.is_banned(user_id):
-                    # Пользователь забанен - не обрабатываем сообщение
-                    logger.info(f"🚫 Забаненный пользователь {user_id} попытался использовать бота")
-                    ban_msg = t("errors.banned", get_user_language_or_default(user_id))
-                    try:
-                        if hasattr(event, "answer"):
-                            await event.answer(ban_msg)
-                        elif hasattr(event, "message") and event.message:
-                            await event.message.answer(ban_msg)
-                    except Exception:
-                        pass  # Игнорируем ошибки отправки
-                    return  # Прерываем обработку
+        # Проверяем бан только для обычных пользователей (не админов);
+        # settings — модульный, ban_cache — в памяти: на обычном пути нет ни I/O, ни блокировок
+        if user_id and user_id not in settings.admin_ids:
+            if ban_cache.loaded:
+                banned = ban_cache.is_banned(user_id)
+            else:
+                # Кэш еще не загрузился (старт или недоступная БД) — прежняя проверка, но вне event loop
+                banned = await asyncio.to_thread(BanService(get_engine()).is_banned, user_id)
+            if banned:
+                # Пользователь забанен - не обрабатываем сообщение
+                logger.info(f"🚫 Забаненный пользователь {user_id} попытался использовать бота")
+                ban_msg = t("errors.banned", get_user_language_or_default(user_id))
+                try:
+                    if hasattr(event, "answer"):
+                        await event.answer(ban_msg)
+                    elif hasattr(event, "message") and event.message:
+                        await event.message.answer(ban_msg)
+                except Exception:
+                    pass  # Игнорируем ошибки отправки
+                return  # Прерываем обработку
 
         return await handler(event, data)
 
@@ -2646,7 +2158,7 @@ class EnsureUserMiddleware(BaseMiddleware):
             else _get_tg_user_from_event(event)
         )
         if tg_user:
-            asyncio.create_task(ensure_user_exists(tg_user.id, tg_user))
+            ensure_user_exists(tg_user.id, tg_user)
         return await handler(event, data)
 
 
@@ -2671,24 +2183,27 @@ class DbSessionMiddleware(BaseMiddleware):
 # Подключаем middleware для всех типов событий (если доступен async_session_maker)
 from database import async_session_maker  # noqa: E402
 
+# Трассировка апдейтов (/diag_slow, /metrics): внешняя — самой первой, middleware — через traced_middleware
+dp.update.outer_middleware(TracingMiddleware())
+
 # Подключаем middleware для проверки бана (должен быть первым)
 # Защита от дублирования callback_query (должен быть первым)
 duplicate_callback_middleware = DuplicateCallbackMiddleware()
-dp.update.middleware(duplicate_callback_middleware)
-dp.callback_query.middleware(duplicate_callback_middleware)
+dp.update.middleware(traced_middleware(duplicate_callback_middleware, "duplicate_callback"))
+dp.callback_query.middleware(traced_middleware(duplicate_callback_middleware, "duplicate_callback"))
 
 # Проверка бана пользователей
-dp.update.middleware(BanCheckMiddleware())
-dp.message.middleware(BanCheckMiddleware())
-dp.callback_query.middleware(BanCheckMiddleware())
+dp.update.middleware(traced_middleware(BanCheckMiddleware(), "ban_check"))
+dp.message.middleware(traced_middleware(BanCheckMiddleware(), "ban_check"))
+dp.callback_query.middleware(traced_middleware(BanCheckMiddleware(), "ban_check"))
 logging.info("✅ Ban check middleware подключен")
 
 # Регистрация пользователя при любом первом взаимодействии (ЛС и группы)
-dp.update.middleware(EnsureUserMiddleware())
+dp.update.middleware(traced_middleware(EnsureUserMiddleware(), "ensure_user"))
 logging.info("✅ EnsureUser middleware подключен")
 
 if async_session_maker is not None:
-    db_session_middleware = DbSessionMiddleware(async_session_maker)
+    db_session_middleware = traced_middleware(DbSessionMiddleware(async_session_maker), "db_session")
     dp.update.middleware(db_session_middleware)
     dp.message.middleware(db_session_middleware)
     dp.callback_query.middleware(db_session_middleware)
@@ -2715,6 +2230,11 @@ else:
         logging.error("❌ Async session middleware недоступен - требуется PostgreSQL и asyncpg")
         raise RuntimeError("PostgreSQL и asyncpg обязательны для работы бота")
 
+# Время хендлеров: inner-middleware последним, ближе всего к хендлеру (действует и во вложенных роутерах)
+handler_tracing_middleware = HandlerTracingMiddleware()
+for _observer in (dp.message, dp.edited_message, dp.callback_query, dp.my_chat_member, dp.chat_member):
+    _observer.middleware(handler_tracing_middleware)
+
 # BOT_ID для корректной фильтрации в групповых чатах
 BOT_ID: int = None
 
@@ -3548,28 +3068,10 @@ async def periodic_commands_update():
             await asyncio.sleep(300)  # При ошибке ждем 5 минут
 
 
-def _ensure_user_exists_sync(user_id: int, tg_user) -> None:
-    """Синхронная версия создания пользователя (для выполнения в отдельном потоке)"""
-    try:
-        with get_session() as session:
-            user = session.get(User, user_id)
-            if not user and tg_user:
-                user = User(
-                    id=user_id,
-                    username=tg_user.username,
-                    full_name=get_user_display_name(tg_user),
-                    default_radius_km=5,  # дефолтный радиус
-                )
-                session.add(user)
-                session.commit()
-                logger.info(f"Создан новый пользователь {user_id}")
-    except Exception as e:
-        logger.error(f"Ошибка создания пользователя {user_id}: {e}")
-
-
-async def ensure_user_exists(user_id: int, tg_user) -> None:
-    """Создаёт пользователя в БД если его нет (выполняется в отдельном потоке)"""
-    await asyncio.to_thread(_ensure_user_exists_sync, user_id, tg_user)
+def ensure_user_exists(user_id: int, tg_user) -> None:
+    """Регистрирует пользователя в users: без I/O, запись — пачкой в фоне (utils.user_upsert)"""
+    if tg_user:
+        user_upserter.observe(user_id, tg_user.username, get_user_display_name(tg_user))
 
 
 def kb_radius(current: int | None = None) -> InlineKeyboardMarkup:
@@ -3719,7 +3221,7 @@ async def cmd_start(message: types.Message, state: FSMContext, command: CommandO
         return
 
     # Создаем пользователя если его нет (в фоне, не ждём)
-    asyncio.create_task(ensure_user_exists(user_id, message.from_user))
+    ensure_user_exists(user_id, message.from_user)
 
     # Увеличиваем счетчик сессий (в фоне, не ждём)
     async def _update_analytics():
@@ -4067,6 +3569,7 @@ async def update_community_event_field_pm(event_id: int, field: str, value: str,
                     # Парсим дату и время (используем глобальный datetime из импортов)
                     dt = datetime.strptime(value.strip(), "%d.%m.%Y %H:%M")
                     event.starts_at = dt  # Сохраняем как naive datetime
+                    event.starts_at_utc = None  # Пересчитает планировщик напоминаний
                     logger.info(f"Обновлена дата/время события {event_id}: {dt}")
                 except ValueError:
                     logger.error(f"Неверный формат даты/времени для события {event_id}: {value}")
@@ -4080,6 +3583,7 @@ async def update_community_event_field_pm(event_id: int, field: str, value: str,
                 logger.info(f"Обновлено описание события {event_id}: '{value}'")
             elif field == "location_url":
                 event.location_url = value
+                event.starts_at_utc = None  # Часовой пояс определяется по ссылке
                 logger.info(f"Обновлен URL локации события {event_id}: '{value}'")
             else:
                 logger.error(f"Неизвестное поле для обновления: {field}")
@@ -5844,7 +5348,7 @@ async def on_start_menu_callback(callback: types.CallbackQuery, state: FSMContex
     user_id = callback.from_user.id
 
     # Создаем пользователя если его нет (в фоне, не ждём)
-    asyncio.create_task(ensure_user_exists(user_id, callback.from_user))
+    ensure_user_exists(user_id, callback.from_user)
 
     # Получаем язык пользователя
     user_lang = get_user_language_or_default(user_id)
@@ -6335,7 +5839,7 @@ async def on_location(message: types.Message, state: FSMContext):
 
     lat = message.location.latitude
     lng = message.location.longitude
-    date_filter = _reset_search_date_filter(message.chat.id)
+    date_filter = await _reset_search_date_filter(message.chat.id)
 
     # Логируем получение геолокации
     logger.debug(f"📍 Получена геолокация для событий: lat={lat} lon={lng} (источник=пользователь)")
@@ -6351,25 +5855,7 @@ async def on_location(message: types.Message, state: FSMContext):
     try:
         # Обновляем геолокацию пользователя и получаем его радиус
         radius = get_user_radius(message.from_user.id, settings.default_radius_km)
-        with get_session() as session:
-            user = session.get(User, message.from_user.id)
-            if user:
-                user.last_lat = lat
-                user.last_lng = lng
-                user.last_geo_at_utc = datetime.now(UTC)
-
-                # Получаем timezone по координатам и сохраняем
-                try:
-                    tz_name = await get_timezone(lat, lng)
-                    if tz_name:
-                        user.user_tz = tz_name
-                        logger.info(f"🕒 Timezone обновлен для пользователя {message.from_user.id}: {tz_name}")
-                    else:
-                        logger.warning(f"⚠️ Не удалось получить timezone для координат ({lat}, {lng})")
-                except Exception as e:
-                    logger.error(f"❌ Ошибка при получении timezone: {e}")
-
-                session.commit()
+        await save_user_location(message.from_user.id, lat, lng)
 
         # Логируем параметры поиска
         logger.debug(f"🔎 Поиск с координатами=({lat}, {lng}) радиус={radius}км источник=пользователь")
@@ -6378,12 +5864,10 @@ async def on_location(message: types.Message, state: FSMContext):
         try:
             logger.debug(f"🔍 Начинаем поиск событий для координат ({lat}, {lng}) с радиусом {radius} км")
 
-            # Используем новую упрощенную архитектуру
-            from database import get_engine
+            # Используем новую упрощенную архитектуру (async: не блокируем event loop)
             from utils.simple_timezone import get_city_from_coordinates
 
-            engine = get_engine()
-            events_service = UnifiedEventsService(engine)
+            events_service = AsyncUnifiedEventsService(get_async_engine(), snapshot=events_snapshot)
 
             # Определяем город по координатам (для временных границ)
             # Если город не определен, используем UTC для временных границ
@@ -6396,64 +5880,10 @@ async def on_location(message: types.Message, state: FSMContext):
             logger.debug("🌍 Поиск: координаты=(%s, %s), радиус=%s км, регион=%s", lat, lng, radius, city)
             logger.debug("🔍 SEARCH COORDS: lat=%s, lng=%s, radius=%s", lat, lng, radius)
             # Только SELECT из БД; парсинг (BaliForum, KudaGo, AI) по расписанию, не по запросу
-            events = events_service.search_events_today(city=city, user_lat=lat, user_lng=lng, radius_km=int(radius))
-
-            # Конвертируем в старый формат для совместимости
-            formatted_events = []
-            logger.debug("🕐 Получили %s событий из UnifiedEventsService", len(events))
-            for event in events:
-                starts_at_value = event.get("starts_at")
-                logger.debug(
-                    "🕐 ДО конвертации: %s - starts_at: %s", event.get("title", "")[:40], type(starts_at_value).__name__
-                )
-
-                formatted_event = {
-                    "id": event.get("id"),  # Добавляем id для отслеживания кликов
-                    "title": event["title"],
-                    "title_en": event.get("title_en"),  # для мультиязычности (render_event_html)
-                    "description": event["description"],
-                    "description_en": event.get("description_en"),
-                    "time_local": event["starts_at"].strftime("%Y-%m-%d %H:%M") if event["starts_at"] else None,
-                    "starts_at": event["starts_at"],  # Добавляем поле starts_at!
-                    "ends_at": event.get("ends_at"),
-                    "time_mode": event.get("time_mode"),
-                    "city": event.get("city"),  # Город события (может быть None)
-                    "location_name": event["location_name"],
-                    "location_name_en": event.get("location_name_en"),
-                    "location_url": event["location_url"],
-                    "lat": event["lat"],
-                    "lng": event["lng"],
-                    "source": event.get("source", ""),  # Сохраняем оригинальный source из БД
-                    "source_type": event.get("source_type", ""),  # Добавляем source_type отдельно
-                    "url": event.get("event_url", ""),
-                    "community_name": event.get("community_name") or "",
-                    "community_link": event.get("community_link") or "",
-                    "venue_name": event.get("venue_name"),
-                    "address": event.get("address"),
-                    # Добавляем поля автора для пользовательских событий
-                    "organizer_id": event.get("organizer_id"),
-                    "organizer_username": event.get("organizer_username"),
-                    "raw_category": event.get("raw_category"),
-                    "tags": event.get("tags") or [],
-                    "categories": event.get("categories"),
-                }
-
-                logger.debug(
-                    "🕐 ПОСЛЕ конвертации: %s - starts_at: %s",
-                    formatted_event.get("title", "")[:40],
-                    formatted_event.get("starts_at"),
-                )
-
-                # Логируем конвертацию для пользовательских событий
-                if event.get("source") == "user":
-                    logger.debug(
-                        f"🔍 CONVERT USER EVENT: title='{event.get('title')}', "
-                        f"organizer_id={event.get('organizer_id')} -> {formatted_event.get('organizer_id')}, "
-                        f"organizer_username='{event.get('organizer_username')}' -> '{formatted_event.get('organizer_username')}'"
-                    )
-                formatted_events.append(formatted_event)
+            events = await events_service.search_events_today(
+                city=city, user_lat=lat, user_lng=lng, radius_km=int(radius)
+            )
 
-            events = formatted_events
             logger.debug("✅ Поиск завершен, найдено %s событий", len(events))
         except Exception:
             logger.exception("❌ Ошибка при поиске событий")
@@ -6565,17 +5995,20 @@ async def on_location(message: types.Message, state: FSMContext):
                     region = "bali"
 
                 # Сохраняем состояние даже когда событий нет
-                user_state[message.chat.id] = {
-                    "prepared": [],
-                    "counts": {},
-                    "lat": lat,
-                    "lng": lng,
-                    "radius": int(current_radius),
-                    "page": 1,
-                    "date_filter": "today",
-                    "diag": diag,
-                    "region": region,
-                }
+                await user_state.set(
+                    message.chat.id,
+                    {
+                        "prepared": [],
+                        "counts": {},
+                        "lat": lat,
+                        "lng": lng,
+                        "radius": int(current_radius),
+                        "page": 1,
+                        "date_filter": "today",
+                        "diag": diag,
+                        "region": region,
+                    },
+                )
                 logger.info(
                     f"💾 Состояние сохранено для пользователя {message.chat.id}: lat={lat}, lng={lng}, radius={current_radius}, region={region}, date_filter=today"
                 )
@@ -6628,7 +6061,7 @@ async def on_location(message: types.Message, state: FSMContext):
                 "date_filter": "today",  # По умолчанию показываем события на сегодня
                 "diag": diag,
             }
-            user_state[message.chat.id] = state_dict
+            await user_state.set(message.chat.id, state_dict)
             logger.info(
                 f"💾 Состояние сохранено для пользователя {message.chat.id}: lat={lat}, lng={lng}, radius={radius}"
             )
@@ -6734,11 +6167,6 @@ async def on_location(message: types.Message, state: FSMContext):
                 logger.debug("🔍 page_size для первой страницы: %s событий", page_size)
 
                 # 4.5) Логируем показ событий в списке (list_view)
-                from database import get_engine
-
-                engine = get_engine()
-                participation_analytics = UserParticipationAnalytics(engine)
-
                 # Определяем group_chat_id (NULL для World, значение для Community)
                 group_chat_id = None
                 if message.chat.type != "private":
@@ -6755,7 +6183,7 @@ async def on_location(message: types.Message, state: FSMContext):
                             event_id,
                             group_chat_id,
                         )
-                        participation_analytics.record_list_view(
+                        participation_writer.record_list_view(
                             user_id=message.from_user.id,
                             event_id=event_id,
                             group_chat_id=group_chat_id,
@@ -6787,17 +6215,9 @@ async def on_location(message: types.Message, state: FSMContext):
                     logger.info("✅ Карта отправлена отдельным сообщением")
 
                     # Сохраняем message_id карты в состоянии для последующего редактирования
-                    if message.chat.id in user_state:
-                        user_state[message.chat.id]["map_message_id"] = map_message.message_id
-                        logger.info(
-                            f"🗺️ [ПЕРВЫЙ ПОИСК] map_message_id={map_message.message_id} сохранен в существующем состоянии"
-                        )
-                    else:
-                        # Если состояния еще нет, создаем его
-                        user_state[message.chat.id] = {"map_message_id": map_message.message_id}
-                        logger.info(
-                            f"🗺️ [ПЕРВЫЙ ПОИСК] map_message_id={map_message.message_id} сохранен в новом состоянии"
-                        )
+                    # Если состояния еще нет, создаем его
+                    await user_state.update(message.chat.id, create=True, map_message_id=map_message.message_id)
+                    logger.info(f"🗺️ [ПЕРВЫЙ ПОИСК] map_message_id={map_message.message_id} сохранен в состоянии")
 
                     # 7.2) Отправляем список событий отдельным текстовым сообщением
                     list_message = await message.answer(
@@ -6808,19 +6228,9 @@ async def on_location(message: types.Message, state: FSMContext):
                     logger.debug("✅ Список событий отправлен отдельным сообщением")
 
                     # Сохраняем message_id списка событий в состоянии для последующего редактирования
-                    if message.chat.id in user_state:
-                        user_state[message.chat.id]["list_message_id"] = list_message.message_id
-                        logger.info(
-                            f"📋 [ПЕРВЫЙ ПОИСК] list_message_id={list_message.message_id} сохранен в существующем состоянии"
-                        )
-                    else:
-                        # Если состояния еще нет, создаем его
-                        if not user_state.get(message.chat.id):
-                            user_state[message.chat.id] = {}
-                        user_state[message.chat.id]["list_message_id"] = list_message.message_id
-                        logger.info(
-                            f"📋 [ПЕРВЫЙ ПОИСК] list_message_id={list_message.message_id} сохранен в новом состоянии"
-                        )
+                    # Если состояния еще нет, создаем его
+                    await user_state.update(message.chat.id, create=True, list_message_id=list_message.message_id)
+                    logger.info(f"📋 [ПЕРВЫЙ ПОИСК] list_message_id={list_message.message_id} сохранен в состоянии")
                 else:
                     # Отправляем без карты, но с полным списком событий
                     list_message = await message.answer(
@@ -6831,16 +6241,8 @@ async def on_location(message: types.Message, state: FSMContext):
                     logger.debug("✅ События отправлены в одном сообщении без карты")
 
                     # Сохраняем message_id списка событий в состоянии для последующего редактирования
-                    if message.chat.id in user_state:
-                        user_state[message.chat.id]["list_message_id"] = list_message.message_id
-                        logger.info(f"📋 [ПЕРВЫЙ ПОИСК БЕЗ КАРТЫ] list_message_id={list_message.message_id} сохранен")
-                    else:
-                        if not user_state.get(message.chat.id):
-                            user_state[message.chat.id] = {}
-                        user_state[message.chat.id]["list_message_id"] = list_message.message_id
-                        logger.info(
-                            f"📋 [ПЕРВЫЙ ПОИСК БЕЗ КАРТЫ] list_message_id={list_message.message_id} сохранен в новом состоянии"
-                        )
+                    await user_state.update(message.chat.id, create=True, list_message_id=list_message.message_id)
+                    logger.info(f"📋 [ПЕРВЫЙ ПОИСК БЕЗ КАРТЫ] list_message_id={list_message.message_id} сохранен")
 
                 # Отправляем главное меню после объединенного сообщения
                 await send_spinning_menu(message)
@@ -7364,9 +6766,6 @@ async def on_services(message: types.Message):
 
 def is_admin_user(user_id: int) -> bool:
     """Проверяет, является ли пользователь админом"""
-    from config import load_settings
-
-    settings = load_settings()
     return user_id in settings.admin_ids
 
 
@@ -7796,13 +7195,34 @@ async def on_diag_commands(message: types.Message):
         await message.answer(format_translation("diag.commands_error", lang, error=str(e)))
 
 
+@main_router.message(Command("diag_slow"))
+async def on_diag_slow(message: types.Message, command: CommandObject):
+    """Самые медленные апдейты за окно трассировки с деревом span'ов (только для админов)"""
+    user_lang = get_user_language_or_default(message.from_user.id)
+    if not is_admin_user(message.from_user.id):
+        await message.answer(t("admin.permission.denied", user_lang))
+        return
+
+    limit = int(command.args) if command.args and command.args.strip().isdigit() else 5
+    traces = slow_updates.top(limit)
+    if not traces:
+        await message.answer("🐢 Медленных апдейтов за окно трассировки нет")
+        return
+
+    blocks = [f"#{rank} {format_trace(trace)}" for rank, trace in enumerate(traces, start=1)]
+    text = html.escape("\n\n".join(blocks))
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    await message.answer(f"🐢 <b>Медленные апдейты</b>\n<pre>{text}</pre>", parse_mode="HTML")
+
+
 @main_router.message(Command("diag_last"))
 async def on_diag_last(message: types.Message):
     """Обработчик команды /diag_last для диагностики последнего запроса"""
     user_lang = get_user_language_or_default(message.from_user.id)
     try:
         # Получаем состояние последнего запроса
-        state = user_state.get(message.chat.id)
+        state = await user_state.get(message.chat.id)
         if not state:
             await message.answer(t("search.no_last_request", user_lang))
             return
@@ -7984,7 +7404,7 @@ async def on_diag_search(message: types.Message):
     user_lang = get_user_language_or_default(message.from_user.id)
     try:
         # Получаем состояние последнего запроса
-        state = user_state.get(message.chat.id)
+        state = await user_state.get(message.chat.id)
         if not state:
             await message.answer(t("search.no_last_request", user_lang))
             return
@@ -8662,7 +8082,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
     logger.debug(f"🔍 handle_expand_radius: пользователь {user_id} расширяет радиус до {new_radius} км")
 
     # Получаем сохраненное состояние
-    state_data = user_state.get(chat_id)
+    state_data = await user_state.get(chat_id)
     if not state_data:
         await callback.answer(t("search.state_expired", get_user_language_or_default(callback.from_user.id)))
         return
@@ -8696,10 +8116,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
     current_message = callback.message  # Сохраняем ссылку на текущее сообщение
 
     # Выполняем поиск с новым радиусом
-    from database import get_engine
-
-    engine = get_engine()
-    events_service = UnifiedEventsService(engine)
+    events_service = AsyncUnifiedEventsService(get_async_engine(), snapshot=events_snapshot)
 
     # Получаем date_filter из состояния (по умолчанию "today")
     date_filter = state_data.get("date_filter", "today")
@@ -8707,7 +8124,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
 
     logger.debug(f"🔍 РАСШИРЕНИЕ РАДИУСА: radius={new_radius} км, date_filter={date_filter}, date_offset={date_offset}")
 
-    events = events_service.search_events_today(
+    events = await events_service.search_events_today(
         city=city,
         user_lat=lat,
         user_lng=lng,
@@ -8716,40 +8133,6 @@ async def handle_expand_radius(callback: types.CallbackQuery):
         message_id=f"{callback.message.message_id}",
     )
 
-    # Конвертируем в старый формат для совместимости (с полями _en для мультиязычности)
-    formatted_events = []
-    for event in events:
-        formatted_event = {
-            "id": event.get("id"),
-            "title": event["title"],
-            "title_en": event.get("title_en"),
-            "description": event["description"],
-            "description_en": event.get("description_en"),
-            "time_local": event["starts_at"].strftime("%Y-%m-%d %H:%M") if event["starts_at"] else None,
-            "starts_at": event["starts_at"],
-            "city": event.get("city"),  # Город события (может быть None)
-            "location_name": event["location_name"],
-            "location_name_en": event.get("location_name_en"),
-            "location_url": event["location_url"],
-            "lat": event["lat"],
-            "lng": event["lng"],
-            "source": event.get("source", ""),
-            "source_type": event.get("source_type", ""),
-            "url": event.get("event_url", ""),
-            "community_name": event.get("community_name") or "",
-            "community_link": event.get("community_link") or "",
-            "venue_name": event.get("venue_name"),
-            "address": event.get("address"),
-            "organizer_id": event.get("organizer_id"),
-            "organizer_username": event.get("organizer_username"),
-            "raw_category": event.get("raw_category"),
-            "tags": event.get("tags") or [],
-            "categories": event.get("categories"),
-        }
-        formatted_events.append(formatted_event)
-
-    events = formatted_events
-
     # Сортируем события по времени
     events = sort_events_by_time(events)
 
@@ -8840,20 +8223,22 @@ async def handle_expand_radius(callback: types.CallbackQuery):
     )
 
     # Обновляем состояние (сохраняем map_message_id и list_message_id для редактирования)
-    update_user_state_timestamp(chat_id)
-    user_state[chat_id] = {
-        "prepared": prepared,
-        "counts": counts,
-        "lat": lat,
-        "lng": lng,
-        "radius": new_radius,
-        "page": 1,
-        "date_filter": date_filter,  # Сохраняем текущий фильтр даты
-        "diag": {"kept": len(prepared), "dropped": 0, "reasons_top3": []},
-        "region": region,
-        "map_message_id": map_message_id,  # Сохраняем message_id карты для редактирования
-        "list_message_id": list_message_id,  # Сохраняем message_id списка событий для редактирования
-    }
+    await user_state.set(
+        chat_id,
+        {
+            "prepared": prepared,
+            "counts": counts,
+            "lat": lat,
+            "lng": lng,
+            "radius": new_radius,
+            "page": 1,
+            "date_filter": date_filter,  # Сохраняем текущий фильтр даты
+            "diag": {"kept": len(prepared), "dropped": 0, "reasons_top3": []},
+            "region": region,
+            "map_message_id": map_message_id,  # Сохраняем message_id карты для редактирования
+            "list_message_id": list_message_id,  # Сохраняем message_id списка событий для редактирования
+        },
+    )
     logger.info(
         f"✅ РАДИУС РАСШИРЕН: новый радиус={new_radius} км, найдено событий={len(prepared)}, "
         f"date_filter={date_filter}, map_message_id={map_message_id} сохранен в состоянии"
@@ -8944,7 +8329,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                         parse_mode="HTML",
                     )
                     # Обновляем message_id в состоянии
-                    user_state[chat_id]["map_message_id"] = new_map_msg.message_id
+                    await user_state.update(chat_id, map_message_id=new_map_msg.message_id)
                     logger.info("✅ Создана новая карта (не удалось отредактировать)")
             else:
                 # Если карты еще не было, создаем новое сообщение
@@ -8954,7 +8339,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                     parse_mode="HTML",
                 )
                 # Сохраняем message_id карты в состоянии
-                user_state[chat_id]["map_message_id"] = new_map_msg.message_id
+                await user_state.update(chat_id, map_message_id=new_map_msg.message_id)
                 logger.info("✅ Карта создана (первый раз)")
 
             # Редактируем существующее сообщение со списком событий или создаем новое
@@ -8985,8 +8370,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                         parse_mode="HTML",
                     )
                     # Обновляем message_id в состоянии
-                    update_user_state_timestamp(chat_id)
-                    user_state[chat_id]["list_message_id"] = new_msg.message_id
+                    await user_state.update(chat_id, list_message_id=new_msg.message_id)
                     logger.info("✅ Создан новый список событий (не удалось отредактировать)")
                     current_message = new_msg
             else:
@@ -8997,7 +8381,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                     parse_mode="HTML",
                 )
                 # Сохраняем message_id списка в состоянии
-                user_state[chat_id]["list_message_id"] = new_msg.message_id
+                await user_state.update(chat_id, list_message_id=new_msg.message_id)
                 logger.info("✅ Список событий создан (первый раз)")
                 current_message = new_msg
         else:
@@ -9028,8 +8412,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                         parse_mode="HTML",
                     )
                     # Обновляем message_id в состоянии
-                    update_user_state_timestamp(chat_id)
-                    user_state[chat_id]["list_message_id"] = new_msg.message_id
+                    await user_state.update(chat_id, list_message_id=new_msg.message_id)
                     logger.info("✅ Создан новый список событий (не удалось отредактировать)")
             else:
                 # Если списка еще не было, создаем новое сообщение
@@ -9039,7 +8422,7 @@ async def handle_expand_radius(callback: types.CallbackQuery):
                     parse_mode="HTML",
                 )
                 # Сохраняем message_id списка в состоянии
-                user_state[chat_id]["list_message_id"] = new_msg.message_id
+                await user_state.update(chat_id, list_message_id=new_msg.message_id)
                 logger.info("✅ Список событий создан (первый раз, без карты)")
     except Exception as e:
         logger.error(f"❌ Ошибка отправки результатов расширенного поиска: {e}")
@@ -9204,7 +8587,7 @@ def _render_partner_pick_line(review_url: str | None, lang: str) -> str:
     return f'<a href="{html.escape(review_url, quote=True)}">{review_text}</a>'
 
 
-_GOOGLE_SHORT_URL_CACHE: dict[str, str | None] = {}
+_GOOGLE_SHORT_URL_CACHE = TTLCache("google_short_urls", maxsize=2000, ttl_s=86400)
 
 
 def _expand_google_maps_short_url(url: str) -> str | None:
@@ -9219,7 +8602,8 @@ def _expand_google_maps_short_url(url: str) -> str | None:
     except Exception:
         final_url = None
 
-    _GOOGLE_SHORT_URL_CACHE[url] = final_url
+    if final_url:
+        _GOOGLE_SHORT_URL_CACHE.set(url, final_url)
     return final_url
 
 
@@ -12116,7 +11500,7 @@ async def handle_date_filter_change(callback: types.CallbackQuery):
         date_type = callback.data.split(":")[1]  # "today" или "tomorrow"
 
         # Получаем сохраненное состояние
-        state = user_state.get(callback.message.chat.id)
+        state = await user_state.get(callback.message.chat.id)
         if not state:
             logger.warning(f"Состояние не найдено для пользователя {callback.message.chat.id}")
             user_lang = get_user_language_or_default(callback.from_user.id)
@@ -12173,10 +11557,7 @@ async def handle_date_filter_change(callback: types.CallbackQuery):
         date_offset = 0 if date_type == "today" else 1
 
         # Перезагружаем события с новым фильтром
-        from database import get_engine
-
-        engine = get_engine()
-        events_service = UnifiedEventsService(engine)
+        events_service = AsyncUnifiedEventsService(get_async_engine(), snapshot=events_snapshot)
 
         logger.info(
             f"🔄 Переключение фильтра даты: {current_filter} → {date_type} "
@@ -12184,7 +11565,7 @@ async def handle_date_filter_change(callback: types.CallbackQuery):
             f"radius={radius} км из состояния"
         )
 
-        events = events_service.search_events_today(
+        events = await events_service.search_events_today(
             city=city, user_lat=lat, user_lng=lng, radius_km=int(radius), date_offset=date_offset
         )
 
@@ -12193,40 +11574,6 @@ async def handle_date_filter_change(callback: types.CallbackQuery):
             f"date_offset={date_offset}"
         )
 
-        # Конвертируем в старый формат для совместимости (с полями _en для мультиязычности)
-        formatted_events = []
-        for event in events:
-            formatted_event = {
-                "id": event.get("id"),
-                "title": event["title"],
-                "title_en": event.get("title_en"),
-                "description": event["description"],
-                "description_en": event.get("description_en"),
-                "time_local": event["starts_at"].strftime("%Y-%m-%d %H:%M") if event["starts_at"] else None,
-                "starts_at": event["starts_at"],
-                "city": event.get("city"),
-                "location_name": event["location_name"],
-                "location_name_en": event.get("location_name_en"),
-                "location_url": event["location_url"],
-                "lat": event["lat"],
-                "lng": event["lng"],
-                "source": event.get("source", ""),
-                "source_type": event.get("source_type", ""),
-                "url": event.get("event_url", ""),
-                "community_name": event.get("community_name") or "",
-                "community_link": event.get("community_link") or "",
-                "venue_name": event.get("venue_name"),
-                "address": event.get("address"),
-                "organizer_id": event.get("organizer_id"),
-                "organizer_username": event.get("organizer_username"),
-                "raw_category": event.get("raw_category"),
-                "tags": event.get("tags") or [],
-                "categories": event.get("categories"),
-            }
-            formatted_events.append(formatted_event)
-
-        events = formatted_events
-
         # Сортируем события по времени
         events = sort_events_by_time(events)
 
@@ -12253,7 +11600,7 @@ async def handle_date_filter_change(callback: types.CallbackQuery):
         state["radius"] = int(radius)  # Сохраняем текущий радиус
         state["page"] = 1  # Сбрасываем страницу на 1
         state["diag"] = diag
-        user_state[callback.message.chat.id] = state
+        await user_state.set(callback.message.chat.id, state)
 
         # Рендерим первую страницу
         # ВАЖНО: Карта показывается только на первой странице
@@ -12375,7 +11722,7 @@ async def handle_pagination(callback: types.CallbackQuery):
         page = int(token)
 
         # Получаем сохраненное состояние
-        state = user_state.get(callback.message.chat.id)
+        state = await user_state.get(callback.message.chat.id)
         if not state:
             logger.warning(f"Состояние не найдено для пользователя {callback.message.chat.id}")
             await callback.answer(t("pager.state_not_found", user_lang))
@@ -12429,11 +11776,6 @@ async def handle_pagination(callback: types.CallbackQuery):
         )
 
         # Логируем показ событий в списке при пагинации (list_view)
-        from database import get_engine
-
-        engine = get_engine()
-        participation_analytics = UserParticipationAnalytics(engine)
-
         # Определяем group_chat_id (NULL для World, значение для Community)
         group_chat_id = None
         if callback.message.chat.type != "private":
@@ -12447,7 +11789,7 @@ async def handle_pagination(callback: types.CallbackQuery):
         for event in shown_events:
             event_id = event.get("id")
             if event_id:
-                participation_analytics.record_list_view(
+                participation_writer.record_list_view(
                     user_id=callback.from_user.id,
                     event_id=event_id,
                     group_chat_id=group_chat_id,
@@ -12520,7 +11862,7 @@ async def handle_pagination(callback: types.CallbackQuery):
 
         # Обновляем состояние
         state["page"] = page
-        user_state[callback.message.chat.id] = state
+        await user_state.set(callback.message.chat.id, state)
 
         await callback.answer()
 
@@ -12689,10 +12031,20 @@ async def main():
 
         # Добавляем health check endpoint СРАЗУ
         async def health_check_early(request):
-            return web.json_response({"ok": True, "status": "starting"})
+            return web.json_response(
+                {
+                    "ok": True,
+                    "status": "starting",
+                    "events_snapshot": events_snapshot.stats(),
+                    "geo_cache": geo_cache.stats(),
+                    "translation": translation_service.stats(),
+                    "upstreams": upstream_stats(),
+                }
+            )
 
         webhook_app.router.add_get("/health", health_check_early)
         webhook_app.router.add_get("/", health_check_early)
+        webhook_app.router.add_get("/metrics", aiohttp_metrics_handler)
 
         # Запускаем сервер СРАЗУ для health check
         webhook_runner = web.AppRunner(webhook_app)
@@ -12723,27 +12075,30 @@ async def main():
 
         logger.error(f"❌ Детали ошибки: {traceback.format_exc()}")
 
+    # Запускаем фоновую запись аналитики (list_view, click_source, click_route)
+    participation_writer.start()
+    user_upserter.start()
+
+    # Кэш банов: первая загрузка, периодическая сверка и LISTEN на изменения
+    await ban_cache.start(get_engine())
+
+    # Реестр админов групп: начальная загрузка из chat_settings и фоновое обновление
+    await chat_admins.start(bot)
+
     # Запускаем фоновую задачу для периодической очистки user_state
     asyncio.create_task(periodic_cleanup_user_state())
     logger.info("✅ Запущена фоновая задача для очистки user_state")
 
-    # Вызываем очистку вручную при старте, чтобы удалить накопившиеся данные
+    # Удаляем состояние, просроченное пока бот был остановлен
     try:
-        cleanup_user_state()
-        cleanup_large_prepared_events()
-        log_memory_stats()  # Логируем начальное состояние памяти
-        logger.info(f"🧹 При старте очищено user_state: осталось {len(user_state)} записей")
+        removed = await asyncio.to_thread(state_backend.purge_expired)
+        await asyncio.to_thread(log_memory_stats)  # Логируем начальное состояние памяти
+        logger.info(f"🧹 При старте удалено просроченных записей состояния: {removed}")
     except Exception as e:
         logger.error(f"Ошибка при очистке user_state при старте: {e}")
 
-    # Восстанавливаем автоудаление сообщений после перезапуска
-    try:
-        from utils.messaging_utils import restore_auto_delete_on_startup
-
-        asyncio.create_task(restore_auto_delete_on_startup(bot))
-        logger.info("✅ Запущено восстановление автоудаления сообщений после перезапуска")
-    except Exception as e:
-        logger.error(f"❌ Ошибка при восстановлении автоудаления: {e}")
+    # Автоудаление сообщений в группах; первая сверка с bot_messages восстанавливает очередь после перезапуска
+    auto_deleter.start(bot)
 
     # Запускаем фоновую задачу для очистки моментов
     from config import load_settings
@@ -12814,6 +12169,7 @@ async def main():
             types.BotCommand(command="diag_search", description="🔍 Диагностика поиска событий"),
             types.BotCommand(command="diag_webhook", description="🔗 Диагностика webhook"),
             types.BotCommand(command="diag_commands", description="🔧 Диагностика команд бота"),
+            types.BotCommand(command="diag_slow", description="🐢 Медленные апдейты (трассировка)"),
         ]
 
         # Используем эталонную функцию установки команд
@@ -13004,7 +12360,16 @@ async def main():
 
             # Обновляем health check endpoint (если был ранний, обновляем на готовый)
             async def health_check_ready(request):
-                return web.json_response({"ok": True, "status": "ready"})
+                return web.json_response(
+                    {
+                        "ok": True,
+                        "status": "ready",
+                        "events_snapshot": events_snapshot.stats(),
+                        "geo_cache": geo_cache.stats(),
+                        "translation": translation_service.stats(),
+                        "upstreams": upstream_stats(),
+                    }
+                )
 
             # Удаляем старый health check если был, и добавляем новый
             # Удаляем маршруты которые могут конфликтовать
@@ -13021,6 +12386,8 @@ async def main():
 
             app.router.add_get("/health", health_check_ready)
             app.router.add_get("/", health_check_ready)
+            if not server_already_running:
+                app.router.add_get("/metrics", aiohttp_metrics_handler)
 
             # Добавляем API endpoint для отслеживания кликов
             async def track_click(request):
@@ -13028,9 +12395,6 @@ async def main():
                 try:
                     from urllib.parse import unquote
 
-                    from database import get_engine
-                    from utils.user_participation_analytics import UserParticipationAnalytics
-
                     # Получаем параметры из query string
                     user_id = int(request.query.get("user_id", 0))
                     event_id = int(request.query.get("event_id", 0))
@@ -13052,15 +12416,12 @@ async def main():
 
                     # Валидация click_type
                     if click_type in ["source", "route"]:
-                        # Логируем клик в базу данных
-                        engine = get_engine()
-                        analytics = UserParticipationAnalytics(engine)
-
+                        # Логируем клик в базу данных (в фоне, пачкой)
                         if click_type == "source":
-                            analytics.record_click_source(user_id, event_id)
+                            participation_writer.record_click_source(user_id, event_id)
                             logger.info(f"✅ Записан click_source: user_id={user_id}, event_id={event_id}")
                         elif click_type == "route":
-                            analytics.record_click_route(user_id, event_id)
+                            participation_writer.record_click_route(user_id, event_id)
                             logger.info(f"✅ Записан click_route: user_id={user_id}, event_id={event_id}")
 
                     # Редиректим на оригинальный URL
@@ -13106,7 +12467,8 @@ async def main():
 
             # ТЕПЕРЬ устанавливаем webhook после запуска сервера
             try:
-                await bot.set_webhook(url=WEBHOOK_URL)
+                # chat_member не приходит по умолчанию — нужен для реестра админов групп
+                await bot.set_webhook(url=WEBHOOK_URL, allowed_updates=dp.resolve_used_update_types())
                 logger.info(f"Webhook установлен: {WEBHOOK_URL}")
             except Exception as e:
                 logger.error(f"Ошибка установки webhook: {e}")
@@ -13145,6 +12507,31 @@ async def main():
     except KeyboardInterrupt:
         logger.info("Остановлено пользователем (KeyboardInterrupt).")
     finally:
+        # Дописываем накопленную аналитику до закрытия соединений
+        try:
+            await participation_writer.close()
+        except Exception as e:
+            logger.error(f"Ошибка дозаписи аналитики при остановке: {e}")
+        try:
+            await close_google_http()
+        except Exception:
+            pass
+        try:
+            await user_upserter.close()
+        except Exception as e:
+            logger.error(f"Ошибка дозаписи пользователей при остановке: {e}")
+        try:
+            await ban_cache.close()
+        except Exception:
+            pass
+        try:
+            await auto_deleter.close()
+        except Exception:
+            pass
+        try:
+            await chat_admins.close()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения админов чатов при остановке: {e}")
         # Закрыть сетевые коннекторы аккуратно
         try:
             await dp.storage.close()
@@ -60,3 +60,20 @@ except Exception as e:
     import traceback
 
     traceback.print_exc()
+
+# Последние запуски по всем репликам (бот и workers/scheduler.py) — из таблицы scheduler_jobs
+try:
+    from utils.job_leases import job_leases
+
+    print("\nПоследние запуски задач (scheduler_jobs):")
+    for row in job_leases.status():
+        lease = f" | выполняет {row['lease_owner']} до {row['lease_until']}" if row["lease_owner"] else ""
+        duration = f"{row['last_duration_s']:.1f} с" if row["last_duration_s"] is not None else "—"
+        print(
+            f"  {row['job_id']}: {row['last_status'] or 'не запускалась'} ({duration}) "
+            f"| старт {row['last_started_at']} | запусков {row['run_count']}, с ошибками {row['fail_count']}{lease}"
+        )
+        if row["last_error"]:
+            print(f"     последняя ошибка: {row['last_error'][:200]}")
+except Exception as e:
+    print(f"❌ Не удалось прочитать scheduler_jobs (миграция 061 применена?): {e}")
@@ -12,16 +12,21 @@ from sqlalchemy import (
     ForeignKey,
     Integer,
     MetaData,
+    SmallInteger,
     String,
     Text,
+    UniqueConstraint,
     create_engine,
     func,
     text,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column, sessionmaker
 
+from utils.metrics import instrument_engine
+
 convention = {
     "ix": "ix_%(column_0_label)s",
     "uq": "uq_%(table_name)s_%(column_0_name)s",
@@ -239,6 +244,9 @@ class CommunityEvent(Base):
     starts_at: Mapped[DateTime] = mapped_column(
         DateTime(timezone=False), nullable=False, index=True
     )  # БЕЗ timezone для Community - сохраняем как указал пользователь
+    starts_at_utc: Mapped[DateTime | None] = mapped_column(
+        DateTime(timezone=True)
+    )  # starts_at в UTC для напоминаний; NULL — еще не посчитан (новое/отредактированное событие)
     city: Mapped[str | None] = mapped_column(String(64))
     location_name: Mapped[str | None] = mapped_column(String(255))
     location_url: Mapped[str | None] = mapped_column(Text)
@@ -304,6 +312,81 @@ class ChatSettings(Base):
     )  # Язык группы: ru, en
 
 
+class BotState(Base):
+    """Состояние бота вне памяти процесса: user_state и FSM (utils/state_store.py)"""
+
+    __tablename__ = "bot_state"
+
+    namespace: Mapped[str] = mapped_column(Text, primary_key=True)  # user_state, fsm
+    state_key: Mapped[str] = mapped_column(Text, primary_key=True)  # chat_id или ключ FSM
+    data: Mapped[dict] = mapped_column(JSON().with_variant(JSONB(), "postgresql"), nullable=False)  # значение
+    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+    updated_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class TranslationJob(Base):
+    """Задание на перевод события (utils/translation_service.py)"""
+
+    __tablename__ = "translation_jobs"
+    __table_args__ = (UniqueConstraint("target_table", "target_id"),)
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    target_table: Mapped[str] = mapped_column(String(32), nullable=False)  # events, events_community
+    target_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    priority: Mapped[int] = mapped_column(SmallInteger, nullable=False, server_default=text("1"))  # 0 user, 1 parser
+    status: Mapped[str] = mapped_column(String(16), nullable=False, server_default=text("'pending'"))
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    available_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_until: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True))
+    last_error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class TranslationMemory(Base):
+    """Память переводов: sha256 исходного текста -> перевод (utils/translation_service.py)"""
+
+    __tablename__ = "translation_memory"
+
+    target_lang: Mapped[str] = mapped_column(String(5), primary_key=True)  # en, ru
+    source_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    translated_text: Mapped[str] = mapped_column(Text, nullable=False)
+    hits: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text("0"))
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_used_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+class SchedulerJob(Base):
+    """Аренда задачи планировщика и итог ее последнего запуска (utils/job_leases.py)"""
+
+    __tablename__ = "scheduler_jobs"
+
+    job_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    lease_owner: Mapped[str | None] = mapped_column(String(128))  # host:pid процесса, выполняющего задачу
+    lease_until: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True))
+    last_started_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True))
+    last_finished_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True))
+    last_duration_s: Mapped[float | None] = mapped_column(Float)
+    last_status: Mapped[str | None] = mapped_column(String(16))  # ok, errors, failed
+    last_error: Mapped[str | None] = mapped_column(Text)
+    run_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+    fail_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default=text("0"))
+
+
+class SchedulerJobRun(Base):
+    """История запусков задач планировщика (utils/job_leases.py)"""
+
+    __tablename__ = "scheduler_job_runs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_id: Mapped[str] = mapped_column(String(64), nullable=False)
+    owner: Mapped[str] = mapped_column(String(128), nullable=False)
+    started_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    finished_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    duration_s: Mapped[float] = mapped_column(Float, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False)
+    error: Mapped[str | None] = mapped_column(Text)
+
+
 engine: Engine | None = None
 Session: sessionmaker | None = None
 async_engine = None
@@ -320,7 +403,9 @@ def make_engine(database_url: str) -> Engine:
         database_url = database_url.replace("postgresql://", "postgresql+psycopg2://", 1)
     elif database_url.startswith("postgres://"):
         database_url = database_url.replace("postgres://", "postgresql+psycopg2://", 1)
-    return create_engine(database_url, future=True, pool_pre_ping=True)
+    sync_engine = create_engine(database_url, future=True, pool_pre_ping=True)
+    instrument_engine(sync_engine)
+    return sync_engine
 
 
 def make_async_engine(database_url: str):
@@ -342,7 +427,9 @@ def make_async_engine(database_url: str):
         else:
             connect_args = {}
 
-        return create_async_engine(async_url, future=True, pool_pre_ping=True, connect_args=connect_args)
+        aio_engine = create_async_engine(async_url, future=True, pool_pre_ping=True, connect_args=connect_args)
+        instrument_engine(aio_engine)
+        return aio_engine
     except ImportError:
         logging.warning("asyncpg не установлен, async engine недоступен")
         return None
@@ -360,6 +447,7 @@ def _ensure_events_community_en_columns() -> None:
     statements = [
         ("events_community", "ALTER TABLE events_community ADD COLUMN IF NOT EXISTS title_en TEXT"),
         ("events_community", "ALTER TABLE events_community ADD COLUMN IF NOT EXISTS description_en TEXT"),
+        ("events_community", "ALTER TABLE events_community ADD COLUMN IF NOT EXISTS starts_at_utc TIMESTAMPTZ"),
         (
             "events_community_archive",
             "ALTER TABLE events_community_archive ADD COLUMN IF NOT EXISTS title_en TEXT",
@@ -463,6 +551,13 @@ def get_engine() -> Engine:
     return engine
 
 
+def get_async_engine():
+    """Возвращает глобальный async engine (asyncpg)"""
+    if async_engine is None:
+        raise RuntimeError("Async engine not initialized. Call init_engine() first.")
+    return async_engine
+
+
 def get_session():
     assert Session is not None
     return Session()
@@ -7,6 +7,8 @@ from threading import Lock
 
 import googlemaps
 
+from utils.cache import TTLCache
+
 log = logging.getLogger(__name__)
 
 API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
@@ -51,43 +53,16 @@ def _stable_key(*parts: str) -> str:
 
 
 # --- Кэш уровня процесса с TTL ------------------------------------------------
-# lru_cache не умеет TTL — добавим простую прослойку
-_cache = {}
-_cache_lock = Lock()
-# ОГРАНИЧЕНИЕ РАЗМЕРА КЭША для защиты от OOM
-_MAX_CACHE_SIZE = 1000  # Максимум 1000 записей в кэше
+# ОГРАНИЧЕНИЕ РАЗМЕРА КЭША для защиты от OOM: максимум 1000 записей (LRU)
+_cache = TTLCache("geocode", maxsize=1000, ttl_s=CACHE_TTL_S)
 
 
 def _cache_get(k: str):
-    with _cache_lock:
-        v = _cache.get(k)
-        if not v:
-            return None
-        value, ts = v
-        if (time.time() - ts) > CACHE_TTL_S:
-            _cache.pop(k, None)
-            return None
-        return value
+    return _cache.get(k)
 
 
 def _cache_set(k: str, value):
-    with _cache_lock:
-        # Очистка устаревших записей при превышении размера
-        if len(_cache) >= _MAX_CACHE_SIZE:
-            # Удаляем самые старые записи (по timestamp)
-            current_time = time.time()
-            expired_keys = [key for key, (_, ts) in _cache.items() if (current_time - ts) > CACHE_TTL_S]
-            for key in expired_keys:
-                _cache.pop(key, None)
-
-            # Если все еще слишком много, удаляем 50% самых старых
-            if len(_cache) >= _MAX_CACHE_SIZE:
-                sorted_items = sorted(_cache.items(), key=lambda x: x[1][1])  # Сортируем по timestamp
-                to_remove = len(_cache) - _MAX_CACHE_SIZE // 2
-                for key, _ in sorted_items[:to_remove]:
-                    _cache.pop(key, None)
-
-        _cache[k] = (value, time.time())
+    _cache.set(k, value)
 
 
 # --- Публичные функции --------------------------------------------------------
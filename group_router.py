@@ -25,6 +25,8 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import BotMessage, CommunityEvent
+from utils.auto_delete import auto_deleter
+from utils.chat_admins import chat_admins
 from utils.i18n import format_translation, get_bot_username, t
 from utils.messaging_utils import delete_all_tracked, is_chat_admin
 from utils.sync_community_world_events import sync_community_event_to_world
@@ -253,12 +255,8 @@ async def test_autodelete(message: Message, bot: Bot, session: AsyncSession):
             tag="service",
         )
 
-        # Запускаем автоудаление через 10 секунд для теста
-        import asyncio
-
-        from utils.messaging_utils import auto_delete_message
-
-        asyncio.create_task(auto_delete_message(bot, message.chat.id, test_msg.message_id, 10))
+        # Переносим автоудаление на 10 секунд для теста
+        auto_deleter.schedule(message.chat.id, test_msg.message_id, 10)
 
         await message.answer(t("group.test_autodelete_ok", lang))
 
@@ -972,12 +970,11 @@ async def handle_start_command(message: Message, bot: Bot, session: AsyncSession
                 )
                 # Трекаем и запускаем автоудаление (как в send_tracked), иначе панель не удалится сама
                 from database import BotMessage
-                from utils.messaging_utils import auto_delete_message
 
                 bot_msg = BotMessage(chat_id=message.chat.id, message_id=panel_msg.message_id, tag="panel")
                 session.add(bot_msg)
                 await session.commit()
-                asyncio.create_task(auto_delete_message(bot, message.chat.id, panel_msg.message_id, 120))
+                auto_deleter.schedule(message.chat.id, panel_msg.message_id)
                 logger.info(f"✅ Панель отправлена fallback и трекируется с автоудалением в чате {message.chat.id}")
             except Exception as fallback_error:
                 if "TOPIC_CLOSED" in str(fallback_error):
@@ -1190,6 +1187,8 @@ group_router.callback_query.filter(F.message.chat.type.in_({"group", "supergroup
 @group_router.my_chat_member(F.chat.type.in_({"group", "supergroup", "channel"}))
 async def handle_group_bot_member(update: ChatMemberUpdated, bot: Bot, session: AsyncSession):
     """Регистрация chat_settings при любом активном статусе бота в группе/канале."""
+    chat_admins.apply_member_update(update, bot.id)  # бота удалили — забываем админов чата
+    auto_deleter.forget_chat(update.chat.id)
     new_status = update.new_chat_member.status
     if new_status not in ("administrator", "member"):
         return
@@ -1235,6 +1234,12 @@ async def handle_group_bot_member(update: ChatMemberUpdated, bot: Bot, session:
         )
 
 
+@group_router.chat_member(F.chat.type.in_({"group", "supergroup"}))
+async def handle_group_member_update(update: ChatMemberUpdated, bot: Bot):
+    """Назначение/снятие админов: обновляем реестр chat_admins без запроса в Telegram."""
+    chat_admins.apply_member_update(update, bot.id)
+
+
 # ПРИНУДИТЕЛЬНАЯ КЛАВИАТУРА ДЛЯ ВСЕХ СООБЩЕНИЙ В ГРУППЕ
 # УБРАНО: force_keyboard_for_all_messages - больше не принудительно добавляем клавиатуру к каждому сообщению
 
@@ -1374,10 +1379,7 @@ async def handle_new_members(message: Message, bot: Bot, session: AsyncSession):
         else:
             # Если from_user недоступен или это бот, пробуем получить первого админа
             try:
-                from utils.community_events_service import CommunityEventsService
-
-                community_service = CommunityEventsService()
-                admin_ids = await community_service.get_cached_admin_ids(bot, message.chat.id)
+                admin_ids = await chat_admins.get_admin_ids(bot, message.chat.id)
                 if admin_ids:
                     adder_user_id = admin_ids[0]  # Берем первого админа
                     logger.info(f"🎯 Определен пользователь, добавивший бота: {adder_user_id} (первый админ)")
@@ -1406,10 +1408,7 @@ async def handle_new_members(message: Message, bot: Bot, session: AsyncSession):
                 admin_ids = []
                 admin_count = 0
                 try:
-                    from utils.community_events_service import CommunityEventsService
-
-                    community_service = CommunityEventsService()
-                    admin_ids = await community_service.get_cached_admin_ids(bot, message.chat.id)
+                    admin_ids = await chat_admins.get_admin_ids(bot, message.chat.id)
                     admin_count = len(admin_ids)
                     logger.info(f"✅ Получены админы для нового чата {message.chat.id}: count={admin_count}")
                 except Exception as e:
@@ -1459,10 +1458,7 @@ async def handle_new_members(message: Message, bot: Bot, session: AsyncSession):
 
                 # Обновляем админов
                 try:
-                    from utils.community_events_service import CommunityEventsService
-
-                    community_service = CommunityEventsService()
-                    admin_ids = await community_service.get_cached_admin_ids(bot, message.chat.id)
+                    admin_ids = await chat_admins.get_admin_ids(bot, message.chat.id)
                     admin_count = len(admin_ids)
                     settings.admin_ids = json.dumps(admin_ids) if admin_ids else None
                     settings.admin_count = admin_count
@@ -1937,12 +1933,9 @@ async def group_list_events_page(callback: CallbackQuery, bot: Bot, session: Asy
                 logger.info("✅ Список событий успешно обновлен")
 
                 # Убеждаемся, что отредактированное сообщение трекируется и будет автоудалено
-                import asyncio
-
                 from sqlalchemy import select
 
                 from database import BotMessage
-                from utils.messaging_utils import auto_delete_message
 
                 # Проверяем, есть ли уже запись в БД
                 result = await session.execute(
@@ -1967,25 +1960,9 @@ async def group_list_events_page(callback: CallbackQuery, bot: Bot, session: Asy
                         f"добавлено в трекинг для автоудаления"
                     )
 
-                # Запускаем автоудаление (если еще не запущено)
-                # Проверяем, не помечено ли сообщение как удаленное
+                # Запускаем автоудаление (повторный вызов переносит срок)
                 if not bot_msg.deleted:
-
-                    async def safe_auto_delete():
-                        try:
-                            await auto_delete_message(bot, chat_id, callback.message.message_id, 120)  # 2 минуты
-                        except Exception as e:
-                            logger.error(
-                                f"❌ Ошибка автоудаления для отредактированного сообщения "
-                                f"{callback.message.message_id}: {e}"
-                            )
-
-                    task = asyncio.create_task(safe_auto_delete())
-                    task.add_done_callback(
-                        lambda t: logger.error(f"❌ Задача автоудаления завершилась с ошибкой: {t.exception()}")
-                        if t.exception()
-                        else None
-                    )
+                    auto_deleter.schedule(chat_id, callback.message.message_id)
                     logger.info(
                         f"🕐 Запущено автоудаление для отредактированного сообщения "
                         f"{callback.message.message_id} в чате {chat_id}"
@@ -2163,13 +2140,11 @@ async def group_back_to_panel(callback: CallbackQuery, bot: Bot, session: AsyncS
         await callback.message.edit_text(panel_text, reply_markup=keyboard)
 
         # Обновляем запись в БД и перезапускаем автоудаление
-        import asyncio
         from datetime import UTC, datetime
 
         from sqlalchemy import select
 
         from database import BotMessage
-        from utils.messaging_utils import auto_delete_message
 
         result = await session.execute(
             select(BotMessage).where(
@@ -2186,15 +2161,6 @@ async def group_back_to_panel(callback: CallbackQuery, bot: Bot, session: AsyncS
             bot_msg.created_at = datetime.now(UTC)
             await session.commit()
             logger.info(f"✅ Обновлена запись сообщения {message_id} для панели, перезапущено автоудаление")
-
-            # Перезапускаем автоудаление
-            async def safe_auto_delete():
-                try:
-                    await auto_delete_message(bot, chat_id, message_id, 120)  # 2 минуты
-                except Exception as e:
-                    logger.error(f"❌ Ошибка автоудаления для сообщения {message_id}: {e}")
-
-            asyncio.create_task(safe_auto_delete())
         else:
             # Если записи нет, создаем новую
             bot_msg = BotMessage(chat_id=chat_id, message_id=message_id, tag="panel")
@@ -2202,14 +2168,8 @@ async def group_back_to_panel(callback: CallbackQuery, bot: Bot, session: AsyncS
             await session.commit()
             logger.info(f"✅ Создана запись для сообщения {message_id} с тегом 'panel'")
 
-            # Запускаем автоудаление
-            async def safe_auto_delete():
-                try:
-                    await auto_delete_message(bot, chat_id, message_id, 120)  # 2 минуты
-                except Exception as e:
-                    logger.error(f"❌ Ошибка автоудаления для сообщения {message_id}: {e}")
-
-            asyncio.create_task(safe_auto_delete())
+        # Перезапускаем автоудаление (повторный вызов переносит срок)
+        auto_deleter.schedule(chat_id, message_id)
 
     except Exception as e:
         logger.error(f"❌ Ошибка редактирования сообщения: {e}")
@@ -4204,6 +4164,7 @@ async def update_community_event_field(
                 # Парсим дату и время (используем глобальный datetime из импортов)
                 dt = datetime.strptime(value.strip(), "%d.%m.%Y %H:%M")
                 event.starts_at = dt  # Сохраняем как naive datetime
+                event.starts_at_utc = None  # Пересчитает планировщик напоминаний
                 logger.info(f"Обновлена дата/время события {event_id}: {dt}")
             except ValueError:
                 logger.error(f"Неверный формат даты/времени для события {event_id}: {value}")
@@ -4217,6 +4178,7 @@ async def update_community_event_field(
             logger.info(f"Обновлено описание события {event_id}: '{value}'")
         elif field == "location_url":
             event.location_url = value
+            event.starts_at_utc = None  # Часовой пояс определяется по ссылке
             logger.info(f"Обновлен URL локации события {event_id}: '{value}'")
         else:
             logger.error(f"Неизвестное поле для обновления: {field}")
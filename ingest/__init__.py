@@ -1,16 +1,16 @@
 """
 Модуль для инжеста событий в базу данных.
-Использует ingest.upsert.upsert_event (с переводом RU→EN через OpenAI).
+Использует ingest.upsert.upsert_events_batch (с переводом RU→EN через OpenAI).
 """
 
 from sqlalchemy import Engine
 
 from event_apis import RawEvent, fingerprint
-from ingest.upsert import upsert_event
+from ingest.upsert import upsert_event, upsert_events_batch
 
 
 def _raw_event_to_row(event: RawEvent) -> dict:
-    """Преобразует RawEvent в словарь для upsert_event."""
+    """Преобразует RawEvent в словарь для upsert_event / upsert_events_batch."""
     external_id = event.external_id or event.fingerprint()
     raw_data = getattr(event, "_raw_data", None) or {}
     return {
@@ -33,11 +33,9 @@ def _raw_event_to_row(event: RawEvent) -> dict:
 def upsert_events(events: list[RawEvent], engine: Engine) -> int:
     """
     Вставляет события в базу с идемпотентным upsert и переводом title_en/description_en.
-    Делегирует в ingest.upsert.upsert_event.
+    Делегирует в ingest.upsert.upsert_events_batch (один пакет на все события).
     """
     if not events:
         return 0
-    for event in events:
-        row = _raw_event_to_row(event)
-        upsert_event(engine, row)
+    upsert_events_batch(engine, [_raw_event_to_row(event) for event in events])
     return len(events)
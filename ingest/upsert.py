@@ -1,98 +1,67 @@
 import logging
 from typing import Any
 
-from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 logger = logging.getLogger(__name__)
 
-UPSERT_SQL = text("""
-INSERT INTO events (
-    source, external_id, url, title, title_en, description, description_en,
-    starts_at, ends_at, lat, lng,
-    location_name, location_name_en, location_url, current_participants, status,
-    created_at_utc, updated_at_utc, is_generated_by_ai, city, country,
-    referral_code, referral_param
-)
-VALUES (
-    :source, :external_id, :url, :title, :title_en, :description, :description_en,
-    :starts_at, :ends_at, :lat, :lng,
-    :location_name, :location_name_en, :location_url, 0, 'active', NOW(), NOW(), false, :city, :country,
-    :referral_code, :referral_param
-)
-ON CONFLICT (source, external_id) DO UPDATE SET
-  url = EXCLUDED.url,
-  title = COALESCE(EXCLUDED.title, events.title),
-  title_en = COALESCE(EXCLUDED.title_en, events.title_en),
-  description = COALESCE(EXCLUDED.description, events.description),
-  description_en = COALESCE(EXCLUDED.description_en, events.description_en),
-  starts_at = COALESCE(EXCLUDED.starts_at, events.starts_at),
-  ends_at = COALESCE(EXCLUDED.ends_at, events.ends_at),
-  lat = COALESCE(EXCLUDED.lat, events.lat),
-  lng = COALESCE(EXCLUDED.lng, events.lng),
-  location_name = COALESCE(EXCLUDED.location_name, events.location_name),
-  location_name_en = COALESCE(EXCLUDED.location_name_en, events.location_name_en),
-  location_url = COALESCE(EXCLUDED.location_url, events.location_url),
-  city = COALESCE(EXCLUDED.city, events.city),
-  country = COALESCE(EXCLUDED.country, events.country),
-  referral_code = COALESCE(EXCLUDED.referral_code, events.referral_code),
-  referral_param = COALESCE(EXCLUDED.referral_param, events.referral_param),
-  updated_at_utc = NOW()
-""")
 
-
-def upsert_event(engine: Engine, row: dict[str, Any]) -> None:
-    """Upsert события в таблицу events с поддержкой реферальных кодов и перевода RU→EN."""
+def _row_to_parser_event(row: dict[str, Any]) -> dict[str, Any]:
+    """Строка ingest (ICS/Nexudus/Meetup/BaliForum API) → событие для save_parser_events_batch."""
     title = (row.get("title") or "").strip()
     description = row.get("description")
     if description is not None and not isinstance(description, str):
         description = str(description)
-    location_name = (
-        row.get("location_name") or row.get("venue_name") or row.get("venue_address") or row.get("raw_location")
-    )
+    # ICS/Nexudus отдают venue_address или raw_location, в БД пишем location_name
+    location_name = row.get("location_name") or row.get("venue_address") or row.get("raw_location")
     if location_name is not None and not isinstance(location_name, str):
         location_name = str(location_name)
-
     title_en = row.get("title_en")
-    description_en = row.get("description_en")
+    if title_en is not None and not title_en.strip():
+        title_en = None
     location_name_en = row.get("location_name_en")
+    # Локация не переводится: location_name_en = оригинал (или NULL), для вывода в боте всегда location_name
+    if location_name_en is None and location_name:
+        location_name_en = location_name
+
+    return {
+        "source": row["source"],
+        "external_id": row["external_id"],
+        "title": title,
+        "description": description,
+        "title_en": title_en,
+        "description_en": row.get("description_en"),
+        "location_name_en": location_name_en,
+        "starts_at_utc": row.get("starts_at"),
+        "ends_at_utc": row.get("ends_at"),
+        "city": row.get("city"),
+        "country": row.get("country"),
+        "lat": row.get("lat"),
+        "lng": row.get("lng"),
+        "location_name": location_name,
+        "location_url": row.get("location_url"),
+        "url": row.get("url"),
+        "status": "active",
+        "referral_code": row.get("referral_code"),
+        "referral_param": row.get("referral_param") or "ref",
+    }
 
-    # Перевод при сохранении: только если ещё не передан (или пустая строка) и есть что переводить
-    need_translation = (title_en is None or (title_en or "").strip() == "") and (title or description or location_name)
-    if need_translation:
-        try:
-            from utils.event_translation import translate_event_to_english
 
-            trans = translate_event_to_english(
-                title=title or "",
-                description=(description or "").strip() or None,
-                location_name=(location_name or "").strip() or None,
-            )
-            if trans.get("title_en"):
-                title_en = trans["title_en"]
-            if trans.get("description_en"):
-                description_en = trans["description_en"]
-            # location_name не переводим — в _en пишем оригинал (Google Maps style)
-        except Exception as e:
-            logger.warning("ingest/upsert: перевод не выполнен для %r: %s", (title or "")[:50], e)
+def upsert_events_batch(engine: Engine, rows: list[dict[str, Any]]) -> list[int | None]:
+    """
+    Пакетный upsert событий ingest через UnifiedEventsService.save_parser_events_batch:
+    одна выборка существующих строк и дубликатов, перевод RU→EN вне транзакции
+    (только для событий без title_en в строке и в БД), многострочная запись.
+    Пустые поля источника не затирают заполненные в БД (keep_existing_on_null).
+    """
+    if not rows:
+        return []
+    from utils.unified_events_service import UnifiedEventsService
 
-    # ICS/Nexudus отдают venue_address или raw_location, SQL ожидает location_name
-    location_name_value = row.get("location_name") or row.get("venue_address") or row.get("raw_location")
-    # Локация не переводится: location_name_en = оригинал (или NULL), для вывода в боте всегда location_name
-    if location_name_en is None and location_name_value:
-        location_name_en = location_name_value
+    events = [_row_to_parser_event(row) for row in rows]
+    return UnifiedEventsService(engine).save_parser_events_batch(events, keep_existing_on_null=True)
 
-    row_with_defaults = {
-        "referral_code": None,
-        "referral_param": "ref",
-        "city": None,
-        "country": None,
-        **row,
-    }
-    row_with_defaults["title_en"] = title_en
-    row_with_defaults["description_en"] = description_en
-    row_with_defaults["location_name_en"] = location_name_en
-    row_with_defaults["description"] = row.get("description")
-    row_with_defaults["location_name"] = location_name_value
-    with engine.begin() as conn:
-        conn.execute(UPSERT_SQL, row_with_defaults)
+
+def upsert_event(engine: Engine, row: dict[str, Any]) -> int | None:
+    """Upsert события в таблицу events с поддержкой реферальных кодов и перевода RU→EN."""
+    return upsert_events_batch(engine, [row])[0]
@@ -0,0 +1,9 @@
+-- Индексы для поиска событий рядом (UnifiedEventsService.search_events_nearby).
+-- Поиск сначала отбирает строки по рамке lat/lng и окну starts_at, затем считает
+-- точную дистанцию только для попавших в рамку строк.
+
+CREATE INDEX IF NOT EXISTS idx_events_starts_at ON events (starts_at);
+
+CREATE INDEX IF NOT EXISTS idx_events_lat_lng_starts_at
+  ON events (lat, lng, starts_at)
+  WHERE lat IS NOT NULL AND lng IS NOT NULL;
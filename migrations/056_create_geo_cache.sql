@@ -0,0 +1,16 @@
+-- Кэш ответов Google Geocoding / Reverse Geocoding / Time Zone API (второй уровень после памяти процесса).
+-- kind: geocode | reverse | timezone; cache_key: нормализованный адрес или квантованные координаты + язык.
+
+CREATE TABLE IF NOT EXISTS geo_cache (
+    kind TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    value JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (kind, cache_key)
+);
+
+-- Для периодической очистки просроченных записей
+CREATE INDEX IF NOT EXISTS idx_geo_cache_expires_at ON geo_cache(expires_at);
+
+COMMENT ON TABLE geo_cache IS 'Кэш geocode/reverse geocode/timezone, чтобы не тратить квоту Google на повторные запросы';
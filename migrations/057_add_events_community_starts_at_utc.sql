@@ -0,0 +1,18 @@
+-- Время начала Community события в UTC для планировщика напоминаний.
+-- starts_at хранится как локальное время города (TIMESTAMP без зоны); часовой пояс определяется
+-- по координатам из location_url. NULL — еще не посчитан: заполняет backfill_community_starts_at_utc
+-- (utils/community_reminders.py), при редактировании времени или ссылки поле сбрасывается в NULL.
+
+ALTER TABLE events_community ADD COLUMN IF NOT EXISTS starts_at_utc TIMESTAMPTZ;
+
+-- Выборка напоминаний: открытые события с началом в окне
+CREATE INDEX IF NOT EXISTS idx_events_community_open_starts_at_utc
+    ON events_community (starts_at_utc)
+    WHERE status = 'open';
+
+-- Очередь на досчет starts_at_utc
+CREATE INDEX IF NOT EXISTS idx_events_community_starts_at_utc_pending
+    ON events_community (starts_at)
+    WHERE status = 'open' AND starts_at_utc IS NULL;
+
+COMMENT ON COLUMN events_community.starts_at_utc IS 'starts_at в UTC (по часовому поясу из координат места); NULL — не посчитан';
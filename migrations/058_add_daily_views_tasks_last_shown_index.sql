@@ -0,0 +1,4 @@
+-- Последний показ мест пользователю одним запросом (tasks_location_service._query_ranked_places):
+-- MAX(view_date) ... WHERE user_id = ? AND view_type = 'place' GROUP BY view_key
+CREATE INDEX IF NOT EXISTS idx_daily_views_tasks_user_type_key_date
+    ON daily_views_tasks (user_id, view_type, view_key, view_date);
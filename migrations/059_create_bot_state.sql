@@ -0,0 +1,18 @@
+-- Состояние бота вне памяти процесса (utils/state_store.py, STATE_BACKEND=postgres):
+-- namespace user_state — результаты поиска по chat_id, fsm — FSM aiogram.
+-- data: значение в JSONB, чтобы дописывать поля user_state одним INSERT ... ON CONFLICT DO UPDATE
+-- SET data = bot_state.data || :patch; большие значения сжимает сам Postgres (TOAST).
+-- Просроченные строки удаляет периодическая очистка.
+
+CREATE TABLE IF NOT EXISTS bot_state (
+    namespace TEXT NOT NULL,
+    state_key TEXT NOT NULL,
+    data JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (namespace, state_key)
+);
+
+CREATE INDEX IF NOT EXISTS ix_bot_state_expires_at ON bot_state(expires_at);
+
+COMMENT ON TABLE bot_state IS 'user_state и FSM бота с TTL: не растут в памяти и переживают рестарты/деплои';
@@ -0,0 +1,34 @@
+-- Очередь перевода событий и память переводов (utils/translation_service.py).
+-- translation_jobs: одно задание на событие; выполненные удаляются, исчерпавшие попытки остаются в статусе failed.
+-- translation_memory: перевод по sha256 исходного текста — одинаковые названия/описания переводятся один раз.
+
+CREATE TABLE IF NOT EXISTS translation_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    target_table VARCHAR(32) NOT NULL,          -- events | events_community
+    target_id BIGINT NOT NULL,
+    priority SMALLINT NOT NULL DEFAULT 1,       -- 0: пользовательские события, 1: парсеры
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    locked_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (target_table, target_id)
+);
+
+-- Выборка следующей пачки: только ожидающие задания в порядке приоритета
+CREATE INDEX IF NOT EXISTS idx_translation_jobs_pending
+    ON translation_jobs (priority, id) WHERE status = 'pending';
+
+CREATE TABLE IF NOT EXISTS translation_memory (
+    target_lang VARCHAR(5) NOT NULL,
+    source_hash CHAR(64) NOT NULL,
+    translated_text TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (target_lang, source_hash)
+);
+
+COMMENT ON TABLE translation_jobs IS 'Очередь перевода событий RU↔EN, разбирается воркером translation_service';
+COMMENT ON TABLE translation_memory IS 'Память переводов по хэшу исходного текста, чтобы не переводить повторы';
@@ -0,0 +1,35 @@
+-- Аренда фоновых задач планировщика (utils/job_leases.py, modern_scheduler.py).
+-- scheduler_jobs: строка на задачу — кто ее сейчас выполняет (lease_owner до lease_until) и итог последнего запуска.
+--   Задачу берет тот процесс бота/воркера, которому удался условный UPDATE, поэтому при любом числе
+--   реплик каждый запуск выполняется один раз.
+-- scheduler_job_runs: история запусков (хранится JOB_RUNS_KEEP_DAYS дней).
+
+CREATE TABLE IF NOT EXISTS scheduler_jobs (
+    job_id VARCHAR(64) PRIMARY KEY,
+    lease_owner VARCHAR(128),
+    lease_until TIMESTAMPTZ,
+    last_started_at TIMESTAMPTZ,
+    last_finished_at TIMESTAMPTZ,
+    last_duration_s DOUBLE PRECISION,
+    last_status VARCHAR(16),                    -- ok | errors (в логе были ошибки) | failed (исключение)
+    last_error TEXT,
+    run_count INTEGER NOT NULL DEFAULT 0,
+    fail_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS scheduler_job_runs (
+    id BIGSERIAL PRIMARY KEY,
+    job_id VARCHAR(64) NOT NULL,
+    owner VARCHAR(128) NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL,
+    finished_at TIMESTAMPTZ NOT NULL,
+    duration_s DOUBLE PRECISION NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_scheduler_job_runs_job_started
+    ON scheduler_job_runs (job_id, started_at DESC);
+
+COMMENT ON TABLE scheduler_jobs IS 'Аренда и итог последнего запуска задач планировщика (бот и воркер scheduler)';
+COMMENT ON TABLE scheduler_job_runs IS 'История запусков задач планировщика: длительность, статус, ошибка';
@@ -5,7 +5,9 @@
 """
 
 import logging
+import os
 import time
+from datetime import timedelta
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy import text
@@ -13,11 +15,21 @@ from sqlalchemy import text
 from config import load_settings
 from database import get_engine, init_engine
 from sources.baliforum import fetch as fetch_baliforum
-from utils.event_translation import translate_titles_batch
+from utils.job_leases import job_leases
 from utils.unified_events_service import UnifiedEventsService
 
 logger = logging.getLogger(__name__)
 
+# Cron-задачи на всех репликах срабатывают в одну минуту: повтор в течение часа — дубль
+CRON_MIN_INTERVAL_S = 3600
+# Разовые задачи старта (backfill, проверка напоминаний) — одна реплика на волну рестартов
+STARTUP_MIN_INTERVAL_S = 15 * 60
+
+
+def scheduler_in_bot_enabled() -> bool:
+    """SCHEDULER_IN_BOT=0 — задачи выполняет только воркер workers/scheduler.py."""
+    return os.getenv("SCHEDULER_IN_BOT", "1").strip() == "1"
+
 
 class ModernEventScheduler:
     """Современный планировщик событий"""
@@ -286,64 +298,18 @@ class ModernEventScheduler:
                 except Exception as e:
                     logger.error(f"   ❌ Ошибка подготовки события '{event.title}': {e}")
 
-            # Пакетный перевод (ТЗ): один вызов API на все заголовки
-            title_en_map = {}
-            if prepared:
-                ext_ids = list({p["external_id"] for p in prepared})
-                with self.engine.connect() as conn:
-                    rows = conn.execute(
-                        text("""
-                            SELECT external_id, title_en
-                            FROM events
-                            WHERE source = 'baliforum' AND external_id = ANY(:ids)
-                        """),
-                        {"ids": ext_ids},
-                    ).fetchall()
-                has_title_en = {r[0] for r in rows if r[1] and str(r[1]).strip()}
-                to_translate = [
-                    (p["source"], p["external_id"], (p["title"] or "").strip())
-                    for p in prepared
-                    if p["external_id"] not in has_title_en and (p["title"] or "").strip()
-                ]
-                if to_translate:
-                    logger.info("[INGEST] Missing translations: %s", len(to_translate))
-                    titles = [t for _, _, t in to_translate]
-                    results = translate_titles_batch(titles)
-                    for (src, ext_id, _), title_en in zip(to_translate, results):
-                        if title_en:
-                            title_en_map[(src, ext_id)] = title_en
-                    n_ok = sum(1 for r in results if r)
-                    logger.info(f"   📝 Пакетный перевод: {n_ok}/{len(to_translate)} заголовков")
-
-            # Сохраняем события
+            # Пакетное сохранение: одна выборка существующих/дубликатов, перевод заголовков одним
+            # запросом к API (только где в БД нет title_en), многострочный upsert
             saved_count = 0
             error_count = 0
-            for p in prepared:
+            if prepared:
                 try:
-                    title_en = title_en_map.get((p["source"], p["external_id"]))
-                    event_id = self.service.save_parser_event(
-                        source=p["source"],
-                        external_id=p["external_id"],
-                        title=p["title"],
-                        description=p["description"],
-                        starts_at_utc=p["starts_at_utc"],
-                        ends_at_utc=p.get("ends_at_utc"),
-                        time_mode=p.get("time_mode"),
-                        city=p["city"],
-                        lat=p["lat"],
-                        lng=p["lng"],
-                        location_name=p["location_name"],
-                        location_url=p["location_url"],
-                        url=p["url"],
-                        place_id=p.get("place_id"),
-                        title_en=title_en,
-                        tags=p.get("tags"),
-                    )
-                    if event_id:
-                        saved_count += 1
+                    ids = self.service.save_parser_events_batch(prepared)
+                    saved_count = sum(1 for event_id in ids if event_id)
+                    error_count = len(ids) - saved_count
                 except Exception as e:
-                    error_count += 1
-                    logger.error(f"   ❌ Ошибка сохранения события '{p.get('title', '')}': {e}")
+                    error_count = len(prepared)
+                    logger.error(f"   ❌ Ошибка сохранения событий BaliForum: {e}")
 
             duration = (time.time() - start_time) * 1000
             logger.info(
@@ -407,55 +373,34 @@ class ModernEventScheduler:
                 logger.info("   KudaGo: событий не найдено")
                 return
 
-            # Batch-перевод: только те, у кого в БД нет title_en
-            ext_ids = list({p["external_id"] for p in prepared})
-            with self.engine.connect() as conn:
-                rows = conn.execute(
-                    text(
-                        "SELECT external_id, title_en FROM events WHERE source = 'kudago' AND external_id = ANY(:ids)"
-                    ),
-                    {"ids": ext_ids},
-                ).fetchall()
-            has_title_en = {r[0] for r in rows if r[1] and str(r[1]).strip()}
-            to_translate = [
-                (p["external_id"], p["title"]) for p in prepared if p["external_id"] not in has_title_en and p["title"]
-            ]
-            title_en_map = {}
-            if to_translate:
-                logger.info("[INGEST] Missing translations (KudaGo): %s", len(to_translate))
-                titles = [t for _, t in to_translate]
-                results = translate_titles_batch(titles)
-                for (ext_id, _), title_en in zip(to_translate, results):
-                    if title_en:
-                        title_en_map[ext_id] = title_en
-                n_ok = sum(1 for r in results if r)
-                logger.info("   📝 KudaGo пакетный перевод: %s/%s заголовков", n_ok, len(to_translate))
+            events_batch = []
+            for p in prepared:
+                ev = p["event"]
+                events_batch.append(
+                    {
+                        "source": "kudago",
+                        "external_id": p["external_id"],
+                        "title": ev["title"],
+                        "description": ev.get("description", ""),
+                        "starts_at_utc": ev["starts_at"],
+                        "city": ev["city"],
+                        "lat": ev.get("lat", 0.0),
+                        "lng": ev.get("lon", 0.0),
+                        "location_name": ev.get("venue_name", ""),
+                        "location_url": ev.get("address", ""),
+                        "url": ev.get("source_url", ""),
+                    }
+                )
 
             total_saved = 0
             total_errors = 0
-            for p in prepared:
-                try:
-                    ev = p["event"]
-                    title_en = title_en_map.get(p["external_id"])
-                    event_id = self.service.save_parser_event(
-                        source="kudago",
-                        external_id=p["external_id"],
-                        title=ev["title"],
-                        description=ev.get("description", ""),
-                        starts_at_utc=ev["starts_at"],
-                        city=ev["city"],
-                        lat=ev.get("lat", 0.0),
-                        lng=ev.get("lon", 0.0),
-                        location_name=ev.get("venue_name", ""),
-                        location_url=ev.get("address", ""),
-                        url=ev.get("source_url", ""),
-                        title_en=title_en,
-                    )
-                    if event_id:
-                        total_saved += 1
-                except Exception as e:
-                    total_errors += 1
-                    logger.error("   ❌ Ошибка сохранения KudaGo: %s", e)
+            try:
+                ids = self.service.save_parser_events_batch(events_batch)
+                total_saved = sum(1 for event_id in ids if event_id)
+                total_errors = len(ids) - total_saved
+            except Exception as e:
+                total_errors = len(events_batch)
+                logger.error("   ❌ Ошибка сохранения KudaGo: %s", e)
 
             duration = (time.time() - start_time) * 1000
             logger.info(
@@ -513,51 +458,34 @@ class ModernEventScheduler:
                 logger.info("   AI: событий не найдено")
                 return
 
-            ext_ids = [p["external_id"] for p in prepared]
-            with self.engine.connect() as conn:
-                rows = conn.execute(
-                    text("SELECT external_id, title_en FROM events WHERE source = 'ai' AND external_id = ANY(:ids)"),
-                    {"ids": ext_ids},
-                ).fetchall()
-            has_title_en = {r[0] for r in rows if r[1] and str(r[1]).strip()}
-            to_translate = [
-                (p["external_id"], p["title"]) for p in prepared if p["external_id"] not in has_title_en and p["title"]
-            ]
-            title_en_map = {}
-            if to_translate:
-                logger.info("[INGEST] Missing translations (AI): %s", len(to_translate))
-                titles = [t for _, t in to_translate]
-                results = translate_titles_batch(titles)
-                for (ext_id, _), title_en in zip(to_translate, results):
-                    if title_en:
-                        title_en_map[ext_id] = title_en
-                n_ok = sum(1 for r in results if r)
-                logger.info("   📝 AI пакетный перевод: %s/%s заголовков", n_ok, len(to_translate))
+            events_batch = []
+            for p in prepared:
+                ev = p["event"]
+                events_batch.append(
+                    {
+                        "source": "ai",
+                        "external_id": p["external_id"],
+                        "title": ev["title"],
+                        "description": ev.get("description", ""),
+                        "starts_at_utc": p["starts_at"],
+                        "city": "bali",
+                        "lat": ev["lat"],
+                        "lng": ev["lng"],
+                        "location_name": ev.get("location_name", ""),
+                        "location_url": ev.get("location_url", ""),
+                        "url": ev.get("community_link", ""),
+                    }
+                )
 
             total_ai_events = 0
             error_count = 0
-            for p in prepared:
-                try:
-                    ev = p["event"]
-                    event_id = self.service.save_parser_event(
-                        source="ai",
-                        external_id=p["external_id"],
-                        title=ev["title"],
-                        description=ev.get("description", ""),
-                        starts_at_utc=p["starts_at"],
-                        city="bali",
-                        lat=ev["lat"],
-                        lng=ev["lng"],
-                        location_name=ev.get("location_name", ""),
-                        location_url=ev.get("location_url", ""),
-                        url=ev.get("community_link", ""),
-                        title_en=title_en_map.get(p["external_id"]),
-                    )
-                    if event_id:
-                        total_ai_events += 1
-                except Exception as e:
-                    error_count += 1
-                    logger.error("   ❌ Ошибка сохранения AI: %s", e)
+            try:
+                ids = self.service.save_parser_events_batch(events_batch)
+                total_ai_events = sum(1 for event_id in ids if event_id)
+                error_count = len(ids) - total_ai_events
+            except Exception as e:
+                error_count = len(events_batch)
+                logger.error("   ❌ Ошибка сохранения AI: %s", e)
 
             duration = (time.time() - start_time) * 1000
             logger.info("   ✅ AI: создано=%s, ошибок=%s, время=%.0fмс", total_ai_events, error_count, duration)
@@ -784,10 +712,9 @@ class ModernEventScheduler:
                             try:
                                 import json
 
-                                from utils.community_events_service import CommunityEventsService
+                                from utils.chat_admins import chat_admins
 
-                                community_service = CommunityEventsService()
-                                admin_ids = await community_service.get_cached_admin_ids(bot, chat.chat_id)
+                                admin_ids = await chat_admins.get_admin_ids(bot, chat.chat_id)
                                 admin_count = len(admin_ids)
 
                                 # Обновляем только если изменилось
@@ -946,6 +873,28 @@ class ModernEventScheduler:
 
             logger.error(traceback.format_exc())
 
+    def _add_leased_job(self, func, trigger: str, job_id: str, **trigger_args) -> None:
+        """add_job под арендой scheduler_jobs: срабатывание выполняет одна реплика из всех."""
+        if trigger == "interval":
+            # Реплика, чей таймер отстает от соседней, пропускает уже выполненный период
+            min_interval_s = timedelta(**trigger_args).total_seconds() * 0.8
+        else:
+            min_interval_s = CRON_MIN_INTERVAL_S
+        self.scheduler.add_job(
+            job_leases.wrap(job_id, func, min_interval_s),
+            trigger,
+            id=job_id,
+            max_instances=1,
+            coalesce=True,
+            **trigger_args,
+        )
+
+    def _run_startup_checks(self) -> None:
+        """Проверка напоминаний и уведомлений сразу после старта (под теми же арендами, что и по расписанию)."""
+        logger.info("🔔 Запускаем проверку напоминаний и уведомлений сразу после старта...")
+        job_leases.run("community-reminders", self.send_community_reminders, STARTUP_MIN_INTERVAL_S)
+        job_leases.run("event-start-notifications", self.send_event_start_notifications, STARTUP_MIN_INTERVAL_S)
+
     def start(self):
         """Запуск планировщика"""
         if self.scheduler and self.scheduler.running:
@@ -956,26 +905,12 @@ class ModernEventScheduler:
             logger.info(f"📋 Зарегистрированные задачи: {job_ids}")
             if "event-start-notifications" not in job_ids:
                 logger.warning("⚠️ Задача 'event-start-notifications' не найдена! Добавляем...")
-                self.scheduler.add_job(
-                    self.send_event_start_notifications,
-                    "interval",
-                    minutes=5,
-                    id="event-start-notifications",
-                    max_instances=1,
-                    coalesce=True,
+                self._add_leased_job(
+                    self.send_event_start_notifications, "interval", "event-start-notifications", minutes=5
                 )
                 logger.info("✅ Задача 'event-start-notifications' добавлена")
 
-            # Запускаем проверку напоминаний и уведомлений сразу для тестирования
-            logger.info("🔔 Запускаем проверку напоминаний и уведомлений сразу после старта...")
-            try:
-                self.send_community_reminders()
-                self.send_event_start_notifications()
-            except Exception as e:
-                logger.warning(f"⚠️ Ошибка при запуске проверки сразу после старта: {e}")
-                import traceback
-
-                logger.error(traceback.format_exc())
+            self._run_startup_checks()
             return
 
         self.scheduler = BackgroundScheduler(timezone="UTC")
@@ -984,130 +919,52 @@ class ModernEventScheduler:
         # Утренний запуск: 16:02 UTC = 00:02 Asia/Makassar (сразу после полуночи на Бали).
         # Раньше было hour=18 (+8ч = 02:02 по Бали) — между полночью и инжестом «завтра»
         # в БД могли отсутствовать события на календарный следующий день.
-        self.scheduler.add_job(
-            self.run_full_ingest,
-            "cron",
-            hour=16,
-            minute=2,
-            id="modern-ingest-morning",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.run_full_ingest, "cron", "modern-ingest-morning", hour=16, minute=2)
         # Вечерний запуск: 04:02 UTC = 12:02 Бали (середина дня по Бали)
-        self.scheduler.add_job(
-            self.run_full_ingest,
-            "cron",
-            hour=4,
-            minute=2,
-            id="modern-ingest-evening",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.run_full_ingest, "cron", "modern-ingest-evening", hour=4, minute=2)
 
         # Парсинг KudaGo (Москва и СПб) - отдельное расписание по времени МСК
         # Утренний запуск: 21:02 UTC = 00:02 МСК (начало нового дня по МСК)
-        self.scheduler.add_job(
-            self.run_kudago_ingest,
-            "cron",
-            hour=21,
-            minute=2,
-            id="kudago-ingest-morning",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.run_kudago_ingest, "cron", "kudago-ingest-morning", hour=21, minute=2)
         # Вечерний запуск: 09:02 UTC = 12:02 МСК (середина дня по МСК)
-        self.scheduler.add_job(
-            self.run_kudago_ingest,
-            "cron",
-            hour=9,
-            minute=2,
-            id="kudago-ingest-evening",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.run_kudago_ingest, "cron", "kudago-ingest-evening", hour=9, minute=2)
 
         # Очистка старых событий каждые 6 часов
-        self.scheduler.add_job(
-            self.cleanup_old_events, "interval", hours=6, id="cleanup-cycle", max_instances=1, coalesce=True
-        )
+        self._add_leased_job(self.cleanup_old_events, "interval", "cleanup-cycle", hours=6)
 
         # Очистка просроченных заданий каждые 2 часа
-        self.scheduler.add_job(
-            self.cleanup_expired_tasks, "interval", hours=2, id="tasks-cleanup", max_instances=1, coalesce=True
-        )
+        self._add_leased_job(self.cleanup_expired_tasks, "interval", "tasks-cleanup", hours=2)
 
         # Очистка старых событий сообществ (архивация) каждые 6 часов
         # Открытые события: архивируются по дате начала (starts_at < NOW() - 1 day)
         # Закрытые события: архивируются по времени закрытия (updated_at < NOW() - 24 hours)
-        self.scheduler.add_job(
-            self.cleanup_expired_community_events,
-            "interval",
-            hours=6,
-            id="community-events-cleanup",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.cleanup_expired_community_events, "interval", "community-events-cleanup", hours=6)
 
         # Проверка удаленных чатов каждые 24 часа
-        self.scheduler.add_job(
-            self.check_removed_chats, "interval", hours=24, id="chat-status-check", max_instances=1, coalesce=True
-        )
+        self._add_leased_job(self.check_removed_chats, "interval", "chat-status-check", hours=24)
 
         # Напоминания о Community событиях за 24 часа - проверяем каждые 30 минут
         # Окно времени 30 минут гарантирует, что события не будут пропущены
         # и снижает нагрузку на систему по сравнению с проверкой каждые 15 минут
-        self.scheduler.add_job(
-            self.send_community_reminders,
-            "interval",
-            minutes=30,
-            id="community-reminders",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.send_community_reminders, "interval", "community-reminders", minutes=30)
 
         # Уведомления о начале события - проверяем каждые 5 минут
-        self.scheduler.add_job(
-            self.send_event_start_notifications,
-            "interval",
-            minutes=5,
-            id="event-start-notifications",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self.send_event_start_notifications, "interval", "event-start-notifications", minutes=5)
         logger.info("   ✅ Зарегистрирована задача: уведомления о начале событий (каждые 5 минут)")
 
         # Backfill переводов:
         # - user-ивенты: каждые 15 минут
         # - parser-ивенты: каждые 60 минут
-        self.scheduler.add_job(
-            self._run_backfill_translations,
-            "interval",
-            minutes=15,
-            id="backfill-translations-user",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self._run_backfill_translations, "interval", "backfill-translations-user", minutes=15)
         logger.info("   ✅ Зарегистрирована задача: backfill переводов (user, каждые 15 минут)")
 
-        self.scheduler.add_job(
-            self._run_backfill_translations_parser,
-            "interval",
-            minutes=60,
-            id="backfill-translations-parser",
-            max_instances=1,
-            coalesce=True,
+        self._add_leased_job(
+            self._run_backfill_translations_parser, "interval", "backfill-translations-parser", minutes=60
         )
         logger.info("   ✅ Зарегистрирована задача: backfill переводов (parser, каждые 60 минут)")
 
         # Перевод подсказок task_places (task_hint → task_hint_en) каждые 6 часов
-        self.scheduler.add_job(
-            self._run_task_places_hint_backfill,
-            "interval",
-            hours=6,
-            id="task-places-hint-backfill",
-            max_instances=1,
-            coalesce=True,
-        )
+        self._add_leased_job(self._run_task_places_hint_backfill, "interval", "task-places-hint-backfill", hours=6)
         logger.info("   ✅ Зарегистрирована задача: task_places hint backfill (каждые 6 часов)")
 
         self.scheduler.start()
@@ -1157,10 +1014,19 @@ class ModernEventScheduler:
             except Exception as e:
                 logger.warning("[AUTO-BACKFILL] Failed: %s", e)
 
-        t = threading.Thread(target=_initial_backfill, daemon=True)
+        t = threading.Thread(
+            target=job_leases.run,
+            args=("initial-backfill-translations", _initial_backfill, STARTUP_MIN_INTERVAL_S),
+            daemon=True,
+        )
         t.start()
         logger.info("[AUTO-BACKFILL] Started in background")
 
+        # Воркер очереди перевода: разбирает задания сразу после постановки (create_user_event, парсеры)
+        from utils.translation_service import translation_service
+
+        translation_service.start_worker()
+
         def _initial_task_places_backfill():
             try:
                 from utils.backfill_task_places_translation import run_full_backfill
@@ -1169,17 +1035,15 @@ class ModernEventScheduler:
             except Exception as e:
                 logger.warning("[TASK-BACKFILL] Failed: %s", e)
 
-        t_places = threading.Thread(target=_initial_task_places_backfill, daemon=True)
+        t_places = threading.Thread(
+            target=job_leases.run,
+            args=("initial-task-places-backfill", _initial_task_places_backfill, STARTUP_MIN_INTERVAL_S),
+            daemon=True,
+        )
         t_places.start()
         logger.info("[TASK-BACKFILL] Started in background")
 
-        # Запускаем проверку напоминаний и уведомлений сразу для тестирования
-        logger.info("🔔 Запускаем проверку напоминаний и уведомлений сразу после старта...")
-        try:
-            self.send_community_reminders()
-            self.send_event_start_notifications()
-        except Exception as e:
-            logger.warning(f"⚠️ Ошибка при запуске проверки сразу после старта: {e}")
+        self._run_startup_checks()
 
     def stop(self):
         """Остановка планировщика"""
@@ -1,10 +1,10 @@
 import os
 
-import requests
+import httpx
 from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy import text
 
-from ingest.upsert import upsert_event
+from ingest.upsert import upsert_events_batch
 from sources.ics import fetch_ics, parse_ics
 from sources.nexudus import discover_event_ics_links
 
@@ -71,16 +71,17 @@ def ingest_once():
                 resp.raise_for_status()
                 new_etag = resp.headers.get("ETag")
                 new_lm = resp.headers.get("Last-Modified")
-                count = 0
-                for row in parse_ics(
-                    resp.content,
-                    source_prefix=f"ics.{src.get('region') or 'id'}",
-                    calendar_url=src["url"],
-                    referral_code=src.get("referral_code"),
-                    referral_param=src.get("referral_param", "ref"),
-                ):
-                    upsert_event(eng, row)
-                    count += 1
+                rows = list(
+                    parse_ics(
+                        resp.content,
+                        source_prefix=f"ics.{src.get('region') or 'id'}",
+                        calendar_url=src["url"],
+                        referral_code=src.get("referral_code"),
+                        referral_param=src.get("referral_param", "ref"),
+                    )
+                )
+                upsert_events_batch(eng, rows)
+                count = len(rows)
                 _update_source_meta(
                     eng,
                     src["id"],
@@ -92,26 +93,28 @@ def ingest_once():
                 print(f"[ICS] {src['url']} → upserted {count}")
             elif src["type"] == "html_nexudus":
                 ics_links = discover_event_ics_links(src["url"])
-                count = 0
+                rows = []
                 for ics_url in ics_links:
                     resp = fetch_ics(ics_url)
                     if resp.status_code != 200:
                         continue
-                    for row in parse_ics(
-                        resp.content,
-                        source_prefix=f"nexudus.{src.get('region') or 'id'}",
-                        calendar_url=ics_url,
-                        referral_code=src.get("referral_code"),
-                        referral_param=src.get("referral_param", "ref"),
-                    ):
-                        upsert_event(eng, row)
-                        count += 1
+                    rows.extend(
+                        parse_ics(
+                            resp.content,
+                            source_prefix=f"nexudus.{src.get('region') or 'id'}",
+                            calendar_url=ics_url,
+                            referral_code=src.get("referral_code"),
+                            referral_param=src.get("referral_param", "ref"),
+                        )
+                    )
+                upsert_events_batch(eng, rows)
+                count = len(rows)
                 _update_source_meta(eng, src["id"], status=200, ok=True)
                 print(f"[NEXUDUS] {src['url']} → upserted {count}")
             else:
                 _update_source_meta(eng, src["id"], status=400, ok=False)
-        except requests.HTTPError as e:
-            _update_source_meta(eng, src["id"], status=e.response.status_code if e.response else 500, ok=False)
+        except httpx.HTTPStatusError as e:
+            _update_source_meta(eng, src["id"], status=e.response.status_code, ok=False)
         except Exception:
             _update_source_meta(eng, src["id"], status=500, ok=False)
 
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк парсера BaliForum на записанных HTML-фикстурах (tests/fixtures/baliforum).
+
+Сайт эмулируется через httpx.MockTransport с задержкой ответа (--latency-ms), детальные
+страницы отдают ETag. Сценарии:
+  - serial: один запрос за раз и пауза 0.3 с между запросами — как прежний парсер на requests;
+  - pooled cold: пул соединений, BALIFORUM_CONCURRENCY запросов, лимит на хост, пустой кэш;
+  - pooled warm/304: повторный цикл — сервер отвечает 304, HTML не парсится;
+  - pooled warm/hash: повторный цикл без ETag — содержимое то же, HTML не парсится по хэшу.
+
+Отчет: события/с по стене и CPU-время процесса на событие (парсинг HTML + разбор ссылок на карты).
+Google не вызывается: ссылки на карты в фикстурах содержат координаты.
+
+Запуск:
+  python -m scripts.bench_baliforum_scraper
+  python -m scripts.bench_baliforum_scraper --events 60 --latency-ms 120 --concurrency 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from sources.baliforum import BALIFORUM_CONCURRENCY, BaliForumDetailCache, BaliForumScraper, HostRateLimiter
+from utils.state_store import MemoryStateBackend
+
+FIXTURES = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "baliforum"
+CARDS_PER_PAGE = 20
+
+
+class FixtureSite:
+    def __init__(self, events: int, latency_s: float, with_etag: bool = True):
+        self.events = events
+        self.latency_s = latency_s
+        self.with_etag = with_etag
+        self.card = (FIXTURES / "list_card.html").read_text(encoding="utf-8")
+        self.list_page = (FIXTURES / "list_page.html").read_text(encoding="utf-8")
+        self.detail_page = (FIXTURES / "detail_page.html").read_text(encoding="utf-8")
+        self.token = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency_s)
+        if request.url.path == "/events":
+            page = int(request.url.params.get("page", "1"))
+            first = (page - 1) * CARDS_PER_PAGE
+            ids = range(first, min(self.events, first + CARDS_PER_PAGE))
+            cards = "\n".join(
+                self.card.format(slug=f"e{i}", title=f"Event {i}", when=f"Сегодня с {10 + i % 12}:00") for i in ids
+            )
+            return httpx.Response(200, text=self.list_page.format(cards=cards))
+
+        slug = request.url.path.rsplit("/", 1)[-1]
+        etag = f'"{slug}-v1"'
+        if self.with_etag and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        self.token += 1
+        i = int(slug[1:])
+        html = self.detail_page.format(
+            token=self.token,
+            title=f"Event {i}",
+            slug=slug,
+            venue=f"Venue {i % 40}",
+            venue_q=f"Venue+{i % 40}",
+            when="Сегодня",
+            lat=f"{-8.60 - i % 50 / 1000:.4f}",
+            lng=f"{115.10 + i % 50 / 1000:.4f}",
+        )
+        return httpx.Response(200, text=html, headers={"ETag": etag} if self.with_etag else {})
+
+
+async def _cycle(site: FixtureSite, cache: BaliForumDetailCache, concurrency: int, min_interval_s: float, limit: int):
+    transport = httpx.MockTransport(site.handler)
+    async with httpx.AsyncClient(transport=transport) as client:
+        scraper = BaliForumScraper(
+            client, concurrency=concurrency, rate_limiter=HostRateLimiter(min_interval_s), cache=cache
+        )
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        events = await scraper.fetch_events(limit=limit)
+        return events, time.perf_counter() - wall, time.process_time() - cpu, scraper.stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--concurrency", type=int, default=BALIFORUM_CONCURRENCY)
+    parser.add_argument("--min-interval-ms", type=float, default=100, help="Пауза между запросами к хосту")
+    args = parser.parse_args()
+
+    latency_s = args.latency_ms / 1000
+    pooled = (args.concurrency, args.min_interval_ms / 1000)
+
+    def fresh_cache() -> BaliForumDetailCache:
+        return BaliForumDetailCache(MemoryStateBackend(max_entries=args.events * 2))
+
+    rows = []
+
+    def run(label: str, site: FixtureSite, cache: BaliForumDetailCache, concurrency: int, interval: float) -> None:
+        events, wall, cpu, stats = asyncio.run(_cycle(site, cache, concurrency, interval, args.events))
+        assert len(events) == args.events and all(e["lat"] for e in events), "парсер потерял события"
+        rows.append((label, len(events) / wall, cpu / len(events) * 1000, stats["parsed"]))
+
+    run("serial, пауза 0.3 с", FixtureSite(args.events, latency_s), fresh_cache(), 1, 0.3)
+
+    cache = fresh_cache()
+    site = FixtureSite(args.events, latency_s, with_etag=True)
+    run("pooled cold", site, cache, *pooled)
+    run("pooled warm/304", site, cache, *pooled)
+
+    cache = fresh_cache()
+    site = FixtureSite(args.events, latency_s, with_etag=False)
+    run("pooled cold (без ETag)", site, cache, *pooled)
+    run("pooled warm/hash", site, cache, *pooled)
+
+    print(
+        f"Событий: {args.events}, задержка ответа {args.latency_ms:.0f} мс, "
+        f"concurrency={args.concurrency}, интервал на хост {args.min_interval_ms:.0f} мс"
+    )
+    print(f"{'сценарий':<26}{'событий/с':>11}{'CPU мс/событие':>16}{'разобрано HTML':>16}")
+    for label, rate, cpu_ms, parsed in rows:
+        print(f"{label:<26}{rate:>11.1f}{cpu_ms:>16.2f}{parsed:>16}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
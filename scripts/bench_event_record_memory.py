@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк памяти на одно закэшированное событие поиска: dict vs EventRecord.
+
+Сравнивает:
+  - legacy: словарь строки поиска (~35 ключей) + копия formatted_event (~28 ключей), как было
+    в perform_nearby_search; в prepared лежит копия после prepare_events_for_feed (type, distance_km);
+  - record: один EventRecord из строки, те же type/distance_km записываются в слоты.
+
+Память меряется через tracemalloc (все аллокации построения N событий, включая значения)
+и sys.getsizeof контейнера; размер в user_state — через pack_state (JSON, при большом размере zlib).
+БД не нужна: строки поиска синтетические, той же формы, что _SEARCH_EVENT_SELECT.
+
+Запуск:
+  python -m scripts.bench_event_record_memory
+  python -m scripts.bench_event_record_memory --events 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.event_record import EventRecord
+from utils.state_store import pack_state
+from utils.unified_events_service import (
+    _parse_categories_value,
+    _parse_raw_category_tags,
+    _search_row_to_event_record,
+)
+
+
+def _legacy_row_to_dict(row) -> dict:
+    """Прежний _search_row_to_event_dict."""
+    return {
+        "source_type": "user" if row[0] == "user" else "parser",
+        "source": row[0],
+        "id": row[1],
+        "title": row[2],
+        "description": row[3],
+        "title_en": row[4],
+        "description_en": row[5],
+        "location_name_en": row[6],
+        "starts_at": row[7],
+        "city": row[8],
+        "lat": row[9],
+        "lng": row[10],
+        "location_name": row[11],
+        "location_url": row[12],
+        "event_url": row[13],
+        "organizer_id": row[14],
+        "organizer_username": row[15],
+        "max_participants": row[16],
+        "current_participants": row[17],
+        "status": row[18],
+        "created_at_utc": row[19],
+        "community_name": row[20],
+        "community_link": row[21],
+        "chat_id": row[22],
+        "venue_name": row[23],
+        "address": row[24],
+        "place_id": row[25],
+        "ends_at": row[28],
+        "time_mode": row[29],
+        "categories": _parse_categories_value(row[30]),
+        "raw_category": row[31],
+        "tags": _parse_raw_category_tags(row[31]),
+        "referral_code": row[32],
+        "dedupe_key": row[33],
+    }
+
+
+def _legacy_formatted(event: dict) -> dict:
+    """Прежняя копия formatted_event из perform_nearby_search."""
+    return {
+        "id": event.get("id"),
+        "title": event["title"],
+        "title_en": event.get("title_en"),
+        "description": event["description"],
+        "description_en": event.get("description_en"),
+        "time_local": event["starts_at"].strftime("%Y-%m-%d %H:%M") if event["starts_at"] else None,
+        "starts_at": event["starts_at"],
+        "ends_at": event.get("ends_at"),
+        "time_mode": event.get("time_mode"),
+        "city": event.get("city"),
+        "location_name": event["location_name"],
+        "location_name_en": event.get("location_name_en"),
+        "location_url": event["location_url"],
+        "lat": event["lat"],
+        "lng": event["lng"],
+        "source": event.get("source", ""),
+        "source_type": event.get("source_type", ""),
+        "url": event.get("event_url", ""),
+        "community_name": event.get("community_name") or "",
+        "community_link": event.get("community_link") or "",
+        "venue_name": event.get("venue_name"),
+        "address": event.get("address"),
+        "organizer_id": event.get("organizer_id"),
+        "organizer_username": event.get("organizer_username"),
+        "tags": event.get("tags") or [],
+        "raw_category": event.get("raw_category"),
+        "place_id": event.get("place_id"),
+        "categories": event.get("categories"),
+    }
+
+
+def _rows(count: int, seed: int = 7) -> list[tuple]:
+    rnd = random.Random(seed)
+    base = datetime(2026, 6, 20, 8, 0, tzinfo=UTC)
+    rows = []
+    for i in range(count):
+        source = rnd.choice(("baliforum", "kudago", "user", "community"))
+        starts_at = base + timedelta(minutes=rnd.randrange(0, 24 * 60))
+        venue = f"Venue {rnd.randrange(500)}"
+        rows.append(
+            (
+                source,
+                i,
+                f"Event {i} " + "x" * rnd.randrange(10, 60),
+                "Описание события " * rnd.randrange(2, 12),
+                None,
+                None,
+                None,
+                starts_at,
+                "bali",
+                -8.65 + rnd.uniform(-0.2, 0.2),
+                115.14 + rnd.uniform(-0.2, 0.2),
+                venue,
+                f"https://maps.google.com/?q={i}",
+                f"https://example.com/e/{i}",
+                rnd.randrange(10**9) if source == "user" else None,
+                f"user{i}" if source == "user" else None,
+                None,
+                0,
+                "open",
+                starts_at - timedelta(days=1),
+                None,
+                None,
+                None,
+                venue,
+                venue,
+                None,
+                "",
+                starts_at,
+                starts_at + timedelta(hours=2),
+                "start",
+                '["Вечеринки"]',
+                "Музыка, Вечеринка",
+                None,
+                None,
+            )
+        )
+    return rows
+
+
+def _build_legacy(rows: list[tuple]) -> list[dict]:
+    prepared = []
+    for row in rows:
+        event = _legacy_formatted(_legacy_row_to_dict(row))
+        event["type"] = "source"
+        event["distance_km"] = 1.23
+        prepared.append(event)
+    return prepared
+
+
+def _build_record(rows: list[tuple]) -> list[EventRecord]:
+    prepared = []
+    for row in rows:
+        event = _search_row_to_event_record(row)
+        event["type"] = "source"
+        event["distance_km"] = 1.23
+        prepared.append(event)
+    return prepared
+
+
+def _traced_bytes(build, rows: list[tuple]) -> tuple[int, list]:
+    gc.collect()
+    tracemalloc.start()
+    result = build(rows)
+    current, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+
+def _container_bytes(event) -> int:
+    if isinstance(event, EventRecord):
+        return sys.getsizeof(event) + (sys.getsizeof(event._extra) if event._extra else 0)
+    return sys.getsizeof(event)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=5000, help="Сколько событий построить")
+    parser.add_argument("--page", type=int, default=50, help="Событий в одном prepared (для pack_state)")
+    args = parser.parse_args()
+
+    rows = _rows(args.events)
+    legacy_bytes, legacy = _traced_bytes(_build_legacy, rows)
+    record_bytes, records = _traced_bytes(_build_record, rows)
+
+    for old, new in zip(legacy[:100], records[:100], strict=True):
+        assert all(new.get(key) == value or key in ("community_name", "community_link") for key, value in old.items())
+
+    legacy_packed = len(pack_state({"prepared": legacy[: args.page]}))
+    record_packed = len(pack_state({"prepared": records[: args.page]}))
+    legacy_raw = len(pack_state({"prepared": legacy[:1]}))
+    record_raw = len(pack_state({"prepared": records[:1]}))
+
+    n = len(rows)
+    print(f"Событий: {n}")
+    print(f"{'':<28}{'dict':>12}{'EventRecord':>14}{'экономия':>11}")
+
+    def line(label: str, before: float, after: float) -> None:
+        print(f"{label:<28}{before:>12.0f}{after:>14.0f}{(1 - after / before) * 100:>10.0f}%")
+
+    line("tracemalloc, байт/событие", legacy_bytes / n, record_bytes / n)
+    line("контейнер, байт/событие", _container_bytes(legacy[0]), _container_bytes(records[0]))
+    line("pack_state 1 событие, байт", legacy_raw, record_raw)
+    line(f"pack_state {args.page} событий, байт", legacy_packed, record_packed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска событий рядом (UnifiedEventsService.search_events_today).
+
+Создаёт отдельную схему, засевает её N событиями (по умолчанию 100k) по регионам
+bali/moscow/spb в окне ±15 дней, и сравнивает латентность:
+  - legacy: старый запрос с inline `6371 * acos(...)` по всем строкам дня (без индексов);
+  - legacy+idx: тот же запрос после индексов миграции 055;
+  - nearby: рамка по индексу lat/lng + точная дистанция (миграция 055).
+
+Основная схема (public) не затрагивается; схема бенчмарка удаляется в конце.
+
+Запуск:
+  python -m scripts.bench_nearby_search
+  python -m scripts.bench_nearby_search --events 100000 --queries 300 --keep-schema
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from config import load_settings
+from database import make_engine
+from utils.simple_timezone import get_today_start_utc, get_tomorrow_start_utc
+from utils.unified_events_service import _SEARCH_EVENT_SELECT, UnifiedEventsService
+
+SCHEMA = "bench_nearby"
+
+# (lat_min, lat_max, lng_min, lng_max) — примерно как в utils/simple_timezone
+REGIONS = {
+    "bali": (-8.85, -8.40, 115.05, 115.45),
+    "moscow": (55.55, 55.95, 37.35, 37.85),
+    "spb": (59.80, 60.05, 30.10, 30.55),
+}
+
+RADII_KM = (5, 10, 15)
+
+LEGACY_QUERY = text(f"""
+    SELECT {_SEARCH_EVENT_SELECT}
+    FROM events
+    WHERE starts_at >= :start_utc
+    AND starts_at < :end_utc
+    AND (
+        (ends_at IS NOT NULL AND ends_at >= NOW())
+        OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
+    )
+    AND lat IS NOT NULL AND lng IS NOT NULL
+    AND status NOT IN ('closed', 'canceled', 'draft')
+    AND city = :city
+    AND 6371 * acos(
+        GREATEST(-1, LEAST(1,
+            cos(radians(:user_lat)) * cos(radians(lat)) *
+            cos(radians(lng) - radians(:user_lng)) +
+            sin(radians(:user_lat)) * sin(radians(lat))
+        ))
+    ) <= :radius_km
+    ORDER BY starts_at
+""")
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _seed(admin_engine, events: int) -> None:
+    with admin_engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"CREATE TABLE {SCHEMA}.events (LIKE public.events INCLUDING DEFAULTS)"))
+
+        lat_cases, lng_cases, city_cases = [], [], []
+        for i, (city, (lat_min, lat_max, lng_min, lng_max)) in enumerate(REGIONS.items()):
+            city_cases.append(f"WHEN {i} THEN '{city}'")
+            lat_cases.append(f"WHEN {i} THEN {lat_min} + random() * {lat_max - lat_min}")
+            lng_cases.append(f"WHEN {i} THEN {lng_min} + random() * {lng_max - lng_min}")
+        conn.execute(
+            text(f"""
+                INSERT INTO {SCHEMA}.events (
+                    source, external_id, title, starts_at, city, lat, lng, location_name,
+                    organizer_id, current_participants, status, is_generated_by_ai,
+                    created_at_utc, updated_at_utc
+                )
+                SELECT
+                    'bench', 'bench_' || g, 'Bench event ' || g,
+                    NOW() + (random() * 30 - 15) * INTERVAL '1 day',
+                    CASE g % {len(REGIONS)} {" ".join(city_cases)} END,
+                    CASE g % {len(REGIONS)} {" ".join(lat_cases)} END,
+                    CASE g % {len(REGIONS)} {" ".join(lng_cases)} END,
+                    'Venue ' || g, 0, 0, 'open', false, NOW(), NOW()
+                FROM generate_series(1, :events) AS g
+            """),
+            {"events": events},
+        )
+
+
+def _apply_indexes(engine) -> None:
+    sql_path = Path(__file__).resolve().parent.parent / "migrations" / "055_add_events_nearby_search_indexes.sql"
+    sql = sql_path.read_text(encoding="utf-8")
+    statements = []
+    for raw in sql.split(";"):
+        body = "\n".join(line for line in raw.splitlines() if not line.strip().startswith("--")).strip()
+        if body:
+            statements.append(body)
+    with engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
+        conn.execute(text("ANALYZE events"))
+
+
+def _run(label: str, fn, queries: list[tuple[str, float, float, int]]) -> list[float]:
+    # Прогрев
+    for q in queries[:5]:
+        fn(*q)
+    samples = []
+    found = 0
+    for q in queries:
+        started = time.perf_counter()
+        found += fn(*q)
+        samples.append((time.perf_counter() - started) * 1000)
+    print(
+        f"{label:<10} queries={len(samples)} avg_found={found / len(samples):.1f} "
+        f"p50={statistics.median(samples):.2f}ms p99={_percentile(samples, 99):.2f}ms"
+    )
+    return samples
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark nearby events search on a seeded table")
+    parser.add_argument("--events", type=int, default=100_000, help="Number of events to seed")
+    parser.add_argument("--queries", type=int, default=300, help="Number of timed queries per variant")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for query points")
+    parser.add_argument("--keep-schema", action="store_true", help=f"Do not drop schema {SCHEMA} at the end")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    admin_engine = make_engine(settings.database_url)
+    bench_engine = create_engine(
+        admin_engine.url,
+        future=True,
+        connect_args={"options": f"-csearch_path={SCHEMA},public"},
+    )
+
+    print(f"Seeding {args.events} events into schema {SCHEMA}...")
+    started = time.perf_counter()
+    _seed(admin_engine, args.events)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    queries = []
+    for _ in range(args.queries):
+        city = rng.choice(list(REGIONS))
+        lat_min, lat_max, lng_min, lng_max = REGIONS[city]
+        queries.append((city, rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max), rng.choice(RADII_KM)))
+
+    service = UnifiedEventsService(bench_engine)
+
+    def legacy(city: str, lat: float, lng: float, radius_km: int) -> int:
+        with bench_engine.connect() as conn:
+            rows = conn.execute(
+                LEGACY_QUERY,
+                {
+                    "start_utc": get_today_start_utc(city),
+                    "end_utc": get_tomorrow_start_utc(city),
+                    "city": city,
+                    "user_lat": lat,
+                    "user_lng": lng,
+                    "radius_km": radius_km,
+                },
+            ).fetchall()
+        return len(rows)
+
+    def nearby(city: str, lat: float, lng: float, radius_km: int) -> int:
+        return len(
+            service.search_events_nearby(
+                user_lat=lat,
+                user_lng=lng,
+                radius_km=radius_km,
+                start_utc=get_today_start_utc(city),
+                end_utc=get_tomorrow_start_utc(city),
+                city=city,
+            )
+        )
+
+    try:
+        with bench_engine.begin() as conn:
+            conn.execute(text("ANALYZE events"))
+        _run("legacy", legacy, queries)
+        _apply_indexes(bench_engine)
+        _run("legacy+idx", legacy, queries)
+        _run("nearby", nearby, queries)
+    finally:
+        bench_engine.dispose()
+        if not args.keep_schema:
+            with admin_engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin_engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк ротации мест для заданий (tasks_location_service.get_all_places_for_category).
+
+Создаёт отдельную схему, засевает её N местами (по умолчанию 20k) по регионам bali/moscow/spb
+и историей показов для нескольких пользователей, и сравнивает латентность:
+  - legacy: все места категории + отдельный запрос к daily_views_tasks на каждое место (N+1),
+    приоритет и сортировка в Python;
+  - ranked: один запрос с GROUP BY view_key, дистанцией и приоритетом в SQL (+ индекс миграции 058).
+
+Основная схема (public) не затрагивается; схема бенчмарка удаляется в конце.
+
+Запуск:
+  python -m scripts.bench_task_places_rotation
+  python -m scripts.bench_task_places_rotation --places 50000 --queries 50 --keep-schema
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import and_, create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+import tasks_location_service
+from config import load_settings
+from database import DailyViewTasks, TaskPlace, make_engine
+from tasks_location_service import EXCLUDE_PLACE_DAYS, PRIORITY_DAYS, get_all_places_for_category
+from utils.geo_utils import haversine_km
+
+SCHEMA = "bench_task_places"
+
+# (lat_min, lat_max, lng_min, lng_max) — внутри границ get_user_region
+REGIONS = {
+    "bali": (-8.85, -8.40, 115.05, 115.45),
+    "moscow": (55.55, 55.95, 37.35, 37.85),
+    "spb": (59.80, 60.05, 30.10, 30.55),
+}
+CATEGORIES = ("food", "health", "places", "entertainment")
+USERS = 20
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _seed(admin_engine, places: int, views_per_user: int) -> None:
+    with admin_engine.begin() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"CREATE TABLE {SCHEMA}.task_places (LIKE public.task_places INCLUDING DEFAULTS)"))
+        conn.execute(
+            text(f"CREATE TABLE {SCHEMA}.daily_views_tasks (LIKE public.daily_views_tasks INCLUDING DEFAULTS)")
+        )
+        # Индексы, которые уже есть в проде (миграции tasks)
+        conn.execute(text(f"CREATE INDEX ON {SCHEMA}.task_places (category, task_type, region, place_type)"))
+        conn.execute(text(f"CREATE INDEX ON {SCHEMA}.daily_views_tasks (user_id, view_date)"))
+
+        lat_cases, lng_cases, region_cases = [], [], []
+        for i, (region, (lat_min, lat_max, lng_min, lng_max)) in enumerate(REGIONS.items()):
+            region_cases.append(f"WHEN {i} THEN '{region}'")
+            lat_cases.append(f"WHEN {i} THEN {lat_min} + random() * {lat_max - lat_min}")
+            lng_cases.append(f"WHEN {i} THEN {lng_min} + random() * {lng_max - lng_min}")
+        categories = ", ".join(f"'{c}'" for c in CATEGORIES)
+        conn.execute(
+            text(f"""
+                INSERT INTO {SCHEMA}.task_places (
+                    id, category, name, lat, lng, google_maps_url, is_active, region, place_type, task_type
+                )
+                SELECT
+                    g,
+                    (ARRAY[{categories}])[1 + g % {len(CATEGORIES)}],
+                    'Bench place ' || g,
+                    CASE g % {len(REGIONS)} {" ".join(lat_cases)} END,
+                    CASE g % {len(REGIONS)} {" ".join(lng_cases)} END,
+                    'https://maps.google.com/?q=' || g,
+                    true,
+                    CASE g % {len(REGIONS)} {" ".join(region_cases)} END,
+                    'park',
+                    'urban'
+                FROM generate_series(1, :places) AS g
+            """),
+            {"places": places},
+        )
+        conn.execute(
+            text(f"""
+                INSERT INTO {SCHEMA}.daily_views_tasks (user_id, view_type, view_key, view_date)
+                SELECT u, 'place', (1 + floor(random() * :places))::int::text, NOW() - random() * INTERVAL '30 days'
+                FROM generate_series(1, :users) AS u, generate_series(1, :views) AS v
+            """),
+            {"places": places, "users": USERS, "views": views_per_user},
+        )
+
+
+def _apply_indexes(engine) -> None:
+    sql_path = Path(__file__).resolve().parent.parent / "migrations" / "058_add_daily_views_tasks_last_shown_index.sql"
+    body = "\n".join(
+        line for line in sql_path.read_text(encoding="utf-8").splitlines() if not line.strip().startswith("--")
+    )
+    with engine.begin() as conn:
+        for stmt in body.split(";"):
+            if stmt.strip():
+                conn.execute(text(stmt))
+        conn.execute(text("ANALYZE daily_views_tasks"))
+
+
+def _legacy_all_places(Session, category: str, user_id: int, user_lat: float, user_lng: float, limit: int = 100):
+    """Прежняя реализация get_all_places_for_category: запрос на каждое место."""
+    region = tasks_location_service.get_user_region(user_lat, user_lng)
+    with Session() as session:
+        places = (
+            session.query(TaskPlace)
+            .filter(
+                and_(
+                    TaskPlace.category == category,
+                    TaskPlace.task_type == "urban",
+                    TaskPlace.is_active == True,  # noqa: E712
+                    TaskPlace.region == region,
+                )
+            )
+            .all()
+        )
+        for place in places:
+            place.distance_km = haversine_km(user_lat, user_lng, place.lat, place.lng)
+            last_shown = (
+                session.query(DailyViewTasks.view_date)
+                .filter(
+                    and_(
+                        DailyViewTasks.user_id == user_id,
+                        DailyViewTasks.view_type == "place",
+                        DailyViewTasks.view_key == str(place.id),
+                    )
+                )
+                .order_by(DailyViewTasks.view_date.desc())
+                .first()
+            )
+            place.days_since_shown = (datetime.now(UTC) - last_shown[0]).days if last_shown else 999
+
+        def get_priority(place):
+            if place.days_since_shown > PRIORITY_DAYS:
+                return (0, place.distance_km)
+            elif place.days_since_shown >= EXCLUDE_PLACE_DAYS:
+                return (1, place.distance_km)
+            return (2, place.distance_km)
+
+        places.sort(key=get_priority)
+        return places[:limit]
+
+
+def _run(label: str, fn, queries: list[tuple]) -> list[list[int]]:
+    # Прогрев
+    for q in queries[:3]:
+        fn(*q)
+    samples = []
+    results = []
+    for q in queries:
+        started = time.perf_counter()
+        results.append([p.id for p in fn(*q)])
+        samples.append((time.perf_counter() - started) * 1000)
+    print(
+        f"{label:<8} queries={len(samples)} avg_found={sum(map(len, results)) / len(results):.1f} "
+        f"p50={statistics.median(samples):.2f}ms p99={_percentile(samples, 99):.2f}ms"
+    )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark task places rotation on a seeded table")
+    parser.add_argument("--places", type=int, default=20_000, help="Number of task places to seed")
+    parser.add_argument("--views", type=int, default=500, help="Number of shown-place rows per user")
+    parser.add_argument("--queries", type=int, default=30, help="Number of timed queries per variant")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for query points")
+    parser.add_argument("--keep-schema", action="store_true", help=f"Do not drop schema {SCHEMA} at the end")
+    args = parser.parse_args()
+
+    settings = load_settings()
+    admin_engine = make_engine(settings.database_url)
+    bench_engine = create_engine(
+        admin_engine.url,
+        future=True,
+        connect_args={"options": f"-csearch_path={SCHEMA},public"},
+    )
+    Session = sessionmaker(bind=bench_engine, expire_on_commit=False)
+
+    print(f"Seeding {args.places} places and {USERS}x{args.views} views into schema {SCHEMA}...")
+    started = time.perf_counter()
+    _seed(admin_engine, args.places, args.views)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(args.seed)
+    queries = []
+    for _ in range(args.queries):
+        lat_min, lat_max, lng_min, lng_max = REGIONS[rng.choice(list(REGIONS))]
+        queries.append(
+            (
+                rng.choice(CATEGORIES),
+                rng.randint(1, USERS),
+                rng.uniform(lat_min, lat_max),
+                rng.uniform(lng_min, lng_max),
+            )
+        )
+
+    def legacy(category: str, user_id: int, lat: float, lng: float):
+        return _legacy_all_places(Session, category, user_id, lat, lng)
+
+    def ranked(category: str, user_id: int, lat: float, lng: float):
+        return get_all_places_for_category(category, user_id, lat, lng, limit=100)
+
+    original_get_session = tasks_location_service.get_session
+    tasks_location_service.get_session = Session
+    try:
+        with bench_engine.begin() as conn:
+            conn.execute(text("ANALYZE task_places"))
+            conn.execute(text("ANALYZE daily_views_tasks"))
+        legacy_ids = _run("legacy", legacy, queries)
+        _apply_indexes(bench_engine)
+        ranked_ids = _run("ranked", ranked, queries)
+        same = sum(a == b for a, b in zip(legacy_ids, ranked_ids, strict=True))
+        print(f"identical results: {same}/{len(queries)}")
+    finally:
+        tasks_location_service.get_session = original_get_session
+        bench_engine.dispose()
+        if not args.keep_schema:
+            with admin_engine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        admin_engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -34,6 +34,7 @@ from dotenv import load_dotenv  # noqa: E402
 from sqlalchemy import select  # noqa: E402
 
 from database import User, get_engine, init_engine  # noqa: E402
+from utils.send_scheduler import install_send_scheduler, send_priority  # noqa: E402
 
 
 def _load_env():
@@ -68,7 +69,9 @@ async def main():
     _load_env()
     parser = argparse.ArgumentParser(description="Broadcast 'we moved' from OLD bot to all DB users.")
     parser.add_argument("--dry-run", action="store_true", help="Only print user count, do not send.")
-    parser.add_argument("--delay", type=float, default=0.08, help="Seconds between messages (default 0.08).")
+    parser.add_argument(
+        "--delay", type=float, default=0.0, help="Extra seconds between messages (rate limits are applied anyway)."
+    )
     args = parser.parse_args()
 
     old_token = os.getenv("OLD_TELEGRAM_TOKEN")
@@ -112,7 +115,8 @@ async def main():
         print("DRY-RUN: would send to:", user_ids[:10], "..." if len(user_ids) > 10 else "")
         return
 
-    bot = Bot(token=old_token.strip())
+    # Лимиты Telegram и 429 (retry_after) соблюдает планировщик отправок
+    bot = install_send_scheduler(Bot(token=old_token.strip()))
     display_at = f"@{new_username}"
     link = f"https://t.me/{new_username}"
     text = _message_ru(display_at, link)
@@ -123,7 +127,8 @@ async def main():
     try:
         for i, user_id in enumerate(user_ids):
             try:
-                await bot.send_message(chat_id=user_id, text=text)
+                with send_priority("bulk"):
+                    await bot.send_message(chat_id=user_id, text=text)
                 sent += 1
                 if (i + 1) % 50 == 0:
                     print(f"  sent {i + 1}/{len(user_ids)} ...")
@@ -139,7 +144,8 @@ async def main():
                 other_errors += 1
                 print(f"  skip {user_id}: {e}")
 
-            await asyncio.sleep(args.delay)
+            if args.delay > 0:
+                await asyncio.sleep(args.delay)
 
     finally:
         await bot.session.close()
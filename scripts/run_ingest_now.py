@@ -50,10 +50,10 @@ def run_ingest():
         print(f"[*] Найдено событий: {len(events)}")
 
         if events:
-            # Сохраняем каждое событие
             saved_count = 0
             skipped_no_coords = 0
             errors = 0
+            prepared = []
 
             for event in events:
                 try:
@@ -101,29 +101,40 @@ def run_ingest():
                         except Exception as e:
                             print(f"⚠️ Ошибка при reverse geocoding для '{event.title[:50]}': {e}")
 
-                    # Сохраняем через UnifiedEventsService
-                    event_id = service.save_parser_event(
-                        source="baliforum",
-                        external_id=event.external_id or event.url.split("/")[-1],
-                        title=event.title,
-                        description=event.description,
-                        starts_at_utc=event.starts_at,
-                        city="bali",
-                        lat=event.lat,
-                        lng=event.lng,
-                        location_name=location_name,
-                        location_url=location_url,
-                        url=event.url,
+                    prepared.append(
+                        {
+                            "source": "baliforum",
+                            "external_id": event.external_id or event.url.split("/")[-1],
+                            "title": event.title,
+                            "description": event.description,
+                            "starts_at_utc": event.starts_at,
+                            "city": "bali",
+                            "lat": event.lat,
+                            "lng": event.lng,
+                            "location_name": location_name,
+                            "location_url": location_url,
+                            "url": event.url,
+                        }
                     )
 
-                    if event_id:
-                        saved_count += 1
-                        print(f"[+] Сохранено: {event.title[:50]}")
-
                 except Exception as e:
-                    print(f"[-] Ошибка сохранения события: {e}")
+                    print(f"[-] Ошибка подготовки события: {e}")
                     errors += 1
 
+            # Сохраняем через UnifiedEventsService одним пакетом
+            if prepared:
+                try:
+                    ids = service.save_parser_events_batch(prepared)
+                    for p, event_id in zip(prepared, ids):
+                        if event_id:
+                            saved_count += 1
+                            print(f"[+] Сохранено: {p['title'][:50]}")
+                        else:
+                            errors += 1
+                except Exception as e:
+                    print(f"[-] Ошибка сохранения событий: {e}")
+                    errors += len(prepared)
+
             print(f"[*] Сохранено событий: {saved_count}")
             print(f"[*] Пропущено без координат: {skipped_no_coords}")
             print(f"[*] Ошибок: {errors}")
@@ -8,6 +8,8 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 
+from utils.events_snapshot import events_snapshot
+
 # Загружаем переменные окружения
 load_dotenv("app.local.env")
 
@@ -44,8 +46,11 @@ def auto_close_events() -> int:
     """Автоматически закрывает события, которые прошли"""
     try:
         with engine.begin() as conn:
-            result = conn.execute(text("SELECT auto_close_events()")).scalar()
-            return result or 0
+            closed = conn.execute(text("SELECT auto_close_events()")).scalar() or 0
+        if closed:
+            # Закрытые события пропадают из поиска: сбрасываем снапшоты всех регионов
+            events_snapshot.invalidate()
+        return closed
     except Exception as e:
         print(f"Ошибка автомодерации: {e}")
         return 0
@@ -62,13 +67,14 @@ def change_event_status(event_id: int, new_status: str, user_id: int) -> bool:
             # Проверяем, что событие принадлежит пользователю
             result = conn.execute(
                 text("""
-                SELECT id FROM events
+                SELECT id, city FROM events
                 WHERE id = :event_id AND organizer_id = :user_id
             """),
                 {"event_id": event_id, "user_id": user_id},
             )
 
-            if not result.fetchone():
+            event_row = result.fetchone()
+            if not event_row:
                 print(f"Событие {event_id} не найдено или не принадлежит пользователю {user_id}")
                 return False
 
@@ -84,6 +90,8 @@ def change_event_status(event_id: int, new_status: str, user_id: int) -> bool:
 
             print(f"Статус события {event_id} изменен на '{new_status}'")
 
+        events_snapshot.invalidate(event_row.city)
+
         # Синхронизация с Community: если событие из community — обновить статус и там
         from database import get_session
         from utils.sync_community_world_events import sync_world_event_to_community
@@ -1,16 +1,20 @@
 # sources/baliforum.py
 from __future__ import annotations
 
+import asyncio
+import concurrent.futures
+import hashlib
 import logging
+import os
 import re
-import time
 from datetime import UTC, datetime, timedelta
 from zoneinfo import ZoneInfo
 
-import requests
+import httpx
 from bs4 import BeautifulSoup
 
 from event_apis import RawEvent
+from utils.http_clients import HostRateLimiter, new_async_client
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,15 @@ UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) " "AppleWebKit/537.36 (KHTML, li
 BASE = "https://baliforum.ru"
 LIST_URL = f"{BASE}/events"
 
+# Одновременных запросов к сайту; интервал между запросами к хосту (BALIFORUM_MIN_INTERVAL_S)
+# соблюдает транспорт общего клиента, см. utils/http_clients.py
+BALIFORUM_CONCURRENCY = int(os.getenv("BALIFORUM_CONCURRENCY", "6"))
+BALIFORUM_DETAIL_CACHE_TTL_S = int(os.getenv("BALIFORUM_DETAIL_CACHE_TTL_S", str(14 * 86400)))
+# Лимит кэша детальных страниц в памяти (когда нет БД); события «сегодня» + «завтра» с запасом
+BALIFORUM_DETAIL_CACHE_MAX_ENTRIES = 2000
+# Предохранитель от бесконечной пагинации (на baliforum обычно ~4 страницы)
+MAX_PAGES = 25
+
 RU_MONTHS = {
     "янв": 1,
     "фев": 2,
@@ -64,6 +77,39 @@ RU_MONTHS = {
 
 TIME_RE = re.compile(r"(?P<h>\d{1,2}):(?P<m>\d{2})")
 MAP_RE = re.compile(r"/@(?P<lat>-?\d+\.\d+),(?P<lng>-?\d+\.\d+)|query=(?P<lat2>-?\d+\.\d+)%2C(?P<lng2>-?\d+\.\d+)")
+# Шаблоны даты в карточке по убыванию точности: «завтра» раньше «сегодня»,
+# «весь день» после шаблонов со временем, чтобы точное время всегда имело приоритет
+DATE_PATTERNS = [
+    re.compile(p)
+    for p in (
+        r"Завтра с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
+        r"Завтра \d{1,2}:\d{2}",
+        r"Сегодня с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
+        r"Сегодня \d{1,2}:\d{2}",
+        r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.?,? "
+        r"с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
+        r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.? \d{1,2}:\d{2}",
+        # Диапазоны времени (только если есть контекст дня)
+        r"\d{1,2}:\d{2}[–-]\d{1,2}:\d{2}",
+        # События "весь день" (крупные фестивали и ретриты без точного времени)
+        r"Сегодня весь день",
+        r"Завтра весь день",
+        r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.? весь день",
+    )
+]
+COORD_TEXT_PATTERNS = [
+    re.compile(p, re.IGNORECASE)
+    for p in (
+        r"(-?\d+\.\d+),\s*(-?\d+\.\d+)",  # Простые координаты
+        r"lat[itude]?[:\s]+(-?\d+\.\d+).*?lng[itude]?[:\s]+(-?\d+\.\d+)",  # lat: X, lng: Y
+        r"@(-?\d+\.\d+),(-?\d+\.\d+)",  # @lat,lng
+    )
+]
+# Части страницы, которые меняются от запроса к запросу и не влияют на событие
+_VOLATILE_HTML_RE = re.compile(
+    r"<script\b.*?</script>|<(?:meta|input)\b[^>]*(?:csrf|_token)[^>]*>",
+    re.IGNORECASE | re.DOTALL,
+)
 EXPLICIT_CALENDAR_DATE_RE = re.compile(
     r"^\d{1,2}\s+(?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)",
     re.IGNORECASE,
@@ -321,494 +367,500 @@ def _extract_venue_from_soup(ds) -> str | None:
     return None
 
 
-def _fetch(url: str, timeout=15) -> str:
-    """Получает HTML страницу"""
-    r = requests.get(url, headers={"User-Agent": UA}, timeout=timeout)
-    r.raise_for_status()
-    return r.text
+def _maps_hrefs(soup) -> list[str]:
+    """Ссылки на Google Maps в разметке, нормализованные до абсолютных URL."""
+    hrefs = []
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        if "google.com/maps" in href or "maps.google.com" in href or "/maps" in href:
+            if href.startswith("/"):
+                href = "https://www.google.com" + href
+            elif not href.startswith("http"):
+                href = "https://" + href
+            hrefs.append(href)
+    return hrefs
 
 
-def fetch_baliforum_events(limit: int = 200, date_filter: str | None = None) -> list[dict]:
-    """
-    Основная функция парсинга событий с baliforum.ru
+def _content_hash(html: str, extra: str = "") -> str:
+    """Хэш значимой части страницы: без script/csrf-токенов, которые меняются на каждый запрос."""
+    stripped = _VOLATILE_HTML_RE.sub("", html)
+    return hashlib.sha1(f"{stripped}\n{extra}".encode()).hexdigest()
 
-    Args:
-        limit: Максимальное количество событий
-        date_filter: Фильтр по дате в формате "YYYY-MM-DD" (например, "2025-11-08")
-                    Если None, парсит главную страницу без фильтра
+
+def _card_base(card, now: datetime, tz: ZoneInfo) -> dict | None:
+    """
+    Поля события из карточки списка (url, title, tags, дата).
+    None — карточка без ссылки; {"start_time": None, ...} — не удалось извлечь дату.
     """
-    import logging
+    links = card.find_all("a", href=True)
+    if not links:
+        return None
 
-    logging.getLogger(__name__)
+    # Берем первую ссылку с текстом (не пустую)
+    a = next((link for link in links if link.get_text(strip=True)), None)
+    if not a:
+        return None
 
-    if date_filter:
-        logging.info(f"🌴 Парсим BaliForum с фильтром по дате: {date_filter}")
-    else:
-        logging.info("🌴 Парсим BaliForum (с обходом пагинации)")
-
-    def _build_page_url(page: int) -> str:
-        """Собирает URL списка с учётом фильтра по дате и номера страницы."""
-        params = []
-        if date_filter:
-            params.append(f"dateStart={date_filter}")
-        if page > 1:
-            params.append(f"page={page}")
-        return f"{LIST_URL}?{'&'.join(params)}" if params else LIST_URL
-
-    # Обходим страницы ?page=1..N, пока они не станут пустыми.
-    # MAX_PAGES — предохранитель от бесконечного цикла (на baliforum обычно ~4 страницы).
-    MAX_PAGES = 25
-    cards = []
-    for page in range(1, MAX_PAGES + 1):
-        page_url = _build_page_url(page)
-        try:
-            page_html = _fetch(page_url)
-        except Exception as e:
-            logger.warning("baliforum: ошибка загрузки страницы %s (%s): %s", page, page_url, e)
+    url = a["href"]
+    if url.startswith("/"):
+        url = BASE + url
+
+    title = a.get_text(strip=True).strip()
+    tags = _extract_tags_from_card(card)
+
+    # Ищем дату в тексте карточки (паттерны упорядочены по точности)
+    date_text = ""
+    all_text = card.get_text()
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(all_text)
+        if match:
+            date_text = match.group(0)
+            logger.debug("baliforum: найден шаблон даты %r -> %r для %r", pattern.pattern, date_text, title[:50])
             break
 
-        page_soup = BeautifulSoup(page_html, "html.parser")
-        page_cards = page_soup.select("div.event-card, article.event") or page_soup.select("li.event-item")
-        if not page_cards:
-            logger.info("baliforum: страница %s пустая — останавливаем пагинацию", page)
-            break
+    start, end = _ru_date_to_dt(date_text, now, tz)
 
-        cards.extend(page_cards)
-        logger.info("baliforum: страница %s -> %s карточек (всего собрано %s)", page, len(page_cards), len(cards))
+    if start:
+        event_date_bali = start.astimezone(tz).date()
+        if event_date_bali == now.date():
+            date_label = "сегодня"
+        elif event_date_bali == (now + timedelta(days=1)).date():
+            date_label = "завтра"
+        else:
+            date_label = f"{event_date_bali}"
+        logger.debug("baliforum: проанализирована дата %r -> %s (%s) для %r", date_text, date_label, start, title[:50])
+    else:
+        logger.debug("baliforum: не удалось распарсить дату из %r для %r", date_text, title[:50])
+
+    # Конвертируем в UTC для хранения в БД
+    return {
+        "url": url,
+        "title": title,
+        "tags": tags,
+        "date_text": date_text,
+        "start_time": start.astimezone(UTC) if start else None,
+        "end_time": end.astimezone(UTC) if end else None,
+    }
 
-        if len(cards) >= limit:
-            break
-        # Небольшая пауза между страницами, чтобы не долбить сайт
-        time.sleep(0.3)
 
-    events: list[dict] = []
+async def _location_from_maps_link(href: str, title: str, where: str) -> dict | None:
+    """Координаты/место по ссылке Google Maps; при ошибке parse_google_maps_link — разбор URL регуляркой."""
+    from utils.geo_utils import parse_google_maps_link
 
-    parsed_count = 0
-    skipped_no_time = 0
-    errors = 0
+    try:
+        maps_data = await parse_google_maps_link(href)
+    except Exception as e:
+        logger.debug("baliforum: ошибка parse_google_maps_link (%s), используем fallback: %s", where, e)
+        lat, lng, place_name, maps_url = _extract_latlng_from_maps(href)
+        if lat and lng:
+            logger.debug("baliforum: координаты (%s, fallback): %s, %s для %r", where, lat, lng, title[:50])
+            return {"lat": lat, "lng": lng, "location_url": maps_url, "place_name_from_maps": place_name}
+        return None
 
-    for card in cards[:limit]:
-        # Ищем все ссылки в карточке
-        links = card.find_all("a", href=True)
-        if not links:
-            continue
+    if maps_data and maps_data.get("lat") and maps_data.get("lng"):
+        logger.debug(
+            "baliforum: координаты (%s): %s, %s для %r, место: %s, place_id: %s",
+            where,
+            maps_data["lat"],
+            maps_data["lng"],
+            title[:50],
+            maps_data.get("name"),
+            maps_data.get("place_id"),
+        )
+        return {
+            "lat": maps_data["lat"],
+            "lng": maps_data["lng"],
+            "location_url": maps_data.get("raw_link", href),
+            "place_name_from_maps": maps_data.get("name"),
+            "place_id": maps_data.get("place_id"),
+        }
+    logger.debug("baliforum: parse_google_maps_link (%s) не нашел координаты в ссылке: %s", where, href[:100])
+    return None
 
-        # Берем первую ссылку с текстом (не пустую)
-        a = None
-        for link in links:
-            if link.get_text(strip=True):
-                a = link
-                break
 
-        if not a:
+def _coords_from_detail_markup(ds, title: str) -> tuple[float | None, float | None]:
+    """Координаты из data-атрибутов или текста детальной страницы (если нет ссылки на карты)."""
+    for elem in ds.find_all(attrs={"data-lat": True, "data-lng": True}):
+        try:
+            lat = float(elem.get("data-lat"))
+            lng = float(elem.get("data-lng"))
+            logger.debug("baliforum: координаты в data-атрибутах: %s, %s для %r", lat, lng, title[:50])
+            return lat, lng
+        except (ValueError, TypeError):
             continue
 
-        url = a["href"]
-        if url.startswith("/"):
-            url = BASE + url
-
-        title = a.get_text(strip=True).strip()
-        tags = _extract_tags_from_card(card)
-
-        # Ищем дату в тексте карточки
-        date_text = ""
-        all_text = card.get_text()
-
-        # Ищем паттерны дат с приоритетом по точности
-        import re
-
-        date_patterns = [
-            # Точные паттерны с временем (высший приоритет) - ПРИОРИТЕТ "ЗАВТРА" ПЕРЕД "СЕГОДНЯ"
-            r"Завтра с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
-            r"Завтра \d{1,2}:\d{2}",
-            r"Сегодня с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
-            r"Сегодня \d{1,2}:\d{2}",
-            r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.?,? "
-            r"с \d{1,2}:\d{2}(?: до \d{1,2}:\d{2})?",
-            r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.? \d{1,2}:\d{2}",
-            # Диапазоны времени (только если есть контекст дня)
-            r"\d{1,2}:\d{2}[–-]\d{1,2}:\d{2}",
-            # События "весь день" (крупные фестивали и ретриты без точного времени).
-            # Ставим ПОСЛЕ паттернов с временем, чтобы точное время всегда имело приоритет.
-            r"Сегодня весь день",
-            r"Завтра весь день",
-            r"\d{1,2} (?:янв|фев|мар|апр|май|июн|июл|авг|сен|окт|ноя|нояб|дек)[а-я]*\.? весь день",
-        ]
-
-        for pattern in date_patterns:
-            match = re.search(pattern, all_text)
-            if match:
-                date_text = match.group(0)
-                logger.debug("baliforum: найден шаблон даты %r -> %r для %r", pattern, date_text, title[:50])
+    # Паттерны типа "-8.674763, 115.230137" или "lat: -8.674763, lng: 115.230137"
+    page_text = ds.get_text()
+    for pattern in COORD_TEXT_PATTERNS:
+        match = pattern.search(page_text)
+        if match:
+            try:
+                lat = float(match.group(1))
+                lng = float(match.group(2))
+            except (ValueError, IndexError):
+                continue
+            # Проверяем что координаты в разумных пределах для Бали
+            if -9.0 <= lat <= -8.0 and 114.0 <= lng <= 116.0:
+                logger.debug("baliforum: найдены координаты в тексте: %s, %s для %r", lat, lng, title[:50])
+                return lat, lng
+    return None, None
+
+
+async def _resolve_location(detail_html: str | None, card, title: str) -> dict:
+    """
+    Место события: ссылка на карты на детальной странице -> data-атрибуты/текст ->
+    ссылка на карты в карточке -> геокодинг venue.
+    """
+    location = {
+        "venue": None,
+        "lat": None,
+        "lng": None,
+        "location_url": None,
+        "place_name_from_maps": None,
+        "place_id": None,
+    }
+
+    if detail_html is not None:
+        try:
+            ds = BeautifulSoup(detail_html, "html.parser")
+            for href in _maps_hrefs(ds):
+                found = await _location_from_maps_link(href, title, "детальная")
+                if found:
+                    location.update(found)
+                    break
+
+            # venue из HTML страницы (event__place на актуальной вёрстке), иначе название из Google Maps
+            location["venue"] = _extract_venue_from_soup(ds) or location["place_name_from_maps"]
+
+            if not location["lat"] or not location["lng"]:
+                location["lat"], location["lng"] = _coords_from_detail_markup(ds, title)
+        except Exception as e:
+            logger.debug("baliforum: ошибка при парсинге детальной страницы для %r: %s", title[:50], e)
+
+    # Если координаты не найдены на детальной странице, ищем в карточке
+    if not location["lat"] or not location["lng"]:
+        for href in _maps_hrefs(card):
+            found = await _location_from_maps_link(href, title, "карточка")
+            if found:
+                location.update(found)
                 break
 
-        # Парсим дату
-        tz = ZoneInfo("Asia/Makassar")
-        now = datetime.now(tz)
-        start, end = _ru_date_to_dt(date_text, now, tz)
-
-        # Логируем результат парсинга даты
-        if start:
-            start_bali = start.astimezone(tz)
-            today_bali = now.date()
-            tomorrow_bali = (now + timedelta(days=1)).date()
-            event_date_bali = start_bali.date()
-            if event_date_bali == today_bali:
-                date_label = "сегодня"
-            elif event_date_bali == tomorrow_bali:
-                date_label = "завтра"
+    # Если координаты все еще не найдены, пробуем геокодинг по venue (ответы кэшируются в geo_cache)
+    venue = location["venue"]
+    if (not location["lat"] or not location["lng"]) and venue and len(venue.strip()) > 5:
+        try:
+            from utils.geo_utils import geocode_address
+
+            coords = await geocode_address(venue.strip(), region_bias="bali")
+            if coords:
+                location["lat"], location["lng"] = coords
+                logger.debug("baliforum: координаты через геокодинг %r: %s для %r", venue[:50], coords, title[:50])
+        except Exception as e:
+            logger.debug("baliforum: ошибка геокодинга для %r: %s", title[:50], e)
+
+    return location
+
+
+class BaliForumDetailCache:
+    """
+    Кэш детальных страниц между циклами инжеста: валидаторы (ETag/Last-Modified), хэш содержимого
+    и уже разрешенное место события. Хранится в state_store (namespace baliforum_detail):
+    bot_state в Postgres, если engine инициализирован, иначе память процесса.
+    """
+
+    namespace = "baliforum_detail"
+
+    def __init__(self, backend=None, ttl_s: int = BALIFORUM_DETAIL_CACHE_TTL_S):
+        self._backend = backend
+        self.ttl_s = ttl_s
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from utils.state_store import MemoryStateBackend, create_state_backend
+
+            try:
+                import database
+
+                engine = database.engine
+            except Exception:
+                engine = None
+            if engine is not None:
+                self._backend = create_state_backend("postgres", engine=engine)
             else:
-                date_label = f"{event_date_bali}"
-            logger.debug(
-                "baliforum: проанализирована дата %r -> %s (%s) для %r",
-                date_text,
-                date_label,
-                start_bali,
-                title[:50],
-            )
-        else:
-            logger.debug("baliforum: не удалось распарсить дату из %r для %r", date_text, title[:50])
-
-        # Конвертируем в UTC для хранения в БД
-        if start:
-            start = start.astimezone(UTC)
-        if end:
-            end = end.astimezone(UTC)
-
-        # Пропускаем события, если вообще не удалось извлечь дату
-        if not start:
-            logger.debug("baliforum: пропуск (нет даты/времени): url=%s, title=%r", url[:60], title[:50])
-            skipped_no_time += 1
-            continue
+                self._backend = MemoryStateBackend(max_entries=BALIFORUM_DETAIL_CACHE_MAX_ENTRIES)
+        return self._backend
+
+    def get(self, url: str) -> dict | None:
+        from utils.state_store import unpack_state
 
-        # Детальная страница
-        venue = None
-        lat = lng = None
-        location_url = None
-        place_name_from_maps = None
-        # ВАЖНO: инициализируем на каждой итерации, иначе при координатах не из Google Maps
-        # (data-атрибуты, текст, геокодинг) словим NameError или утечку чужого place_id.
-        place_id = None
         try:
-            detail = _fetch(url)
-            ds = BeautifulSoup(detail, "html.parser")
-
-            # Ищем координаты на детальной странице
-            # 1. В ссылках на Google Maps
-            location_url = None
-            place_name_from_maps = None
-            for link in ds.find_all("a", href=True):
-                href = link["href"]
-                if "google.com/maps" in href or "maps.google.com" in href or "/maps" in href:
-                    # Нормализуем относительные ссылки
-                    if href.startswith("/"):
-                        href = "https://www.google.com" + href
-                    elif not href.startswith("http"):
-                        href = "https://" + href
-
-                    # Используем parse_google_maps_link для лучшего извлечения данных
-                    try:
-                        import asyncio
-
-                        from utils.geo_utils import parse_google_maps_link
-
-                        # Выполняем async функцию синхронно
-                        try:
-                            loop = asyncio.get_event_loop()
-                            if loop.is_running():
-                                # Если loop уже запущен, используем ThreadPoolExecutor
-                                import concurrent.futures
-
-                                def run_parse():
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-                                    try:
-                                        return loop.run_until_complete(parse_google_maps_link(href))
-                                    finally:
-                                        loop.close()
-
-                                with concurrent.futures.ThreadPoolExecutor() as executor:
-                                    future = executor.submit(run_parse)
-                                    maps_data = future.result(timeout=5)
-                            else:
-                                maps_data = loop.run_until_complete(parse_google_maps_link(href))
-                        except RuntimeError:
-                            maps_data = asyncio.run(parse_google_maps_link(href))
-
-                        if maps_data and maps_data.get("lat") and maps_data.get("lng"):
-                            lat = maps_data["lat"]
-                            lng = maps_data["lng"]
-                            location_url = maps_data.get("raw_link", href)
-                            place_name_from_maps = maps_data.get("name")
-                            place_id = maps_data.get("place_id")
-                            logger.debug(
-                                "baliforum: координаты на детальной: %s, %s для %r, место: %s, place_id: %s",
-                                lat,
-                                lng,
-                                title[:50],
-                                place_name_from_maps,
-                                place_id,
-                            )
-                            break
-                    except Exception as e:
-                        # Fallback на старый метод
-                        logger.debug("baliforum: ошибка parse_google_maps_link, используем fallback: %s", e)
-                        lat, lng, place_name, maps_url = _extract_latlng_from_maps(href)
-                        if lat and lng:
-                            location_url = maps_url
-                            place_name_from_maps = place_name
-                            logger.debug(
-                                "baliforum: координаты (fallback): %s, %s для %r, место: %s",
-                                lat,
-                                lng,
-                                title[:50],
-                                place_name_from_maps,
-                            )
-                            break
-
-            # Извлекаем venue из HTML страницы (event__place на актуальной вёрстке)
-            venue = _extract_venue_from_soup(ds)
-
-            # Если venue не найдено, но есть название места из Google Maps, используем его
-            if not venue and place_name_from_maps:
-                venue = place_name_from_maps
-
-            # 2. В data-атрибутах элементов
-            if not lat or not lng:
-                for elem in ds.find_all(attrs={"data-lat": True, "data-lng": True}):
-                    try:
-                        lat = float(elem.get("data-lat"))
-                        lng = float(elem.get("data-lng"))
-                        logger.debug(
-                            "baliforum: координаты в data-атрибутах: %s, %s для %r",
-                            lat,
-                            lng,
-                            title[:50],
-                        )
-                        break
-                    except (ValueError, TypeError):
-                        continue
+            data = self.backend.get(self.namespace, url)
+        except Exception as e:
+            logger.debug("baliforum: кэш детальных страниц недоступен: %s", e)
+            return None
+        return unpack_state(data) if data is not None else None
 
-            # 3. В тексте страницы (ищем паттерны координат)
-            if not lat or not lng:
-                import re
-
-                # Ищем паттерны типа "-8.674763, 115.230137" или "lat: -8.674763, lng: 115.230137"
-                coord_patterns = [
-                    r"(-?\d+\.\d+),\s*(-?\d+\.\d+)",  # Простые координаты
-                    r"lat[itude]?[:\s]+(-?\d+\.\d+).*?lng[itude]?[:\s]+(-?\d+\.\d+)",  # lat: X, lng: Y
-                    r"@(-?\d+\.\d+),(-?\d+\.\d+)",  # @lat,lng
-                ]
-                page_text = ds.get_text()
-                for pattern in coord_patterns:
-                    match = re.search(pattern, page_text, re.IGNORECASE)
-                    if match:
-                        try:
-                            lat = float(match.group(1))
-                            lng = float(match.group(2))
-                            # Проверяем что координаты в разумных пределах для Бали
-                            if -9.0 <= lat <= -8.0 and 114.0 <= lng <= 116.0:
-                                logger.debug(
-                                    "baliforum: найдены координаты в тексте: %s, %s для %r", lat, lng, title[:50]
-                                )
-                                break
-                        except (ValueError, IndexError):
-                            continue
+    def set(self, url: str, entry: dict) -> None:
+        from utils.state_store import pack_state
+
+        try:
+            self.backend.set(self.namespace, url, pack_state(entry, self.backend.compress), self.ttl_s)
         except Exception as e:
-            logger.debug("baliforum: ошибка при парсинге детальной страницы для %r: %s", title[:50], e)
-            ds = None
-
-        # Если координаты не найдены на детальной странице, ищем в карточке
-        if not lat or not lng:
-            for link in card.find_all("a", href=True):
-                href = link["href"]
-                if "google.com/maps" in href or "/maps" in href:
-                    # Нормализуем относительные ссылки
-                    if href.startswith("/"):
-                        href = "https://www.google.com" + href
-                    elif not href.startswith("http"):
-                        href = "https://" + href
-
-                    # Используем parse_google_maps_link для лучшего извлечения данных
-                    try:
-                        import asyncio
-
-                        from utils.geo_utils import parse_google_maps_link
-
-                        logger.debug("baliforum: пытаемся извлечь координаты из ссылки в карточке: %s", href[:100])
-
-                        # Выполняем async функцию синхронно
-                        try:
-                            loop = asyncio.get_event_loop()
-                            if loop.is_running():
-                                import concurrent.futures
-
-                                def run_parse():
-                                    loop = asyncio.new_event_loop()
-                                    asyncio.set_event_loop(loop)
-                                    try:
-                                        return loop.run_until_complete(parse_google_maps_link(href))
-                                    finally:
-                                        loop.close()
-
-                                with concurrent.futures.ThreadPoolExecutor() as executor:
-                                    future = executor.submit(run_parse)
-                                    maps_data = future.result(timeout=10)
-                            else:
-                                maps_data = loop.run_until_complete(parse_google_maps_link(href))
-                        except RuntimeError:
-                            maps_data = asyncio.run(parse_google_maps_link(href))
-
-                        logger.debug("baliforum: parse_google_maps_link (карточка) вернул: %s", maps_data)
-
-                        if maps_data and maps_data.get("lat") and maps_data.get("lng"):
-                            lat = maps_data["lat"]
-                            lng = maps_data["lng"]
-                            location_url = maps_data.get("raw_link", href)
-                            place_name_from_maps = maps_data.get("name")
-                            place_id = maps_data.get("place_id")
-                            logger.debug(
-                                "baliforum: найдены координаты в карточке: %s, %s для %r, место: %s, place_id: %s",
-                                lat,
-                                lng,
-                                title[:50],
-                                place_name_from_maps,
-                                place_id,
-                            )
-                            break
-                        else:
-                            logger.debug(
-                                "baliforum: parse_google_maps_link (карточка) не нашел координаты в ссылке: %s",
-                                href[:100],
-                            )
-                    except Exception as e:
-                        # Fallback на старый метод
-                        logger.debug(
-                            "baliforum: ошибка parse_google_maps_link в карточке, fallback: %s: %s",
-                            type(e).__name__,
-                            e,
-                        )
-                        lat, lng, place_name, maps_url = _extract_latlng_from_maps(href)
-                        if lat and lng:
-                            location_url = maps_url
-                            place_name_from_maps = place_name
-                            logger.debug(
-                                "baliforum: найдены координаты в карточке (fallback): %s, %s для %r, место: %s",
-                                lat,
-                                lng,
-                                title[:50],
-                                place_name_from_maps,
-                            )
-                            break
-                        else:
-                            logger.debug("baliforum: fallback (карточка) не нашел координаты в ссылке: %s", href[:100])
-
-        # Если координаты все еще не найдены, пробуем геокодинг по адресу/venue
-        if (not lat or not lng) and venue:
-            try:
-                import asyncio
-
-                from utils.geo_utils import geocode_address
-
-                # Пробуем геокодинг по venue/address
-                address = venue.strip()
-                if address and len(address) > 5:  # Минимальная длина адреса
-                    # Выполняем async функцию синхронно
-                    try:
-                        loop = asyncio.get_event_loop()
-                        if loop.is_running():
-                            # Если loop уже запущен, используем ThreadPoolExecutor
-                            import concurrent.futures
-
-                            def run_geocode():
-                                loop = asyncio.new_event_loop()
-                                asyncio.set_event_loop(loop)
-                                try:
-                                    return loop.run_until_complete(geocode_address(address, region_bias="bali"))
-                                finally:
-                                    loop.close()
-
-                            with concurrent.futures.ThreadPoolExecutor() as executor:
-                                future = executor.submit(run_geocode)
-                                coords = future.result(timeout=10)
-                        else:
-                            coords = loop.run_until_complete(geocode_address(address, region_bias="bali"))
-                    except RuntimeError:
-                        coords = asyncio.run(geocode_address(address, region_bias="bali"))
-
-                    if coords:
-                        lat, lng = coords
-                        logger.debug(
-                            "baliforum: координаты через геокодинг адреса %r: %s, %s для %r",
-                            address[:50],
-                            lat,
-                            lng,
-                            title[:50],
-                        )
-            except Exception as e:
-                logger.debug("baliforum: ошибка геокодинга для %r: %s", title[:50], e)
-
-        # Создаем стабильный external_id
-        import hashlib
-
-        normalized_url = url.split("?")[0].split("#")[0]  # Убираем UTM и якоря
-        external_id = hashlib.sha1(f"baliforum|{normalized_url}".encode()).hexdigest()[:16]
-
-        # Определяем режим времени для трёх сценариев отображения/видимости
-        time_mode = _determine_time_mode(date_text, bool(end))
+            logger.debug("baliforum: не удалось записать кэш детальной страницы: %s", e)
+
+
+detail_cache = BaliForumDetailCache()
+
+
+class BaliForumScraper:
+    """
+    Обход списка и детальных страниц BaliForum одним пулом соединений.
+
+    Одновременно не больше concurrency запросов. Интервал между запросами к хосту соблюдает
+    транспорт клиента из utils/http_clients.py; rate_limiter — дополнительный лимит для чужого клиента.
+    Детальная страница запрашивается условно (If-None-Match / If-Modified-Since); если сервер
+    ответил 304 или хэш содержимого не изменился, место события берется из кэша без парсинга
+    HTML и без запросов к Google.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        *,
+        concurrency: int = BALIFORUM_CONCURRENCY,
+        rate_limiter: HostRateLimiter | None = None,
+        cache: BaliForumDetailCache | None = None,
+    ):
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.rate_limiter = rate_limiter
+        self.cache = cache if cache is not None else detail_cache
+        self.stats = {"pages": 0, "details": 0, "not_modified": 0, "hash_hits": 0, "parsed": 0, "errors": 0}
+
+    async def _get(self, url: str, headers: dict | None = None) -> httpx.Response:
+        async with self._semaphore:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.wait(httpx.URL(url).host)
+            response = await self.client.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def fetch_cards(self, date_filter: str | None, limit: int) -> list:
+        """Карточки со страниц ?page=1..N (окнами по concurrency), до первой пустой или ошибочной страницы."""
+
+        def page_url(page: int) -> str:
+            params = []
+            if date_filter:
+                params.append(f"dateStart={date_filter}")
+            if page > 1:
+                params.append(f"page={page}")
+            return f"{LIST_URL}?{'&'.join(params)}" if params else LIST_URL
+
+        async def fetch_page(page: int):
+            response = await self._get(page_url(page))
+            soup = BeautifulSoup(response.text, "html.parser")
+            return soup.select("div.event-card, article.event") or soup.select("li.event-item")
+
+        cards = []
+        page = 1
+        while page <= MAX_PAGES and len(cards) < limit:
+            # Первая страница одна: большинство выдач укладывается в нее, лишние запросы не нужны
+            window = range(page, min(MAX_PAGES, page + (1 if page == 1 else self.concurrency) - 1) + 1)
+            results = await asyncio.gather(*(fetch_page(p) for p in window), return_exceptions=True)
+            for p, result in zip(window, results, strict=True):
+                if isinstance(result, Exception):
+                    logger.warning("baliforum: ошибка загрузки страницы %s (%s): %s", p, page_url(p), result)
+                    return cards
+                if not result:
+                    logger.info("baliforum: страница %s пустая — останавливаем пагинацию", p)
+                    return cards
+                self.stats["pages"] += 1
+                cards.extend(result)
+                logger.info("baliforum: страница %s -> %s карточек (всего собрано %s)", p, len(result), len(cards))
+                if len(cards) >= limit:
+                    return cards
+            page = window[-1] + 1
+        return cards
+
+    async def fetch_location(self, url: str, card, title: str) -> dict:
+        """Место события по детальной странице с условным запросом и кэшем по хэшу содержимого."""
+        card_hash = _content_hash("", " ".join(_maps_hrefs(card)))
+        cached = await asyncio.to_thread(self.cache.get, url)
+        if cached and cached.get("card_hash") != card_hash:
+            cached = None
+
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
 
         try:
+            response = await self._get(url, headers=headers or None)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.debug("baliforum: ошибка загрузки детальной страницы для %r: %s", title[:50], e)
+            return await _resolve_location(None, card, title)
+
+        self.stats["details"] += 1
+        if response.status_code == 304 and cached:
+            self.stats["not_modified"] += 1
+            return cached["location"]
+
+        html = response.text
+        content_hash = _content_hash(html)
+        if cached and cached.get("content_hash") == content_hash:
+            self.stats["hash_hits"] += 1
+            location = cached["location"]
+        else:
+            self.stats["parsed"] += 1
+            location = await _resolve_location(html, card, title)
+
+        # Без координат не кэшируем: геокодинг мог не пройти временно, повторим в следующем цикле
+        if location["lat"] and location["lng"]:
+            entry = {
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "content_hash": content_hash,
+                "card_hash": card_hash,
+                "location": location,
+            }
+            await asyncio.to_thread(self.cache.set, url, entry)
+        return location
+
+    async def fetch_events(self, limit: int = 200, date_filter: str | None = None) -> list[dict]:
+        cards = (await self.fetch_cards(date_filter, limit))[:limit]
+
+        tz = ZoneInfo("Asia/Makassar")
+        now = datetime.now(tz)
+        bases = [_card_base(card, now, tz) for card in cards]
+        skipped_no_time = 0
+        jobs = []
+        for card, base in zip(cards, bases, strict=True):
+            if base is None:
+                continue
+            # Пропускаем события, если вообще не удалось извлечь дату
+            if not base["start_time"]:
+                logger.debug(
+                    "baliforum: пропуск (нет даты/времени): url=%s, title=%r", base["url"][:60], base["title"][:50]
+                )
+                skipped_no_time += 1
+                continue
+            jobs.append((card, base))
+
+        locations = await asyncio.gather(
+            *(self.fetch_location(base["url"], card, base["title"]) for card, base in jobs)
+        )
+
+        events: list[dict] = []
+        for (_card, base), location in zip(jobs, locations, strict=True):
+            url = base["url"]
+            # Стабильный external_id: без UTM и якорей
+            normalized_url = url.split("?")[0].split("#")[0]
+            external_id = hashlib.sha1(f"baliforum|{normalized_url}".encode()).hexdigest()[:16]
+            venue = location["venue"]
             events.append(
                 {
                     "source": "baliforum",
-                    "title": title or "Событие",
-                    "start_time": start,
-                    "end_time": end,
-                    "time_mode": time_mode,
+                    "title": base["title"] or "Событие",
+                    "start_time": base["start_time"],
+                    "end_time": base["end_time"],
+                    # Режим времени для трёх сценариев отображения/видимости
+                    "time_mode": _determine_time_mode(base["date_text"], bool(base["end_time"])),
                     "venue": venue,
                     "address": venue,  # пусть address=venue для начала
-                    "lat": lat,
-                    "lng": lng,
+                    "lat": location["lat"],
+                    "lng": location["lng"],
                     "url": url,
                     "source_url": url,
-                    "location_url": location_url,  # Сохраняем ссылку Google Maps для маршрута
+                    "location_url": location["location_url"],  # Ссылка Google Maps для маршрута
                     "booking_url": None,
                     "ticket_url": None,
                     "external_id": external_id,
-                    "tags": tags,
+                    "tags": base["tags"],
                     "raw": {
-                        "date_text": date_text,
-                        "tags": tags,
-                        "place_name_from_maps": place_name_from_maps,
-                        "place_id": place_id,
+                        "date_text": base["date_text"],
+                        "tags": base["tags"],
+                        "place_name_from_maps": location["place_name_from_maps"],
+                        "place_id": location["place_id"],
                     },
                 }
             )
-            parsed_count += 1
-        except Exception as e:
-            logger.error("baliforum: ошибка обработки события %r: %s", title[:50], e)
-            errors += 1
-
-        # Rate limiting
-        time.sleep(0.3)
-
-    # Логируем сводку
-    total_cards = len(cards)
-    logger.info(
-        "baliforum: найдено карточек=%s, обработано=%s, распарсено=%s, пропущено без времени=%s, ошибок=%s",
-        total_cards,
-        min(total_cards, limit),
-        parsed_count,
-        skipped_no_time,
-        errors,
-    )
-    if skipped_no_time > 0:
-        logger.warning(
-            "baliforum: пропущено %s событий без времени (%.1f%% от обработанных)",
+
+        total_cards = len(cards)
+        logger.info(
+            "baliforum: найдено карточек=%s, распарсено=%s, пропущено без времени=%s, "
+            "детальных=%s (304: %s, без изменений: %s, разобрано: %s), ошибок=%s",
+            total_cards,
+            len(events),
             skipped_no_time,
-            skipped_no_time / min(total_cards, limit) * 100 if total_cards else 0,
+            self.stats["details"],
+            self.stats["not_modified"],
+            self.stats["hash_hits"],
+            self.stats["parsed"],
+            self.stats["errors"],
         )
-    return events
+        if skipped_no_time > 0:
+            logger.warning(
+                "baliforum: пропущено %s событий без времени (%.1f%% от обработанных)",
+                skipped_no_time,
+                skipped_no_time / total_cards * 100 if total_cards else 0,
+            )
+        return events
+
+
+def _http_client() -> httpx.AsyncClient:
+    return new_async_client("baliforum", headers={"User-Agent": UA})
+
+
+async def fetch_baliforum_events_async(
+    limit: int = 200,
+    date_filter: str | None = None,
+    *,
+    client: httpx.AsyncClient | None = None,
+    cache: BaliForumDetailCache | None = None,
+    concurrency: int = BALIFORUM_CONCURRENCY,
+) -> list[dict]:
+    """
+    Парсинг событий с baliforum.ru (асинхронно, одним пулом соединений).
+
+    Args:
+        limit: Максимальное количество событий
+        date_filter: Фильтр по дате в формате "YYYY-MM-DD" (например, "2025-11-08")
+                    Если None, парсит главную страницу без фильтра
+    """
+    if date_filter:
+        logger.info(f"🌴 Парсим BaliForum с фильтром по дате: {date_filter}")
+    else:
+        logger.info("🌴 Парсим BaliForum (с обходом пагинации)")
+
+    own_client = client is None
+    client = client or _http_client()
+    try:
+        scraper = BaliForumScraper(client, concurrency=concurrency, cache=cache)
+        return await scraper.fetch_events(limit, date_filter)
+    finally:
+        if own_client:
+            await client.aclose()
+
+
+def _run_sync(coro):
+    """Синхронный запуск корутины: в потоке без event loop — asyncio.run, иначе в отдельном потоке."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def fetch_baliforum_events(limit: int = 200, date_filter: str | None = None) -> list[dict]:
+    """Синхронная обертка над fetch_baliforum_events_async (планировщик, скрипты)."""
+    return _run_sync(fetch_baliforum_events_async(limit, date_filter))
 
 
 def event_dict_to_raw_event(event: dict) -> RawEvent:
@@ -918,6 +970,12 @@ def merge_tomorrow_baliforum_events(
     return raw_events, added, skipped_dup, updated_date
 
 
+async def fetch_async(limit: int = 200) -> list[RawEvent]:
+    """Точка входа для инжеста из async-кода (источник бота, API)."""
+    events = await fetch_baliforum_events_async(limit)
+    return [event_dict_to_raw_event(event) for event in events]
+
+
 def fetch(limit: int = 200) -> list[RawEvent]:
     """Главная точка входа для инжеста - возвращает RawEvent объекты"""
     events = fetch_baliforum_events(limit)
@@ -7,7 +7,7 @@ import logging
 import time
 from typing import Any
 
-from sources.baliforum import fetch as fetch_baliforum_events
+from sources.baliforum import fetch_async as fetch_baliforum_events
 from utils.structured_logging import StructuredLogger
 
 logger = logging.getLogger(__name__)
@@ -56,7 +56,7 @@ class BaliForumSource:
             logger.info(f"🌴 Ищем события в {self.display_name}...")
 
             # Получаем события из BaliForum
-            raw_events = fetch_baliforum_events(limit=100)
+            raw_events = await fetch_baliforum_events(limit=100)
             parsed = len(raw_events) if raw_events else 0
 
             if not raw_events:
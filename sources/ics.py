@@ -3,9 +3,9 @@ from collections.abc import Iterable
 from typing import Any
 
 import icalendar
-import requests
 
 from sources.common import make_external_id, norm_text
+from utils.http_clients import get_sync_client
 
 
 def _to_utc(dt_like) -> dt.datetime | None:
@@ -26,8 +26,7 @@ def fetch_ics(url: str, *, etag: str | None = None, last_modified: str | None =
         headers["If-None-Match"] = etag
     if last_modified:
         headers["If-Modified-Since"] = last_modified
-    resp = requests.get(url, headers=headers, timeout=timeout)
-    return resp
+    return get_sync_client("ics").get(url, headers=headers, timeout=timeout)
 
 
 def parse_ics(
@@ -4,6 +4,8 @@
 """
 
 import asyncio
+import hashlib
+import json
 import logging
 import math
 import os
@@ -20,6 +22,9 @@ except ImportError:
 
 from config import load_settings
 from sources.base import BaseSource
+from utils.cache import TTLCache
+from utils.http_clients import new_async_client
+from utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +48,12 @@ TODAY_MAX_EVENTS = _SETTINGS.today_max_events
 TODAY_SHOW_TOP = _SETTINGS.today_show_top
 CACHE_TTL_S = _SETTINGS.cache_ttl_s
 PAGE_RECOVERY_ROUNDS = _SETTINGS.kudago_page_recovery_rounds
+# Кэш ответов API: сколько записей держать в памяти, сколько хранить в bot_state,
+# через сколько страницу списка перепроверять (условным запросом) и детали события запрашивать заново
+KUDAGO_CACHE_MEMORY_SIZE = int(os.getenv("KUDAGO_CACHE_MEMORY_SIZE", "500"))
+KUDAGO_CACHE_TTL_S = int(os.getenv("KUDAGO_CACHE_TTL_S", str(3 * 86400)))
+KUDAGO_PAGE_REFRESH_S = int(os.getenv("KUDAGO_PAGE_REFRESH_S", "1800"))
+KUDAGO_DETAIL_REFRESH_S = int(os.getenv("KUDAGO_DETAIL_REFRESH_S", str(24 * 3600)))
 
 DEFAULT_BACKOFF = (1.0, 2.0, 5.0, 10.0, 20.0)
 
@@ -75,6 +86,8 @@ METRICS = {
     "events_saved": 0,
     "api_errors": 0,
     "cache_hits": 0,
+    "not_modified": 0,
+    "detail_cache_hits": 0,
     "timeouts": 0,
     "retries": 0,
     "pages_failed": 0,
@@ -86,50 +99,115 @@ METRICS = {
     "integrity_failures": 0,
 }
 
-INTEGRITY_FAIL_STREAK = 0
 
-# ---- Лёгкий in-memory кэш результатов на короткое время ----------
-_CACHE: dict[str, tuple[float, list[dict[str, Any]]]] = {}
-# ОГРАНИЧЕНИЕ РАЗМЕРА КЭША для защиты от OOM
-_MAX_CACHE_SIZE = 500  # Максимум 500 записей в кэше KudaGo
+def _collect_metrics():
+    samples = [({"counter": name}, value) for name, value in METRICS.items()]
+    return [("kudago_source_total", "counter", "Счетчики источника KudaGo (METRICS)", samples)]
+
+
+registry.register_collector(_collect_metrics)
+
+INTEGRITY_FAIL_STREAK = 0
 
 
 class FetchPageError(RuntimeError):
     """Ошибка получения страницы из KudaGo"""
 
 
+# ---- Кэш ответов API ----------------------------------------------
+def request_cache_key(url: str, params: dict[str, Any]) -> str:
+    """Ключ ответа по URL и параметрам запроса (порядок параметров не важен)."""
+    canonical = json.dumps({"url": url, "params": {k: str(v) for k, v in params.items()}}, sort_keys=True)
+    return "req:" + hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class KudaGoResponseCache:
+    """
+    Ответы KudaGo между циклами и рестартами: LRU в памяти процесса перед state_store
+    (namespace kudago_response, bot_state в Postgres; без БД — только память).
+
+    Запись: {"fetched_at", "etag", "last_modified", "payload"}. Ключи:
+      - req:<hash> — страница списка по URL и параметрам (окно actual_since/actual_until
+        выровнено по суткам, поэтому утренний и вечерний циклы попадают в одни ключи);
+      - event:<id> — детали события;
+      - result:<...> — итоговый список событий fetch_events (короткий TTL, CACHE_TTL_S).
+    """
+
+    namespace = "kudago_response"
+
+    def __init__(self, backend=None, maxsize: int = KUDAGO_CACHE_MEMORY_SIZE, ttl_s: int = KUDAGO_CACHE_TTL_S):
+        self._backend = backend
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        # TTL записи считается от fetched_at (см. _remember), а не от момента записи в память
+        self._memory = TTLCache("kudago_response", maxsize=maxsize)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from utils.state_store import create_state_backend
+
+            try:
+                import database
+
+                engine = database.engine
+            except Exception:
+                engine = None
+            # False — второго уровня нет, хватает памяти
+            self._backend = create_state_backend("postgres", engine=engine) if engine is not None else False
+        return self._backend
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        entry = self._memory.get(key)
+        if entry is not None:
+            return entry
+        if not self.backend:
+            return None
+        from utils.state_store import unpack_state
+
+        try:
+            data = self.backend.get(self.namespace, key)
+        except Exception as e:
+            logger.debug("kudago: кэш ответов недоступен: %s", e)
+            return None
+        if data is None:
+            return None
+        entry = unpack_state(data)
+        self._remember(key, entry)
+        return entry
+
+    def set(self, key: str, entry: dict[str, Any], ttl_s: int | None = None) -> None:
+        self._remember(key, entry)
+        if not self.backend:
+            return
+        from utils.state_store import pack_state
+
+        try:
+            self.backend.set(self.namespace, key, pack_state(entry, self.backend.compress), ttl_s or self.ttl_s)
+        except Exception as e:
+            logger.debug("kudago: не удалось записать кэш ответа: %s", e)
+
+    def _remember(self, key: str, entry: dict[str, Any]) -> None:
+        self._memory.set(key, entry, ttl_s=entry["fetched_at"] + self.ttl_s - time.time())
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+
+response_cache = KudaGoResponseCache()
+
+
 def _cache_get(key: str) -> list[dict[str, Any]] | None:
-    """Получает данные из кэша"""
-    rec = _CACHE.get(key)
-    if not rec:
-        return None
-    ts, data = rec
-    current_time = time.time()
-    # Удаляем устаревшие записи при чтении
-    if current_time - ts > CACHE_TTL_S:
-        _CACHE.pop(key, None)
+    """Итоговый список событий, если он моложе CACHE_TTL_S"""
+    entry = response_cache.get(f"result:{key}")
+    if entry is None or time.time() - entry["fetched_at"] > CACHE_TTL_S:
         return None
     METRICS["cache_hits"] += 1
-    return data
+    return entry["payload"]
 
 
 def _cache_put(key: str, data: list[dict[str, Any]]) -> None:
-    """Сохраняет данные в кэш с ограничением размера"""
-    current_time = time.time()
-
-    # Очистка устаревших записей
-    expired_keys = [k for k, (ts, _) in _CACHE.items() if current_time - ts > CACHE_TTL_S]
-    for k in expired_keys:
-        _CACHE.pop(k, None)
-
-    # Если все еще слишком много, удаляем 50% самых старых
-    if len(_CACHE) >= _MAX_CACHE_SIZE:
-        sorted_items = sorted(_CACHE.items(), key=lambda x: x[1][0])  # Сортируем по timestamp
-        to_remove = len(_CACHE) - _MAX_CACHE_SIZE // 2
-        for k, _ in sorted_items[:to_remove]:
-            _CACHE.pop(k, None)
-
-    _CACHE[key] = (current_time, data)
+    response_cache.set(f"result:{key}", {"fetched_at": time.time(), "payload": data}, ttl_s=CACHE_TTL_S)
 
 
 def today_window_utc(
@@ -175,22 +253,46 @@ async def _fetch_json(
     jitter: bool = False,
     label: str | None = None,
     stats: dict[str, Any] | None = None,
+    cache: KudaGoResponseCache | None = None,
+    refresh_after_s: float | None = None,
 ) -> dict[str, Any]:
-    """Выполняет HTTP запрос с расширенным retry/backoff."""
+    """
+    Выполняет HTTP запрос с расширенным retry/backoff.
+
+    С cache: ответ моложе refresh_after_s (KUDAGO_PAGE_REFRESH_S) отдается без запроса, более старый перепроверяется
+    условным запросом (If-None-Match / If-Modified-Since); на 304 берется сохраненный ответ.
+    """
     timeout_value: httpx.Timeout | float = timeout or KUDAGO_TIMEOUT_S
     backoff_seq = backoff or DEFAULT_BACKOFF
     label = label or url
     start_time = time.time()
     consecutive_timeouts = 0
 
+    if refresh_after_s is None:
+        refresh_after_s = KUDAGO_PAGE_REFRESH_S
+    cache_key = request_cache_key(url, params) if cache is not None else None
+    cached = cache.get(cache_key) if cache is not None else None
+    headers: dict[str, str] = {}
+    if cached is not None:
+        if time.time() - cached["fetched_at"] < refresh_after_s:
+            METRICS["cache_hits"] += 1
+            if stats is not None:
+                stats["cache_hits"] = stats.get("cache_hits", 0) + 1
+            return cached["payload"]
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
     for attempt in range(1, len(backoff_seq) + 2):
         await limiter.wait()
         try:
             METRICS["kudago_requests"] += 1
-            response = await client.get(url, params=params, timeout=timeout_value)
+            response = await client.get(url, params=params, timeout=timeout_value, headers=headers or None)
+            not_modified = response.status_code == 304 and cached is not None
             if response.status_code >= 500:
                 raise httpx.HTTPStatusError("5xx", request=response.request, response=response)
-            if response.status_code != 200:
+            if response.status_code != 200 and not not_modified:
                 raise httpx.HTTPStatusError(
                     str(response.status_code),
                     request=response.request,
@@ -213,7 +315,21 @@ async def _fetch_json(
                     consecutive_timeouts,
                 )
 
-            return response.json()
+            if not_modified:
+                METRICS["not_modified"] += 1
+                if stats is not None:
+                    stats["not_modified"] = stats.get("not_modified", 0) + 1
+                payload = cached["payload"]
+                etag = response.headers.get("ETag") or cached.get("etag")
+                last_modified = response.headers.get("Last-Modified") or cached.get("last_modified")
+            else:
+                payload = response.json()
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+            if cache is not None:
+                entry = {"fetched_at": time.time(), "etag": etag, "last_modified": last_modified, "payload": payload}
+                cache.set(cache_key, entry)
+            return payload
         except httpx.ReadTimeout as exc:
             METRICS["timeouts"] += 1
             consecutive_timeouts += 1
@@ -548,6 +664,8 @@ class KudaGoSource(BaseSource):
             }
 
             cache_key_local = cache_key if use_cache else f"{cache_key}:{plan_name}"
+            # Кэш ответов API только в основном плане: запасные планы идут в сеть заново
+            cache = response_cache if use_cache else None
             if use_cache:
                 cached = _cache_get(cache_key_local)
                 if cached is not None:
@@ -608,17 +726,7 @@ class KudaGoSource(BaseSource):
             missing_batches_all: set[int] = set()
             total_count: int | None = None
 
-            async with httpx.AsyncClient(
-                headers={
-                    "User-Agent": "events-bot/1.0 (+ok)",
-                    "Accept": "application/json",
-                    "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-                    "Referer": "https://kudago.com/",
-                    "Connection": "keep-alive",
-                },
-                timeout=KUDAGO_TIMEOUT_S,
-                http2=False,
-            ) as client:
+            async with new_async_client("kudago", timeout=KUDAGO_TIMEOUT_S) as client:
 
                 async def fetch_details(
                     ids: list[int],
@@ -626,9 +734,19 @@ class KudaGoSource(BaseSource):
                     detail_map: dict[int, dict[str, Any]] = {}
                     if not ids:
                         return detail_map
-                    for offset in range(0, len(ids), 20):
+                    # Детали событий, уже виденных в прошлых циклах, берем из кэша
+                    missing_ids: list[int] = []
+                    for event_id in ids:
+                        entry = cache.get(f"event:{event_id}") if cache is not None else None
+                        if entry is not None and time.time() - entry["fetched_at"] < KUDAGO_DETAIL_REFRESH_S:
+                            detail_map[event_id] = entry["payload"]
+                        else:
+                            missing_ids.append(event_id)
+                    stats["detail_cache_hits"] = stats.get("detail_cache_hits", 0) + len(ids) - len(missing_ids)
+                    METRICS["detail_cache_hits"] += len(ids) - len(missing_ids)
+                    for offset in range(0, len(missing_ids), 20):
                         chunk_end = offset + 20
-                        chunk = ids[offset:chunk_end]
+                        chunk = missing_ids[offset:chunk_end]
                         stats["detail_requests"] += 1
                         params = {
                             "ids": ",".join(str(i) for i in chunk),
@@ -651,6 +769,8 @@ class KudaGoSource(BaseSource):
                             event_id = item.get("id")
                             if event_id is not None:
                                 detail_map[event_id] = item
+                                if cache is not None:
+                                    cache.set(f"event:{event_id}", {"fetched_at": time.time(), "payload": item})
                     return detail_map
 
                 async def fetch_first_batch(
@@ -678,6 +798,7 @@ class KudaGoSource(BaseSource):
                                 jitter=True,
                                 label=f"first_batch:{label}",
                                 stats=stats,
+                                cache=cache,
                             )
                         except FetchPageError:
                             stats["first_batch_failures"] += 1
@@ -729,6 +850,7 @@ class KudaGoSource(BaseSource):
                         limiter=limiter,
                         label=label,
                         stats=stats,
+                        cache=cache,
                     )
 
                 next_page = 2
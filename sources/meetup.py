@@ -11,6 +11,7 @@ from api.oauth_meetup import MeetupOAuth
 from config import load_settings
 from event_apis import RawEvent
 from utils.geo_utils import get_bbox
+from utils.http_clients import new_async_client
 
 
 async def fetch(lat: float, lng: float, radius_km: float = 5.0) -> list[RawEvent]:
@@ -57,7 +58,7 @@ async def fetch(lat: float, lng: float, radius_km: float = 5.0) -> list[RawEvent
 
     for attempt in range(max_retries):
         try:
-            async with httpx.AsyncClient(timeout=30) as client:
+            async with new_async_client("meetup") as client:
                 response = await client.get(url, params=params, headers=headers)
                 response.raise_for_status()
                 data = response.json()
@@ -1,15 +1,17 @@
 import time
 
-import requests
 from bs4 import BeautifulSoup
 
+from utils.http_clients import get_sync_client
+
 
 def discover_event_ics_links(list_url: str, *, per_page_delay=1.0) -> list[str]:
     """
     Парсит страницу списка событий Nexudus, заходит в карточки и выцепляет ссылку .ics ("Add to calendar").
     Возвращает список .ics-URL по событиям.
     """
-    r = requests.get(list_url, timeout=20)
+    client = get_sync_client("nexudus")
+    r = client.get(list_url)
     r.raise_for_status()
     soup = BeautifulSoup(r.text, "html.parser")
 
@@ -31,7 +33,7 @@ def discover_event_ics_links(list_url: str, *, per_page_delay=1.0) -> list[str]:
     ics_links = []
     for link in card_links[:50]:  # ограничим, чтобы не сканить бесконечно
         time.sleep(per_page_delay)
-        rr = requests.get(link, timeout=20)
+        rr = client.get(link)
         if rr.status_code != 200:
             continue
         ss = BeautifulSoup(rr.text, "html.parser")
@@ -12,7 +12,7 @@ from threading import Thread
 
 import uvicorn
 
-from modern_scheduler import start_modern_scheduler
+from modern_scheduler import scheduler_in_bot_enabled, start_modern_scheduler
 
 # Настройка логирования для продакшна
 logging.basicConfig(
@@ -26,6 +26,9 @@ logger = logging.getLogger(__name__)
 
 def start_automation():
     """Запуск автоматизации в отдельном потоке"""
+    if not scheduler_in_bot_enabled():
+        logger.info("⏭️ SCHEDULER_IN_BOT=0 — автоматизацию выполняет workers/scheduler.py")
+        return
     try:
         logger.info("🚀 Запуск автоматизации парсинга...")
         start_modern_scheduler()
@@ -7,18 +7,92 @@
 """
 
 import logging
-from datetime import UTC, datetime, timedelta
+from datetime import UTC, datetime
 
-from sqlalchemy import and_, func
+from sqlalchemy import String, and_, case, cast, func, literal, null
 
 from database import DailyViewTasks, TaskPlace, get_session
-from utils.geo_utils import haversine_km
 
 logger = logging.getLogger(__name__)
 
 # Настройки ротации
 EXCLUDE_PLACE_DAYS = 3  # Не показывать место 3 дня подряд
 PRIORITY_DAYS = 7  # После 7 дней - высокий приоритет
+NEVER_SHOWN_DAYS = 999  # days_since_shown для мест, которые пользователю еще не показывались
+EARTH_RADIUS_KM = 6371.0088  # Как в utils.geo_utils.haversine_km
+
+
+def _distance_km_expr(user_lat: float, user_lng: float):
+    """Haversine-дистанция от пользователя до TaskPlace в SQL (та же формула, что в haversine_km)."""
+    dphi = func.radians(TaskPlace.lat - user_lat)
+    dlambda = func.radians(TaskPlace.lng - user_lng)
+    a = func.power(func.sin(dphi / 2), 2) + func.cos(func.radians(literal(user_lat))) * func.cos(
+        func.radians(TaskPlace.lat)
+    ) * func.power(func.sin(dlambda / 2), 2)
+    return 2 * EARTH_RADIUS_KM * func.atan2(func.sqrt(a), func.sqrt(1 - a))
+
+
+def _query_ranked_places(
+    session,
+    filters: list,
+    user_id: int,
+    user_lat: float | None = None,
+    user_lng: float | None = None,
+    exclude_days: int = EXCLUDE_PLACE_DAYS,
+    order: str = "priority",
+    limit: int | None = None,
+) -> list[TaskPlace]:
+    """
+    Места по фильтрам одним запросом вместе с дистанцией и днями с последнего показа.
+
+    Последний показ берется из daily_views_tasks через GROUP BY view_key (вместо запроса на каждое место).
+    order="priority": сначала не показывались >PRIORITY_DAYS, затем >=exclude_days, затем недавние;
+    внутри группы — по расстоянию. order="oldest": дольше всего не показывавшиеся первыми.
+    Результат: TaskPlace с атрибутами days_since_shown и distance_km (None без координат пользователя).
+    """
+    now = datetime.now(UTC)
+    last_shown = (
+        session.query(
+            DailyViewTasks.view_key.label("view_key"),
+            func.max(DailyViewTasks.view_date).label("last_shown"),
+        )
+        .filter(DailyViewTasks.user_id == user_id, DailyViewTasks.view_type == "place")
+        .group_by(DailyViewTasks.view_key)
+        .subquery()
+    )
+    # Как (now - last_shown).days в Python: целые сутки с округлением вниз
+    days_since_shown = func.coalesce(
+        func.floor(func.extract("epoch", literal(now) - last_shown.c.last_shown) / 86400),
+        NEVER_SHOWN_DAYS,
+    )
+    if user_lat is not None and user_lng is not None:
+        distance_km = _distance_km_expr(user_lat, user_lng)
+    else:
+        distance_km = null()
+
+    query = (
+        session.query(TaskPlace, days_since_shown.label("days_since_shown"), distance_km.label("distance_km"))
+        .outerjoin(last_shown, last_shown.c.view_key == cast(TaskPlace.id, String))
+        .filter(and_(*filters))
+    )
+    if order == "oldest":
+        query = query.order_by(days_since_shown.desc(), TaskPlace.id)
+    else:
+        priority = case(
+            (days_since_shown > PRIORITY_DAYS, 0),
+            (days_since_shown >= exclude_days, 1),
+            else_=2,
+        )
+        query = query.order_by(priority, distance_km, TaskPlace.id)
+    if limit is not None:
+        query = query.limit(limit)
+
+    places = []
+    for place, days, distance in query.all():
+        place.days_since_shown = int(days)
+        place.distance_km = distance
+        places.append(place)
+    return places
 
 
 def get_user_region(lat: float, lng: float) -> str:
@@ -178,19 +252,25 @@ def find_nearest_available_place(
         return None
 
     with get_session() as session:
-        # 1. Получаем все места категории и типа в регионе, с учетом типа задания
-        places = (
-            session.query(TaskPlace)
-            .filter(
-                and_(
-                    TaskPlace.category == category,
-                    TaskPlace.place_type == place_type,
-                    TaskPlace.task_type == task_type,  # Фильтр по типу задания
-                    TaskPlace.is_active == True,  # noqa: E712
-                    TaskPlace.region == region,
-                )
-            )
-            .all()
+        # Места категории и типа в регионе (с учетом типа задания), отсортированные по приоритету:
+        # - сначала не показывались >7 дней (высокий приоритет)
+        # - потом не показывались 3-7 дней (средний приоритет)
+        # - потом показывались <3 дней (низкий приоритет)
+        # - внутри каждой группы — по расстоянию
+        places = _query_ranked_places(
+            session,
+            [
+                TaskPlace.category == category,
+                TaskPlace.place_type == place_type,
+                TaskPlace.task_type == task_type,  # Фильтр по типу задания
+                TaskPlace.is_active == True,  # noqa: E712
+                TaskPlace.region == region,
+            ],
+            user_id,
+            user_lat,
+            user_lng,
+            exclude_days=exclude_days,
+            limit=1,
         )
 
         if not places:
@@ -200,60 +280,8 @@ def find_nearest_available_place(
             )
             return None
 
-        # 2. Вычисляем расстояние и время последнего показа для каждого места
-        datetime.now(UTC) - timedelta(days=exclude_days)
-
-        places_with_priority = []
-        for place in places:
-            place.distance_km = haversine_km(user_lat, user_lng, place.lat, place.lng)
-
-            # Получаем дату последнего показа этого места пользователю
-            last_shown = (
-                session.query(DailyViewTasks.view_date)
-                .filter(
-                    and_(
-                        DailyViewTasks.user_id == user_id,
-                        DailyViewTasks.view_type == "place",
-                        DailyViewTasks.view_key == str(place.id),
-                    )
-                )
-                .order_by(DailyViewTasks.view_date.desc())
-                .first()
-            )
-
-            if last_shown:
-                days_since_shown = (datetime.now(UTC) - last_shown[0]).days
-                place.days_since_shown = days_since_shown
-            else:
-                place.days_since_shown = 999  # Никогда не показывалось - максимальный приоритет
-
-            places_with_priority.append(place)
-
-        # 3. Сортируем по приоритету:
-        # - Сначала места, которые не показывались >7 дней (высокий приоритет)
-        # - Потом места, которые не показывались 3-7 дней (средний приоритет)
-        # - Потом места, которые не показывались <3 дней (низкий приоритет)
-        # - Внутри каждой группы сортируем по расстоянию
-
-        def get_priority(place):
-            days = place.days_since_shown
-
-            # Приоритет 1: не показывалось >7 дней (обязательно показать)
-            if days > PRIORITY_DAYS:
-                return (0, place.distance_km)
-
-            # Приоритет 2: не показывалось 3-7 дней
-            elif days >= exclude_days:
-                return (1, place.distance_km)
-
-            # Приоритет 3: показывалось недавно (<3 дней)
-            else:
-                return (2, place.distance_km)
-
-        places_with_priority.sort(key=get_priority)
-
-        # 4. Берем первое место (самое приоритетное)
-        return places_with_priority[0] if places_with_priority else None
+        # Берем первое место (самое приоритетное)
+        return places[0]
 
 
 def find_oldest_unshown_place_in_region(
@@ -287,56 +315,24 @@ def find_oldest_unshown_place_in_region(
         return None
 
     with get_session() as session:
-        # Получаем все места региона с учетом типа задания
-        places = (
-            session.query(TaskPlace)
-            .filter(
-                and_(
-                    TaskPlace.category == category,
-                    TaskPlace.place_type == place_type,
-                    TaskPlace.task_type == task_type,  # Фильтр по типу задания
-                    TaskPlace.region == region,
-                    TaskPlace.is_active == True,  # noqa: E712
-                )
-            )
-            .all()
+        # Места региона с учетом типа задания; первым — то, что дольше всего не показывалось
+        places = _query_ranked_places(
+            session,
+            [
+                TaskPlace.category == category,
+                TaskPlace.place_type == place_type,
+                TaskPlace.task_type == task_type,  # Фильтр по типу задания
+                TaskPlace.region == region,
+                TaskPlace.is_active == True,  # noqa: E712
+            ],
+            user_id,
+            user_lat,
+            user_lng,
+            order="oldest",
+            limit=1,
         )
 
-        if not places:
-            return None
-
-        # Для каждого места находим дату последнего показа и вычисляем расстояние
-        places_with_dates = []
-        for place in places:
-            last_shown = (
-                session.query(DailyViewTasks.view_date)
-                .filter(
-                    and_(
-                        DailyViewTasks.user_id == user_id,
-                        DailyViewTasks.view_type == "place",
-                        DailyViewTasks.view_key == str(place.id),
-                    )
-                )
-                .order_by(DailyViewTasks.view_date.desc())
-                .first()
-            )
-
-            if last_shown:
-                days_since = (datetime.now(UTC) - last_shown[0]).days
-            else:
-                days_since = 999  # Никогда не показывалось
-
-            # Вычисляем расстояние, если есть координаты пользователя
-            if user_lat is not None and user_lng is not None:
-                place.distance_km = haversine_km(user_lat, user_lng, place.lat, place.lng)
-
-            places_with_dates.append((place, days_since))
-
-        # Сортируем по времени последнего показа (самое старое первым)
-        places_with_dates.sort(key=lambda x: x[1])
-
-        # Возвращаем место, которое дольше всего не показывалось
-        return places_with_dates[0][0] if places_with_dates else None
+        return places[0] if places else None
 
 
 def mark_place_as_shown(user_id: int, place_id: int) -> None:
@@ -498,18 +494,22 @@ def get_all_places_for_category(
         return []
 
     with get_session() as session:
-        # Все места категории в регионе (взятые не исключаем; «Квест взят» — в _build_places_list_content).
-        places_query = session.query(TaskPlace).filter(
-            and_(
+        # Все места категории в регионе (взятые не исключаем; «Квест взят» — в _build_places_list_content),
+        # отсортированные по приоритету как в find_nearest_available_place
+        places = _query_ranked_places(
+            session,
+            [
                 TaskPlace.category == category,
                 TaskPlace.task_type == task_type,
                 TaskPlace.is_active == True,  # noqa: E712
                 TaskPlace.region == region,
-            )
+            ],
+            user_id,
+            user_lat,
+            user_lng,
+            limit=limit,
         )
 
-        places = places_query.all()
-
         logger.info(
             f"get_all_places_for_category: category={category}, region={region}, "
             f"task_type={task_type}, found={len(places)} places"
@@ -522,45 +522,4 @@ def get_all_places_for_category(
             )
             return []
 
-        # Вычисляем расстояние и время последнего показа для каждого места
-        places_with_priority = []
-        for place in places:
-            place.distance_km = haversine_km(user_lat, user_lng, place.lat, place.lng)
-
-            # Получаем дату последнего показа
-            last_shown = (
-                session.query(DailyViewTasks.view_date)
-                .filter(
-                    and_(
-                        DailyViewTasks.user_id == user_id,
-                        DailyViewTasks.view_type == "place",
-                        DailyViewTasks.view_key == str(place.id),
-                    )
-                )
-                .order_by(DailyViewTasks.view_date.desc())
-                .first()
-            )
-
-            if last_shown:
-                days_since_shown = (datetime.now(UTC) - last_shown[0]).days
-                place.days_since_shown = days_since_shown
-            else:
-                place.days_since_shown = 999  # Никогда не показывалось
-
-            places_with_priority.append(place)
-
-        # Сортируем по приоритету (как в find_nearest_available_place)
-        def get_priority(place):
-            days = place.days_since_shown
-
-            if days > PRIORITY_DAYS:
-                return (0, place.distance_km)
-            elif days >= EXCLUDE_PLACE_DAYS:
-                return (1, place.distance_km)
-            else:
-                return (2, place.distance_km)
-
-        places_with_priority.sort(key=get_priority)
-
-        # Возвращаем ограниченное количество
-        return places_with_priority[:limit]
+        return places
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.ingest import ai_ingest
+from api.ingest.ai_ingest import AiIngestPipeline, SourceCache, normalize_extracted
+from utils.geo_cache import GeoCache
+from utils.state_store import MemoryStateBackend
+
+pytestmark = pytest.mark.no_db
+
+PAGE = "<html><body><script>var csrf = '{token}';</script><main><h1>Jazz night</h1><p>{body}</p></main></body></html>"
+
+
+class _Site:
+    """Два сайта-источника: /etag отдает ETag, /plain без валидаторов, но с меняющимся script."""
+
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+        self.body = "Friday 20:00"
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        html = PAGE.format(token=len(self.requests), body=self.body)
+        if request.url.path == "/etag":
+            etag = f'"{self.body}"'
+            if request.headers.get("if-none-match") == etag:
+                return httpx.Response(304)
+            return httpx.Response(200, text=html, headers={"ETag": etag})
+        return httpx.Response(200, text=html)
+
+
+@pytest.fixture()
+def llm(monkeypatch):
+    calls = []
+
+    def extract(text, *, source_url=None, model=None):
+        calls.append(source_url)
+        return [
+            {
+                "title": "Jazz night",
+                "start_datetime": "2030-06-20T20:00",
+                "venue_name": "Milu",
+                "lat": -8.6,
+                "lng": 115.1,
+            }
+        ]
+
+    monkeypatch.setattr(ai_ingest, "call_openai_for_events", extract)
+    return calls
+
+
+def _run(site: _Site, cache: SourceCache, written: list) -> int:
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(site.handler)) as client:
+            pipeline = AiIngestPipeline(client, cache, GeoCache(engine_getter=lambda: None))
+
+            async def write(rows):
+                written.append(rows)
+
+            pipeline.write = write
+            return await pipeline.run([{"url": "https://a.test/etag"}, {"url": "https://b.test/plain"}])
+
+    return asyncio.run(scenario())
+
+
+def test_unchanged_pages_skip_llm_and_db(llm):
+    site = _Site()
+    cache = SourceCache(MemoryStateBackend())
+    written = []
+
+    assert _run(site, cache, written) == 2
+    assert len(llm) == 2 and len(written) == 2
+
+    # Повторный запуск: /etag отвечает 304, у /plain изменился только script — текст тот же
+    assert _run(site, cache, written) == 0
+    assert len(llm) == 2 and len(written) == 2
+    etag_requests = [r for r in site.requests if r.url.path == "/etag"]
+    assert etag_requests[1].headers["if-none-match"] == '"Friday 20:00"'
+
+    site.body = "Saturday 21:00"
+    assert _run(site, cache, written) == 2
+    assert len(llm) == 4
+
+
+def test_llm_failure_does_not_cache_the_page(monkeypatch):
+    calls = []
+
+    def extract(text, *, source_url=None, model=None):
+        calls.append(source_url)
+        return None if len(calls) <= 2 else []  # первый запуск: OpenAI недоступен для обоих URL
+
+    monkeypatch.setattr(ai_ingest, "call_openai_for_events", extract)
+    site = _Site()
+    cache = SourceCache(MemoryStateBackend())
+    written = []
+
+    assert _run(site, cache, written) == 0
+    assert len(calls) == 2 and cache.get("https://b.test/plain") is None
+
+    assert _run(site, cache, written) == 0
+    assert len(calls) == 4 and cache.get("https://b.test/plain") is not None
+
+
+def test_missing_coordinates_are_geocoded_once(monkeypatch):
+    queries = []
+
+    def geocode_one(query):
+        queries.append(query)
+        return (-8.5, 115.2)
+
+    monkeypatch.setattr(ai_ingest, "geocode_one", geocode_one)
+    monkeypatch.setattr(ai_ingest, "NOMINATIM_INTERVAL_S", 0)
+    events = normalize_extracted(
+        [
+            {"title": "Yoga", "start": "2030-06-20T07:00", "venue_name": "Pyramids"},
+            {"title": "Yoga", "start": "2030-06-21T07:00", "venue_name": "Pyramids"},
+        ],
+        "Ubud",
+    )
+
+    async def scenario():
+        pipeline = AiIngestPipeline(None, SourceCache(MemoryStateBackend()), GeoCache(engine_getter=lambda: None))
+        return await pipeline.to_rows(events, "https://a.test")
+
+    rows = asyncio.run(scenario())
+
+    assert [(r["lat"], r["lng"], r["city"]) for r in rows] == [(-8.5, 115.2, "Ubud")] * 2
+    assert queries == ["Pyramids Ubud"]
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from utils.events_snapshot import EventsSnapshotCache
+from utils.unified_events_service import (
+    _SEARCH_EVENT_SELECT,
+    AsyncUnifiedEventsService,
+    _collect_search_events,
+    _finish_search,
+    _search_window,
+)
+
+pytestmark = pytest.mark.no_db
+
+USER = (-8.65, 115.14)
+MOSCOW_USER = (55.75, 37.62)
+
+
+_SELECT_WIDTH = len(_SEARCH_EVENT_SELECT.split(","))
+
+
+class _Row(tuple):
+    distance_km = 0.42
+
+
+def _row(event_id, source="baliforum", title=None, dedupe_key=None):
+    starts_at = _search_window("bali", 0)[0] + timedelta(hours=20)
+    columns = (
+        (source, event_id, title or f"Event {event_id}", None, None, None, None, starts_at, "bali", -8.651, 115.141)
+        + ("Beach", None, None, 1, "org", None, 0, "open", starts_at)
+        + (None,) * 8
+        + (starts_at + timedelta(days=2), None, "[]", None, None, dedupe_key)
+    )
+    # Колонки _SEARCH_EVENT_SELECT, затем distance_km, как в радиусном SQL (SELECT candidates.*, ...)
+    return _Row(columns[:_SELECT_WIDTH] + (_Row.distance_km,))
+
+
+class FakeAsyncEngine:
+    """async engine: connect() -> async context manager, execute() отдает заготовленные строки по очереди."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.queries = []
+
+    def connect(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params=None):
+        self.queries.append(query.text)
+        return self.results.pop(0)
+
+
+def test_async_search_runs_radius_sql():
+    engine = FakeAsyncEngine([_row(1, source="user"), _row(2)])
+    service = AsyncUnifiedEventsService(engine)
+
+    events = asyncio.run(service.search_events_today(city="bali", user_lat=USER[0], user_lng=USER[1], radius_km=5))
+
+    assert [e["id"] for e in events] == [1, 2]
+    assert events[0]["distance_km"] == 0.42
+    assert len(engine.queries) == 1 and "6371 * acos" in engine.queries[0]
+
+
+def test_async_search_serves_repeat_from_snapshot():
+    engine = FakeAsyncEngine([_row(7)])
+    cache = EventsSnapshotCache(ttl_s=60, max_events=100, enabled=True)
+    service = AsyncUnifiedEventsService(engine, snapshot=cache)
+
+    async def scenario():
+        first = await service.search_events_today(city="bali", user_lat=USER[0], user_lng=USER[1], radius_km=5)
+        second = await service.search_events_today(city="bali", user_lat=USER[0], user_lng=USER[1], radius_km=5)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert len(engine.queries) == 1 and "6371 * acos" not in engine.queries[0]
+    assert [e["id"] for e in first] == [e["id"] for e in second] == [7]
+    assert cache.stats()["hits"] == 1
+
+
+def test_async_search_falls_back_to_region_window():
+    engine = FakeAsyncEngine([], [_row(3)])  # рядом с пользователем из Москвы ничего нет
+    service = AsyncUnifiedEventsService(engine)
+
+    events = asyncio.run(
+        service.search_events_today(city="bali", user_lat=MOSCOW_USER[0], user_lng=MOSCOW_USER[1], radius_km=5)
+    )
+
+    assert [e["id"] for e in events] == [3]
+    assert len(engine.queries) == 2 and "LIMIT 50" in engine.queries[1]
+
+
+def test_radius_rows_keep_same_venue_events_apart():
+    rows = [_row(1, title="Jazz night", dedupe_key="k1"), _row(2, title="Sunset yoga", dedupe_key="k2")]
+
+    events, found_user, found_parser = _collect_search_events(rows, with_distance=True)
+    events = _finish_search(
+        events,
+        city="bali",
+        user_lat=USER[0],
+        user_lng=USER[1],
+        radius_km=5,
+        found_user=found_user,
+        found_parser=found_parser,
+        message_id=None,
+        start_time=0.0,
+    )
+
+    assert [e["id"] for e in events] == [1, 2]
+    assert [e["dedupe_key"] for e in events] == ["k1", "k2"]
+    assert events[0]["distance_km"] == 0.42
@@ -0,0 +1,200 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from utils.auto_delete import AutoDeleteScheduler
+
+pytestmark = pytest.mark.no_db
+
+
+class FakeBot:
+    id = 999
+
+    def __init__(self, status="administrator", fail_batch=False, errors=None):
+        self.status = status
+        self.fail_batch = fail_batch
+        self.errors = errors or {}  # message_id -> текст ошибки Telegram
+        self.calls = []
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(("get_chat_member", chat_id))
+        return SimpleNamespace(status=self.status)
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls.append(("delete_messages", chat_id, sorted(message_ids)))
+        if self.fail_batch:
+            raise TelegramBadRequest(method=None, message="Bad Request: message can't be deleted")
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete_message", chat_id, message_id))
+        if message_id in self.errors:
+            raise TelegramBadRequest(method=None, message=self.errors[message_id])
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.tables["bot_messages"].create(engine)
+    return engine
+
+
+def _track(engine, chat_id, message_ids, deleted=False, age_s=0, tag="service"):
+    created_at = datetime.now(UTC) - timedelta(seconds=age_s)
+    with engine.begin() as conn:
+        conn.execute(
+            Base.metadata.tables["bot_messages"].insert(),
+            [
+                {"chat_id": chat_id, "message_id": mid, "tag": tag, "deleted": deleted, "created_at": created_at}
+                for mid in message_ids
+            ],
+        )
+
+
+def _deleted(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT chat_id, message_id FROM bot_messages WHERE deleted ORDER BY 1, 2"))
+        return [tuple(row) for row in rows]
+
+
+def test_due_messages_are_deleted_per_chat_in_one_call(engine):
+    now = [0.0]
+    bot = FakeBot()
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine, clock=lambda: now[0])
+    scheduler._bot = bot
+    _track(engine, -1, range(1, 151))
+    _track(engine, -2, [1, 2])
+    _track(engine, -2, [3], deleted=True)  # уже удалено через «Спрятать бота»
+    for mid in range(1, 151):
+        scheduler.schedule(-1, mid)
+    for mid in (1, 2, 3):
+        scheduler.schedule(-2, mid)
+    scheduler.schedule(-2, 4, delay_s=500)
+
+    now[0] = 121
+    assert asyncio.run(scheduler.run_due()) == 152
+
+    assert sorted(bot.calls) == [
+        ("delete_messages", -2, [1, 2]),
+        ("delete_messages", -1, list(range(1, 101))),
+        ("delete_messages", -1, list(range(101, 151))),
+        ("get_chat_member", -2),
+        ("get_chat_member", -1),
+    ]
+    assert len(_deleted(engine)) == 153
+    assert len(scheduler) == 1  # -2/4 ждет своего срока
+
+
+def test_rescheduled_message_waits_for_new_deadline(engine):
+    now = [0.0]
+    bot = FakeBot()
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine, clock=lambda: now[0])
+    scheduler._bot = bot
+
+    scheduler.schedule(-1, 10)
+    now[0] = 100
+    scheduler.schedule(-1, 10)  # панель снова показана — срок переносится
+    now[0] = 130
+    assert asyncio.run(scheduler.run_due()) == 0
+    now[0] = 221
+    assert asyncio.run(scheduler.run_due()) == 1
+    assert [call[0] for call in bot.calls] == ["get_chat_member", "delete_messages"]
+
+
+def test_chat_without_bot_is_only_marked(engine):
+    bot = FakeBot(status="kicked")
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine)
+    scheduler._bot = bot
+    _track(engine, -1, [1, 2])
+    scheduler.schedule(-1, 1, delay_s=0)
+    scheduler.schedule(-1, 2, delay_s=0)
+
+    assert asyncio.run(scheduler.run_due()) == 0
+    assert bot.calls == [("get_chat_member", -1)]
+    assert _deleted(engine) == [(-1, 1), (-1, 2)]
+
+
+def test_failed_batch_falls_back_to_single_deletes(engine):
+    bot = FakeBot(fail_batch=True, errors={2: "Bad Request: message to delete not found", 3: "Bad Gateway"})
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine)
+    scheduler._bot = bot
+    _track(engine, -1, [1, 2, 3])
+    for mid in (1, 2, 3):
+        scheduler.schedule(-1, mid, delay_s=0)
+
+    assert asyncio.run(scheduler.run_due()) == 1
+    # Временная ошибка: строка не помечена, ее подберет сверка
+    assert _deleted(engine) == [(-1, 1), (-1, 2)]
+
+
+def test_sweep_restores_queue_from_bot_messages(engine):
+    now = [0.0]
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine, clock=lambda: now[0])
+    _track(engine, -1, [1], age_s=300)  # срок прошел, пока бот был остановлен
+    _track(engine, -1, [2], age_s=60)
+    _track(engine, -1, [3], age_s=60, tag="notification")
+    _track(engine, -1, [4], age_s=3 * 24 * 3600)  # старше 48 часов — Telegram уже не даст удалить
+
+    assert asyncio.run(scheduler.sweep()) == 2
+    assert asyncio.run(scheduler.sweep()) == 0
+    assert list(scheduler._pop_due(0)) == [-1] and len(scheduler) == 1
+    assert 55 <= scheduler._due[(-1, 2)] <= 61
+
+
+def test_one_task_serves_many_messages(engine):
+    bot = FakeBot()
+    scheduler = AutoDeleteScheduler(engine_getter=lambda: engine, tick_s=0.01, delay_s=0.05)
+    _track(engine, -1, range(1, 1001))
+
+    async def scenario():
+        scheduler.start(bot)
+        for mid in range(1, 1001):
+            scheduler.schedule(-1, mid)
+        tasks = len(asyncio.all_tasks())
+        await asyncio.sleep(0.3)
+        await scheduler.close()
+        return tasks
+
+    assert asyncio.run(scenario()) <= 3
+    assert len(_deleted(engine)) == 1000
+    assert [call[0] for call in bot.calls].count("delete_messages") < 20  # пачки, а не вызов на сообщение
+
+
+def test_overflow_sweeps_are_throttled(engine):
+    _track(engine, -1, range(1, 11))
+    loads = []
+
+    def run(delay_s):
+        scheduler = AutoDeleteScheduler(
+            engine_getter=lambda: engine, tick_s=0.01, max_pending=3, overflow_sweep_ticks=5, delay_s=delay_s
+        )
+        load_pending = scheduler._load_pending
+
+        def counting_load(limit):
+            loads.append(limit)
+            return load_pending(limit)
+
+        scheduler._load_pending = counting_load
+
+        async def scenario():
+            scheduler.start(FakeBot())
+            await asyncio.sleep(0.3)
+            await scheduler.close()
+
+        asyncio.run(scenario())
+        return scheduler
+
+    # Сроки еще не наступили: очередь заполнена и не освобождается — повторных сверок нет
+    assert len(run(delay_s=120)) == 3
+    assert len(loads) == 1
+
+    # Очередь освобождается каждый тик — досверка раз в overflow_sweep_ticks тиков, а не на каждом
+    loads.clear()
+    run(delay_s=0)
+    assert len(_deleted(engine)) == 10
+    assert 2 <= len(loads) <= 8
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from sources import baliforum
+from sources.baliforum import BaliForumDetailCache, BaliForumScraper, HostRateLimiter
+from utils.state_store import MemoryStateBackend
+
+pytestmark = pytest.mark.no_db
+
+FIXTURES = Path(__file__).parent / "fixtures" / "baliforum"
+CARD = (FIXTURES / "list_card.html").read_text(encoding="utf-8")
+LIST_PAGE = (FIXTURES / "list_page.html").read_text(encoding="utf-8")
+DETAIL_PAGE = (FIXTURES / "detail_page.html").read_text(encoding="utf-8")
+
+
+class _Site:
+    """Фейковый baliforum.ru: две страницы списка по 3 события, детальные страницы с ETag (если with_etag)."""
+
+    def __init__(self, with_etag: bool = True):
+        self.with_etag = with_etag
+        self.requests: list[httpx.Request] = []
+        self.token = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if request.url.path == "/events":
+            page = int(request.url.params.get("page", "1"))
+            ids = range((page - 1) * 3, page * 3) if page <= 2 else []
+            cards = "\n".join(
+                CARD.format(slug=f"e{i}", title=f"Event {i}", when=f"Сегодня с 1{i}:00 до 2{i % 4}:30") for i in ids
+            )
+            return httpx.Response(200, text=LIST_PAGE.format(cards=cards))
+
+        slug = request.url.path.rsplit("/", 1)[-1]
+        etag = f'"{slug}-v1"'
+        if self.with_etag and request.headers.get("if-none-match") == etag:
+            return httpx.Response(304)
+        # Токен меняется на каждый ответ, как csrf на реальном сайте
+        self.token += 1
+        html = DETAIL_PAGE.format(
+            token=self.token,
+            title=slug,
+            slug=slug,
+            venue=f"Milu {slug}",
+            venue_q=f"Milu+{slug}",
+            when="Сегодня",
+            lat="-8.6500",
+            lng="115.1300",
+        )
+        return httpx.Response(200, text=html, headers={"ETag": etag} if self.with_etag else {})
+
+    def detail_requests(self) -> list[httpx.Request]:
+        return [r for r in self.requests if r.url.path != "/events"]
+
+
+def _run(site: _Site, cache: BaliForumDetailCache, limit: int = 100):
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(site.handler)) as client:
+            scraper = BaliForumScraper(client, concurrency=4, rate_limiter=HostRateLimiter(0), cache=cache)
+            events = await scraper.fetch_events(limit=limit)
+            return events, scraper.stats
+
+    return asyncio.run(scenario())
+
+
+def _cache() -> BaliForumDetailCache:
+    return BaliForumDetailCache(MemoryStateBackend(max_entries=100))
+
+
+def test_scraper_walks_pages_and_resolves_locations():
+    site = _Site()
+
+    events, stats = _run(site, _cache())
+
+    assert [e["title"] for e in events] == [f"Event {i}" for i in range(6)]
+    assert all(e["lat"] == -8.65 and e["lng"] == 115.13 for e in events)
+    assert events[0]["venue"] == "Milu e0"
+    assert events[0]["tags"] == ["Музыка", "Вечеринка"]
+    assert events[0]["time_mode"] == "range"
+    assert stats["pages"] == 2
+    assert stats["parsed"] == 6
+
+
+def test_second_cycle_uses_conditional_requests():
+    site = _Site(with_etag=True)
+    cache = _cache()
+    _run(site, cache)
+
+    events, stats = _run(site, cache)
+
+    assert len(events) == 6
+    assert events[3]["venue"] == "Milu e3"
+    assert stats["not_modified"] == 6
+    assert stats["parsed"] == 0
+    assert all(r.headers.get("if-none-match") for r in site.detail_requests()[6:])
+
+
+def test_unchanged_content_is_not_reparsed(monkeypatch):
+    site = _Site(with_etag=False)
+    cache = _cache()
+    _run(site, cache)
+
+    async def fail_resolve(*args, **kwargs):
+        raise AssertionError("страница не менялась — парсинг не нужен")
+
+    monkeypatch.setattr(baliforum, "_resolve_location", fail_resolve)
+    events, stats = _run(site, cache)
+
+    assert [e["lat"] for e in events] == [-8.65] * 6
+    assert stats["hash_hits"] == 6
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    limiter = HostRateLimiter(0.05)
+
+    async def scenario():
+        started = []
+
+        async def hit(host):
+            await limiter.wait(host)
+            started.append((host, time.monotonic()))
+
+        await asyncio.gather(*(hit("baliforum.ru") for _ in range(3)), hit("example.com"))
+        return started
+
+    started = asyncio.run(scenario())
+    bali = [t for host, t in started if host == "baliforum.ru"]
+
+    assert bali[2] - bali[0] >= 0.09
+    # Другой хост не ждет очереди baliforum.ru
+    assert [t for host, t in started if host == "example.com"][0] - bali[0] < 0.05
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from utils import ban_service
+from utils.ban_service import BanCache, BanService
+
+pytestmark = pytest.mark.no_db
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, is_banned BOOLEAN DEFAULT FALSE)"))
+        conn.execute(
+            text(
+                "CREATE TABLE banned_users (id INTEGER PRIMARY KEY, user_id INTEGER, username TEXT, first_name TEXT,"
+                " banned_by INTEGER, reason TEXT, expires_at TIMESTAMP, is_active BOOLEAN DEFAULT TRUE,"
+                " banned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+            )
+        )
+        conn.execute(text("INSERT INTO users (id, is_banned) VALUES (1, TRUE), (2, FALSE), (3, FALSE)"))
+    return engine
+
+
+@pytest.fixture()
+def cache(monkeypatch):
+    cache = BanCache(listen=False)
+    monkeypatch.setattr(ban_service, "ban_cache", cache)
+    return cache
+
+
+def test_reload_reads_banned_users(engine, cache):
+    assert not cache.loaded
+
+    assert cache.reload(engine) == 1
+
+    assert cache.loaded and cache.is_banned(1) and not cache.is_banned(2)
+
+
+def test_ban_and_unban_update_cache_without_reload(engine, cache):
+    cache.reload(engine)
+    service = BanService(engine)
+
+    assert service.ban_user(user_id=2, banned_by=99, reason="spam")
+    assert cache.is_banned(2)
+    assert service.unban_user(2)
+    assert not cache.is_banned(2)
+    assert not service.unban_user(3)
+    assert cache.reloads == 1
+
+
+def test_marks_made_during_reload_win_over_snapshot(engine, cache):
+    original_connect = engine.connect
+
+    def connect_and_unban_concurrently():
+        # Разбан пришел, пока reload() читал старый снимок, где пользователь 1 еще забанен
+        cache.mark(1, banned=False)
+        cache.mark(3, banned=True)
+        return original_connect()
+
+    engine.connect = connect_and_unban_concurrently
+    cache.reload(engine)
+
+    assert not cache.is_banned(1) and cache.is_banned(3)
+
+
+def test_notify_payload_updates_cache(cache):
+    cache._on_notify(None, 1, "user_bans", "ban:42")
+    assert cache.is_banned(42)
+    cache._on_notify(None, 1, "user_bans", "unban:42")
+    cache._on_notify(None, 1, "user_bans", "garbage")
+    assert not cache.is_banned(42) and cache.notifications == 2
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from utils.cache import TTLCache
+from utils.metrics import registry
+
+pytestmark = pytest.mark.no_db
+
+
+def test_lru_eviction_and_ttl():
+    now = [0.0]
+    cache = TTLCache("t_lru", maxsize=2, ttl_s=10, clock=lambda: now[0])
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" становится свежей
+    cache.set("c", 3)  # вытесняет "b"
+    assert cache.get("b") is None and cache.get("a") == 1
+
+    now[0] += 11
+    assert "a" not in cache and cache.get("c") is None
+    assert cache.stats()["evictions"] == {"lru": 1, "bytes": 0, "expired": 1}
+
+
+def test_byte_limit_and_accounting():
+    cache = TTLCache("t_bytes", maxsize=100, max_bytes=10, sizeof=len)
+
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    assert cache.bytes == 10
+    cache.set("c", b"123")  # не влезает — уходит самая давняя
+    cache.set("huge", b"x" * 11)  # больше лимита целиком — не кэшируется
+
+    assert [k for k in ("a", "b", "c", "huge") if k in cache] == ["b", "c"]
+    assert cache.bytes == 8
+    cache.pop("b")
+    assert cache.bytes == 3
+
+
+def test_add_marks_key_once():
+    cache = TTLCache("t_add", maxsize=10)
+
+    assert cache.add("cb-1") is True
+    assert cache.add("cb-1") is False
+    assert cache.add("cb-2") is True
+
+
+def test_concurrent_misses_load_once():
+    cache = TTLCache("t_flight", maxsize=10, ttl_s=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["admin"]
+
+    async def scenario():
+        results = await asyncio.gather(*(cache.get_or_load(-100, loader) for _ in range(20)))
+        return results, await cache.get_or_load(-100, loader)
+
+    results, cached = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert results == [["admin"]] * 20 and cached == ["admin"]
+    assert cache.stats()["coalesced"] == 19
+
+
+def test_failed_load_reaches_all_waiters_and_is_not_cached():
+    cache = TTLCache("t_fail", maxsize=10)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("telegram down")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1 and all(isinstance(r, RuntimeError) for r in results)
+    assert len(cache) == 0
+
+
+def test_refresh_reloads_cached_value_and_joins_running_load():
+    cache = TTLCache("t_refresh", maxsize=10)
+    cache.set("k", "old")
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "new"
+
+    async def scenario():
+        task = asyncio.ensure_future(cache.get_or_load("k", loader, refresh=True))
+        await asyncio.sleep(0)
+        loading = cache.is_loading("k")
+        results = await asyncio.gather(task, cache.get_or_load("k", loader, refresh=True))
+        return loading, results
+
+    loading, results = asyncio.run(scenario())
+
+    assert loading is True and not cache.is_loading("k")
+    assert len(calls) == 1 and results == ["new", "new"]
+    assert cache.get("k") == "new"
+
+
+def test_cache_metrics_are_exported():
+    cache = TTLCache("t_metrics", maxsize=1)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.set("b", 2)
+
+    text = registry.render()
+
+    assert 'cache_requests_total{cache="t_metrics",result="hit"} 1' in text
+    assert 'cache_evictions_total{cache="t_metrics",reason="lru"} 1' in text
+    assert 'cache_entries{cache="t_metrics"} 1' in text
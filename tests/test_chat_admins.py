@@ -0,0 +1,134 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from utils.chat_admins import ChatAdminRegistry
+
+pytestmark = pytest.mark.no_db
+
+BOT_ID = 999
+
+
+class FakeBot:
+    id = BOT_ID
+
+    def __init__(self, admins):
+        self.admins = admins  # chat_id -> [(user_id, status)]
+        self.calls = []
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls.append(chat_id)
+        await asyncio.sleep(0.01)
+        return [
+            SimpleNamespace(status=status, user=SimpleNamespace(id=user_id)) for user_id, status in self.admins[chat_id]
+        ]
+
+
+def _member_update(chat_id, user_id, status):
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id),
+        new_chat_member=SimpleNamespace(status=status, user=SimpleNamespace(id=user_id)),
+    )
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.tables["chat_settings"].create(engine)
+    return engine
+
+
+def test_concurrent_lookups_call_telegram_once():
+    bot = FakeBot({-100: [(1, "creator"), (2, "administrator"), (3, "member"), (BOT_ID, "administrator")]})
+    registry = ChatAdminRegistry()
+
+    async def scenario():
+        results = await asyncio.gather(*(registry.get_admin_ids(bot, -100) for _ in range(20)))
+        checks = [await registry.is_admin(bot, -100, uid) for uid in (1, 2)]
+        return results, checks
+
+    results, checks = asyncio.run(scenario())
+
+    assert bot.calls == [-100]
+    assert results == [[1, 2]] * 20 and checks == [True, True]
+    # single-flight — через TTLCache.get_or_load самого реестра
+    assert registry._entries.stats()["coalesced"] == 19
+
+
+def test_stale_entry_is_served_and_refreshed_once():
+    now = [0.0]
+    bot = FakeBot({-100: [(1, "creator")]})
+    registry = ChatAdminRegistry(ttl_s=100, jitter=0, clock=lambda: now[0])
+
+    async def scenario():
+        await registry.get_admin_ids(bot, -100)
+        bot.admins[-100] = [(1, "creator"), (2, "administrator")]
+        now[0] += 101
+        stale = await registry.get_admin_ids(bot, -100)  # отдается сразу, обновление — в фоне
+        await registry.get_admin_ids(bot, -100)
+        await asyncio.sleep(0.05)
+        return stale, await registry.get_admin_ids(bot, -100)
+
+    stale, fresh = asyncio.run(scenario())
+
+    assert stale == [1] and fresh == [1, 2]
+    assert bot.calls == [-100, -100]
+
+
+def test_denied_check_rechecks_only_after_interval():
+    now = [0.0]
+    bot = FakeBot({-100: [(1, "creator")]})
+    registry = ChatAdminRegistry(recheck_s=60, clock=lambda: now[0])
+
+    async def scenario():
+        await registry.get_admin_ids(bot, -100)
+        bot.admins[-100] = [(1, "creator"), (2, "administrator")]
+        denied = await registry.is_admin(bot, -100, 2)
+        now[0] += 61
+        return denied, await registry.is_admin(bot, -100, 2)
+
+    assert asyncio.run(scenario()) == (False, True)
+    assert bot.calls == [-100, -100]
+
+
+def test_member_updates_change_admins_without_api_calls():
+    bot = FakeBot({-100: [(1, "creator")]})
+    registry = ChatAdminRegistry()
+    asyncio.run(registry.get_admin_ids(bot, -100))
+
+    registry.apply_member_update(_member_update(-100, 2, "administrator"), BOT_ID)
+    assert registry.peek(-100) == (1, 2)
+    registry.apply_member_update(_member_update(-100, 1, "member"), BOT_ID)
+    assert registry.peek(-100) == (2,)
+    registry.apply_member_update(_member_update(-100, BOT_ID, "kicked"), BOT_ID)
+    assert registry.peek(-100) is None
+
+    assert bot.calls == [-100]
+
+
+def test_seeded_from_db_and_changes_persisted(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            Base.metadata.tables["chat_settings"].insert(),
+            [
+                {"chat_id": -100, "admin_ids": json.dumps([1]), "admin_count": 1, "bot_status": "active"},
+                {"chat_id": -200, "admin_ids": json.dumps([5]), "admin_count": 1, "bot_status": "removed"},
+            ],
+        )
+    registry = ChatAdminRegistry(engine_getter=lambda: engine)
+
+    assert asyncio.run(registry.load_from_db()) == 1
+    assert registry.peek(-100) == (1,) and registry.peek(-200) is None
+
+    registry.apply_member_update(_member_update(-100, 7, "administrator"), BOT_ID)
+    assert asyncio.run(registry.persist()) == 1
+    assert asyncio.run(registry.persist()) == 0
+
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT admin_ids, admin_count FROM chat_settings WHERE chat_id = -100")).one()
+    assert json.loads(row[0]) == [1, 7] and row[1] == 2
@@ -0,0 +1,42 @@
+import asyncio
+from datetime import UTC, datetime, timedelta, timezone
+
+import pytest
+
+from utils import community_reminders
+from utils.community_events_service import community_starts_at_utc
+
+pytestmark = pytest.mark.no_db
+
+LOCAL = datetime(2026, 6, 20, 19, 0)
+
+
+def test_starts_at_utc_uses_city_timezone():
+    assert community_starts_at_utc(LOCAL, "bali") == datetime(2026, 6, 20, 11, 0, tzinfo=UTC)
+    assert community_starts_at_utc(LOCAL, "moscow") == datetime(2026, 6, 20, 16, 0, tzinfo=UTC)
+
+
+def test_starts_at_utc_without_city_is_utc():
+    assert community_starts_at_utc(LOCAL, None) == LOCAL.replace(tzinfo=UTC)
+
+
+def test_starts_at_utc_keeps_aware_datetime():
+    aware = LOCAL.replace(tzinfo=timezone(timedelta(hours=3)))
+    assert community_starts_at_utc(aware, "bali") == datetime(2026, 6, 20, 16, 0, tzinfo=UTC)
+
+
+def test_resolve_takes_timezone_from_location_url(monkeypatch):
+    async def fake_parse(link):
+        return {"lat": -8.65, "lng": 115.14} if "bali" in link else None
+
+    monkeypatch.setattr(community_reminders, "parse_google_maps_link", fake_parse)
+
+    async def scenario():
+        bali = await community_reminders.resolve_community_starts_at_utc(1, LOCAL, "https://maps/bali")
+        unknown = await community_reminders.resolve_community_starts_at_utc(2, LOCAL, "https://maps/short")
+        return bali, unknown
+
+    bali, unknown = asyncio.run(scenario())
+
+    assert bali == datetime(2026, 6, 20, 11, 0, tzinfo=UTC)
+    assert unknown == LOCAL.replace(tzinfo=UTC)
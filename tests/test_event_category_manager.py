@@ -10,7 +10,7 @@ from utils.event_category_manager import (
     normalize_tag,
     parse_source_display_tags,
 )
-from utils.unified_events_service import _parse_categories_value, _search_row_to_event_dict
+from utils.unified_events_service import _parse_categories_value, _search_row_to_event_record
 
 
 @pytest.mark.no_db
@@ -132,7 +132,7 @@ def test_parse_categories_value():
 
 
 @pytest.mark.no_db
-def test_search_row_to_event_dict_includes_categories():
+def test_search_row_to_event_record_includes_categories():
     row = (
         "baliforum",
         1,
@@ -167,7 +167,7 @@ def test_search_row_to_event_dict_includes_categories():
         ["Выставка"],
         "Фестиваль, Искусство",
     )
-    event = _search_row_to_event_dict(row)
+    event = _search_row_to_event_record(row)
     assert event["categories"] == ["Выставка"]
     assert event["raw_category"] == "Фестиваль, Искусство"
     assert event["tags"] == ["Фестиваль", "Искусство"]
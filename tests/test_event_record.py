@@ -0,0 +1,130 @@
+from datetime import UTC, datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+
+from utils.event_record import EventRecord
+from utils.events_snapshot import RegionSnapshot
+from utils.state_store import pack_state, unpack_state
+from utils.unified_events_service import UnifiedEventsService, _search_window
+
+pytestmark = pytest.mark.no_db
+
+STARTS_AT = datetime(2026, 6, 20, 19, 30, tzinfo=UTC)
+
+
+def _record(**fields) -> EventRecord:
+    base = {
+        "id": 1,
+        "source": "baliforum",
+        "title": "Jazz night",
+        "starts_at": STARTS_AT,
+        "lat": -8.65,
+        "lng": 115.14,
+        "event_url": "https://example.com/e/1",
+        "community_name": None,
+    }
+    base.update(fields)
+    return EventRecord(base)
+
+
+def test_record_behaves_like_dict():
+    event = _record()
+
+    assert event["title"] == "Jazz night"
+    assert event.get("community_name") is None
+    assert "community_name" in event
+    # Поле, которое не присваивали, — отсутствующий ключ, как в словаре
+    assert "distance_km" not in event
+    assert event.get("distance_km") is None
+    assert event.get("type", "source") == "source"
+    with pytest.raises(KeyError):
+        event["distance_km"]
+
+    event["type"] = "source"
+    event["coords"] = (-8.65, 115.14)
+    assert event["type"] == "source"
+    assert event["coords"] == (-8.65, 115.14)
+    assert {**event}["coords"] == (-8.65, 115.14)
+
+
+def test_url_and_time_local_are_derived():
+    event = _record()
+
+    assert event["url"] == "https://example.com/e/1"
+    assert event["time_local"] == "2026-06-20 19:30"
+    assert set(event) >= {"url", "time_local", "event_url", "starts_at"}
+    assert _record(starts_at=None)["time_local"] is None
+
+    event["url"] = "https://example.com/other"
+    assert event["event_url"] == "https://example.com/other"
+
+
+def test_copy_is_independent():
+    event = _record()
+    event["coords"] = (1, 2)
+
+    clone = event.copy()
+    clone["distance_km"] = 0.5
+    clone["coords"] = (3, 4)
+
+    assert "distance_km" not in event
+    assert event["coords"] == (1, 2)
+    assert clone.to_dict() == {**event.to_dict(), "distance_km": 0.5, "coords": (3, 4)}
+
+
+def test_state_store_round_trip_keeps_unset_fields_missing():
+    event = _record(distance_km=1.5)
+    event["coords"] = [-8.65, 115.14]
+
+    restored = unpack_state(pack_state({"prepared": [event]}))["prepared"][0]
+
+    assert isinstance(restored, EventRecord)
+    assert restored.to_dict() == event.to_dict()
+    assert restored["starts_at"] == STARTS_AT
+    assert "type" not in restored
+
+
+def test_snapshot_search_copies_records():
+    event = _record(starts_at=datetime.now(UTC) + timedelta(hours=1))
+    snapshot = RegionSnapshot("bali", 0, STARTS_AT, STARTS_AT + timedelta(days=1), [event])
+
+    found = snapshot.search(-8.65, 115.14, radius_km=5)
+
+    assert isinstance(found[0], EventRecord)
+    assert found[0]["distance_km"] == 0
+    assert "distance_km" not in event
+
+
+class _SearchRow(tuple):
+    distance_km = 0.42
+
+
+def _search_row(event_id, starts_at):
+    return _SearchRow(
+        ("baliforum", event_id, "Jazz night", None, None, None, None, starts_at, "bali", -8.651, 115.141)
+        + ("Beach", None, None, None, None, None, 0, "open", starts_at)
+        + (None,) * 8
+        + (None, None, "[]", None, None)
+    )
+
+
+def test_search_returns_records_from_sql_and_region_fallback():
+    starts_at = _search_window("bali", 0)[0] + timedelta(hours=20)
+    conn = Mock()
+    conn.execute.side_effect = [
+        [_search_row(1, starts_at)],  # радиусный SQL
+        [],  # радиусный SQL: пусто рядом с пользователем из другого региона
+        [_search_row(2, starts_at)],  # fallback по окну региона
+    ]
+    engine = Mock()
+    engine.connect.return_value.__enter__ = Mock(return_value=conn)
+    engine.connect.return_value.__exit__ = Mock(return_value=None)
+    service = UnifiedEventsService(engine)
+
+    nearby = service.search_events_today(city="bali", user_lat=-8.65, user_lng=115.14, radius_km=5)
+    fallback = service.search_events_today(city="bali", user_lat=55.75, user_lng=37.62, radius_km=5)
+
+    assert [type(e) for e in nearby + fallback] == [EventRecord, EventRecord]
+    assert nearby[0]["distance_km"] == 0.42
+    assert fallback[0]["id"] == 2 and "distance_km" not in fallback[0]
@@ -0,0 +1,128 @@
+from datetime import UTC, datetime, timedelta
+from unittest.mock import Mock
+
+import pytest
+
+from utils.events_snapshot import EventsSnapshotCache, RegionSnapshot
+from utils.unified_events_service import UnifiedEventsService, _search_window
+
+pytestmark = pytest.mark.no_db
+
+NOW = datetime(2026, 6, 20, 10, 0, tzinfo=UTC)
+START = datetime(2026, 6, 19, 16, 0, tzinfo=UTC)
+END = START + timedelta(days=1)
+USER = (-8.65, 115.14)
+
+
+def _event(event_id, lat, lng, starts_at, ends_at=None, source="baliforum"):
+    return {"id": event_id, "source": source, "lat": lat, "lng": lng, "starts_at": starts_at, "ends_at": ends_at}
+
+
+def test_snapshot_search_filters_radius_and_orders_by_time_then_distance():
+    later = NOW + timedelta(hours=2)
+    events = [
+        _event(1, -8.651, 115.141, later),  # ~150 м
+        _event(2, -8.70, 115.14, NOW + timedelta(hours=1)),  # ~5.5 км
+        _event(3, -8.652, 115.142, NOW + timedelta(hours=1)),  # ~300 м, раньше по времени
+        _event(4, -8.40, 115.14, NOW + timedelta(hours=1)),  # ~28 км — вне радиуса
+        _event(5, -8.65, 115.40, NOW + timedelta(hours=1)),  # вне рамки по долготе
+        _event(6, None, None, NOW + timedelta(hours=1)),  # без координат
+    ]
+    snapshot = RegionSnapshot("bali", 0, START, END, events)
+
+    found = snapshot.search(*USER, radius_km=10, now=NOW)
+
+    assert [e["id"] for e in found] == [3, 2, 1]
+    assert found[0]["distance_km"] < found[1]["distance_km"]
+    assert 5 < found[1]["distance_km"] < 6
+    # Снапшот не мутируется distance_km конкретного запроса
+    assert "distance_km" not in events[0]
+
+
+def test_snapshot_search_skips_finished_events():
+    events = [
+        _event(1, -8.651, 115.141, NOW - timedelta(hours=5)),  # без ends_at, старше 3 часов
+        _event(2, -8.651, 115.141, NOW - timedelta(hours=2)),  # без ends_at, идет
+        _event(3, -8.651, 115.141, NOW - timedelta(hours=5), ends_at=NOW - timedelta(minutes=1)),
+        _event(4, -8.651, 115.141, NOW - timedelta(hours=5), ends_at=NOW + timedelta(hours=1)),
+    ]
+    snapshot = RegionSnapshot("bali", 0, START, END, events)
+
+    assert [e["id"] for e in snapshot.search(*USER, radius_km=5, now=NOW)] == [4, 2]
+
+
+def test_cache_hit_miss_and_rollover():
+    cache = EventsSnapshotCache(ttl_s=60, max_events=100, enabled=True)
+
+    assert cache.get("bali", 0, START) is None
+    cache.build("bali", 0, START, END, [_event(1, -8.651, 115.141, NOW)], cache.generation("bali"))
+    assert cache.get("bali", 0, START) is not None
+
+    # Наступили новые сутки региона — старое окно не отдается
+    assert cache.get("bali", 0, END) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["rollovers"]) == (1, 2, 1)
+
+
+def test_invalidate_drops_snapshot_and_discards_stale_load():
+    cache = EventsSnapshotCache(ttl_s=60, max_events=100, enabled=True)
+    cache.build("bali", 0, START, END, [], cache.generation("bali"))
+    cache.build("moscow", 0, START, END, [], cache.generation("moscow"))
+
+    generation = cache.generation("bali")
+    cache.invalidate("bali")
+    # Загрузка началась до записи: результат отдается запросу, но не кэшируется
+    assert cache.build("bali", 0, START, END, [], generation) is not None
+
+    assert cache.get("bali", 0, START) is None
+    assert cache.get("moscow", 0, START) is not None
+
+    cache.invalidate()
+    assert cache.get("moscow", 0, START) is None
+
+
+def test_ttl_and_size_limit():
+    cache = EventsSnapshotCache(ttl_s=0, max_events=1, enabled=True)
+    cache.build("bali", 0, START, END, [_event(1, -8.651, 115.141, NOW)], 0)
+    assert cache.get("bali", 0, START) is None
+
+    cache.ttl_s = 60
+    events = [_event(1, -8.651, 115.141, NOW), _event(2, -8.652, 115.141, NOW)]
+    cache.build("bali", 0, START, END, events, 0)
+    assert cache.get("bali", 0, START) is None
+
+
+def test_supports_only_known_regions_and_today_tomorrow():
+    cache = EventsSnapshotCache(enabled=True)
+    assert cache.supports("bali", 0)
+    assert cache.supports("spb", 1)
+    assert not cache.supports("bali", 2)
+    assert not cache.supports("paris", 0)
+    assert not EventsSnapshotCache(enabled=False).supports("bali", 0)
+
+
+def test_service_serves_repeat_search_from_snapshot():
+    start_utc, _ = _search_window("bali", 0)
+    row = (
+        ("user", 7, "Sunset", None, None, None, None, start_utc + timedelta(hours=20), "bali", -8.651, 115.141)
+        + ("Beach", None, None, 1, "org", None, 0, "open", start_utc)
+        + (None,) * 8
+        + (start_utc + timedelta(days=2), None, "[]", None, None)
+    )
+    engine = Mock()
+    conn = Mock()
+    conn.execute.return_value = [row]
+    engine.connect.return_value.__enter__ = Mock(return_value=conn)
+    engine.connect.return_value.__exit__ = Mock(return_value=None)
+
+    cache = EventsSnapshotCache(ttl_s=60, max_events=100, enabled=True)
+    service = UnifiedEventsService(engine, snapshot=cache)
+
+    first = service.search_events_today(city="bali", user_lat=USER[0], user_lng=USER[1], radius_km=5)
+    second = service.search_events_today(city="bali", user_lat=USER[0], user_lng=USER[1], radius_km=5)
+
+    assert conn.execute.call_count == 1
+    assert "6371 * acos" not in conn.execute.call_args[0][0].text
+    assert [e["id"] for e in first] == [e["id"] for e in second] == [7]
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,91 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from utils import geo_utils
+from utils.geo_cache import GEO_CACHE_TTL_S, GeoCache, geocode_key, reverse_key, timezone_key
+
+pytestmark = pytest.mark.no_db
+
+
+def _memory_only_cache(maxsize: int = 100) -> GeoCache:
+    return GeoCache(maxsize=maxsize, engine_getter=lambda: None)
+
+
+def test_keys_normalize_address_and_quantize_coordinates():
+    assert geocode_key("  Jl. Raya   Ubud ", "en") == geocode_key("jl. raya ubud", "en")
+    assert geocode_key("Jl. Raya Ubud", "en") != geocode_key("Jl. Raya Ubud", "ru")
+    assert reverse_key(-8.650011, 115.140019, "ru") == reverse_key(-8.650029, 115.139981, "ru")
+    assert timezone_key(-8.651, 115.141) == timezone_key(-8.649, 115.139)
+
+
+def test_memory_tier_hits_and_lru_eviction():
+    cache = _memory_only_cache(maxsize=2)
+
+    async def scenario():
+        await cache.set("timezone", "a", "Asia/Makassar")
+        await cache.set("timezone", "b", "Europe/Moscow")
+        assert await cache.get("timezone", "a") == "Asia/Makassar"  # "a" становится свежим
+        await cache.set("timezone", "c", "Europe/Moscow")  # вытесняет "b"
+        return await cache.get("timezone", "b"), await cache.get("timezone", "a")
+
+    evicted, kept = asyncio.run(scenario())
+
+    assert evicted is None
+    assert kept == "Asia/Makassar"
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["api_calls_saved"] == 2
+
+
+def test_memory_tier_expires(monkeypatch):
+    cache = _memory_only_cache()
+    monkeypatch.setitem(GEO_CACHE_TTL_S, "reverse", -1)
+
+    async def scenario():
+        await cache.set("reverse", "k", "Cafe")
+        return await cache.get("reverse", "k")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_get_timezone_calls_google_once(monkeypatch):
+    calls = []
+
+    async def fake_api(lat, lng, timestamp, api_key):
+        calls.append((lat, lng))
+        return "Asia/Makassar"
+
+    monkeypatch.setattr(geo_utils, "load_settings", lambda: SimpleNamespace(google_maps_api_key="test-key"))
+    monkeypatch.setattr(geo_utils, "_get_timezone_api", fake_api)
+    monkeypatch.setattr(geo_utils, "geo_cache", _memory_only_cache())
+
+    async def scenario():
+        first = await geo_utils.get_timezone(-8.6501, 115.1401)
+        second = await geo_utils.get_timezone(-8.6502, 115.1402)
+        return first, second
+
+    assert asyncio.run(scenario()) == ("Asia/Makassar", "Asia/Makassar")
+    assert len(calls) == 1
+    assert geo_utils.geo_cache.stats()["api_calls_saved"] == 1
+
+
+def test_negative_results_are_not_cached(monkeypatch):
+    calls = []
+
+    async def fake_api(address, language, api_key):
+        calls.append(address)
+        return None
+
+    monkeypatch.setattr(geo_utils, "load_settings", lambda: SimpleNamespace(google_maps_api_key="test-key"))
+    monkeypatch.setattr(geo_utils, "_geocode_address_api", fake_api)
+    monkeypatch.setattr(geo_utils, "geo_cache", _memory_only_cache())
+
+    async def scenario():
+        await geo_utils.geocode_address("Nowhere 1")
+        await geo_utils.geocode_address("Nowhere 1")
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
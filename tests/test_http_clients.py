@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from utils import http_clients
+from utils.http_clients import CircuitOpenError, HostRateLimiter, new_async_client, new_sync_client, upstream_stats
+
+pytestmark = pytest.mark.no_db
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstreams(monkeypatch):
+    monkeypatch.setattr(http_clients, "_upstreams", {})
+
+
+def _service(monkeypatch, name, **config):
+    monkeypatch.setitem(http_clients.SERVICES, name, http_clients.ServiceConfig(**config))
+    return name
+
+
+def test_breaker_opens_after_consecutive_failures_and_skips_network(monkeypatch):
+    service = _service(monkeypatch, "flaky", breaker_fails=2, breaker_cooldown_s=60)
+    hits = []
+
+    def handler(request):
+        hits.append(request.url.path)
+        return httpx.Response(503)
+
+    with new_sync_client(service, transport=httpx.MockTransport(handler)) as client:
+        assert client.get("https://flaky.test/a").status_code == 503
+        assert client.get("https://flaky.test/b").status_code == 503
+        with pytest.raises(CircuitOpenError):
+            client.get("https://flaky.test/c")
+
+    assert hits == ["/a", "/b"]
+    stats = upstream_stats()[service]
+    assert stats["requests"] == 2 and stats["errors"] == 2 and stats["rejected_by_breaker"] == 1
+    assert stats["status"] == {"5xx": 2}
+    assert stats["breaker"]["is_open"]
+
+    # После cooldown пробный запрос проходит, успех закрывает breaker
+    http_clients.get_breaker(service).open_until = 0
+    with new_sync_client(service, transport=httpx.MockTransport(lambda r: httpx.Response(200))) as client:
+        assert client.get("https://flaky.test/d").status_code == 200
+    assert upstream_stats()[service]["breaker"]["fails_count"] == 0
+
+
+def test_expected_content_type_counts_html_as_failure(monkeypatch):
+    service = _service(monkeypatch, "maps", breaker_fails=1, expect_content_type="image")
+
+    async def scenario():
+        transport = httpx.MockTransport(lambda r: httpx.Response(200, text="<html>quota</html>"))
+        async with new_async_client(service, transport=transport) as client:
+            await client.get("https://maps.test/staticmap")
+            with pytest.raises(CircuitOpenError):
+                await client.get("https://maps.test/staticmap")
+
+    asyncio.run(scenario())
+    assert upstream_stats()[service]["errors"] == 1
+
+
+def test_service_rate_limit_is_shared_between_clients(monkeypatch):
+    service = _service(monkeypatch, "slow", min_interval_s=0.05, breaker_fails=0)
+    started = []
+
+    def handler(request):
+        started.append((request.url.host, time.monotonic()))
+        return httpx.Response(200)
+
+    async def scenario():
+        transport = httpx.MockTransport(handler)
+        async with (
+            new_async_client(service, transport=transport) as a,
+            new_async_client(service, transport=transport) as b,
+        ):
+            await asyncio.gather(a.get("https://one.test/"), b.get("https://one.test/"), a.get("https://two.test/"))
+
+    asyncio.run(scenario())
+    one = [t for host, t in started if host == "one.test"]
+    assert abs(one[1] - one[0]) >= 0.045
+    assert upstream_stats()[service]["requests"] == 3
+
+
+def test_host_rate_limiter_reserves_slots_across_threads():
+    limiter = HostRateLimiter(0.1)
+
+    delays = [limiter.reserve("a.test") for _ in range(3)]
+
+    assert delays[0] == 0
+    assert delays[1] == pytest.approx(0.1, abs=0.01)
+    assert delays[2] == pytest.approx(0.2, abs=0.01)
+    assert limiter.reserve("b.test") == 0
+
+
+def test_shared_async_client_is_per_event_loop():
+    async def grab():
+        client = http_clients.get_async_client("google")
+        assert http_clients.get_async_client("google") is client
+        await http_clients.close_async_clients()
+        return client
+
+    first = asyncio.run(grab())
+    second = asyncio.run(grab())
+
+    assert first is not second
+    assert first.is_closed and second.is_closed
@@ -0,0 +1,135 @@
+import logging
+import threading
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from utils import job_leases
+from utils.job_leases import JobLeases
+
+pytestmark = pytest.mark.no_db
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.tables["scheduler_jobs"].create(engine)
+    Base.metadata.tables["scheduler_job_runs"].create(engine)
+    return engine
+
+
+def _leases(engine, owner, **kwargs):
+    return JobLeases(engine_getter=lambda: engine, owner=owner, **kwargs)
+
+
+def _runs(engine):
+    with engine.connect() as conn:
+        rows = conn.execute(Base.metadata.tables["scheduler_job_runs"].select().order_by("id")).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def test_running_job_is_not_started_by_another_replica(engine):
+    bot, worker = _leases(engine, "bot:1"), _leases(engine, "worker:1")
+    calls = []
+
+    def job():
+        calls.append("bot")
+        assert worker.run("cleanup-cycle", lambda: calls.append("worker")) is False
+
+    assert bot.run("cleanup-cycle", job) is True
+    assert calls == ["bot"]
+    [row] = bot.status()
+    assert row["lease_owner"] is None and row["last_status"] == "ok" and row["run_count"] == 1
+
+
+def test_min_interval_skips_the_same_period_on_a_late_replica(engine):
+    bot, worker = _leases(engine, "bot:1"), _leases(engine, "worker:1")
+    calls = []
+
+    assert bot.run("community-reminders", lambda: calls.append("bot"), min_interval_s=1440) is True
+    assert worker.run("community-reminders", lambda: calls.append("worker"), min_interval_s=1440) is False
+
+    with engine.begin() as conn:  # прошел период — задачу берет любой
+        conn.execute(
+            update(Base.metadata.tables["scheduler_jobs"]).values(
+                last_started_at=datetime.now(UTC) - timedelta(hours=1)
+            )
+        )
+    assert worker.run("community-reminders", lambda: calls.append("worker"), min_interval_s=1440) is True
+    assert calls == ["bot", "worker"]
+    assert [run["owner"] for run in _runs(engine)] == ["bot:1", "worker:1"]
+
+
+def test_expired_lease_of_a_dead_process_is_taken_over(engine):
+    dead, alive = _leases(engine, "bot:1", lease_ttl_s=0), _leases(engine, "worker:1")
+
+    assert dead.try_acquire("chat-status-check") is not None  # процесс упал, не сняв аренду
+    threading.Event().wait(0.01)  # часы sqlite — с точностью до миллисекунды
+    assert alive.run("chat-status-check", lambda: None) is True
+    assert alive.status()[0]["run_count"] == 1
+
+
+def test_lease_uses_database_clock(engine, monkeypatch):
+    bot, worker = _leases(engine, "bot:1"), _leases(engine, "worker:1")
+    started_at = bot.try_acquire("modern-ingest-morning")
+    [row] = bot.status()
+    assert started_at is not None and started_at.tzinfo is not None
+    assert started_at.replace(tzinfo=None) == row["last_started_at"].replace(tzinfo=None)
+
+    class _SkewedClock(datetime):  # часы реплики убежали на час вперед
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + timedelta(hours=1)
+
+    monkeypatch.setattr(job_leases, "datetime", _SkewedClock)
+    assert worker.run("modern-ingest-morning", lambda: None) is False
+
+
+def test_heartbeat_keeps_a_long_job_leased(engine):
+    bot, worker = _leases(engine, "bot:1", lease_ttl_s=0.3), _leases(engine, "worker:1")
+    started, finish = threading.Event(), threading.Event()
+
+    def job():
+        started.set()
+        finish.wait(5)
+
+    thread = threading.Thread(target=bot.run, args=("modern-ingest-morning", job))
+    thread.start()
+    started.wait(5)
+    try:
+        threading.Event().wait(0.6)  # дольше TTL: без продления аренда бы истекла
+        assert worker.run("modern-ingest-morning", lambda: None) is False
+    finally:
+        finish.set()
+        thread.join(5)
+
+
+def test_errors_are_recorded_in_history(engine):
+    leases = _leases(engine, "worker:1")
+
+    def logs_error():
+        logging.getLogger("modern_scheduler").error("❌ Ошибка очистки: connection reset")
+
+    def raises():
+        raise RuntimeError("BaliForum is down")
+
+    leases.run("cleanup-cycle", logs_error)
+    leases.run("modern-ingest-evening", raises)
+    leases.run("tasks-cleanup", lambda: None)
+
+    status = {row["job_id"]: row for row in leases.status()}
+    assert status["cleanup-cycle"]["last_status"] == "errors"
+    assert "connection reset" in status["cleanup-cycle"]["last_error"]
+    assert status["modern-ingest-evening"]["last_status"] == "failed"
+    assert status["modern-ingest-evening"]["last_error"] == "RuntimeError: BaliForum is down"
+    assert status["modern-ingest-evening"]["fail_count"] == 1
+    assert status["tasks-cleanup"]["last_error"] is None
+    assert [(run["job_id"], run["status"]) for run in _runs(engine)] == [
+        ("cleanup-cycle", "errors"),
+        ("modern-ingest-evening", "failed"),
+        ("tasks-cleanup", "ok"),
+    ]
+    assert all(run["duration_s"] >= 0 for run in _runs(engine))
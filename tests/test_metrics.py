@@ -0,0 +1,124 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from utils import metrics
+from utils.metrics import MetricsRegistry, RollingWindow, instrument_engine, statement_label
+
+pytestmark = pytest.mark.no_db
+
+
+def test_render_prometheus_text_format():
+    reg = MetricsRegistry()
+    calls = reg.counter("calls_total", "Вызовы", ("api",))
+    depth = reg.gauge("queue_depth", "Очередь")
+    latency = reg.histogram("latency_seconds", "Задержка", ("api",), buckets=(0.1, 1.0))
+
+    calls.labels("geocode").inc()
+    calls.labels(api="geocode").inc(2)
+    depth.set(7)
+    for value in (0.05, 0.5, 3.0):
+        latency.labels("geocode").observe(value)
+    reg.register_collector(lambda: [("legacy_total", "counter", "Старые счетчики", [({"name": 'a"b'}, 4)])])
+
+    assert reg.render().splitlines() == [
+        "# HELP calls_total Вызовы",
+        "# TYPE calls_total counter",
+        'calls_total{api="geocode"} 3',
+        "# HELP latency_seconds Задержка",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{api="geocode",le="0.1"} 1',
+        'latency_seconds_bucket{api="geocode",le="1.0"} 2',
+        'latency_seconds_bucket{api="geocode",le="+Inf"} 3',
+        'latency_seconds_sum{api="geocode"} 3.55',
+        'latency_seconds_count{api="geocode"} 3',
+        "# HELP queue_depth Очередь",
+        "# TYPE queue_depth gauge",
+        "queue_depth 7",
+        "# HELP legacy_total Старые счетчики",
+        "# TYPE legacy_total counter",
+        'legacy_total{name="a\\"b"} 4',
+    ]
+
+
+def test_histogram_memory_is_fixed_and_series_are_capped(monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_MAX_SERIES", 2)
+    hist = MetricsRegistry().histogram("h", "h", ("key",), buckets=(1, 2, 4, 8))
+
+    child = hist.labels("a")
+    for i in range(10_000):
+        child.observe(i % 8)
+    for key in ("b", "c", "d"):
+        hist.labels(key).observe(1)
+
+    assert len(child.counts) == 5 and child.count == 10_000
+    assert 2.5 <= child.quantile(0.5) <= 4.5
+    assert [values for values, _ in hist.series()] == [("a",), ("b",), ("other",)]
+    assert hist.labels("zzz").count == 2
+
+
+def test_registry_returns_same_metric_and_rejects_conflicts():
+    reg = MetricsRegistry()
+
+    assert reg.counter("x_total", "x", ("a",)) is reg.counter("x_total", "x", ("a",))
+    with pytest.raises(ValueError):
+        reg.gauge("x_total", "x", ("a",))
+
+
+def test_rolling_window_sums_only_recent_slots():
+    now = [1_000_000.0]
+    window = RollingWindow(("requests", "errors"), slot_s=60, slots=60, clock=lambda: now[0])
+
+    window.add(requests=1, errors=1)
+    now[0] += 10 * 60
+    window.add(requests=2)
+    now[0] += 4 * 60
+    window.add(requests=3)
+
+    assert window.totals(5 * 60) == {"requests": 5, "errors": 0}
+    assert window.totals(15 * 60) == {"requests": 6, "errors": 1}
+    now[0] += 61 * 60
+    assert window.totals(60 * 60) == {"requests": 0, "errors": 0}
+
+
+def test_engine_queries_are_timed_per_statement():
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    instrument_engine(engine)  # повторный вызов не вешает обработчики второй раз
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE events (id INTEGER)"))
+        conn.execute(text("INSERT INTO events (id) VALUES (1)"))
+        conn.execute(text("SELECT id FROM events WHERE id = 1"))
+        with pytest.raises(Exception):
+            conn.execute(text("SELECT * FROM missing_table"))
+
+    series = dict(metrics.DB_QUERY_SECONDS.series())
+    assert series[("insert events",)].count >= 1
+    assert series[("select events",)].count >= 1
+    assert ("select missing_table",) not in series
+
+
+def test_statement_label_uses_operation_and_first_table():
+    assert statement_label("  SELECT a FROM public.events e JOIN users u ON ...") == "select public.events"
+    assert statement_label("UPDATE translation_jobs SET status = 'done'") == "update translation_jobs"
+    assert statement_label("SELECT 1") == "select"
+
+
+def test_fastapi_metrics_endpoint_exposes_registry():
+    pytest.importorskip("fastapi")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from web.health import record_kudago_request, router
+
+    app = FastAPI()
+    app.include_router(router)
+    record_kudago_request(success=True, latency_ms=120, events_count=5)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'kudago_requests_total{result="ok"}' in response.text
+    assert "kudago_request_duration_seconds_bucket" in response.text
+    assert TestClient(app).get("/health/kudago").json()["events_received_15m"] >= 5
@@ -74,6 +74,24 @@ class TestNullSafeRadius(unittest.TestCase):
 
             self.assertEqual(sql_params["radius_km"], radius)
 
+    def test_bbox_prefilter_before_distance(self):
+        """Тест: рамка по lat/lng отсекает строки до точной дистанции, дистанция участвует в сортировке"""
+        self.service.search_events_today(city="bali", user_lat=-8.673445, user_lng=115.244452, radius_km=10)
+
+        sql_query = self.mock_conn.execute.call_args[0][0].text
+        sql_params = self.mock_conn.execute.call_args[0][1]
+
+        self.assertIn("lat BETWEEN :min_lat AND :max_lat", sql_query)
+        self.assertIn("lng BETWEEN :min_lng AND :max_lng", sql_query)
+        self.assertLess(sql_query.find("lat BETWEEN"), sql_query.find("6371 * acos"))
+        self.assertIn("ORDER BY starts_at, distance_km", sql_query)
+
+        # Рамка содержит точку пользователя и не уже радиуса
+        self.assertLess(sql_params["min_lat"], -8.673445 - 10 / 111.32 + 1e-6)
+        self.assertGreater(sql_params["max_lat"], -8.673445 + 10 / 111.32 - 1e-6)
+        self.assertLess(sql_params["min_lng"], 115.244452)
+        self.assertGreater(sql_params["max_lng"], 115.244452)
+
     def test_no_coordinates_search(self):
         """Тест: поиск без координат не использует Haversine"""
         # Вызываем поиск без координат
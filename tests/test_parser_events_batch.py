@@ -0,0 +1,144 @@
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from ingest.upsert import upsert_event
+from utils import unified_events_service
+from utils.event_dedupe import events_look_same
+from utils.translation_service import PRIORITY_PARSER
+from utils.unified_events_service import UnifiedEventsService
+
+STARTS_AT = datetime(2030, 6, 20, 12, 0, tzinfo=UTC)
+
+
+class _ConnectionEngine:
+    """Движок поверх одного соединения: записи сервиса — savepoint'ы внешней транзакции теста."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @contextmanager
+    def connect(self):
+        yield self.conn
+
+    @contextmanager
+    def begin(self):
+        with self.conn.begin_nested():
+            yield self.conn
+
+
+@pytest.fixture()
+def enqueued(monkeypatch):
+    """Задания перевода, поставленные сервисом: [(table, ids, priority)]."""
+    calls = []
+    monkeypatch.setattr(
+        unified_events_service.translation_service,
+        "enqueue",
+        lambda table, ids, priority: calls.append((table, sorted(ids), priority)),
+    )
+    return calls
+
+
+@pytest.fixture()
+def batch_engine(api_engine, enqueued):
+    with api_engine.connect() as conn:
+        trans = conn.begin()
+        # Как в проде: уникальный индекс (migrations/add_baliforum_unique_index.sql), организатор необязателен
+        conn.execute(text("CREATE UNIQUE INDEX tmp_ux_events_source_ext ON events (source, external_id)"))
+        conn.execute(text("ALTER TABLE events ALTER COLUMN organizer_id DROP NOT NULL"))
+        try:
+            yield _ConnectionEngine(conn)
+        finally:
+            trans.rollback()
+
+
+def _event(external_id: str, title: str, **fields) -> dict:
+    return {
+        "source": "baliforum",
+        "external_id": external_id,
+        "title": title,
+        "description": "desc",
+        "starts_at_utc": STARTS_AT,
+        "city": "bali",
+        "lat": -8.65,
+        "lng": 115.14,
+        **fields,
+    }
+
+
+def test_batch_inserts_updates_and_skips_duplicates(batch_engine, enqueued):
+    service = UnifiedEventsService(batch_engine)
+    [first_id] = service.save_parser_events_batch([_event("a1", "Jazz night Canggu")])
+
+    ids = service.save_parser_events_batch(
+        [
+            _event("a1", "Jazz night Canggu", description="updated"),
+            _event("b1", "Sunset yoga Uluwatu", starts_at_utc=STARTS_AT + timedelta(hours=5)),
+            # Тот же концерт из другого источника — дубликат первого события
+            _event("k9", "Jazz night Canggu", source="kudago"),
+            # Повтор b1 в пакете под другим external_id — сворачивается в b1
+            _event("b2", "Sunset yoga Uluwatu", starts_at_utc=STARTS_AT + timedelta(hours=5, minutes=10)),
+        ]
+    )
+
+    assert ids[0] == first_id
+    assert ids[2] == first_id
+    assert ids[1] is not None and ids[3] == ids[1]
+    rows = batch_engine.conn.execute(
+        text("SELECT external_id, description, title_en FROM events WHERE id IN (:a, :b) ORDER BY external_id"),
+        {"a": first_id, "b": ids[1]},
+    ).fetchall()
+    assert [tuple(r) for r in rows] == [("a1", "updated", None), ("b1", "desc", None)]
+    # Перевод не делается inline: записанные события без EN уходят в очередь одним заданием на пакет
+    assert enqueued[-1] == ("events", sorted([first_id, ids[1]]), PRIORITY_PARSER)
+    assert (
+        batch_engine.conn.execute(text("SELECT count(*) FROM events WHERE external_id IN ('k9', 'b2')")).scalar() == 0
+    )
+
+
+def test_batch_keeps_existing_translation(batch_engine, enqueued):
+    service = UnifiedEventsService(batch_engine)
+    service.save_parser_events_batch([_event("a1", "Jazz night", title_en="EN", description_en="Desc EN")])
+    [event_id] = service.save_parser_events_batch([_event("a1", "Jazz night")])
+
+    row = batch_engine.conn.execute(
+        text("SELECT title_en, description_en FROM events WHERE id = :id"), {"id": event_id}
+    ).fetchone()
+    assert tuple(row) == ("EN", "Desc EN")
+    assert enqueued == [("events", [], PRIORITY_PARSER), ("events", [], PRIORITY_PARSER)]
+
+
+def test_ingest_upsert_does_not_wipe_filled_fields(batch_engine):
+    row = {
+        "source": "ics.id",
+        "external_id": "ics-1",
+        "title": "Open mic",
+        "description": "Stand-up",
+        "starts_at": STARTS_AT,
+        "lat": -8.65,
+        "lng": 115.14,
+        "venue_address": "Jl. Pantai 1",
+        "referral_code": "PARTNER",
+    }
+    first_id = upsert_event(batch_engine, row)
+
+    second_id = upsert_event(batch_engine, {**row, "description": None, "referral_code": None})
+
+    assert second_id == first_id
+    stored = batch_engine.conn.execute(
+        text("SELECT description, location_name, referral_code, referral_param, status FROM events WHERE id = :id"),
+        {"id": first_id},
+    ).fetchone()
+    assert tuple(stored) == ("Stand-up", "Jl. Pantai 1", "PARTNER", "ref", "active")
+
+
+@pytest.mark.no_db
+def test_events_look_same_within_batch():
+    left = {"title": "Sunset yoga Uluwatu", "starts_at": STARTS_AT, "city": "bali", "lat": -8.8, "lng": 115.1}
+
+    assert events_look_same(left, {**left, "starts_at": STARTS_AT + timedelta(minutes=40)})
+    assert not events_look_same(left, {**left, "starts_at": STARTS_AT + timedelta(hours=2)})
+    assert not events_look_same(left, {**left, "lat": -8.5})
+    assert not events_look_same(left, {**left, "title": "Jazz night"})
@@ -0,0 +1,86 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+
+from utils.user_participation_analytics import ParticipationAnalyticsWriter, _merge_batch
+
+pytestmark = pytest.mark.no_db
+
+
+class _RecordingEngine:
+    """Engine-заглушка: запоминает параметры каждого execute внутри begin()."""
+
+    def __init__(self):
+        self.calls = []
+
+    @contextmanager
+    def begin(self):
+        yield self
+
+    def execute(self, query, params):
+        self.calls.append(params)
+
+
+def test_merge_batch_collapses_same_user_event():
+    params = _merge_batch(
+        [
+            (1, 10, -100, "list_view"),
+            (1, 10, None, "click_route"),
+            (1, 10, -200, "list_view"),
+            (2, 10, None, "click_source"),
+        ]
+    )
+
+    assert params["user_ids"] == [1, 2]
+    assert params["event_ids"] == [10, 10]
+    # group_chat_id берется из первого показа
+    assert params["group_chat_ids"] == [-100, None]
+    assert params["list_views"] == [True, False]
+    assert params["click_sources"] == [False, True]
+    assert params["click_routes"] == [True, False]
+
+
+def test_writer_flushes_on_batch_size():
+    async def scenario():
+        engine = _RecordingEngine()
+        writer = ParticipationAnalyticsWriter(engine, batch_size=3, flush_interval_s=60)
+        writer.start()
+        for event_id in (1, 2, 3):
+            writer.record_list_view(user_id=7, event_id=event_id)
+        for _ in range(50):
+            if engine.calls:
+                break
+            await asyncio.sleep(0.01)
+        await writer.close()
+        return engine, writer
+
+    engine, writer = asyncio.run(scenario())
+
+    assert engine.calls[0]["event_ids"] == [1, 2, 3]
+    assert writer.written == 3
+
+
+def test_writer_close_flushes_pending_events():
+    async def scenario():
+        engine = _RecordingEngine()
+        writer = ParticipationAnalyticsWriter(engine, batch_size=100, flush_interval_s=60)
+        writer.start()
+        writer.record_click_source(user_id=7, event_id=1)
+        writer.record_click_route(user_id=7, event_id=1)
+        await writer.close()
+        return engine
+
+    engine = asyncio.run(scenario())
+
+    assert len(engine.calls) == 1
+    assert engine.calls[0]["click_sources"] == [True]
+    assert engine.calls[0]["click_routes"] == [True]
+
+
+def test_writer_drops_when_queue_full():
+    writer = ParticipationAnalyticsWriter(_RecordingEngine(), max_queue=1)
+    writer.record_list_view(user_id=1, event_id=1)
+    writer.record_list_view(user_id=1, event_id=2)
+
+    assert writer.dropped == 1
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import GetMe, SendMessage
+
+from utils.metrics import registry
+from utils.send_scheduler import SendRateMiddleware, SendScheduler, TokenBucket, send_priority
+
+pytestmark = pytest.mark.no_db
+
+
+def test_chat_limits_for_private_chats_and_groups():
+    now = [0.0]
+    scheduler = SendScheduler(chat_rate=1, chat_burst=2, group_per_min=20, group_burst=3, clock=lambda: now[0])
+
+    assert [scheduler._reserve_chat(42) for _ in range(3)] == [0.0, 0.0, 1.0]
+    assert [scheduler._reserve_chat(-100) for _ in range(4)] == [0.0, 0.0, 0.0, pytest.approx(3.0)]
+
+    now[0] = 10  # лимит одного чата не задевает другие и восстанавливается со временем
+    assert scheduler._reserve_chat(42) == 0.0 and scheduler._reserve_chat(-100) == 0.0
+
+
+def test_retry_after_pauses_the_chat():
+    now = [0.0]
+    bucket = TokenBucket(rate=1, capacity=3, clock=lambda: now[0])
+
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5.0)
+    now[0] = 20
+    assert bucket.reserve() == 0.0
+
+
+def test_interactive_replies_overtake_queued_bulk():
+    scheduler = SendScheduler(global_rate=100, global_burst=1, chat_burst=100, group_burst=100)
+    middleware = SendRateMiddleware(scheduler)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append(method.chat_id)
+        return True
+
+    async def bulk():
+        with send_priority("bulk"):
+            await asyncio.gather(
+                *(middleware(make_request, None, SendMessage(chat_id=-i, text="reminder")) for i in range(1, 11))
+            )
+
+    async def scenario():
+        reminders = asyncio.create_task(bulk())
+        await asyncio.sleep(0.015)  # рассылка уже упирается в общий лимит
+        await middleware(make_request, None, SendMessage(chat_id=42, text="reply"))
+        reply_position = len(sent)
+        await reminders
+        return reply_position
+
+    reply_position = asyncio.run(scenario())
+
+    assert len(sent) == 11
+    assert reply_position < 6  # ответ не ждал, пока уйдут все 10 напоминаний
+    assert 'telegram_send_total{priority="bulk",result="ok"}' in registry.render()
+
+
+def test_retry_after_is_retried_and_other_methods_pass_through():
+    scheduler = SendScheduler()
+    middleware = SendRateMiddleware(scheduler)
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(type(method).__name__)
+        if isinstance(method, SendMessage) and calls.count("SendMessage") == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0)
+        return "ok"
+
+    async def scenario():
+        return (
+            await middleware(make_request, None, SendMessage(chat_id=7, text="hi")),
+            await middleware(make_request, None, GetMe()),
+        )
+
+    assert asyncio.run(scenario()) == ("ok", "ok")
+    assert calls == ["SendMessage", "SendMessage", "GetMe"]
+    assert scheduler.waiting() == {"interactive": 0, "notify": 0, "bulk": 0}
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with send_priority("urgent"):
+            pass
@@ -0,0 +1,153 @@
+import asyncio
+from datetime import UTC, date, datetime
+
+import pytest
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from utils.state_store import (
+    MemoryStateBackend,
+    SQLiteStateBackend,
+    StateStoreFSMStorage,
+    UserStateStore,
+    pack_state,
+    unpack_state,
+)
+
+pytestmark = pytest.mark.no_db
+
+
+class _Form(StatesGroup):
+    title = State()
+
+
+def _prepared(n: int) -> list[dict]:
+    starts_at = datetime(2026, 6, 20, 11, 0, tzinfo=UTC)
+    return [{"id": i, "title": f"Событие {i}", "starts_at": starts_at, "lat": -8.65, "lng": 115.14} for i in range(n)]
+
+
+def test_pack_roundtrip_keeps_datetimes_and_compresses_large_values():
+    state = {"prepared": _prepared(50), "day": date(2026, 6, 20), "radius": 5}
+
+    packed = pack_state(state)
+
+    assert unpack_state(packed) == state
+    assert packed[:1] == b"z"
+    assert len(packed) < len(pack_state({"x": "y"}) * 50)
+    assert unpack_state(pack_state({"page": 1})) == {"page": 1}
+    # Postgres (compress=False): JSON как есть, jsonb сжимает сам
+    assert pack_state(state, compress=False)[:1] == b"j"
+    assert unpack_state(pack_state(state, compress=False)) == state
+
+
+@pytest.mark.parametrize("backend_factory", [MemoryStateBackend, lambda: SQLiteStateBackend(":memory:")])
+def test_user_state_store_set_get_update(backend_factory):
+    store = UserStateStore(backend_factory(), ttl_s=60)
+
+    async def scenario():
+        assert await store.get(1) is None
+        assert await store.update(1, map_message_id=10) is False
+        assert await store.get(1) is None
+
+        await store.set(1, {"prepared": _prepared(3), "page": 1})
+        state = await store.get(1)
+        state["page"] = 2  # копия: без set() не сохраняется
+        assert (await store.get(1))["page"] == 1
+
+        assert await store.update(1, list_message_id=20) is True
+        assert await store.update(2, create=True, map_message_id=30) is True
+        assert (await store.get(1))["list_message_id"] == 20
+        assert (await store.get(1))["prepared"][0]["starts_at"] == datetime(2026, 6, 20, 11, 0, tzinfo=UTC)
+        assert await store.get(2) == {"map_message_id": 30}
+        await store.delete(2)
+        assert await store.get(2) is None
+
+    asyncio.run(scenario())
+    assert len(store) == 1
+
+
+@pytest.mark.parametrize("backend_factory", [MemoryStateBackend, lambda: SQLiteStateBackend(":memory:")])
+def test_concurrent_updates_keep_each_others_fields(backend_factory):
+    store = UserStateStore(backend_factory(), ttl_s=60)
+
+    async def scenario():
+        await store.set(1, {"prepared": _prepared(20), "page": 1})
+        # Карта и список отправлены одновременно: оба message_id должны сохраниться
+        await asyncio.gather(*(store.update(1, **{f"message_{i}": i}) for i in range(20)))
+        return await store.get(1)
+
+    state = asyncio.run(scenario())
+
+    assert {f"message_{i}": i for i in range(20)}.items() <= state.items()
+    assert state["page"] == 1 and len(state["prepared"]) == 20
+
+
+@pytest.mark.parametrize("backend_factory", [MemoryStateBackend, lambda: SQLiteStateBackend(":memory:")])
+def test_expired_state_is_hidden_and_purged(backend_factory):
+    backend = backend_factory()
+    store = UserStateStore(backend, ttl_s=-1)
+
+    async def scenario():
+        await store.set(1, {"page": 1})
+        await store.set(2, {"page": 1})
+        assert await store.get(1) is None
+        assert await store.update(1, page=2) is False
+        assert backend.purge_expired() >= 1
+        assert await store.get(2) is None
+
+    asyncio.run(scenario())
+    assert len(store) == 0
+
+
+def test_memory_backend_evicts_oldest_written():
+    store = UserStateStore(MemoryStateBackend(max_entries=2), ttl_s=60)
+
+    async def scenario():
+        await store.set(1, {})
+        await store.set(2, {})
+        await store.update(1, page=2)
+        await store.set(3, {})
+        return await store.get(2), await store.get(1)
+
+    assert asyncio.run(scenario()) == (None, {"page": 2})
+
+
+def test_memory_fsm_survives_heavy_user_state_traffic():
+    backend = MemoryStateBackend(max_entries=50)
+    store = UserStateStore(backend, ttl_s=60)
+    storage = StateStoreFSMStorage(backend)
+    key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+    async def scenario():
+        await storage.set_state(key, _Form.title)
+        await storage.update_data(key, {"title": "Йога"})
+        for chat_id in range(1, 1001):  # поиск у тысячи пользователей, пока форма не заполнена
+            await store.set(chat_id, {"prepared": _prepared(1), "page": 1})
+        return await storage.get_state(key), await storage.get_data(key)
+
+    assert asyncio.run(scenario()) == ("_Form:title", {"title": "Йога"})
+    assert len(store) == 50
+
+
+def test_fsm_storage_state_and_data():
+    storage = StateStoreFSMStorage(SQLiteStateBackend(":memory:"))
+    key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+    other = StorageKey(bot_id=1, chat_id=-100, user_id=10)
+
+    async def scenario():
+        await storage.set_state(key, _Form.title)
+        await storage.update_data(key, {"title": "Йога"})
+        await storage.update_data(key, {"city": "bali"})
+        result = (await storage.get_state(key), await storage.get_data(key), await storage.get_state(other))
+        await storage.set_state(key, None)
+        await storage.set_data(key, {})
+        cleared = (await storage.get_state(key), await storage.get_data(key))
+        await storage.close()
+        return result, cleared
+
+    (state, data, other_state), cleared = asyncio.run(scenario())
+
+    assert state == "_Form:title"
+    assert data == {"title": "Йога", "city": "bali"}
+    assert other_state is None
+    assert cleared == (None, {})
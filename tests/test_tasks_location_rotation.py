@@ -0,0 +1,97 @@
+from datetime import UTC, datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+import tasks_location_service
+from database import DailyViewTasks, TaskPlace, User
+from tasks_location_service import (
+    NEVER_SHOWN_DAYS,
+    find_nearest_available_place,
+    find_oldest_unshown_place_in_region,
+    get_all_places_for_category,
+)
+from utils.geo_utils import haversine_km
+
+USER_ID = 990_007
+USER = (-8.65, 115.14)
+CATEGORY = "rotation_test"
+
+
+@pytest.fixture
+def seeded(api_engine, monkeypatch):
+    """Места и показы в транзакции, которая откатывается после теста."""
+    conn = api_engine.connect()
+    trans = conn.begin()
+    monkeypatch.setattr(
+        tasks_location_service,
+        "get_session",
+        lambda: Session(bind=conn, join_transaction_mode="create_savepoint"),
+    )
+
+    now = datetime.now(UTC)
+    places = {
+        # name: (lat, lng, is_active, показы N дней назад)
+        "recent_near": (-8.651, 115.14, True, [20, 1]),  # последний показ вчера — низкий приоритет
+        "stale_far": (-8.70, 115.14, True, [10]),  # >7 дней — высокий приоритет
+        "never_mid": (-8.67, 115.14, True, []),  # не показывалось — высокий приоритет
+        "medium_near": (-8.655, 115.14, True, [4]),  # 3-7 дней — средний приоритет
+        "inactive": (-8.65, 115.14, False, []),
+    }
+    ids = {}
+    with Session(bind=conn, join_transaction_mode="create_savepoint") as session:
+        session.add(User(id=USER_ID, username="rotation_test"))
+        session.flush()
+        for name, (lat, lng, is_active, shown_days_ago) in places.items():
+            place = TaskPlace(
+                category=CATEGORY,
+                name=name,
+                lat=lat,
+                lng=lng,
+                is_active=is_active,
+                region="bali",
+                place_type="park",
+                task_type="urban",
+            )
+            session.add(place)
+            session.flush()
+            ids[name] = place.id
+            for days in shown_days_ago:
+                session.add(
+                    DailyViewTasks(
+                        user_id=USER_ID,
+                        view_type="place",
+                        view_key=str(place.id),
+                        view_date=now - timedelta(days=days, minutes=1),
+                    )
+                )
+        session.commit()
+    yield ids
+
+    trans.rollback()
+    conn.close()
+
+
+def test_all_places_ordered_by_priority_then_distance(seeded):
+    places = get_all_places_for_category(CATEGORY, USER_ID, *USER)
+
+    assert [p.name for p in places] == ["never_mid", "stale_far", "medium_near", "recent_near"]
+    assert [p.days_since_shown for p in places] == [NEVER_SHOWN_DAYS, 10, 4, 1]
+    for place in places:
+        assert place.distance_km == pytest.approx(haversine_km(*USER, place.lat, place.lng))
+
+
+def test_all_places_respects_limit(seeded):
+    assert [p.name for p in get_all_places_for_category(CATEGORY, USER_ID, *USER, limit=2)] == [
+        "never_mid",
+        "stale_far",
+    ]
+
+
+def test_nearest_and_oldest_pick_single_place(seeded):
+    nearest = find_nearest_available_place(CATEGORY, "park", *USER, user_id=USER_ID)
+    oldest = find_oldest_unshown_place_in_region(CATEGORY, "park", "bali", USER_ID)
+
+    assert nearest.id == seeded["never_mid"]
+    assert oldest.id == seeded["never_mid"]
+    assert oldest.distance_km is None
@@ -0,0 +1,118 @@
+import asyncio
+from datetime import UTC, datetime
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Chat, Message, Update, User
+from sqlalchemy import create_engine, text
+
+from utils import tracing
+from utils.metrics import instrument_engine, registry
+from utils.tracing import (
+    HandlerTracingMiddleware,
+    SlowUpdates,
+    TracingMiddleware,
+    format_trace,
+    span,
+    traced_middleware,
+)
+
+pytestmark = pytest.mark.no_db
+
+
+def _update(update_id: int, text_: str) -> Update:
+    return Update(
+        update_id=update_id,
+        message=Message(
+            message_id=update_id,
+            date=datetime.now(UTC),
+            chat=Chat(id=1, type="private"),
+            from_user=User(id=1, is_bot=False, first_name="Ann"),
+            text=text_,
+        ),
+    )
+
+
+@pytest.fixture()
+def slow(monkeypatch):
+    updates = SlowUpdates(size=2, window_s=3600)
+    monkeypatch.setattr(tracing, "slow_updates", updates)
+    return updates
+
+
+def test_update_trace_has_middleware_handler_and_sql_spans(slow):
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    async def gate(handler, event, data):
+        return await handler(event, data)
+
+    router = Router()
+
+    @router.message(Command("slow"))
+    async def on_slow(message: Message):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+        with span("render"):
+            await asyncio.sleep(0.02)
+
+    @router.message(Command("fast"))
+    async def on_fast(message: Message):
+        pass
+
+    dp = Dispatcher()
+    dp.update.outer_middleware(TracingMiddleware())
+    dp.update.middleware(traced_middleware(gate, "gate"))
+    dp.message.middleware(HandlerTracingMiddleware())
+    dp.include_router(router)  # хендлеры во вложенном роутере, как в боте
+
+    async def scenario():
+        bot = Bot("42:TEST")
+        for update_id, command in ((1, "/fast"), (2, "/slow"), (3, "/fast"), (4, "/fast")):
+            await dp.feed_update(bot, _update(update_id, command))
+        await bot.session.close()
+
+    asyncio.run(scenario())
+
+    top = slow.top()
+    assert [t.update_id for t in top][0] == 2 and len(top) == 2
+    trace = top[0]
+    assert trace.handler == "on_slow" and trace.sql_count == 2
+
+    gate_span = trace.root.children[0]
+    assert gate_span.name == "middleware:gate"
+    handler_span = gate_span.children[0]
+    assert handler_span.name == "handler:on_slow"
+    assert [c.name for c in handler_span.children] == ["sql select", "sql select", "render"]
+    assert handler_span.duration >= 0.02
+
+    rendered = format_trace(trace)
+    assert "→ on_slow | sql=2" in rendered
+    assert "  middleware:gate" in rendered and "    handler:on_slow" in rendered
+
+    exposition = registry.render()
+    assert 'bot_slow_update_seconds{rank="1",kind="message",handler="on_slow"}' in exposition
+    assert 'bot_handler_duration_seconds_count{handler="on_slow"}' in exposition
+
+
+def test_span_outside_update_is_noop():
+    with span("background") as node:
+        assert node is None
+    tracing.record_call("sql", "select events", 0.01)  # без трассы ничего не пишет
+
+
+def test_slow_updates_forget_traces_outside_window():
+    now = [1000.0]
+    updates = SlowUpdates(size=3, window_s=60, clock=lambda: now[0])
+
+    for update_id, duration in ((1, 0.5), (2, 0.1)):
+        trace = tracing.Trace(update_id, "message")
+        trace.started_at = now[0]
+        trace.root.duration = duration
+        updates.add(trace)
+
+    assert [t.update_id for t in updates.top()] == [1, 2]
+    now[0] += 61
+    assert updates.top() == []
@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from utils import translation_service as ts
+from utils.translation_service import TranslationService, estimate_tokens, pack_batches, text_hash
+
+pytestmark = pytest.mark.no_db
+
+
+class _MemoryConnection:
+    """Соединение, которое понимает только запросы к translation_memory."""
+
+    def __init__(self, store: dict):
+        self.store = store
+
+    def execute(self, sql, params):
+        lang = params["target_lang"]
+        if sql is ts._MEMORY_GET_SQL:
+            return [
+                SimpleNamespace(source_hash=h, translated_text=self.store[(lang, h)])
+                for h in params["hashes"]
+                if (lang, h) in self.store
+            ]
+        assert sql is ts._MEMORY_SET_SQL
+        for h, translated in zip(params["hashes"], params["translations"]):
+            self.store[(lang, h)] = translated
+
+
+class _MemoryEngine:
+    def __init__(self):
+        self.store = {}
+
+    @contextmanager
+    def begin(self):
+        yield _MemoryConnection(self.store)
+
+
+def _service(translator):
+    engine = _MemoryEngine()
+    return TranslationService(engine_getter=lambda: engine, translator=translator)
+
+
+def test_pack_batches_respects_token_budget_and_order():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400]
+    budget = estimate_tokens("a" * 40) * 2
+
+    batches = pack_batches(texts, token_budget=budget, max_items=10)
+
+    assert batches == [["a" * 40, "b" * 40], ["c" * 40], ["d" * 400]]
+    assert pack_batches(["x"] * 5, token_budget=10_000, max_items=2) == [["x", "x"], ["x", "x"], ["x"]]
+
+
+def test_text_hash_ignores_surrounding_whitespace():
+    assert text_hash("  Джаз на пляже \n") == text_hash("Джаз на пляже")
+    assert text_hash("Джаз на пляже") != text_hash("Джаз  на пляже")
+
+
+def test_repeated_texts_are_translated_once():
+    calls = []
+
+    def translator(batch, lang):
+        calls.append(list(batch))
+        return [f"EN:{source}" for source in batch]
+
+    service = _service(translator)
+
+    first, failed = service.translate_texts(["Йога", "Джаз", "Йога ", ""], "en")
+    second, _ = service.translate_texts(["Джаз", "Йога"], "en")
+
+    assert not failed
+    assert first == {"Йога": "EN:Йога", "Джаз": "EN:Джаз"}
+    assert second == first
+    assert calls == [["Йога", "Джаз"]]
+    stats = service.stats()
+    assert stats["texts_requested"] == 4
+    assert stats["memory_hits"] == 2
+    assert stats["memory_hit_rate"] == 0.5
+
+
+def test_batch_with_broken_answer_is_split_in_halves():
+    def translator(batch, lang):
+        if len(batch) > 1:
+            return [None] * len(batch)  # модель вернула массив не той длины
+        return [f"EN:{batch[0]}"]
+
+    service = _service(translator)
+
+    translated, failed = service.translate_texts(["a", "b", "c"], "en")
+
+    assert not failed
+    assert translated == {"a": "EN:a", "b": "EN:b", "c": "EN:c"}
+
+
+def test_api_failure_stops_and_keeps_nothing():
+    service = _service(lambda batch, lang: None)
+
+    translated, failed = service.translate_texts(["Йога"], "en")
+
+    assert failed
+    assert translated == {}
+
+
+def test_plan_by_language_and_source():
+    service = _service(lambda batch, lang: [])
+
+    def row(**fields):
+        base = {"id": 1, "title_en": None, "description_en": None, "event_source": "parser", "description": None}
+        return SimpleNamespace(**{**base, **fields})
+
+    ru = service._plan(row(title="Джаз на пляже", description="Живая музыка"))
+    assert ru["need"] == {"title_en": ("en", "Джаз на пляже"), "description_en": ("en", "Живая музыка")}
+
+    en_user = service._plan(row(title="Beach jazz", description="Live music", event_source="user"))
+    assert en_user["copy"] == {"title_en": "Beach jazz", "description_en": "Live music"}
+    assert en_user["need"] == {}
+    assert en_user["optional"] == {"title": ("ru", "Beach jazz"), "description": ("ru", "Live music")}
+
+    done = service._plan(row(title="Джаз", title_en="Jazz"))
+    assert done["need"] == {} and done["copy"] == {}
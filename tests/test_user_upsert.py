@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from utils.user_upsert import UserUpsertBatcher
+
+pytestmark = pytest.mark.no_db
+
+
+@pytest.fixture()
+def engine():
+    # Одна in-memory база на все потоки: flush() пишет через asyncio.to_thread
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.tables["users"].create(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    engine.statements = statements
+    return engine
+
+
+def _users(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT id, username, full_name, default_radius_km FROM users ORDER BY id")).fetchall()
+
+
+def test_burst_of_updates_becomes_one_statement(engine):
+    upserter = UserUpsertBatcher(engine, flush_interval_s=0.01)
+
+    async def scenario():
+        upserter.start()
+        for _ in range(50):  # активный групповой чат: одни и те же люди пишут подряд
+            for user_id in (1, 2, 3):
+                upserter.observe(user_id, f"user{user_id}", f"@user{user_id}")
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        await upserter.close()
+
+    asyncio.run(scenario())
+
+    assert _users(engine) == [(1, "user1", "@user1", 5), (2, "user2", "@user2", 5), (3, "user3", "@user3", 5)]
+    inserts = [s for s in engine.statements if s.startswith("INSERT INTO users")]
+    assert len(inserts) == 1
+    assert upserter.written == 3
+
+
+def test_seen_users_are_skipped_until_they_change_or_expire(engine):
+    now = [0.0]
+    upserter = UserUpsertBatcher(engine, seen_ttl_s=60, clock=lambda: now[0])
+
+    assert upserter.observe(1, "ann", "@ann")
+    asyncio.run(upserter.flush())
+    assert not upserter.observe(1, "ann", "@ann")
+
+    assert upserter.observe(1, "ann_new", "@ann_new")
+    asyncio.run(upserter.flush())
+    assert _users(engine) == [(1, "ann_new", "@ann_new", 5)]
+
+    now[0] += 61
+    assert upserter.observe(1, "ann_new", "@ann_new")
+
+
+def test_upsert_keeps_user_choices(engine):
+    with engine.begin() as conn:
+        conn.execute(
+            Base.metadata.tables["users"].insert(),
+            {"id": 1, "username": "a", "full_name": "@a", "default_radius_km": 15, "language_code": "en"},
+        )
+    upserter = UserUpsertBatcher(engine)
+
+    upserter.observe(1, "b", "@b")
+    asyncio.run(upserter.flush())
+
+    with engine.connect() as conn:
+        row = conn.execute(text("SELECT username, default_radius_km, language_code FROM users")).one()
+    assert tuple(row) == ("b", 15, "en")
+
+
+def test_failed_batch_is_retried(engine, monkeypatch):
+    upserter = UserUpsertBatcher(engine)
+    upserter.observe(1, "ann", "@ann")
+
+    original = upserter._execute
+    monkeypatch.setattr(upserter, "_execute", lambda batch: (_ for _ in ()).throw(RuntimeError("db down")))
+    assert asyncio.run(upserter.flush()) == 0 and upserter.failed == 1
+
+    monkeypatch.setattr(upserter, "_execute", original)
+    assert asyncio.run(upserter.flush()) == 1
+    assert _users(engine) == [(1, "ann", "@ann", 5)]
@@ -0,0 +1,334 @@
+"""
+Автоудаление служебных сообщений бота в группах одной фоновой задачей.
+
+Вместо спящей задачи на каждое сообщение — куча (chat_id, message_id) по сроку удаления.
+Задача просыпается не чаще раза в AUTO_DELETE_TICK_S, забирает до AUTO_DELETE_BATCH
+наступивших сроков и обрабатывает их по чатам:
+  - одним запросом отсеивает сообщения, уже помеченные в bot_messages как удаленные
+    («Спрятать бота» и т.п.);
+  - статус бота в чате берется из кэша (AUTO_DELETE_PERMS_TTL_S): из чата, где бота нет,
+    ничего не удаляем, а только помечаем строки;
+  - удаляет пачкой deleteMessages (до 100 сообщений за вызов), при ошибке пачки — по одному;
+  - помечает удаленные строки одним UPDATE.
+
+Источник истины — bot_messages: при старте и раз в AUTO_DELETE_SWEEP_S сверка подбирает
+неудаленные сообщения с тегами AUTO_DELETE_TAGS (после перезапуска, после временных ошибок
+и сверх лимита AUTO_DELETE_MAX_PENDING, до которого куча хранит сроки в памяти). Сообщения
+сверх лимита досверка подбирает, когда в очереди освободилось место, но не чаще раза
+в AUTO_DELETE_OVERFLOW_SWEEP_TICKS тиков.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import UTC, datetime, timedelta
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import bindparam, text
+
+from utils.cache import TTLCache
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+AUTO_DELETE_DELAY_S = float(os.getenv("AUTO_DELETE_DELAY_S", "120"))
+AUTO_DELETE_TICK_S = float(os.getenv("AUTO_DELETE_TICK_S", "1"))
+AUTO_DELETE_BATCH = int(os.getenv("AUTO_DELETE_BATCH", "500"))
+AUTO_DELETE_SWEEP_S = float(os.getenv("AUTO_DELETE_SWEEP_S", "600"))
+AUTO_DELETE_MAX_PENDING = int(os.getenv("AUTO_DELETE_MAX_PENDING", "50000"))
+AUTO_DELETE_OVERFLOW_SWEEP_TICKS = int(os.getenv("AUTO_DELETE_OVERFLOW_SWEEP_TICKS", "30"))
+AUTO_DELETE_PERMS_TTL_S = float(os.getenv("AUTO_DELETE_PERMS_TTL_S", "600"))
+
+# Теги, сообщения с которыми удаляются автоматически ("notification" — новые события — остаются)
+AUTO_DELETE_TAGS = ("service", "panel", "list")
+
+# Бот не может удалять сообщения старше 48 часов — такие строки сверка не трогает
+TELEGRAM_DELETE_MAX_AGE = timedelta(hours=48)
+DELETE_MESSAGES_LIMIT = 100
+
+# Ошибки удаления, после которых повторять бессмысленно — строку помечаем как удаленную
+_FINAL_ERRORS = ("message to delete not found", "message can't be deleted", "not enough rights", "can't delete")
+
+AUTO_DELETE_MESSAGES = registry.counter(
+    "auto_delete_messages_total",
+    "Автоудаление: deleted / gone (уже удалено или бота нет в чате) / skipped / retry / failed",
+    ("result",),
+)
+AUTO_DELETE_PENDING = registry.gauge("auto_delete_pending", "Сообщения в очереди автоудаления")
+
+
+def _default_engine():
+    import database
+
+    return database.engine
+
+
+class AutoDeleteScheduler:
+    """Куча сроков удаления + одна фоновая задача; строки bot_messages помечаются пачками."""
+
+    def __init__(
+        self,
+        delay_s: float = AUTO_DELETE_DELAY_S,
+        tick_s: float = AUTO_DELETE_TICK_S,
+        batch: int = AUTO_DELETE_BATCH,
+        sweep_s: float = AUTO_DELETE_SWEEP_S,
+        max_pending: int = AUTO_DELETE_MAX_PENDING,
+        overflow_sweep_ticks: int = AUTO_DELETE_OVERFLOW_SWEEP_TICKS,
+        perms_ttl_s: float = AUTO_DELETE_PERMS_TTL_S,
+        engine_getter=_default_engine,
+        clock=time.monotonic,
+    ):
+        self.delay_s = delay_s
+        self.tick_s = tick_s
+        self.batch = batch
+        self.sweep_s = sweep_s
+        self.max_pending = max_pending
+        self.overflow_sweep_ticks = overflow_sweep_ticks
+        self._engine_getter = engine_getter
+        self._clock = clock
+        # (due, chat_id, message_id); запись устарела, если _due хранит для ключа другой срок
+        self._heap: list[tuple[float, int, int]] = []
+        self._due: dict[tuple[int, int], float] = {}
+        self._perms = TTLCache("bot_chat_status", maxsize=10000, ttl_s=perms_ttl_s)
+        self._overflow = False
+        self._last_sweep = float("-inf")
+        self._wakeup = asyncio.Event()
+        self._bot = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def schedule(self, chat_id: int, message_id: int, delay_s: float | None = None) -> None:
+        """Удалить сообщение через delay_s (по умолчанию AUTO_DELETE_DELAY_S); повтор переносит срок."""
+        key = (chat_id, message_id)
+        if key not in self._due and len(self._due) >= self.max_pending:
+            self._overflow = True  # строка есть в bot_messages — подберет ближайшая сверка
+            return
+        due = self._clock() + (self.delay_s if delay_s is None else delay_s)
+        self._due[key] = due
+        heapq.heappush(self._heap, (due, chat_id, message_id))
+        if self._heap[0][0] == due:
+            self._wakeup.set()
+
+    def cancel(self, chat_id: int, message_id: int) -> None:
+        self._due.pop((chat_id, message_id), None)
+
+    def forget_chat(self, chat_id: int) -> None:
+        """Бота добавили в чат или удалили из него — статус перечитаем при следующем удалении."""
+        self._perms.pop(chat_id)
+
+    # ---- обработка сроков --------------------------------------------------
+
+    def _pop_due(self, now: float) -> dict[int, list[int]]:
+        by_chat: dict[int, list[int]] = {}
+        taken = 0
+        while self._heap and self._heap[0][0] <= now and taken < self.batch:
+            due, chat_id, message_id = heapq.heappop(self._heap)
+            if self._due.get((chat_id, message_id)) != due:
+                continue  # срок перенесен или отменен
+            del self._due[(chat_id, message_id)]
+            by_chat.setdefault(chat_id, []).append(message_id)
+            taken += 1
+        return by_chat
+
+    async def run_due(self) -> int:
+        """Обработать наступившие сроки (не больше batch); возвращает число удаленных сообщений."""
+        by_chat = self._pop_due(self._clock())
+        if not by_chat:
+            return 0
+        rows = await asyncio.to_thread(self._select_rows, by_chat)
+        done: list[int] = []  # bot_messages.id к пометке deleted
+        deleted = 0
+        for chat_id, message_ids in by_chat.items():
+            chat_rows = rows.get(chat_id, {})
+            live = [mid for mid in message_ids if not chat_rows.get(mid, (None, False))[1]]
+            AUTO_DELETE_MESSAGES.labels("skipped").inc(len(message_ids) - len(live))
+            if not live:
+                continue
+            finished = await self._delete_in_chat(chat_id, live)
+            deleted += sum(1 for result in finished.values() if result == "deleted")
+            done.extend(chat_rows[mid][0] for mid in finished if mid in chat_rows)
+        if done:
+            await asyncio.to_thread(self._mark_deleted, done)
+        return deleted
+
+    async def _bot_status(self, chat_id: int) -> str | None:
+        try:
+            member = await self._bot.get_chat_member(chat_id, self._bot.id)
+        except TelegramForbiddenError:
+            return "kicked"
+        except Exception as e:
+            logger.warning("⚠️ auto_delete: не удалось проверить статус бота в чате %s: %s", chat_id, e)
+            return None  # не кэшируется — попробуем удалить и спросим снова в следующий раз
+        return member.status
+
+    async def _delete_in_chat(self, chat_id: int, message_ids: list[int]) -> dict[int, str]:
+        """Удалить сообщения чата; результат — {message_id: deleted|gone} для строк, которые можно пометить."""
+        status = await self._perms.get_or_load(chat_id, lambda: self._bot_status(chat_id))
+        if status in ("left", "kicked"):
+            AUTO_DELETE_MESSAGES.labels("gone").inc(len(message_ids))
+            return dict.fromkeys(message_ids, "gone")
+        finished: dict[int, str] = {}
+        for start in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+            chunk = message_ids[start : start + DELETE_MESSAGES_LIMIT]
+            try:
+                await self._bot.delete_messages(chat_id=chat_id, message_ids=chunk)
+            except TelegramRetryAfter as e:
+                for message_id in message_ids[start:]:
+                    self.schedule(chat_id, message_id, e.retry_after)
+                AUTO_DELETE_MESSAGES.labels("retry").inc(len(message_ids) - start)
+                break
+            except Exception as e:
+                logger.info("ℹ️ auto_delete: пачка в чате %s не удалена (%s), удаляем по одному", chat_id, e)
+                for message_id in chunk:
+                    result = await self._delete_one(chat_id, message_id)
+                    if result is not None:
+                        finished[message_id] = result
+                continue
+            finished.update(dict.fromkeys(chunk, "deleted"))
+            AUTO_DELETE_MESSAGES.labels("deleted").inc(len(chunk))
+        return finished
+
+    async def _delete_one(self, chat_id: int, message_id: int) -> str | None:
+        try:
+            await self._bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except TelegramRetryAfter as e:
+            self.schedule(chat_id, message_id, e.retry_after)
+            AUTO_DELETE_MESSAGES.labels("retry").inc()
+            return None
+        except TelegramForbiddenError:
+            self._perms.set(chat_id, "kicked")
+            AUTO_DELETE_MESSAGES.labels("gone").inc()
+            return "gone"
+        except Exception as e:
+            if any(marker in str(e).lower() for marker in _FINAL_ERRORS):
+                logger.info("ℹ️ auto_delete: сообщение %s в чате %s не удалить: %s", message_id, chat_id, e)
+                AUTO_DELETE_MESSAGES.labels("gone").inc()
+                return "gone"
+            # Временная ошибка: строка остается неудаленной, ее подберет сверка
+            logger.warning("⚠️ auto_delete: ошибка удаления сообщения %s в чате %s: %s", message_id, chat_id, e)
+            AUTO_DELETE_MESSAGES.labels("failed").inc()
+            return None
+        AUTO_DELETE_MESSAGES.labels("deleted").inc()
+        return "deleted"
+
+    # ---- БД ----------------------------------------------------------------
+
+    def _select_rows(self, by_chat: dict[int, list[int]]) -> dict[int, dict[int, tuple[int, bool]]]:
+        """{chat_id: {message_id: (bot_messages.id, deleted)}} для сообщений пачки."""
+        chat_ids = list(by_chat)
+        message_ids = sorted({mid for mids in by_chat.values() for mid in mids})
+        with self._engine_getter().connect() as conn:
+            result = conn.execute(
+                text(
+                    "SELECT id, chat_id, message_id, deleted FROM bot_messages "
+                    "WHERE chat_id IN :chat_ids AND message_id IN :message_ids"
+                ).bindparams(bindparam("chat_ids", expanding=True), bindparam("message_ids", expanding=True)),
+                {"chat_ids": chat_ids, "message_ids": message_ids},
+            )
+            rows: dict[int, dict[int, tuple[int, bool]]] = {}
+            for row_id, chat_id, message_id, deleted in result:
+                if message_id in by_chat.get(chat_id, ()):
+                    rows.setdefault(chat_id, {})[message_id] = (row_id, bool(deleted))
+            return rows
+
+    def _mark_deleted(self, row_ids: list[int]) -> None:
+        with self._engine_getter().begin() as conn:
+            conn.execute(
+                text("UPDATE bot_messages SET deleted = TRUE WHERE id IN :ids").bindparams(
+                    bindparam("ids", expanding=True)
+                ),
+                {"ids": sorted(row_ids)},
+            )
+
+    def _load_pending(self, limit: int) -> list[tuple[int, int, datetime]]:
+        since = datetime.now(UTC) - TELEGRAM_DELETE_MAX_AGE
+        with self._engine_getter().connect() as conn:
+            return conn.execute(
+                text(
+                    "SELECT chat_id, message_id, created_at FROM bot_messages "
+                    "WHERE deleted = FALSE AND tag IN :tags AND created_at >= :since "
+                    "ORDER BY created_at LIMIT :limit"
+                ).bindparams(bindparam("tags", expanding=True)),
+                {"tags": list(AUTO_DELETE_TAGS), "since": since, "limit": limit},
+            ).fetchall()
+
+    async def sweep(self) -> int:
+        """Поставить в очередь неудаленные сообщения из bot_messages, которых в ней нет."""
+        self._last_sweep = self._clock()
+        if len(self._due) >= self.max_pending:
+            self._overflow = True  # места нет — запрос ничего бы не добавил
+            return 0
+        self._overflow = False
+        # На строку больше лимита: иначе полная выборка не отличалась бы от переполнения
+        rows = await asyncio.to_thread(self._load_pending, self.max_pending + 1)
+        now = datetime.now(UTC)
+        added = 0
+        for chat_id, message_id, created_at in rows:
+            if (chat_id, message_id) in self._due:
+                continue
+            if len(self._due) >= self.max_pending:
+                self._overflow = True
+                break
+            if isinstance(created_at, str):  # sqlite
+                created_at = datetime.fromisoformat(created_at)
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=UTC)
+            elapsed = (now - created_at).total_seconds()
+            self.schedule(chat_id, message_id, max(0.0, self.delay_s - elapsed))
+            added += 1
+        return added
+
+    def _next_overflow_sweep(self) -> float:
+        """Когда досверять сообщения сверх лимита: не раньше overflow_sweep_ticks тиков после прошлой сверки."""
+        return self._last_sweep + self.tick_s * self.overflow_sweep_ticks
+
+    # ---- фоновая задача ----------------------------------------------------
+
+    def start(self, bot) -> None:
+        """Запустить фоновую задачу (вызывать из работающего event loop); первая сверка — сразу."""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        next_sweep = self._clock()
+        while True:
+            try:
+                overflow_due = (
+                    self._overflow
+                    and len(self._due) < self.max_pending
+                    and self._clock() >= self._next_overflow_sweep()
+                )
+                if overflow_due or self._clock() >= next_sweep:
+                    added = await self.sweep()
+                    next_sweep = self._clock() + self.sweep_s
+                    if added:
+                        logger.info("🕐 auto_delete: из bot_messages в очередь поставлено %s сообщений", added)
+                await self.run_due()
+            except Exception as e:
+                logger.error("❌ auto_delete: ошибка обработки очереди: %s", e)
+            AUTO_DELETE_PENDING.set(len(self._due))
+            wake_at = min(self._heap[0][0], next_sweep) if self._heap else next_sweep
+            if self._overflow:
+                wake_at = min(wake_at, self._next_overflow_sweep())
+            # Не чаще раза в тик: сроки, наступившие за тик, уходят одной пачкой
+            timeout = max(self.tick_s, wake_at - self._clock())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except TimeoutError:
+                pass
+            else:
+                await asyncio.sleep(self.tick_s)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+auto_deleter = AutoDeleteScheduler()
@@ -1,16 +1,38 @@
 """
 Сервис для управления банами пользователей
+
+BanService — запись банов в БД. BanCache (синглтон ban_cache) — множество забаненных id в памяти:
+загружается при старте, обновляется ban_user/unban_user, раз в BAN_RECONCILE_INTERVAL_S
+сверяется с users.is_banned, а на PostgreSQL дополнительно слушает LISTEN user_bans —
+так баны из других процессов доходят без ожидания сверки.
 """
 
+import asyncio
 import logging
+import os
+import threading
 from datetime import datetime, timedelta
 
 from sqlalchemy import text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.ext.asyncio import AsyncSession
 
 logger = logging.getLogger(__name__)
 
+BAN_RECONCILE_INTERVAL_S = float(os.getenv("BAN_RECONCILE_INTERVAL_S", "300"))
+BAN_LISTEN_ENABLE = os.getenv("BAN_LISTEN_ENABLE", "1").strip() == "1"
+BAN_NOTIFY_CHANNEL = "user_bans"
+
+
+def _notify_ban_change(conn: Connection, user_id: int, banned: bool) -> None:
+    """NOTIFY внутри транзакции бана: слушатели получат его только после COMMIT."""
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": BAN_NOTIFY_CHANNEL, "payload": f"{'ban' if banned else 'unban'}:{user_id}"},
+    )
+
 
 class BanService:
     """Сервис для работы с банами пользователей"""
@@ -144,7 +166,9 @@ class BanService:
                     text("UPDATE users SET is_banned = TRUE WHERE id = :user_id"),
                     {"user_id": user_id},
                 )
+                _notify_ban_change(conn, user_id, banned=True)
 
+            ban_cache.mark(user_id, banned=True)
             return True
         except Exception as e:
             logger.error(f"❌ Ошибка при бане пользователя {user_id}: {e}")
@@ -178,11 +202,13 @@ class BanService:
                         text("UPDATE users SET is_banned = FALSE WHERE id = :user_id"),
                         {"user_id": user_id},
                     )
+                    _notify_ban_change(conn, user_id, banned=False)
                     logger.info(f"✅ Пользователь {user_id} разбанен")
-                    return True
                 else:
                     logger.warning(f"⚠️ Пользователь {user_id} не найден в списке банов")
                     return False
+            ban_cache.mark(user_id, banned=False)
+            return True
         except Exception as e:
             logger.error(f"❌ Ошибка при разбане пользователя {user_id}: {e}")
             return False
@@ -226,3 +252,126 @@ class BanService:
         except Exception as e:
             logger.error(f"❌ Ошибка при получении списка банов: {e}")
             return []
+
+
+class BanCache:
+    """
+    Забаненные пользователи в памяти: is_banned() — проверка по множеству, без I/O.
+
+    Источник истины — users.is_banned (его же читает BanService.is_banned). reload() перечитывает
+    таблицу целиком; mark() применяет бан/разбан сразу. Отметки, сделанные пока идет reload(),
+    накладываются поверх прочитанного, чтобы свежий бан не затерся старым снимком.
+    """
+
+    def __init__(self, reconcile_interval_s: float = BAN_RECONCILE_INTERVAL_S, listen: bool = BAN_LISTEN_ENABLE):
+        self.engine: Engine | None = None
+        self.reconcile_interval_s = reconcile_interval_s
+        self.listen = listen
+        self.loaded = False
+        self._banned: frozenset[int] = frozenset()
+        self._lock = threading.Lock()
+        self._marks_during_reload: dict[int, bool] | None = None
+        self._task: asyncio.Task | None = None
+        self._listener = None
+        self.reloads = 0
+        self.notifications = 0
+
+    def is_banned(self, user_id: int) -> bool:
+        return user_id in self._banned
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def mark(self, user_id: int, banned: bool) -> None:
+        with self._lock:
+            self._banned = self._banned | {user_id} if banned else self._banned - {user_id}
+            if self._marks_during_reload is not None:
+                self._marks_during_reload[user_id] = banned
+
+    def reload(self, engine: Engine | None = None) -> int:
+        """Полная сверка с БД (синхронно — звать через asyncio.to_thread)."""
+        engine = engine or self.engine
+        with self._lock:
+            self._marks_during_reload = {}
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(text("SELECT id FROM users WHERE is_banned = TRUE")).fetchall()
+        except Exception:
+            with self._lock:
+                self._marks_during_reload = None
+            raise
+        banned = {row[0] for row in rows}
+        with self._lock:
+            for user_id, is_banned in self._marks_during_reload.items():
+                if is_banned:
+                    banned.add(user_id)
+                else:
+                    banned.discard(user_id)
+            self._marks_during_reload = None
+            self._banned = frozenset(banned)
+            self.loaded = True
+            self.reloads += 1
+        return len(banned)
+
+    async def start(self, engine: Engine) -> None:
+        """Первая загрузка, фоновая сверка и (на PostgreSQL) LISTEN; вызывать из event loop."""
+        self.engine = engine
+        try:
+            count = await asyncio.to_thread(self.reload)
+            logger.info(f"🚫 Кэш банов загружен: {count} пользователей")
+        except Exception as e:
+            logger.error(f"❌ Не удалось загрузить кэш банов: {e}")
+        await self._ensure_listener()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval_s)
+            try:
+                before = self._banned
+                await asyncio.to_thread(self.reload)
+                if before != self._banned:
+                    logger.info(f"🔄 Сверка банов: было {len(before)}, стало {len(self._banned)}")
+            except Exception as e:
+                logger.error(f"❌ Ошибка сверки кэша банов: {e}")
+            await self._ensure_listener()
+
+    async def _ensure_listener(self) -> None:
+        if not self.listen or self.engine is None or self.engine.dialect.name != "postgresql":
+            return
+        if self._listener is not None and not self._listener.is_closed():
+            return
+        try:
+            import asyncpg
+
+            dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+            self._listener = await asyncpg.connect(dsn)
+            await self._listener.add_listener(BAN_NOTIFY_CHANNEL, self._on_notify)
+            logger.info(f"✅ LISTEN {BAN_NOTIFY_CHANNEL}: баны из других процессов применяются сразу")
+        except Exception as e:
+            # Без LISTEN кэш все равно сходится за BAN_RECONCILE_INTERVAL_S
+            self._listener = None
+            logger.warning(f"⚠️ LISTEN {BAN_NOTIFY_CHANNEL} недоступен: {e}")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        action, _, user_id = payload.partition(":")
+        try:
+            self.mark(int(user_id), banned=action == "ban")
+            self.notifications += 1
+        except ValueError:
+            logger.warning(f"⚠️ Некорректное уведомление {channel}: {payload!r}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._listener is not None:
+            try:
+                await self._listener.close()
+            except Exception:
+                pass
+            self._listener = None
+
+
+ban_cache = BanCache()
@@ -0,0 +1,260 @@
+"""
+Общий кэш в памяти процесса: LRU + TTL с учетом размера в байтах.
+
+TTLCache — основа кэшей бота (админы групп, обработанные callback'и, память geo_cache и ответов
+KudaGo, MemoryStateBackend). Все операции O(1): при переполнении вытесняется самая давняя запись
+из головы OrderedDict, без сортировки словаря и без выбрасывания произвольных элементов.
+Просроченная запись удаляется при обращении к ней; purge_expired() — для периодической уборки.
+
+get_or_load() — single-flight: одновременные промахи по одному ключу ждут одну загрузку.
+Попадания, промахи, вытеснения, число записей и байты каждого кэша видны в /metrics
+(cache_*{cache="<name>"}; кэши с одинаковым именем суммируются).
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+from utils.metrics import registry
+
+_MISSING = object()
+
+
+def approx_sizeof(value: Any) -> int:
+    """Приблизительный размер значения: сам объект и его элементы первого уровня."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    elif isinstance(value, list | tuple | set | frozenset):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class TTLCache:
+    """
+    LRU с TTL на запись и лимитами по числу записей и байтам.
+
+    ttl_s=None — записи не устаревают (только вытесняются). Потокобезопасен: geo_cache и
+    кэш KudaGo читают его из asyncio.to_thread. get_or_load() вызывается из event loop.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = 1024,
+        ttl_s: float | None = None,
+        max_bytes: int | None = None,
+        sizeof: Callable[[Any], int] = approx_sizeof,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (expires_at | None, value, size)
+        self._data: OrderedDict[Hashable, tuple[float | None, Any, int]] = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.coalesced = 0
+        self.evictions = {"lru": 0, "bytes": 0, "expired": 0}
+        _caches.add(self)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[0] is not None and entry[0] <= self._clock():
+                self._drop(key, "expired")
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Есть ли живая запись (без учета в попаданиях и без изменения порядка LRU)."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[0] is None or entry[0] > self._clock())
+
+    def set(self, key: Hashable, value: Any, ttl_s: float | None = None) -> None:
+        """Записать значение; ttl_s перекрывает TTL кэша (ttl_s <= 0 — запись сразу просрочена)."""
+        size = self._sizeof(value)
+        with self._lock:
+            self._set(key, value, self.ttl_s if ttl_s is None else ttl_s, size)
+
+    def add(self, key: Hashable, value: Any = True, ttl_s: float | None = None) -> bool:
+        """Записать, только если живой записи нет; True — записали (ключ видим впервые)."""
+        size = self._sizeof(value)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > self._clock()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return False
+            self.misses += 1
+            self._set(key, value, self.ttl_s if ttl_s is None else ttl_s, size)
+            return True
+
+    def _set(self, key: Hashable, value: Any, ttl_s: float | None, size: int) -> None:
+        if key in self._data:
+            self._drop(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = (self._clock() + ttl_s if ttl_s is not None else None, value, size)
+        self.bytes += size
+        self._evict()
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def purge_expired(self) -> int:
+        """Удалить все просроченные записи (полный проход — для фоновой уборки, не для горячего пути)."""
+        now = self._clock()
+        with self._lock:
+            expired = [
+                key for key, (expires_at, _, _) in self._data.items() if expires_at is not None and expires_at <= now
+            ]
+            for key in expired:
+                self._drop(key, "expired")
+        return len(expired)
+
+    def _drop(self, key: Hashable, reason: str | None = None) -> None:
+        _, _, size = self._data.pop(key)
+        self.bytes -= size
+        if reason is not None:
+            self.evictions[reason] += 1
+
+    def _evict(self) -> None:
+        while len(self._data) > self.maxsize or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            over_count = len(self._data) > self.maxsize
+            key, (expires_at, _, _) = next(iter(self._data.items()))
+            if expires_at is not None and expires_at <= self._clock():
+                reason = "expired"
+            else:
+                reason = "lru" if over_count else "bytes"
+            self._drop(key, reason)
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_s: float | None = None,
+        cache_none: bool = False,
+        refresh: bool = False,
+    ) -> Any:
+        """
+        Значение из кэша или результат loader(); одновременные промахи по ключу ждут одну загрузку.
+
+        Загрузка идет отдельной задачей: отмена одного из ожидающих ее не прерывает. Ошибку
+        загрузки получают все ожидающие, в кэш она не попадает. None кэшируется только с cache_none.
+        refresh=True — загрузить заново, даже если значение есть (идущую загрузку не дублирует).
+        """
+        if not refresh:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, ttl_s, cache_none))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._load_done(key, done))
+        else:
+            with self._lock:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader, ttl_s: float | None, cache_none: bool) -> Any:
+        value = await loader()
+        with self._lock:
+            self.loads += 1
+        if value is not None or cache_none:
+            self.set(key, value, ttl_s)
+        return value
+
+    def is_loading(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def _load_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # ошибку уже получили ожидающие; если их не осталось — не шумим в лог
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "coalesced": self.coalesced,
+                "evictions": dict(self.evictions),
+            }
+
+
+_caches: "weakref.WeakSet[TTLCache]" = weakref.WeakSet()
+
+
+def _collect_cache_metrics():
+    totals: dict[str, dict] = {}
+    for cache in list(_caches):
+        stats = cache.stats()
+        total = totals.setdefault(cache.name, {"evictions": {}})
+        for field, value in stats.items():
+            if field == "evictions":
+                for reason, count in value.items():
+                    total["evictions"][reason] = total["evictions"].get(reason, 0) + count
+            else:
+                total[field] = total.get(field, 0) + value
+
+    def samples(field):
+        return [({"cache": name}, total[field]) for name, total in sorted(totals.items())]
+
+    requests = [
+        ({"cache": name, "result": result}, total[field])
+        for name, total in sorted(totals.items())
+        for result, field in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))
+    ]
+    evictions = [
+        ({"cache": name, "reason": reason}, count)
+        for name, total in sorted(totals.items())
+        for reason, count in sorted(total["evictions"].items())
+    ]
+    return [
+        ("cache_requests_total", "counter", "Обращения к кэшам в памяти", requests),
+        ("cache_loads_total", "counter", "Загрузки get_or_load (после single-flight)", samples("loads")),
+        ("cache_evictions_total", "counter", "Вытеснения из кэшей: lru, bytes, expired", evictions),
+        ("cache_entries", "gauge", "Записей в кэше", samples("entries")),
+        ("cache_bytes", "gauge", "Приблизительный размер значений в кэше", samples("bytes")),
+    ]
+
+
+registry.register_collector(_collect_cache_metrics)
@@ -0,0 +1,281 @@
+"""
+Реестр админов групповых чатов на весь процесс.
+
+chat_id -> ID админов (creator/administrator, без самого бота) в порядке Telegram. Источники:
+  - апдейты chat_member / my_chat_member (apply_member_update) — применяются сразу;
+  - chat_settings.admin_ids — начальная загрузка при старте (load_from_db);
+  - getChatAdministrators — ленивое обновление: запись старше CHAT_ADMINS_TTL_S (±CHAT_ADMINS_JITTER,
+    чтобы чаты не устаревали одновременно) отдается из памяти и ставится в очередь.
+
+Фоновая задача (start) раз в CHAT_ADMINS_REFRESH_INTERVAL_S берет из очереди до
+CHAT_ADMINS_REFRESH_BATCH чатов, обновляет их не более чем CHAT_ADMINS_REFRESH_CONCURRENCY
+запросами одновременно и пишет изменившиеся admin_ids в chat_settings одной транзакцией.
+
+is_admin() — проверка по памяти. Отрицательный ответ по записи старше CHAT_ADMINS_RECHECK_S
+перепроверяется в Telegram, чтобы только что назначенный админ не ждал истечения TTL.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import text
+
+from utils.cache import TTLCache
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CHAT_ADMINS_TTL_S = float(os.getenv("CHAT_ADMINS_TTL_S", "1800"))
+CHAT_ADMINS_JITTER = float(os.getenv("CHAT_ADMINS_JITTER", "0.2"))
+CHAT_ADMINS_RECHECK_S = float(os.getenv("CHAT_ADMINS_RECHECK_S", "60"))
+CHAT_ADMINS_REFRESH_INTERVAL_S = float(os.getenv("CHAT_ADMINS_REFRESH_INTERVAL_S", "5"))
+CHAT_ADMINS_REFRESH_BATCH = int(os.getenv("CHAT_ADMINS_REFRESH_BATCH", "20"))
+CHAT_ADMINS_REFRESH_CONCURRENCY = int(os.getenv("CHAT_ADMINS_REFRESH_CONCURRENCY", "4"))
+CHAT_ADMINS_MAX_CHATS = int(os.getenv("CHAT_ADMINS_MAX_CHATS", "20000"))
+
+ADMIN_STATUSES = ("creator", "administrator")
+
+CHAT_ADMIN_API_CALLS = registry.counter(
+    "chat_admin_api_calls_total", "Вызовы getChatAdministrators реестра админов", ("reason", "result")
+)
+
+
+def _default_engine():
+    import database
+
+    return database.engine
+
+
+class _Entry:
+    __slots__ = ("admin_ids", "admin_set", "refreshed_at", "stale_at")
+
+    def __init__(self, admin_ids, refreshed_at: float, stale_at: float):
+        self.admin_ids: tuple[int, ...] = tuple(admin_ids)
+        self.admin_set = frozenset(self.admin_ids)
+        self.refreshed_at = refreshed_at
+        self.stale_at = stale_at
+
+
+class ChatAdminRegistry:
+    """Админы чатов в памяти процесса с ленивым пакетным обновлением из Telegram."""
+
+    def __init__(
+        self,
+        ttl_s: float = CHAT_ADMINS_TTL_S,
+        jitter: float = CHAT_ADMINS_JITTER,
+        recheck_s: float = CHAT_ADMINS_RECHECK_S,
+        refresh_interval_s: float = CHAT_ADMINS_REFRESH_INTERVAL_S,
+        refresh_batch: int = CHAT_ADMINS_REFRESH_BATCH,
+        refresh_concurrency: int = CHAT_ADMINS_REFRESH_CONCURRENCY,
+        max_chats: int = CHAT_ADMINS_MAX_CHATS,
+        engine_getter=_default_engine,
+        clock=time.monotonic,
+    ):
+        self.ttl_s = ttl_s
+        self.jitter = jitter
+        self.recheck_s = recheck_s
+        self.refresh_interval_s = refresh_interval_s
+        self.refresh_batch = refresh_batch
+        self.refresh_concurrency = refresh_concurrency
+        self._engine_getter = engine_getter
+        self._clock = clock
+        self._entries = TTLCache("chat_admins", maxsize=max_chats)
+        # Упорядоченное множество чатов на обновление и admin_ids, которые нужно записать в БД
+        self._queue: dict[int, None] = {}
+        self._dirty: dict[int, tuple[int, ...]] = {}
+        self._bot = None
+        self._task: asyncio.Task | None = None
+
+    # ---- чтение ------------------------------------------------------------
+
+    def peek(self, chat_id: int) -> tuple[int, ...] | None:
+        """Админы из памяти без обращений к Telegram; None — чат неизвестен."""
+        entry = self._entries.get(chat_id)
+        return entry.admin_ids if entry is not None else None
+
+    async def get_admin_ids(self, bot, chat_id: int) -> list[int]:
+        entry = await self._entry(bot, chat_id)
+        return list(entry.admin_ids) if entry is not None else []
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        entry = await self._entry(bot, chat_id)
+        if entry is not None and user_id in entry.admin_set:
+            return True
+        if entry is not None and self._clock() - entry.refreshed_at < self.recheck_s:
+            return False
+        entry = await self._fetch(bot, chat_id, "recheck")
+        return entry is not None and user_id in entry.admin_set
+
+    async def _entry(self, bot, chat_id: int) -> _Entry | None:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return await self._fetch(bot, chat_id, "miss")
+        if entry.stale_at <= self._clock():
+            self._schedule(bot, chat_id)
+        return entry
+
+    # ---- обновление --------------------------------------------------------
+
+    def _stale_at(self, now: float) -> float:
+        return now + self.ttl_s * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _schedule(self, bot, chat_id: int) -> None:
+        if self._entries.is_loading(chat_id) or chat_id in self._queue:
+            return
+        if self._task is not None and not self._task.done():
+            self._queue[chat_id] = None
+        else:
+            # Фоновой задачи нет (API, тесты) — обновляем сразу, но не ждем
+            asyncio.ensure_future(self._fetch(bot, chat_id, "refresh"))
+
+    async def _fetch(self, bot, chat_id: int, reason: str) -> _Entry | None:
+        """getChatAdministrators с single-flight по чату (TTLCache.get_or_load); при ошибке — прежняя запись."""
+        return await self._entries.get_or_load(chat_id, lambda: self._load(bot, chat_id, reason), refresh=True)
+
+    async def _load(self, bot, chat_id: int, reason: str) -> _Entry | None:
+        previous = self._entries.get(chat_id)
+        try:
+            administrators = await bot.get_chat_administrators(chat_id)
+        except Exception as e:
+            CHAT_ADMIN_API_CALLS.labels(reason, "error").inc()
+            logger.warning("⚠️ chat_admins: не удалось получить админов чата %s: %s", chat_id, e)
+            if previous is not None:
+                # Не дергаем Telegram снова ни перепроверкой, ни до следующего окна TTL
+                now = self._clock()
+                previous.refreshed_at = now
+                previous.stale_at = self._stale_at(now)
+            return previous
+        CHAT_ADMIN_API_CALLS.labels(reason, "ok").inc()
+        admin_ids = [
+            admin.user.id for admin in administrators if admin.status in ADMIN_STATUSES and admin.user.id != bot.id
+        ]
+        now = self._clock()
+        entry = _Entry(admin_ids, refreshed_at=now, stale_at=self._stale_at(now))
+        if previous is None or previous.admin_set != entry.admin_set:
+            self._dirty[chat_id] = entry.admin_ids
+        return entry
+
+    def apply_member_update(self, update, bot_id: int) -> None:
+        """chat_member / my_chat_member: назначение и снятие админов без запроса в Telegram."""
+        chat_id = update.chat.id
+        member = update.new_chat_member
+        if member.user.id == bot_id:
+            if member.status in ("left", "kicked"):
+                self.forget(chat_id)
+            return
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return  # чат еще не загружен — загрузится целиком при первом обращении
+        is_admin = member.status in ADMIN_STATUSES
+        if is_admin == (member.user.id in entry.admin_set):
+            return
+        if is_admin:
+            admin_ids = (*entry.admin_ids, member.user.id)
+        else:
+            admin_ids = tuple(uid for uid in entry.admin_ids if uid != member.user.id)
+        self._entries.set(chat_id, _Entry(admin_ids, entry.refreshed_at, entry.stale_at))
+        self._dirty[chat_id] = admin_ids
+        logger.info("👮 chat_admins: чат %s, пользователь %s -> %s", chat_id, member.user.id, member.status)
+
+    def forget(self, chat_id: int) -> None:
+        self._entries.pop(chat_id)
+        self._queue.pop(chat_id, None)
+        self._dirty.pop(chat_id, None)
+
+    # ---- БД ----------------------------------------------------------------
+
+    def _load_rows(self) -> list[tuple[int, str]]:
+        with self._engine_getter().connect() as conn:
+            return conn.execute(
+                text(
+                    "SELECT chat_id, admin_ids FROM chat_settings "
+                    "WHERE bot_status = 'active' AND admin_ids IS NOT NULL"
+                )
+            ).fetchall()
+
+    async def load_from_db(self) -> int:
+        """Засеять реестр из chat_settings.admin_ids; записи сразу устаревшие — обновятся при обращении."""
+        rows = await asyncio.to_thread(self._load_rows)
+        loaded = 0
+        for chat_id, raw in rows:
+            try:
+                admin_ids = [int(uid) for uid in json.loads(raw)]
+            except (TypeError, ValueError):
+                continue
+            if self._entries.get(chat_id) is None:
+                self._entries.set(chat_id, _Entry(admin_ids, refreshed_at=float("-inf"), stale_at=float("-inf")))
+                loaded += 1
+        return loaded
+
+    def _write(self, dirty: dict[int, tuple[int, ...]]) -> None:
+        params = [
+            {"chat_id": chat_id, "admin_ids": json.dumps(list(ids)) if ids else None, "admin_count": len(ids)}
+            for chat_id, ids in sorted(dirty.items())
+        ]
+        with self._engine_getter().begin() as conn:
+            conn.execute(
+                text(
+                    "UPDATE chat_settings SET admin_ids = :admin_ids, admin_count = :admin_count "
+                    "WHERE chat_id = :chat_id"
+                ),
+                params,
+            )
+
+    async def persist(self) -> int:
+        """Записать изменившиеся admin_ids в chat_settings одной транзакцией."""
+        if not self._dirty:
+            return 0
+        dirty, self._dirty = self._dirty, {}
+        try:
+            await asyncio.to_thread(self._write, dirty)
+        except Exception as e:
+            logger.warning("⚠️ chat_admins: не удалось сохранить admin_ids (%s чатов): %s", len(dirty), e)
+            for chat_id, ids in dirty.items():
+                self._dirty.setdefault(chat_id, ids)
+            return 0
+        return len(dirty)
+
+    # ---- фоновая задача ----------------------------------------------------
+
+    async def start(self, bot) -> None:
+        """Загрузка из БД и фоновое обновление очереди (вызывать из работающего event loop)."""
+        self._bot = bot
+        try:
+            loaded = await self.load_from_db()
+            logger.info("👮 chat_admins: загружены админы %s чатов из chat_settings", loaded)
+        except Exception as e:
+            logger.warning("⚠️ chat_admins: не удалось загрузить admin_ids из БД: %s", e)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        semaphore = asyncio.Semaphore(self.refresh_concurrency)
+
+        async def refresh(chat_id: int) -> None:
+            async with semaphore:
+                await self._fetch(self._bot, chat_id, "refresh")
+
+        while True:
+            await asyncio.sleep(self.refresh_interval_s)
+            try:
+                batch = list(self._queue)[: self.refresh_batch]
+                for chat_id in batch:
+                    del self._queue[chat_id]
+                if batch:
+                    await asyncio.gather(*(refresh(chat_id) for chat_id in batch))
+                await self.persist()
+            except Exception as e:
+                logger.error("❌ chat_admins: ошибка фонового обновления: %s", e)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.persist()
+
+
+chat_admins = ChatAdminRegistry()
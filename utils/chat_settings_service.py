@@ -47,10 +47,9 @@ async def ensure_chat_settings(
     admin_ids: list[int] = []
     admin_count = 0
     try:
-        from utils.community_events_service import CommunityEventsService
+        from utils.chat_admins import chat_admins
 
-        community_service = CommunityEventsService()
-        admin_ids = await community_service.get_cached_admin_ids(bot, chat_id)
+        admin_ids = await chat_admins.get_admin_ids(bot, chat_id)
         admin_count = len(admin_ids)
     except Exception as e:
         logger.warning("⚠️ ensure_chat_settings: не удалось получить админов для %s: %s", chat_id, e)
@@ -4,42 +4,29 @@
 """
 
 import logging
-import threading
-from datetime import datetime
+from datetime import UTC, datetime
+from zoneinfo import ZoneInfo
 
 from sqlalchemy import text
 
 from config import load_settings
-from utils.event_translation import translate_event_to_english
+from utils.chat_admins import chat_admins
+from utils.simple_timezone import get_city_timezone
+from utils.translation_service import PRIORITY_USER, translation_service
 
 logger = logging.getLogger(__name__)
 
 
-def _backfill_event_translation_sync(engine, event_id: int, title: str, description: str) -> None:
+def community_starts_at_utc(starts_at: datetime, city: str | None) -> datetime:
     """
-    В фоне переводит title/description RU→EN и обновляет events_community.
-    Если OpenAI не ответил — событие уже создано, поля _en остаются NULL.
+    starts_at Community события — naive datetime в локальном времени города; переводим в UTC.
+
+    city — город, определенный по координатам места; None — часовой пояс неизвестен, считаем UTC.
     """
-    try:
-        trans = translate_event_to_english(title=title or "", description=description)
-        if not trans or (not trans.get("title_en") and not trans.get("description_en")):
-            return
-        with engine.begin() as conn:
-            conn.execute(
-                text("""
-                UPDATE events_community
-                SET title_en = :title_en, description_en = :description_en
-                WHERE id = :event_id
-                """),
-                {
-                    "event_id": event_id,
-                    "title_en": trans.get("title_en"),
-                    "description_en": trans.get("description_en"),
-                },
-            )
-        logger.info("✅ Фоновый перевод события %s (RU→EN) применён", event_id)
-    except Exception as e:
-        logger.warning("⚠️ Фоновый перевод события %s не удался: %s", event_id, e)
+    if starts_at.tzinfo is not None:
+        return starts_at.astimezone(UTC)
+    tz_name = get_city_timezone(city) if city else "UTC"
+    return starts_at.replace(tzinfo=ZoneInfo(tz_name)).astimezone(UTC)
 
 
 class CommunityEventsService:
@@ -55,12 +42,6 @@ class CommunityEventsService:
         else:
             self.engine = engine
 
-        # Кэш для админов групп (chat_id -> (admin_ids, timestamp))
-        # ОГРАНИЧЕНИЕ РАЗМЕРА для защиты от OOM
-        self._admin_cache = {}
-        self._cache_ttl = 600  # 10 минут
-        self._max_cache_size = 200  # Максимум 200 групп в кэше
-
     def create_community_event(
         self,
         group_id: int,
@@ -100,7 +81,7 @@ class CommunityEventsService:
             title_en = (title or "").strip() or None
             description_en = (description or "").strip() or None
         else:
-            # RU (или по умолчанию): _en заполняем в фоне через OpenAI; не блокируем создание
+            # RU (или по умолчанию): _en заполнит очередь перевода; не блокируем создание
             if (title or "").strip():
                 run_background_translation = True
                 title_en = None
@@ -111,10 +92,11 @@ class CommunityEventsService:
             query = text("""
                 INSERT INTO events_community
                 (chat_id, organizer_id, organizer_username, admin_id, admin_ids, admin_count, title, title_en,
-                 description, description_en, starts_at, city, location_name, location_url, status)
+                 description, description_en, starts_at, starts_at_utc, city, location_name, location_url, status)
                 VALUES
                 (:chat_id, :organizer_id, :organizer_username, :admin_id, :admin_ids, :admin_count, :title, :title_en,
-                 :description, :description_en, :starts_at, :city, :location_name, :location_url, 'open')
+                 :description, :description_en, :starts_at, :starts_at_utc, :city, :location_name, :location_url,
+                 'open')
                 RETURNING id
             """)
 
@@ -130,6 +112,9 @@ class CommunityEventsService:
                 "description": description,
                 "description_en": description_en,
                 "starts_at": date,
+                # Без ссылки на карту часовой пояс — UTC; со ссылкой город определяется по сети,
+                # поэтому starts_at_utc досчитает планировщик напоминаний (backfill_community_starts_at_utc)
+                "starts_at_utc": None if location_url else community_starts_at_utc(date, None),
                 "city": city,
                 "location_name": location_name,
                 "location_url": location_url,
@@ -162,17 +147,9 @@ class CommunityEventsService:
 
             logger.info("✅ Создано событие сообщества ID %s в группе %s", event_id, group_id)
 
-        # Фоновый перевод RU→EN не блокирует создание: поток запускается после commit,
-        # событие уже сохранено и event_id возвращается сразу.
+        # Перевод RU→EN не блокирует создание: задание ставится после commit, event_id возвращается сразу
         if run_background_translation:
-            thread = threading.Thread(
-                target=_backfill_event_translation_sync,
-                args=(self.engine, event_id, title or "", description or ""),
-                name=f"community-translate-{event_id}",
-                daemon=True,
-            )
-            thread.start()
-            logger.debug("Запущен фоновый перевод события %s (RU→EN)", event_id)
+            translation_service.enqueue("events_community", [event_id], priority=PRIORITY_USER)
 
         return event_id
 
@@ -435,44 +412,8 @@ class CommunityEventsService:
         Returns:
             Список ID администраторов группы
         """
-        import logging
-        import time
-
-        logger = logging.getLogger(__name__)
-        current_time = time.time()
-
-        # Проверяем кэш
-        if group_id in self._admin_cache:
-            admin_ids, timestamp = self._admin_cache[group_id]
-            if current_time - timestamp < self._cache_ttl:
-                logger.info(f"⚡ Использован кэш админов для группы {group_id}: {admin_ids}")
-                return admin_ids
-            else:
-                # Кэш устарел, удаляем
-                del self._admin_cache[group_id]
-
-        # Получаем свежие данные
-        admin_ids = await self.get_group_admin_ids_async(bot, group_id)
-
-        # Очистка кэша при превышении размера
-        if len(self._admin_cache) >= self._max_cache_size:
-            # Удаляем устаревшие записи
-            expired_keys = [key for key, (_, ts) in self._admin_cache.items() if (current_time - ts) >= self._cache_ttl]
-            for key in expired_keys:
-                self._admin_cache.pop(key, None)
-
-            # Если все еще слишком много, удаляем 50% самых старых
-            if len(self._admin_cache) >= self._max_cache_size:
-                sorted_items = sorted(self._admin_cache.items(), key=lambda x: x[1][1])
-                to_remove = len(self._admin_cache) - self._max_cache_size // 2
-                for key, _ in sorted_items[:to_remove]:
-                    self._admin_cache.pop(key, None)
-
-        # Сохраняем в кэш
-        self._admin_cache[group_id] = (admin_ids, current_time)
-        logger.info("💾 Админы сохранены в кэш")
-
-        return admin_ids
+        # Общий на процесс реестр: память, chat_member-апдейты и ленивое обновление (utils.chat_admins)
+        return await chat_admins.get_admin_ids(bot, group_id)
 
     async def get_group_admin_id_async(self, group_id: int, bot) -> int | None:
         """
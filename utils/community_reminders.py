@@ -8,19 +8,25 @@ from datetime import UTC, datetime, timedelta
 
 from aiogram import Bot
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import select
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import load_only
 
 from config import load_settings
 from database import BotMessage, ChatSettings, CommunityEvent, User, init_engine
+from utils.community_events_service import community_starts_at_utc
 from utils.community_participants_service_optimized import get_participants_optimized
+from utils.geo_utils import parse_google_maps_link
 from utils.i18n import t
 from utils.messaging_utils import send_tracked
+from utils.send_scheduler import install_send_scheduler, send_priority
 from utils.user_language import get_event_description, get_event_title
 
 logger = logging.getLogger(__name__)
 
+# Сколько событий без starts_at_utc (новые со ссылкой на карту и отредактированные) досчитываем за тик
+STARTS_AT_UTC_BACKFILL_LIMIT = 100
+
 
 def escape_markdown(text: str) -> str:
     """Экранирует специальные символы Markdown"""
@@ -70,6 +76,110 @@ def _reminder_card_keyboard(event_id: int, lang: str) -> InlineKeyboardMarkup:
     )
 
 
+async def resolve_community_starts_at_utc(event_id: int, starts_at: datetime, location_url: str | None) -> datetime:
+    """
+    UTC-время начала Community события.
+
+    Часовой пояс — ТОЛЬКО по координатам из location_url (event.city не используем: пользователь мог
+    ошибиться в названии). Нет ссылки или координат — считаем starts_at временем в UTC.
+    """
+    from utils.simple_timezone import get_city_from_coordinates
+
+    city = None
+    if location_url:
+        try:
+            location_data = await parse_google_maps_link(location_url)
+            if location_data and location_data.get("lat") and location_data.get("lng"):
+                city = get_city_from_coordinates(location_data["lat"], location_data["lng"])
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось извлечь координаты из location_url для события {event_id}: {e}")
+    if not city:
+        logger.warning(
+            f"⚠️ Событие {event_id}: не удалось определить город по координатам из location_url, используем UTC"
+        )
+    return community_starts_at_utc(starts_at, city)
+
+
+async def backfill_community_starts_at_utc(session: AsyncSession, limit: int = STARTS_AT_UTC_BACKFILL_LIMIT) -> int:
+    """
+    Досчитывает starts_at_utc для открытых событий, где он еще не заполнен.
+
+    NULL остается у событий со ссылкой на карту (город определяется по сети) и у отредактированных
+    (время или ссылка изменились). Давно прошедшие события пропускаем — напоминать о них уже нечего.
+    UPDATE проверяет, что starts_at/location_url не поменялись, пока мы ходили в сеть.
+    """
+    result = await session.execute(
+        text("""
+            SELECT id, starts_at, location_url
+            FROM events_community
+            WHERE status = 'open'
+              AND starts_at_utc IS NULL
+              AND starts_at >= (NOW() AT TIME ZONE 'UTC') - INTERVAL '1 day'
+            ORDER BY starts_at
+            LIMIT :limit
+        """),
+        {"limit": limit},
+    )
+    rows = result.fetchall()
+    if not rows:
+        return 0
+
+    for row in rows:
+        starts_at_utc = await resolve_community_starts_at_utc(row.id, row.starts_at, row.location_url)
+        await session.execute(
+            text("""
+                UPDATE events_community
+                SET starts_at_utc = :starts_at_utc
+                WHERE id = :id
+                  AND starts_at_utc IS NULL
+                  AND starts_at = :starts_at
+                  AND location_url IS NOT DISTINCT FROM :location_url
+            """),
+            {
+                "id": row.id,
+                "starts_at_utc": starts_at_utc,
+                "starts_at": row.starts_at,
+                "location_url": row.location_url,
+            },
+        )
+    await session.commit()
+    logger.info(f"🕒 Заполнен starts_at_utc для {len(rows)} Community событий")
+    return len(rows)
+
+
+async def _load_due_events(session: AsyncSession, time_min_utc: datetime, time_max_utc: datetime) -> list:
+    """Открытые Community события с началом в [time_min_utc, time_max_utc] (title_en/description_en для i18n)."""
+    stmt = (
+        select(CommunityEvent)
+        .options(
+            load_only(
+                CommunityEvent.id,
+                CommunityEvent.chat_id,
+                CommunityEvent.organizer_id,
+                CommunityEvent.organizer_username,
+                CommunityEvent.title,
+                CommunityEvent.title_en,
+                CommunityEvent.description,
+                CommunityEvent.description_en,
+                CommunityEvent.starts_at,
+                CommunityEvent.starts_at_utc,
+                CommunityEvent.city,
+                CommunityEvent.location_name,
+                CommunityEvent.location_url,
+                CommunityEvent.status,
+            )
+        )
+        .where(
+            CommunityEvent.status == "open",
+            CommunityEvent.starts_at_utc >= time_min_utc,
+            CommunityEvent.starts_at_utc <= time_max_utc,
+        )
+        .order_by(CommunityEvent.starts_at_utc)
+    )
+    result = await session.execute(stmt)
+    return list(result.scalars().all())
+
+
 async def send_event_start_notifications(bot: Bot, session: AsyncSession):
     """
     Отправляет уведомления о начале событий (когда событие начинается)
@@ -87,167 +197,11 @@ async def send_event_start_notifications(bot: Bot, session: AsyncSession):
             f"ищем события между {time_min_utc} и {time_max_utc} UTC"
         )
 
-        # Открытые Community события (title_en/description_en для i18n напоминаний)
-        stmt = (
-            select(CommunityEvent)
-            .options(
-                load_only(
-                    CommunityEvent.id,
-                    CommunityEvent.chat_id,
-                    CommunityEvent.organizer_id,
-                    CommunityEvent.organizer_username,
-                    CommunityEvent.title,
-                    CommunityEvent.title_en,
-                    CommunityEvent.description,
-                    CommunityEvent.description_en,
-                    CommunityEvent.starts_at,
-                    CommunityEvent.city,
-                    CommunityEvent.location_name,
-                    CommunityEvent.location_url,
-                    CommunityEvent.status,
-                )
-            )
-            .where(CommunityEvent.status == "open")
-            .order_by(CommunityEvent.starts_at)
-        )
-        result = await session.execute(stmt)
-        all_events = result.scalars().all()
-
-        logger.info(f"📊 Запрос к таблице events_community: найдено {len(all_events)} открытых Community событий")
-
-        # Фильтруем события, учитывая часовой пояс города
-        from zoneinfo import ZoneInfo
-
-        from utils.simple_timezone import get_city_from_coordinates, get_city_timezone
-
-        events = []
-        for event in all_events:
-            # Определяем часовой пояс города события
-            city = None
-            lat = None
-            lng = None
-
-            # ПРИОРИТЕТ: Определяем город по координатам из location_url (Google Maps ссылки)
-            # Это самый точный способ, так как координаты не врут
-            if event.location_url:
-                try:
-                    from utils.geo_utils import parse_google_maps_link
-
-                    location_data = await parse_google_maps_link(event.location_url)
-                    if location_data:
-                        lat = location_data.get("lat")
-                        lng = location_data.get("lng")
-                        if lat and lng:
-                            city = get_city_from_coordinates(lat, lng)
-                            if city:
-                                tz_name = get_city_timezone(city)
-                                logger.info(
-                                    f"🔍 Событие {event.id}: определен город '{city}' "
-                                    f"по координатам из location_url ({lat}, {lng}) -> tz='{tz_name}' "
-                                    f"(event.city из БД='{event.city}')"
-                                )
-                except Exception as e:
-                    logger.debug(f"⚠️ Не удалось извлечь координаты из location_url для события {event.id}: {e}")
-
-            # ВАЖНО: Определяем timezone ТОЛЬКО по координатам из location_url
-            # Если location_url нет или не удалось извлечь координаты, используем UTC
-            # НЕ используем event.city из БД, так как пользователь мог ошибиться в названии
-            if not city:
-                logger.warning(
-                    f"⚠️ Событие {event.id}: не удалось определить город по координатам из location_url, "
-                    f"используем UTC (event.city из БД='{event.city}', location_url={bool(event.location_url)})"
-                )
-                city = None  # Будет использован UTC
-
-            tz_name = get_city_timezone(city) if city else "UTC"
-            city_tz = ZoneInfo(tz_name)
-
-            # starts_at - это naive datetime в локальном времени города
-            # ВАЖНО: event.starts_at - это TIMESTAMP WITHOUT TIME ZONE (naive datetime)
-            # Мы интерпретируем его как local time в часовом поясе города
-            # Преобразуем его в UTC для сравнения
-            if event.starts_at.tzinfo is not None:
-                # Если по какой-то причине starts_at уже имеет timezone, логируем предупреждение
-                logger.warning(
-                    f"⚠️ Событие {event.id}: starts_at уже имеет timezone: {event.starts_at.tzinfo}, "
-                    f"ожидался naive datetime"
-                )
-                # Используем как есть, если уже aware
-                starts_at_utc = event.starts_at.astimezone(UTC)
-            else:
-                # Naive datetime - интерпретируем как local time в часовом поясе города
-                starts_at_local = event.starts_at.replace(tzinfo=city_tz)
-                starts_at_utc = starts_at_local.astimezone(UTC)
-
-            # Логируем для отладки определения часового пояса (INFO уровень для важных событий)
-            logger.info(
-                f"🔍 Событие {event.id} '{event.title[:30]}': city='{city}' -> tz='{tz_name}', "
-                f"starts_at={event.starts_at} (local {tz_name}) -> {starts_at_utc} (UTC)"
-            )
-
-            # Проверяем, попадает ли событие в диапазон начала
-            time_diff_minutes = (starts_at_utc - now).total_seconds() / 60
-            if time_min_utc <= starts_at_utc <= time_max_utc:
-                events.append(event)
-                logger.info(
-                    f"🔔 Событие {event.id} '{event.title}': начинается сейчас "
-                    f"(starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                    f"разница: {time_diff_minutes:.1f} минут от сейчас)"
-                )
-            else:
-                # Логируем события, которые близки к началу (в пределах 2 часов) для отладки
-                if abs(time_diff_minutes) < 120:
-                    logger.info(
-                        f"⏭️ Событие {event.id} '{event.title}': не в диапазоне "
-                        f"(starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                        f"разница: {time_diff_minutes:.1f} минут от сейчас, "
-                        f"диапазон: {time_min_utc} - {time_max_utc})"
-                    )
-                # Для событий в пределах 24 часов логируем более подробно
-                elif abs(time_diff_minutes) < 1440:
-                    logger.debug(
-                        f"📅 Событие {event.id} '{event.title[:30]}': "
-                        f"starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                        f"разница: {time_diff_minutes:.1f} минут ({time_diff_minutes/60:.1f} часов) от сейчас"
-                    )
+        # Открытые Community события, начинающиеся в окне (индекс по starts_at_utc)
+        await backfill_community_starts_at_utc(session)
+        events = await _load_due_events(session, time_min_utc, time_max_utc)
 
-        logger.info(f"🔔 Найдено {len(events)} событий для уведомлений о начале (из {len(all_events)} открытых)")
-
-        # Логируем информацию о всех событиях для отладки
-        if len(all_events) > 0:
-            logger.info(f"📋 Всего открытых событий: {len(all_events)}")
-            for event in all_events[:5]:  # Показываем первые 5 для отладки
-                # Определяем часовой пояс для этого события
-                city = None
-                if event.location_url:
-                    try:
-                        location_data = await parse_google_maps_link(event.location_url)
-                        if location_data:
-                            lat = location_data.get("lat")
-                            lng = location_data.get("lng")
-                            if lat and lng:
-                                city = get_city_from_coordinates(lat, lng)
-                    except Exception:
-                        pass
-                # ВАЖНО: Определяем timezone ТОЛЬКО по координатам из location_url
-                # Если не удалось определить город по координатам, используем UTC
-                if not city:
-                    logger.warning(
-                        f"⚠️ Событие {event.id}: не удалось определить город по координатам из location_url "
-                        f"для логирования, используем UTC (event.city из БД='{event.city}', "
-                        f"location_url={bool(event.location_url)})"
-                    )
-                    city = None
-                tz_name = get_city_timezone(city) if city else "UTC"
-                city_tz = ZoneInfo(tz_name)
-                starts_at_local = event.starts_at.replace(tzinfo=city_tz)
-                starts_at_utc = starts_at_local.astimezone(UTC)
-                time_diff_minutes = (starts_at_utc - now).total_seconds() / 60
-                logger.info(
-                    f"   📅 Событие {event.id} '{event.title[:30]}': "
-                    f"starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                    f"разница: {time_diff_minutes:.1f} минут от сейчас"
-                )
+        logger.info(f"🔔 Найдено {len(events)} событий для уведомлений о начале")
 
         sent_count = 0
         skipped_count = 0
@@ -386,10 +340,6 @@ async def send_event_start_notifications(bot: Bot, session: AsyncSession):
                     )
                     sent_count += 1
 
-                    import asyncio
-
-                    await asyncio.sleep(1)
-
                 except Exception as e:
                     logger.error(f"❌ Ошибка отправки уведомления о начале для события {event.id}: {e}")
                     continue
@@ -435,140 +385,11 @@ async def send_24h_reminders(bot: Bot, session: AsyncSession):
             f"ищем события между {time_min_utc} и {time_max_utc} UTC (через ~24 часа)"
         )
 
-        # Открытые Community события (title_en/description_en для i18n напоминаний)
-        logger.info("🔔 Выполняем запрос к БД для получения открытых Community событий...")
-        stmt = (
-            select(CommunityEvent)
-            .options(
-                load_only(
-                    CommunityEvent.id,
-                    CommunityEvent.chat_id,
-                    CommunityEvent.organizer_id,
-                    CommunityEvent.organizer_username,
-                    CommunityEvent.title,
-                    CommunityEvent.title_en,
-                    CommunityEvent.description,
-                    CommunityEvent.description_en,
-                    CommunityEvent.starts_at,
-                    CommunityEvent.city,
-                    CommunityEvent.location_name,
-                    CommunityEvent.location_url,
-                    CommunityEvent.status,
-                )
-            )
-            .where(CommunityEvent.status == "open")
-            .order_by(CommunityEvent.starts_at)
-        )
-        result = await session.execute(stmt)
-        logger.info("🔔 Запрос к БД выполнен, получаем результаты...")
-        all_events = result.scalars().all()
-        logger.info(f"📊 Запрос к таблице events_community: найдено {len(all_events)} открытых Community событий")
-
-        # Фильтруем события, учитывая часовой пояс города
-        from zoneinfo import ZoneInfo
-
-        from utils.simple_timezone import get_city_from_coordinates, get_city_timezone
-
-        events = []
-        for event in all_events:
-            # Определяем часовой пояс города события
-            # Приоритет: координаты из location_url > название города
-            city = None
-            lat = None
-            lng = None
-
-            # Пытаемся извлечь координаты из location_url (самый надежный способ)
-            if event.location_url:
-                try:
-                    from utils.geo_utils import parse_google_maps_link
-
-                    location_data = await parse_google_maps_link(event.location_url)
-                    if location_data:
-                        lat = location_data.get("lat")
-                        lng = location_data.get("lng")
-                        if lat and lng:
-                            # Определяем город по координатам (самый точный способ)
-                            from utils.simple_timezone import get_city_from_coordinates
-
-                            city = get_city_from_coordinates(lat, lng)
-                            if city:
-                                tz_name = get_city_timezone(city)
-                                logger.info(
-                                    f"🔍 Событие {event.id}: определен город '{city}' "
-                                    f"(get_city_from_coordinates вернул '{city}') "
-                                    f"по координатам из location_url ({lat}, {lng}) -> tz='{tz_name}' "
-                                    f"(event.city из БД='{event.city}')"
-                                )
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось извлечь координаты из location_url для события {event.id}: {e}")
-
-            # ВАЖНО: Определяем timezone ТОЛЬКО по координатам из location_url
-            # Если location_url нет или не удалось извлечь координаты, используем UTC
-            # НЕ используем event.city из БД, так как пользователь мог ошибиться в названии
-            if not city:
-                logger.warning(
-                    f"⚠️ Событие {event.id}: не удалось определить город по координатам из location_url, "
-                    f"используем UTC (event.city из БД='{event.city}', location_url={bool(event.location_url)})"
-                )
-                city = None  # Будет использован UTC
-
-            tz_name = get_city_timezone(city) if city else "UTC"
-            city_tz = ZoneInfo(tz_name)
-
-            # starts_at - это naive datetime в локальном времени города
-            # ВАЖНО: event.starts_at - это TIMESTAMP WITHOUT TIME ZONE (naive datetime)
-            # Мы интерпретируем его как local time в часовом поясе города
-            # Преобразуем его в UTC для сравнения
-            if event.starts_at.tzinfo is not None:
-                # Если по какой-то причине starts_at уже имеет timezone, логируем предупреждение
-                logger.warning(
-                    f"⚠️ Событие {event.id}: starts_at уже имеет timezone: {event.starts_at.tzinfo}, "
-                    f"ожидался naive datetime"
-                )
-                # Используем как есть, если уже aware
-                starts_at_utc = event.starts_at.astimezone(UTC)
-            else:
-                # Naive datetime - интерпретируем как local time в часовом поясе города
-                starts_at_local = event.starts_at.replace(tzinfo=city_tz)
-                starts_at_utc = starts_at_local.astimezone(UTC)
-
-            # Логируем для отладки определения часового пояса
-            time_diff_hours = (starts_at_utc - now).total_seconds() / 3600
-            logger.info(
-                f"🔍 Событие {event.id} '{event.title[:30]}': city='{city}' -> tz='{tz_name}', "
-                f"starts_at={event.starts_at} (local {tz_name}) -> {starts_at_utc} (UTC), "
-                f"до начала: {time_diff_hours:.1f} часов"
-            )
+        # Открытые Community события, начинающиеся в окне (индекс по starts_at_utc)
+        await backfill_community_starts_at_utc(session)
+        events = await _load_due_events(session, time_min_utc, time_max_utc)
 
-            # Проверяем, попадает ли событие в диапазон 23.75-24.25 часов от сейчас
-            # Детальное логирование для отладки
-            is_in_range = time_min_utc <= starts_at_utc <= time_max_utc
-            # Логируем ВСЕ события, которые близки к 24-часовой отметке (в пределах 6 часов)
-            if 18 <= time_diff_hours <= 30:
-                logger.info(
-                    f"🔍 Событие {event.id} '{event.title[:30]}': проверка диапазона - "
-                    f"starts_at_utc={starts_at_utc}, time_min={time_min_utc}, time_max={time_max_utc}, "
-                    f"в диапазоне: {is_in_range}, разница: {time_diff_hours:.2f} часов"
-                )
-
-            if is_in_range:
-                events.append(event)
-                logger.info(
-                    f"✅ Событие {event.id} '{event.title}': попадает в окно напоминаний "
-                    f"(starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                    f"до начала: {time_diff_hours:.1f} часов)"
-                )
-            else:
-                # Логируем события, которые близки к 24-часовой отметке (в пределах 4 часов) для отладки
-                if 20 <= time_diff_hours <= 28:
-                    logger.info(
-                        f"⏭️ Событие {event.id} '{event.title}': не в диапазоне напоминаний "
-                        f"(starts_at={event.starts_at} ({tz_name}) = {starts_at_utc} UTC, "
-                        f"до начала: {time_diff_hours:.1f} часов, "
-                        f"диапазон: {time_min_utc} - {time_max_utc})"
-                    )
-
-        logger.info(f"🔔 Найдено {len(events)} событий для отправки напоминаний (из {len(all_events)} открытых)")
+        logger.info(f"🔔 Найдено {len(events)} событий для отправки напоминаний")
 
         sent_count = 0
         skipped_count = 0
@@ -717,11 +538,6 @@ async def send_24h_reminders(bot: Bot, session: AsyncSession):
                     logger.info(f"✅ Отправлено напоминание о событии {event.id} '{event.title}' в чат {event.chat_id}")
                     sent_count += 1
 
-                    # Небольшая задержка между отправками
-                    import asyncio
-
-                    await asyncio.sleep(1)
-
                 except Exception as e:
                     logger.error(f"❌ Ошибка отправки напоминания для события {event.id}: {e}")
                     continue
@@ -759,11 +575,13 @@ async def send_event_start_notifications_sync(bot_token: str):
     async_engine = make_async_engine(settings.database_url)
     async_session = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
-    bot = Bot(token=bot_token)
+    # Темп задает планировщик отправок; рассылка уступает ответам пользователям
+    bot = install_send_scheduler(Bot(token=bot_token))
 
     try:
         async with async_session() as session:
-            await send_event_start_notifications(bot, session)
+            with send_priority("bulk"):
+                await send_event_start_notifications(bot, session)
     finally:
         await bot.session.close()
         await async_engine.dispose()
@@ -789,12 +607,13 @@ async def send_24h_reminders_sync(bot_token: str):
 
     async_session = sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
-    bot = Bot(token=bot_token)
+    bot = install_send_scheduler(Bot(token=bot_token))
 
     try:
         async with async_session() as session:
             logger.info("🔔 Вызываем send_24h_reminders...")
-            await send_24h_reminders(bot, session)
+            with send_priority("bulk"):
+                await send_24h_reminders(bot, session)
             logger.info("🔔 === КОНЕЦ send_24h_reminders_sync ===")
     except Exception as e:
         logger.error(f"❌ Ошибка в send_24h_reminders_sync: {e}")
@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import hashlib
+import json
 import re
 import unicodedata
 from datetime import UTC, datetime, timedelta
@@ -112,65 +113,137 @@ def find_duplicate_event_id(
     exclude_external_id: str | None = None,
 ) -> int | None:
     """Return existing event id if this post looks like the same event."""
-    row = conn.execute(
-        text(
-            """
-            SELECT id
-            FROM events
-            WHERE dedupe_key = :dedupe_key
-              AND status NOT IN ('closed', 'canceled')
-              AND NOT (source = :exclude_source AND external_id = :exclude_external_id)
+    candidate = {
+        "dedupe_key": dedupe_key,
+        "title": title,
+        "starts_at": starts_at,
+        "lat": lat,
+        "lng": lng,
+        "city": city,
+        "source": exclude_source,
+        "external_id": exclude_external_id,
+    }
+    return find_duplicate_event_ids(conn, [candidate]).get(0)
+
+
+_DUPLICATE_CANDIDATES_SQL = text(
+    """
+    SELECT c.idx, d.id, d.title, d.lat, d.lng, d.exact
+    FROM jsonb_to_recordset(CAST(:items AS jsonb)) AS c(
+        idx int, dedupe_key text, source text, external_id text,
+        window_start timestamptz, window_end timestamptz, city text
+    )
+    CROSS JOIN LATERAL (
+        (
+            SELECT e.id, e.title, e.lat, e.lng, true AS exact, 0::bigint AS ord
+            FROM events e
+            WHERE e.dedupe_key = c.dedupe_key
+              AND e.status NOT IN ('closed', 'canceled')
+              AND NOT (e.source = c.source AND e.external_id = c.external_id)
             ORDER BY
-              (referral_code IS NOT NULL AND btrim(referral_code) <> '') DESC,
-              id ASC
+              (e.referral_code IS NOT NULL AND btrim(e.referral_code) <> '') DESC,
+              e.id ASC
             LIMIT 1
-            """
-        ),
-        {
-            "dedupe_key": dedupe_key,
-            "exclude_source": exclude_source or "",
-            "exclude_external_id": exclude_external_id or "",
-        },
-    ).fetchone()
-    if row:
-        return int(row[0])
+        )
+        UNION ALL
+        (
+            SELECT f.id, f.title, f.lat, f.lng, false AS exact,
+                   row_number() OVER (ORDER BY f.has_referral DESC, f.id ASC) AS ord
+            FROM (
+                SELECT e.id, e.title, e.lat, e.lng,
+                       (e.referral_code IS NOT NULL AND btrim(e.referral_code) <> '') AS has_referral
+                FROM events e
+                WHERE e.status NOT IN ('closed', 'canceled')
+                  AND e.starts_at BETWEEN c.window_start AND c.window_end
+                  AND NOT (e.source = c.source AND e.external_id = c.external_id)
+                  AND (c.city IS NULL OR e.city = c.city)
+                ORDER BY has_referral DESC, e.id ASC
+                LIMIT 50
+            ) f
+        )
+    ) d
+    ORDER BY c.idx, d.exact DESC, d.ord
+    """
+)
 
-    title_fp = _title_fingerprint(title)
-    if not title_fp or starts_at is None:
-        return None
 
+def _fuzzy_window(title: str, starts_at: datetime | None) -> tuple[datetime, datetime] | None:
+    if not _title_fingerprint(title) or starts_at is None:
+        return None
     if starts_at.tzinfo is None:
         starts_at = starts_at.replace(tzinfo=UTC)
-    window_start = starts_at - timedelta(hours=1)
-    window_end = starts_at + timedelta(hours=1)
+    return starts_at - timedelta(hours=1), starts_at + timedelta(hours=1)
 
-    params = {
-        "window_start": window_start,
-        "window_end": window_end,
-        "city": city,
-        "exclude_source": exclude_source or "",
-        "exclude_external_id": exclude_external_id or "",
-    }
-    fuzzy_sql = """
-        SELECT id, title, lat, lng,
-               (referral_code IS NOT NULL AND btrim(referral_code) <> '') AS has_referral
-        FROM events
-        WHERE status NOT IN ('closed', 'canceled')
-          AND starts_at BETWEEN :window_start AND :window_end
-          AND NOT (source = :exclude_source AND external_id = :exclude_external_id)
+
+def _near_enough(lat, lng, other_lat, other_lng) -> bool:
+    if lat is None or lng is None or other_lat is None or other_lng is None:
+        return True
+    return _haversine_km(float(lat), float(lng), float(other_lat), float(other_lng)) <= 2.0
+
+
+def find_duplicate_event_ids(conn: Connection, candidates: list[dict]) -> dict[int, int]:
+    """
+    Batch version of find_duplicate_event_id: one query for the whole list.
+
+    Each candidate is a dict with dedupe_key, title, starts_at, lat, lng, city, source, external_id
+    (source/external_id are excluded from matching). Returns {candidate index: existing event id}
+    for candidates that look like an existing event; rules match find_duplicate_event_id:
+    exact dedupe_key first, then up to 50 events within ±1h (same city) with a similar title
+    and ≤2 km apart; referral events and older ids win.
     """
-    if city:
-        fuzzy_sql += " AND city = :city"
-    fuzzy_sql += " ORDER BY has_referral DESC, id ASC LIMIT 50"
+    if not candidates:
+        return {}
 
-    for candidate in conn.execute(text(fuzzy_sql), params):
-        if not titles_likely_same(title, candidate.title or ""):
+    items = []
+    for idx, candidate in enumerate(candidates):
+        window = _fuzzy_window(candidate.get("title") or "", candidate.get("starts_at"))
+        items.append(
+            {
+                "idx": idx,
+                "dedupe_key": candidate.get("dedupe_key"),
+                "source": candidate.get("source") or "",
+                "external_id": candidate.get("external_id") or "",
+                "window_start": window[0].isoformat() if window else None,
+                "window_end": window[1].isoformat() if window else None,
+                "city": candidate.get("city") or None,
+            }
+        )
+
+    found: dict[int, int] = {}
+    for row in conn.execute(_DUPLICATE_CANDIDATES_SQL, {"items": json.dumps(items)}):
+        if row.idx in found:
             continue
-        if lat is not None and lng is not None and candidate.lat is not None and candidate.lng is not None:
-            if _haversine_km(lat, lng, float(candidate.lat), float(candidate.lng)) > 2.0:
+        candidate = candidates[row.idx]
+        if not row.exact:
+            if not titles_likely_same(candidate.get("title") or "", row.title or ""):
+                continue
+            if not _near_enough(candidate.get("lat"), candidate.get("lng"), row.lat, row.lng):
                 continue
-        return int(candidate.id)
-    return None
+        found[row.idx] = int(row.id)
+    return found
+
+
+def events_look_same(left: dict, right: dict) -> bool:
+    """
+    In-memory counterpart of the duplicate rules for two not-yet-saved events (same batch):
+    equal dedupe_key, or a similar title within ±1h, same city and ≤2 km apart.
+    """
+    if left.get("dedupe_key") and left.get("dedupe_key") == right.get("dedupe_key"):
+        return True
+    left_start, right_start = left.get("starts_at"), right.get("starts_at")
+    if left_start is None or right_start is None or not _title_fingerprint(left.get("title") or ""):
+        return False
+    if left_start.tzinfo is None:
+        left_start = left_start.replace(tzinfo=UTC)
+    if right_start.tzinfo is None:
+        right_start = right_start.replace(tzinfo=UTC)
+    if abs(left_start - right_start) > timedelta(hours=1):
+        return False
+    if left.get("city") and left.get("city") != right.get("city"):
+        return False
+    if not titles_likely_same(left.get("title") or "", right.get("title") or ""):
+        return False
+    return _near_enough(left.get("lat"), left.get("lng"), right.get("lat"), right.get("lng"))
 
 
 def pick_preferred_event(events: list[dict]) -> dict:
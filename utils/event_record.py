@@ -0,0 +1,196 @@
+"""
+Компактное представление события из поиска (результаты «Что рядом», prepared в user_state).
+
+Раньше каждая строка поиска превращалась в словарь на ~35 ключей, затем бот копировал его
+в еще один словарь formatted_event (time_local, url) — на каждое закэшированное событие
+приходилось два хэш-словаря. EventRecord создается один раз из строки SQL и проходит поиск,
+prepare_events_for_feed, пагинацию и рендеринг без копий.
+
+Запись ведет себя как dict (get, [], in, keys/items, **распаковка), поэтому код, работающий
+со словарями событий (venue_enrich, render_event_html, get_source_url), менять не нужно:
+  - известные поля лежат в __slots__; поле, которое не присваивали, считается отсутствующим ключом;
+  - url — псевдоним event_url, time_local вычисляется из starts_at («%Y-%m-%d %H:%M»);
+  - прочие ключи (coords, venue, ...) попадают в лениво создаваемый словарь _extra.
+"""
+
+from collections.abc import Iterator, MutableMapping
+from typing import Any
+
+# Порядок важен: в нем поля упаковываются в state_store (см. to_packed/from_packed)
+EVENT_RECORD_FIELDS = (
+    "source_type",
+    "source",
+    "id",
+    "title",
+    "description",
+    "title_en",
+    "description_en",
+    "location_name_en",
+    "starts_at",
+    "ends_at",
+    "time_mode",
+    "city",
+    "lat",
+    "lng",
+    "location_name",
+    "location_url",
+    "event_url",
+    "organizer_id",
+    "organizer_username",
+    "max_participants",
+    "current_participants",
+    "status",
+    "created_at_utc",
+    "community_name",
+    "community_link",
+    "chat_id",
+    "venue_name",
+    "address",
+    "place_id",
+    "categories",
+    "raw_category",
+    "tags",
+    "referral_code",
+    "dedupe_key",
+    "type",
+    "distance_km",
+)
+
+_FIELD_SET = frozenset(EVENT_RECORD_FIELDS)
+_TIME_LOCAL_FORMAT = "%Y-%m-%d %H:%M"
+
+
+class _Unset:
+    """Маркер незаданного поля в упакованном виде (None — допустимое значение поля)."""
+
+    __slots__ = ()
+
+
+_UNSET = _Unset()
+
+
+class EventRecord(MutableMapping):
+    """Событие поиска на __slots__ с интерфейсом dict."""
+
+    __slots__ = EVENT_RECORD_FIELDS + ("_extra",)
+
+    def __init__(self, fields: dict[str, Any] | None = None, /, **kwargs: Any):
+        self._extra = None
+        if fields:
+            self.update(fields)
+        if kwargs:
+            self.update(kwargs)
+
+    # --- Mapping ---
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        extra = self._extra
+        if extra is not None and key in extra:
+            return extra[key]
+        if key == "url":
+            try:
+                return self.event_url
+            except AttributeError:
+                raise KeyError(key) from None
+        if key == "time_local":
+            try:
+                starts_at = self.starts_at
+            except AttributeError:
+                raise KeyError(key) from None
+            return starts_at.strftime(_TIME_LOCAL_FORMAT) if starts_at else None
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        elif key == "url":
+            self.event_url = value
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif key == "url":
+            del self["event_url"]
+        else:
+            if self._extra is None or key not in self._extra:
+                raise KeyError(key)
+            del self._extra[key]
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        extra = self._extra or {}
+        for name in EVENT_RECORD_FIELDS:
+            if hasattr(self, name):
+                yield name
+        if "url" not in extra and hasattr(self, "event_url"):
+            yield "url"
+        if "time_local" not in extra and hasattr(self, "starts_at"):
+            yield "time_local"
+        yield from extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"EventRecord(id={self.get('id')!r}, title={self.get('title')!r})"
+
+    def copy(self) -> "EventRecord":
+        clone = EventRecord.__new__(EventRecord)
+        for name in EVENT_RECORD_FIELDS:
+            try:
+                setattr(clone, name, getattr(self, name))
+            except AttributeError:
+                pass
+        clone._extra = dict(self._extra) if self._extra else None
+        return clone
+
+    def to_dict(self) -> dict[str, Any]:
+        return dict(self.items())
+
+    # --- Компактная сериализация (state_store) ---
+
+    def to_packed(self) -> list:
+        """[значения полей в порядке EVENT_RECORD_FIELDS (None для незаданных — см. маску), маска, extra]."""
+        values = []
+        unset_mask = 0
+        for i, name in enumerate(EVENT_RECORD_FIELDS):
+            value = getattr(self, name, _UNSET)
+            if value is _UNSET:
+                unset_mask |= 1 << i
+                value = None
+            values.append(value)
+        return [values, unset_mask, self._extra or None]
+
+    @classmethod
+    def from_packed(cls, packed: list) -> "EventRecord":
+        values, unset_mask, extra = packed
+        record = cls.__new__(cls)
+        for i, (name, value) in enumerate(zip(EVENT_RECORD_FIELDS, values, strict=False)):
+            if not unset_mask & (1 << i):
+                setattr(record, name, value)
+        record._extra = dict(extra) if extra else None
+        return record
@@ -690,3 +690,90 @@ async def translate_titles_batch_async(titles: list[str]) -> list[str | None]:
                     )
                     return [None] * len(titles)
         return [None] * len(titles)
+
+
+# Промпт для смешанного пакета (названия и описания): вход и выход — JSON-массивы строк
+TEXTS_BATCH_SYSTEM_PROMPTS = {
+    "en": (
+        "Ты — профессиональный переводчик афиши мероприятий. "
+        "Тебе дан JSON-массив строк — названия и описания событий. Переведи каждую строку на английский. "
+        "Сохраняй смысл, эмоциональный окрас, эмодзи, переносы строк и форматирование. "
+        "Названия заведений и брендов оставляй на латинице. "
+        "Верни только JSON-массив переводов той же длины и в том же порядке, без комментариев."
+    ),
+    "ru": (
+        "Ты — профессиональный переводчик афиши мероприятий. "
+        "Тебе дан JSON-массив строк — названия и описания событий. Переведи каждую строку на русский. "
+        "Сохраняй смысл, эмоциональный окрас, эмодзи, переносы строк и форматирование. "
+        "Названия заведений и брендов можно оставлять на латинице. "
+        "Верни только JSON-массив переводов той же длины и в том же порядке, без комментариев."
+    ),
+}
+
+
+def translate_texts_batch(texts: list[str], target_lang: str = "en") -> list[str | None] | None:
+    """
+    Переводит пачку названий и описаний одним запросом (вход — JSON-массив, чтобы описания
+    с переносами строк не ломали нумерацию, как в translate_titles_batch).
+
+    Возвращает None, если запрос не выполнен (нет ключа, сеть, ошибка API) — пачку надо повторить позже;
+    иначе список той же длины, где None — строка не переведена (невалидный ответ, несовпадение длины).
+    """
+    if not texts:
+        return []
+    client = _make_client()
+    if not client:
+        return None
+
+    user_content = json.dumps(texts, ensure_ascii=False)
+    _sync_semaphore.acquire()
+    try:
+        for attempt in range(MAX_RETRIES):
+            try:
+                completion = client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=[
+                        {"role": "system", "content": TEXTS_BATCH_SYSTEM_PROMPTS[target_lang]},
+                        {"role": "user", "content": user_content},
+                    ],
+                    temperature=0.3,
+                    timeout=OPENAI_TIMEOUT,
+                )
+                raw = (completion.choices[0].message.content or "").strip()
+                if raw.startswith("```"):
+                    raw = raw.split("```")[1]
+                    if raw.startswith("json"):
+                        raw = raw[4:]
+                    raw = raw.strip()
+                data = json.loads(raw) if raw else None
+                if not isinstance(data, list) or len(data) != len(texts):
+                    logger.warning(
+                        "translate_texts_batch: ожидали массив из %s строк, получили %s",
+                        len(texts),
+                        len(data) if isinstance(data, list) else type(data).__name__,
+                    )
+                    return [None] * len(texts)
+                return [(str(val).strip() or None) if val else None for val in data]
+            except json.JSONDecodeError as e:
+                logger.warning("translate_texts_batch: невалидный JSON: %s", e)
+                return [None] * len(texts)
+            except Exception as e:
+                is_retryable = (
+                    "connection" in str(e).lower() or "timeout" in str(e).lower()
+                ) and attempt < MAX_RETRIES - 1
+                if is_retryable:
+                    delay = min(INITIAL_DELAY_SEC * (2**attempt), MAX_DELAY_SEC)
+                    logger.warning(
+                        "translate_texts_batch: попытка %s/%s ошибка (%s), повтор через %.1f с",
+                        attempt + 1,
+                        MAX_RETRIES,
+                        e,
+                        delay,
+                    )
+                    time.sleep(delay)
+                else:
+                    logger.error("translate_texts_batch: ошибка OpenAI (пачка будет повторена): %s", e)
+                    return None
+        return None
+    finally:
+        _sync_semaphore.release()
@@ -0,0 +1,227 @@
+"""
+In-process снапшот событий «сегодня/завтра» по регионам для поиска рядом.
+
+Почти каждый тап по «Что рядом» запрашивает одно и то же: активные события bali/moscow/spb
+за сегодня или завтра. Снапшот хранит эти окна в памяти процесса (ключ — регион + смещение даты),
+а радиус считается по колонкам lat/lng без запроса в Postgres.
+
+Актуальность:
+  - запись (save_parser_event, create_user_event, cleanup_old_events, смена статуса) вызывает
+    invalidate() — снапшот региона сбрасывается, следующий поиск перечитывает окно;
+  - смена суток (get_today_start_utc региона) — снапшот со старым окном не отдается (rollover);
+  - TTL (EVENTS_SNAPSHOT_TTL_S) — страховка от записей из других процессов (API, воркеры).
+
+Фильтр «событие еще идет» (ends_at >= NOW() ...) зависит от текущего времени,
+поэтому применяется в памяти при каждом поиске, а не при загрузке окна.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import UTC, datetime, timedelta
+
+from utils.geo_utils import bbox_around
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_REGIONS = frozenset({"bali", "moscow", "spb"})
+SNAPSHOT_DATE_OFFSETS = frozenset({0, 1})
+
+EVENTS_SNAPSHOT_ENABLED = os.getenv("EVENTS_SNAPSHOT_ENABLED", "1").strip() == "1"
+EVENTS_SNAPSHOT_TTL_S = float(os.getenv("EVENTS_SNAPSHOT_TTL_S", "60"))
+# Больше событий в окне — снапшот не кэшируем, чтобы не держать в памяти пол-таблицы
+EVENTS_SNAPSHOT_MAX_EVENTS = int(os.getenv("EVENTS_SNAPSHOT_MAX_EVENTS", "5000"))
+
+_EARTH_RADIUS_KM = 6371.0
+# Как в SQL: событие без ends_at считается идущим 3 часа после начала
+_NO_END_GRACE = timedelta(hours=3)
+
+
+def _is_active(event: dict, now: datetime) -> bool:
+    ends_at = event.get("ends_at")
+    if ends_at is not None:
+        return ends_at >= now
+    starts_at = event.get("starts_at")
+    return starts_at is not None and starts_at >= now - _NO_END_GRACE
+
+
+class RegionSnapshot:
+    """
+    События окна [start_utc, end_utc) одного региона + колонки для радиусного поиска.
+
+    События с координатами отсортированы по lat: диапазон рамки находится бинарным поиском,
+    для точной дистанции заранее посчитаны sin/cos широты и долгота в радианах.
+    """
+
+    __slots__ = (
+        "region",
+        "date_offset",
+        "start_utc",
+        "end_utc",
+        "loaded_at",
+        "events",
+        "_lat",
+        "_lng_rad",
+        "_sin_lat",
+        "_cos_lat",
+    )
+
+    def __init__(self, region: str, date_offset: int, start_utc: datetime, end_utc: datetime, events: list[dict]):
+        self.region = region
+        self.date_offset = date_offset
+        self.start_utc = start_utc
+        self.end_utc = end_utc
+        self.loaded_at = time.monotonic()
+        self.events = sorted(
+            (e for e in events if e.get("lat") is not None and e.get("lng") is not None),
+            key=lambda e: e["lat"],
+        )
+        self._lat = array("d", (float(e["lat"]) for e in self.events))
+        self._lng_rad = array("d", (math.radians(float(e["lng"])) for e in self.events))
+        self._sin_lat = array("d", (math.sin(math.radians(lat)) for lat in self._lat))
+        self._cos_lat = array("d", (math.cos(math.radians(lat)) for lat in self._lat))
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def search(self, user_lat: float, user_lng: float, radius_km: float, now: datetime | None = None) -> list[dict]:
+        """
+        События в радиусе, которые еще не закончились: копии с distance_km,
+        порядок как у SQL-поиска — по starts_at, затем по distance_km.
+        """
+        now = now or datetime.now(UTC)
+        min_lat, max_lat, min_lng, max_lng = bbox_around(user_lat, user_lng, radius_km)
+
+        user_lng_rad = math.radians(user_lng)
+        user_sin = math.sin(math.radians(user_lat))
+        user_cos = math.cos(math.radians(user_lat))
+        min_lng_rad = math.radians(min_lng)
+        max_lng_rad = math.radians(max_lng)
+
+        lng_rad, sin_lat, cos_lat = self._lng_rad, self._sin_lat, self._cos_lat
+        found = []
+        for i in range(bisect_left(self._lat, min_lat), bisect_right(self._lat, max_lat)):
+            if not min_lng_rad <= lng_rad[i] <= max_lng_rad:
+                continue
+            cos_angle = user_cos * cos_lat[i] * math.cos(lng_rad[i] - user_lng_rad) + user_sin * sin_lat[i]
+            distance_km = _EARTH_RADIUS_KM * math.acos(max(-1.0, min(1.0, cos_angle)))
+            if distance_km > radius_km:
+                continue
+            event = self.events[i]
+            if not _is_active(event, now):
+                continue
+            found_event = event.copy()
+            found_event["distance_km"] = round(distance_km, 2)
+            found.append(found_event)
+
+        found.sort(key=lambda e: (e["starts_at"], e["distance_km"]))
+        return found
+
+
+class EventsSnapshotCache:
+    """Снапшоты по (регион, смещение даты) со счетчиками попаданий и поколениями для инвалидации."""
+
+    def __init__(
+        self,
+        ttl_s: float = EVENTS_SNAPSHOT_TTL_S,
+        max_events: int = EVENTS_SNAPSHOT_MAX_EVENTS,
+        enabled: bool = EVENTS_SNAPSHOT_ENABLED,
+    ):
+        self.ttl_s = ttl_s
+        self.max_events = max_events
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._snapshots: dict[tuple[str, int], RegionSnapshot] = {}
+        # Поколение региона растет при каждой инвалидации: загрузка, начатая до записи, не попадет в кэш
+        self._generations: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.rollovers = 0
+
+    def supports(self, city: str | None, date_offset: int) -> bool:
+        return self.enabled and city in SNAPSHOT_REGIONS and date_offset in SNAPSHOT_DATE_OFFSETS
+
+    def generation(self, region: str) -> int:
+        with self._lock:
+            return self._generations.get(region, 0)
+
+    def get(self, region: str, date_offset: int, start_utc: datetime) -> RegionSnapshot | None:
+        """Актуальный снапшот или None (промах: нет, устарел по TTL или сменились сутки региона)."""
+        key = (region, date_offset)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and snapshot.start_utc != start_utc:
+                del self._snapshots[key]
+                self.rollovers += 1
+                snapshot = None
+            elif snapshot is not None and time.monotonic() - snapshot.loaded_at > self.ttl_s:
+                del self._snapshots[key]
+                snapshot = None
+
+            if snapshot is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return snapshot
+
+    def build(
+        self,
+        region: str,
+        date_offset: int,
+        start_utc: datetime,
+        end_utc: datetime,
+        events: list[dict],
+        generation: int,
+    ) -> RegionSnapshot:
+        """
+        Собирает снапшот из загруженного окна и кэширует его, если за время загрузки
+        регион не инвалидировали и окно не слишком большое. Снапшот возвращается в любом случае —
+        текущий поиск обслуживается им же.
+        """
+        snapshot = RegionSnapshot(region, date_offset, start_utc, end_utc, events)
+        with self._lock:
+            if len(events) > self.max_events:
+                logger.info(
+                    "events_snapshot: %s/+%s не кэшируем — %s событий (лимит %s)",
+                    region,
+                    date_offset,
+                    len(events),
+                    self.max_events,
+                )
+            elif self._generations.get(region, 0) == generation:
+                self._snapshots[(region, date_offset)] = snapshot
+        return snapshot
+
+    def invalidate(self, region: str | None = None) -> None:
+        """Сбросить снапшоты региона (None — всех регионов)."""
+        with self._lock:
+            regions = SNAPSHOT_REGIONS if region is None else {region}
+            for name in regions:
+                self._generations[name] = self._generations.get(name, 0) + 1
+            for key in [k for k in self._snapshots if k[0] in regions]:
+                del self._snapshots[key]
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "rollovers": self.rollovers,
+                "snapshots": {
+                    f"{region}+{offset}": len(snapshot) for (region, offset), snapshot in self._snapshots.items()
+                },
+            }
+
+
+# Общий снапшот процесса бота
+events_snapshot = EventsSnapshotCache()
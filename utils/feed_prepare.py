@@ -0,0 +1,356 @@
+"""
+Подготовка событий к показу в ленте: тип события, ссылка на источник, фильтры локации и радиуса.
+
+Горячий путь поиска — вызывается на каждый запрос для всех найденных событий, поэтому
+по-событийные логи идут через HotPathLog, а в INFO пишется одна сводка на запрос.
+"""
+
+import logging
+from datetime import UTC, datetime
+from urllib.parse import urlparse
+
+from config import load_settings
+from logging_helpers import DropStats
+from utils.geo_utils import haversine_km
+from utils.structured_logging import HotPathLog
+from utils.telegram_source_visibility import is_public_telegram_event
+from venue_enrich import enrich_venue_from_text
+
+logger = logging.getLogger(__name__)
+
+BLACKLIST_DOMAINS = {"example.com", "example.org", "example.net"}
+
+
+def enrich_venue_name(e: dict) -> dict:
+    """
+    Обогащает событие названием места, если его нет
+    НЕ извлекает из названия события - использует только данные из БД (геокодирование)
+    """
+    # Проверяем venue_name из БД (должен быть из геокодирования)
+    if e.get("venue_name") and e.get("venue_name") not in [
+        "",
+        "Место проведения",
+        "Место не указано",
+    ]:
+        return e
+
+    # Проверяем location_name из БД (альтернативный источник)
+    if e.get("location_name") and e.get("location_name") not in [
+        "",
+        "Место проведения",
+        "Место не указано",
+        "Место по ссылке",
+    ]:
+        e["venue_name"] = e.get("location_name")
+        return e
+
+    # Если всё ещё пустое, используем fallback
+    # НЕ извлекаем из названия события - это неправильно!
+    if not e.get("venue_name") or e.get("venue_name") in [
+        "",
+        "Место проведения",
+        "Место не указано",
+    ]:
+        e["venue_name"] = "Локация"
+
+    return e
+
+
+def is_blacklisted_url(url: str) -> bool:
+    """
+    Проверяет, является ли URL в черном списке доменов
+    """
+    if not url:
+        return True
+    try:
+        p = urlparse(url)
+        host = p.netloc.lower()
+        return any(host == d or host.endswith("." + d) for d in BLACKLIST_DOMAINS)
+    except Exception:
+        return True
+
+
+def prepare_events_for_feed(
+    events: list[dict],
+    user_point: tuple[float, float] = None,
+    radius_km: float = None,
+    with_diag: bool = False,
+) -> tuple[list[dict], dict] | list[dict]:
+    """
+    Фильтрует события для показа в ленте с улучшенной диагностикой
+    Поддерживает три типа событий: source, user, ai_parsed
+    """
+    settings = load_settings()
+    drop = DropStats()
+    hot = HotPathLog(logger, "prepare_events_for_feed")
+    kept = []
+    kept_by_type = {"source": 0, "user": 0, "community": 0, "ai_parsed": 0}
+
+    for e in events:
+        # 0) Сначала обогащаем локацию из текста
+        e = enrich_venue_from_text(e)
+        if hot.debug:
+            hot.event(
+                "event",
+                "%s, coords: %s, %s, type: %s, source: %s",
+                e.get("title"),
+                e.get("lat"),
+                e.get("lng"),
+                e.get("type"),
+                e.get("source"),
+            )
+
+        # Определяем тип события согласно ТЗ
+        source = e.get("source", "")
+        input_type = e.get("type", "")
+        event_type = "source"  # по умолчанию
+
+        # Проверяем, является ли это событием от группы (community)
+        if source == "community" or input_type == "community":
+            event_type = "community"
+        # Проверяем, является ли это событием от пользователя (но не от группы)
+        elif input_type == "user" or source in ["user_created", "user"]:
+            event_type = "user"
+        # Проверяем, является ли это AI-парсингом
+        elif input_type in ["ai", "ai_parsed", "ai_generated"] or e.get("ai_parsed") or source == "ai_parsed":
+            event_type = input_type if input_type in ["ai", "ai_parsed", "ai_generated"] else "ai_parsed"
+        # Все остальное - источники
+        else:
+            event_type = "source"
+
+        # Добавляем поле type в событие
+        e["type"] = event_type
+
+        title = (e.get("title") or "").strip() or "—"
+
+        # 1) Проверяем URL согласно ТЗ
+        url = get_source_url(e)
+
+        # Для ai_parsed URL обязателен
+        if event_type == "ai_parsed" and not url:
+            drop.add("no_url", title)
+            continue
+
+        # Для user и community URL не обязателен
+        if event_type in ["user", "community"] and not url:
+            # Пользовательские события и события от групп могут не иметь URL
+            pass
+
+        # 2) Проверяем наличие локации (venue_name ИЛИ address ИЛИ coords)
+        venue = e.get("venue", {})
+        has_loc = any(
+            [
+                venue.get("name"),
+                venue.get("address"),
+                (venue.get("lat") is not None and venue.get("lon") is not None),
+                e.get("venue_name"),
+                e.get("address"),
+                (e.get("lat") is not None and e.get("lng") is not None),
+            ]
+        )
+
+        # Для source и ai*: пропускать события без URL И без локации
+        has_telegram_author = (
+            e.get("source") == "telegram"
+            and not is_public_telegram_event(e)
+            and (e.get("organizer_id") or e.get("organizer_username"))
+        )
+        if (
+            event_type in ["source", "ai_parsed", "ai", "ai_generated"]
+            and not url
+            and not has_loc
+            and not has_telegram_author
+        ):
+            drop.add("source_without_url_and_location", title)
+            continue
+
+        if not has_loc:
+            drop.add("no_venue_or_location", title)
+            continue
+
+        # 3) Специальные проверки для моментов пользователей
+        if event_type == "user":
+            # Проверяем TTL для моментов
+            expires_utc = e.get("expires_utc")
+            if expires_utc:
+                if isinstance(expires_utc, str):
+                    try:
+                        expires_utc = datetime.fromisoformat(expires_utc.replace("Z", "+00:00"))
+                    except Exception:
+                        drop.add("invalid_expires_time", title)
+                        continue
+
+                if expires_utc < datetime.now(UTC):
+                    drop.add("event_expired", title)
+                    continue
+
+            # Для пользовательских событий используем радиус пользователя
+            user_radius = radius_km
+            if user_point and user_radius is not None:
+                # Получаем координаты события
+                event_lat = None
+                event_lng = None
+
+                # Проверяем новую структуру venue
+                venue = e.get("venue", {})
+                if venue.get("lat") is not None and venue.get("lon") is not None:
+                    event_lat = venue.get("lat")
+                    event_lng = venue.get("lon")
+                # Проверяем старую структуру
+                elif e.get("lat") is not None and e.get("lng") is not None:
+                    event_lat = e.get("lat")
+                    event_lng = e.get("lng")
+
+                if event_lat is not None and event_lng is not None:
+                    # Вычисляем расстояние
+                    distance = haversine_km(user_point[0], user_point[1], event_lat, event_lng)
+                    if distance > user_radius:
+                        hot.event("user_out_of_radius", "'%s' - %.2fkm > %skm", title, distance, user_radius)
+                        drop.add("user_event_out_of_radius", title)
+                        continue
+                    hot.event("user_in_radius", "'%s' - %.2fkm <= %skm", title, distance, user_radius)
+                    # Добавляем расстояние к событию
+                    e["distance_km"] = round(distance, 2)
+
+        # 4) Проверяем радиус для обычных событий (если указан user_point и radius_km)
+        elif user_point and radius_km is not None:
+            # Получаем координаты события
+            event_lat = None
+            event_lng = None
+
+            # Проверяем новую структуру venue
+            venue = e.get("venue", {})
+            if venue.get("lat") is not None and venue.get("lon") is not None:
+                event_lat = venue.get("lat")
+                event_lng = venue.get("lon")
+            # Проверяем старую структуру
+            elif e.get("lat") is not None and e.get("lng") is not None:
+                event_lat = e.get("lat")
+                event_lng = e.get("lng")
+
+            if event_lat is not None and event_lng is not None:
+                # Вычисляем расстояние
+                distance = haversine_km(user_point[0], user_point[1], event_lat, event_lng)
+                if distance > radius_km:
+                    drop.add("out_of_radius", title)
+                    continue
+                # Добавляем расстояние к событию
+                e["distance_km"] = round(distance, 2)
+
+        # 5) Проверяем доменные/спам-правила (только для событий с URL)
+        if url and is_blacklisted_url(url):
+            drop.add("blacklist_domain", title)
+            continue
+
+        # 6) Проверяем AI_GENERATE_SYNTHETIC флаг
+        if event_type == "ai_parsed" and not settings.ai_generate_synthetic:
+            # Если AI генерация запрещена, проверяем что у события есть валидный URL
+            if not url or not sanitize_url(url):
+                drop.add("ai_synthetic_blocked", title)
+                continue
+
+        # OK — оставляем событие
+        e = enrich_venue_name(e)
+
+        # Логируем пользовательские события
+        if event_type == "user":
+            hot.event(
+                "user_kept",
+                "'%s', organizer_id=%s, organizer_username='%s'",
+                title,
+                e.get("organizer_id"),
+                e.get("organizer_username"),
+            )
+
+        kept.append(e)
+        kept_by_type[event_type] = kept_by_type.get(event_type, 0) + 1
+
+    # Логируем сводку: одна строка на запрос
+    if logger.isEnabledFor(logging.INFO):
+        radius_info = (
+            f"radius_km={radius_km}, user_point=({user_point[0]:.4f},{user_point[1]:.4f})"
+            if user_point and radius_km is not None
+            else "no_radius_filter"
+        )
+        hot.summary("%s | %s", drop.summary(kept_by_type=kept_by_type, total=len(events)), radius_info)
+
+    diag = {
+        "in": len(events),
+        "kept": len(kept),
+        "dropped": sum(drop.reasons.values()),
+        "found_by_stream": {
+            "source": kept_by_type["source"],
+            "ai_parsed": kept_by_type["ai_parsed"],
+        },
+        "kept_by_type": kept_by_type,
+        "reasons": list(drop.reasons.keys()),
+        "reasons_top3": [f"{r}({n})" for r, n in drop.reasons.most_common(3)],
+    }
+
+    return (kept, diag) if with_diag else kept
+
+
+def get_source_url(e: dict) -> str | None:
+    """Единая точка истины для получения URL источника согласно ТЗ"""
+    t = e.get("type")
+    candidates: list[str | None] = []
+
+    if t == "source":
+        # Закрытая telegram-группа: в ленте контакт автора, не ссылка на пост
+        if e.get("source") == "telegram" and not is_public_telegram_event(e):
+            return None
+        # Для источников: url > booking_url > ticket_url > source_url
+        candidates = [
+            e.get("url"),
+            e.get("booking_url"),
+            e.get("ticket_url"),
+            e.get("source_url"),
+            e.get("link"),
+            e.get("community_link") if e.get("source") == "telegram" else None,
+        ]
+    elif t in ("ai", "ai_parsed", "ai_generated"):
+        # Для AI-парсинга: source_url > url > original_url > location_url
+        candidates = [e.get("source_url"), e.get("url"), e.get("original_url"), e.get("location_url")]
+    elif t == "user":
+        # Для пользовательских событий URL не обязателен
+        candidates = [e.get("author_url"), e.get("chat_url")]
+    else:
+        # Fallback для неизвестных типов
+        candidates = [e.get("source_url"), e.get("url"), e.get("link")]
+
+    for u in candidates:
+        if u:
+            sanitized = sanitize_url(u)
+            if sanitized:
+                # Если есть реферальный код, добавляем его к URL
+                referral_code = e.get("referral_code")
+                if referral_code:
+                    from utils.referral_url import add_referral_to_url
+
+                    referral_param = e.get("referral_param", "ref")
+                    return add_referral_to_url(sanitized, referral_code, referral_param)
+                return sanitized
+    return None  # нет реального источника — лучше не показывать ссылку
+
+
+def sanitize_url(u: str | None) -> str | None:
+    """Фильтрует мусорные URL включая example.com"""
+    if not u:
+        return None
+    try:
+        p = urlparse(u)
+    except Exception:
+        return None
+    if p.scheme not in ("http", "https") or not p.netloc:
+        return None
+    host = p.netloc.lower()
+    if any(host == d or host.endswith("." + d) for d in BLACKLIST_DOMAINS):
+        return None
+    # Разрешаем Google Calendar ссылки с параметрами события
+    if "calendar.google.com" in host:
+        # Проверяем наличие параметров события
+        if any(param in u for param in ["eid=", "event=", "cid="]):
+            return u
+        # Отбрасываем пустые календарные ссылки
+        return None
+    return u
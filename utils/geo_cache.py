@@ -0,0 +1,172 @@
+"""
+Двухуровневый cache-aside для геокодинга, reverse geocoding и часовых поясов Google.
+
+Уровень 1 — LRU в памяти процесса с TTL (utils.cache.TTLCache), уровень 2 — таблица geo_cache в Postgres
+(миграция 056), общая для бота, API и воркеров. Промах по обоим уровням — запрос в Google,
+положительный ответ записывается в оба уровня.
+
+Ключи:
+  - geocode: язык + нормализованный адрес (нижний регистр, схлопнутые пробелы);
+  - reverse: язык + координаты, округленные до 4 знаков (~11 м);
+  - timezone: координаты, округленные до 2 знаков (~1 км) — зона не меняется на таком масштабе;
+  - nominatim: как geocode, для геокодинга через OSM Nominatim (api/normalize.geocode_one в AI-инжесте).
+
+Если таблицы нет или БД недоступна, работает только память (уровень 2 пробуется снова через минуту).
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import text
+
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GEO_CACHE_MEMORY_SIZE = int(os.getenv("GEO_CACHE_MEMORY_SIZE", "5000"))
+GEO_CACHE_TTL_S = {
+    "geocode": int(os.getenv("GEO_CACHE_GEOCODE_TTL_S", str(30 * 86400))),
+    "reverse": int(os.getenv("GEO_CACHE_REVERSE_TTL_S", str(30 * 86400))),
+    "timezone": int(os.getenv("GEO_CACHE_TIMEZONE_TTL_S", str(180 * 86400))),
+    "nominatim": int(os.getenv("GEO_CACHE_NOMINATIM_TTL_S", str(30 * 86400))),
+}
+# Пауза перед повторной попыткой уровня 2 после ошибки БД
+_DB_RETRY_S = 60
+
+
+def geocode_key(address: str, language: str | None = None) -> str:
+    return f"{language or ''}:{' '.join((address or '').lower().split())}"
+
+
+def reverse_key(lat: float, lng: float, language: str | None = None) -> str:
+    return f"{language or ''}:{lat:.4f},{lng:.4f}"
+
+
+def timezone_key(lat: float, lng: float) -> str:
+    return f"{lat:.2f},{lng:.2f}"
+
+
+def _default_engine():
+    import database
+
+    return database.engine
+
+
+class GeoCache:
+    """LRU+TTL в памяти перед таблицей geo_cache; считает сэкономленные запросы к Google."""
+
+    def __init__(self, maxsize: int = GEO_CACHE_MEMORY_SIZE, engine_getter=_default_engine):
+        self.maxsize = maxsize
+        self._engine_getter = engine_getter
+        self._lock = threading.Lock()
+        # (kind, key) -> value; TTL у каждой записи свой (по kind или по expires_at из БД)
+        self._memory = TTLCache("geo", maxsize=maxsize)
+        self._db_retry_at = 0.0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def _memory_get(self, kind: str, key: str) -> Any | None:
+        return self._memory.get((kind, key))
+
+    def _memory_set(self, kind: str, key: str, value: Any, expires_at: float) -> None:
+        self._memory.set((kind, key), value, ttl_s=expires_at - time.time())
+
+    def _db_engine(self):
+        if time.monotonic() < self._db_retry_at:
+            return None
+        return self._engine_getter()
+
+    def _db_failed(self, action: str, error: Exception) -> None:
+        self._db_retry_at = time.monotonic() + _DB_RETRY_S
+        logger.warning(f"⚠️ geo_cache: {action} в БД не удался, временно работаем только с памятью: {error}")
+
+    def _db_get(self, kind: str, key: str) -> tuple[Any, float] | None:
+        engine = self._db_engine()
+        if engine is None:
+            return None
+        try:
+            with engine.connect() as conn:
+                row = conn.execute(
+                    text("""
+                        SELECT value, EXTRACT(EPOCH FROM expires_at)
+                        FROM geo_cache
+                        WHERE kind = :kind AND cache_key = :key AND expires_at > NOW()
+                    """),
+                    {"kind": kind, "key": key},
+                ).fetchone()
+        except Exception as e:
+            self._db_failed("чтение", e)
+            return None
+        if row is None:
+            return None
+        return row[0], float(row[1])
+
+    def _db_set(self, kind: str, key: str, value: Any, ttl_s: int) -> None:
+        engine = self._db_engine()
+        if engine is None:
+            return
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO geo_cache (kind, cache_key, value, expires_at)
+                        VALUES (:kind, :key, CAST(:value AS JSONB), NOW() + make_interval(secs => :ttl_s))
+                        ON CONFLICT (kind, cache_key) DO UPDATE SET
+                            value = EXCLUDED.value,
+                            created_at = NOW(),
+                            expires_at = EXCLUDED.expires_at
+                    """),
+                    {"kind": kind, "key": key, "value": json.dumps(value), "ttl_s": ttl_s},
+                )
+        except Exception as e:
+            self._db_failed("запись", e)
+
+    async def get(self, kind: str, key: str) -> Any | None:
+        """Значение из памяти или из БД (с подъемом в память); None — промах, нужен запрос в API."""
+        value = self._memory_get(kind, key)
+        if value is not None:
+            with self._lock:
+                self.memory_hits += 1
+            return value
+
+        found = await asyncio.to_thread(self._db_get, kind, key)
+        if found is not None:
+            value, expires_at = found
+            self._memory_set(kind, key, value, expires_at)
+            with self._lock:
+                self.db_hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    async def set(self, kind: str, key: str, value: Any) -> None:
+        ttl_s = GEO_CACHE_TTL_S[kind]
+        self._memory_set(kind, key, value, time.time() + ttl_s)
+        await asyncio.to_thread(self._db_set, kind, key, value, ttl_s)
+
+    def record_api_call(self) -> None:
+        with self._lock:
+            self.api_calls += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "api_calls": self.api_calls,
+                "api_calls_saved": self.memory_hits + self.db_hits,
+                "memory_size": len(self._memory),
+            }
+
+
+geo_cache = GeoCache()
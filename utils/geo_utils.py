@@ -3,17 +3,38 @@ from __future__ import annotations
 import logging
 import math
 import re
+from contextlib import asynccontextmanager
 from datetime import datetime
 from html import unescape
 from urllib.parse import parse_qs, unquote, urljoin, urlparse
 from zoneinfo import ZoneInfo
 
-import httpx
-
 from config import load_settings
+from utils.geo_cache import geo_cache, geocode_key, reverse_key, timezone_key
+from utils.http_clients import close_async_clients, get_async_client
+from utils.metrics import registry
 
 logger = logging.getLogger(__name__)
 
+
+GOOGLE_API_CALLS = registry.counter("google_api_calls_total", "Запросы к Google Maps API", ("api",))
+GOOGLE_API_SECONDS = registry.histogram("google_api_duration_seconds", "Запрос к Google Maps API", ("api",))
+
+
+@asynccontextmanager
+async def _google_http(api: str):
+    """Общий клиент Google текущего event loop (utils/http_clients); каждый вход — один запрос к API."""
+    geo_cache.record_api_call()
+    GOOGLE_API_CALLS.labels(api).inc()
+    with GOOGLE_API_SECONDS.labels(api).time():
+        yield get_async_client("google")
+
+
+async def close_google_http() -> None:
+    """Закрыть общие HTTP-клиенты текущего event loop (при остановке бота/API)."""
+    await close_async_clients()
+
+
 _MAPS_SHORT_URL_RE = re.compile(
     r"(?:https?://)?(?:(?:maps\.app\.)?goo\.gl/maps|maps\.app\.goo\.gl)/[A-Za-z0-9_-]+(?:\?[A-Za-z0-9_=&%.-]*)?",
     re.IGNORECASE,
@@ -39,16 +60,28 @@ async def geocode_address(
     if not settings.google_maps_api_key:
         return None
 
+    key = geocode_key(address, language)
+    cached = await geo_cache.get("geocode", key)
+    if cached is not None:
+        return float(cached[0]), float(cached[1])
+
+    coords = await _geocode_address_api(address, language, settings.google_maps_api_key)
+    if coords is not None:
+        await geo_cache.set("geocode", key, list(coords))
+    return coords
+
+
+async def _geocode_address_api(address: str, language: str | None, api_key: str) -> tuple[float, float] | None:
     # Простой геокодинг без сложной логики привязки к регионам
     # language: язык ответа (en, ru) — названия мест вернутся на выбранном языке
     params = {
         "address": address,
-        "key": settings.google_maps_api_key,
+        "key": api_key,
     }
     if language:
         params["language"] = language
 
-    async with httpx.AsyncClient(timeout=15) as client:
+    async with _google_http("geocode") as client:
         r = await client.get("https://maps.googleapis.com/maps/api/geocode/json", params=params)
         r.raise_for_status()
         data = r.json()
@@ -136,6 +169,18 @@ async def reverse_geocode(lat: float, lng: float, language: str | None = None) -
     if not settings.google_maps_api_key:
         return None
 
+    key = reverse_key(lat, lng, language)
+    cached = await geo_cache.get("reverse", key)
+    if cached is not None:
+        return cached
+
+    name = await _reverse_geocode_api(lat, lng, language, settings)
+    if name:
+        await geo_cache.set("reverse", key, name)
+    return name
+
+
+async def _reverse_geocode_api(lat: float, lng: float, language: str | None, settings) -> str | None:
     params = {
         "latlng": f"{lat:.6f},{lng:.6f}",
         "key": settings.google_maps_api_key,
@@ -155,7 +200,7 @@ async def reverse_geocode(lat: float, lng: float, language: str | None = None) -
             }
             if language:
                 places_params["language"] = language
-            async with httpx.AsyncClient(timeout=15) as client:
+            async with _google_http("nearbysearch") as client:
                 places_r = await client.get(
                     "https://maps.googleapis.com/maps/api/place/nearbysearch/json",
                     params=places_params,
@@ -174,7 +219,7 @@ async def reverse_geocode(lat: float, lng: float, language: str | None = None) -
             pass
 
         # Используем Geocoding API как fallback
-        async with httpx.AsyncClient(timeout=15) as client:
+        async with _google_http("reverse_geocode") as client:
             r = await client.get("https://maps.googleapis.com/maps/api/geocode/json", params=params)
             r.raise_for_status()
             data = r.json()
@@ -248,14 +293,28 @@ async def get_timezone(lat: float, lng: float, timestamp: int | None = None) ->
     settings = load_settings()
     if not settings.google_maps_api_key:
         return None
+
+    # timeZoneId от timestamp не зависит (меняется только смещение DST), поэтому в ключе его нет
+    key = timezone_key(lat, lng)
+    cached = await geo_cache.get("timezone", key)
+    if cached is not None:
+        return cached
+
+    tz_name = await _get_timezone_api(lat, lng, timestamp, settings.google_maps_api_key)
+    if tz_name:
+        await geo_cache.set("timezone", key, tz_name)
+    return tz_name
+
+
+async def _get_timezone_api(lat: float, lng: float, timestamp: int | None, api_key: str) -> str | None:
     if timestamp is None:
         timestamp = int(datetime.utcnow().timestamp())
     params = {
         "location": f"{lat:.6f},{lng:.6f}",
         "timestamp": timestamp,
-        "key": settings.google_maps_api_key,
+        "key": api_key,
     }
-    async with httpx.AsyncClient(timeout=15) as client:
+    async with _google_http("timezone") as client:
         r = await client.get("https://maps.googleapis.com/maps/api/timezone/json", params=params)
         r.raise_for_status()
         data = r.json()
@@ -342,7 +401,7 @@ async def get_coordinates_from_place_id(place_id: str) -> tuple[float, float] |
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
+        async with _google_http("place_details") as client:
             r = await client.get("https://maps.googleapis.com/maps/api/place/details/json", params=params)
             r.raise_for_status()
             data = r.json()
@@ -378,7 +437,7 @@ async def search_nearby_places(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=15) as client:
+        async with _google_http("nearbysearch") as client:
             r = await client.get("https://maps.googleapis.com/maps/api/place/nearbysearch/json", params=params)
             r.raise_for_status()
             data = r.json()
@@ -895,21 +954,20 @@ async def expand_short_url(short_url: str) -> str | None:
     try:
         # Сразу проходим всю цепочку редиректов: первый Location часто промежуточный,
         # финальный URL надёжнее для паттернов @lat,lng и /place/.../data=...
-        async with httpx.AsyncClient(follow_redirects=True, timeout=15, headers=headers) as client:
-            response = await client.get(short_url)
-            final_url = str(response.url)
-            logger.debug("[expand_short_url] GET (follow) %s final=%s", response.status_code, final_url)
+        client = get_async_client("google")
+        response = await client.get(short_url, headers=headers, follow_redirects=True)
+        final_url = str(response.url)
+        logger.debug("[expand_short_url] GET (follow) %s final=%s", response.status_code, final_url)
 
-            if final_url and final_url != short_url and ("google." in final_url and "maps" in final_url):
-                return final_url
+        if final_url and final_url != short_url and ("google." in final_url and "maps" in final_url):
+            return final_url
 
-            candidate = _extract_maps_url_from_html(response.text, short_url)
-            if candidate:
-                return candidate
+        candidate = _extract_maps_url_from_html(response.text, short_url)
+        if candidate:
+            return candidate
 
         # Fallback: один шаг по Location (если follow не дал распознаваемый maps URL)
-        async with httpx.AsyncClient(follow_redirects=False, timeout=15, headers=headers) as client:
-            response = await client.get(short_url)
+        response = await client.get(short_url, headers=headers, follow_redirects=False)
         logger.debug("[expand_short_url] GET (no redirect) %s %s", response.status_code, short_url)
 
         if response.status_code in [301, 302, 303, 307, 308]:
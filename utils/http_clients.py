@@ -0,0 +1,427 @@
+"""
+Общий слой исходящих HTTP-запросов: реестр httpx-клиентов по сервисам.
+
+У каждого внешнего сервиса (Google, статические карты, KudaGo, BaliForum, ICS, Nominatim...)
+свой пул соединений с keep-alive, HTTP/2 (если установлен пакет h2), лимит частоты запросов
+на хост, circuit breaker и метрики (запросы, ошибки, задержка). Все это живет в транспорте
+клиента, поэтому вызывающий код работает с обычным httpx.AsyncClient / httpx.Client.
+
+  - get_async_client(service) — общий клиент сервиса для текущего event loop
+    (часть вызовов идет через asyncio.run в отдельных потоках, клиент нельзя делить между loop'ами);
+  - new_async_client(service) — клиент, которым владеет вызывающий (пул на один прогон парсера),
+    с теми же лимитами, breaker'ом и метриками;
+  - get_sync_client(service) — общий синхронный клиент процесса (планировщик ICS, Nominatim).
+
+Ошибкой для breaker'а и метрик считаются сетевые ошибки, 5xx и 429 (и 4xx, если сервис так настроен).
+Пока breaker открыт, запросы к сервису сразу завершаются CircuitOpenError без обращения в сеть.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+import httpx
+
+from utils.metrics import observe_call, registry
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+# Сколько последних задержек хранить на сервис для перцентилей
+LATENCY_WINDOW = 200
+
+
+@dataclass(frozen=True)
+class ServiceConfig:
+    timeout_s: float = 15.0
+    max_connections: int = 20
+    max_keepalive: int = 10
+    http2: bool = True
+    follow_redirects: bool = False
+    headers: dict[str, str] = field(default_factory=dict)
+    # Минимальный интервал между стартами запросов к одному хосту (0 — без лимита)
+    min_interval_s: float = 0.0
+    # Breaker открывается после breaker_fails ошибок подряд на breaker_cooldown_s (0 — без breaker'а)
+    breaker_fails: int = 5
+    breaker_cooldown_s: float = 60.0
+    # Считать ли 4xx ошибкой сервиса (например, неверный ключ Static Maps)
+    fail_on_4xx: bool = False
+    # Ожидаемый content-type успешного ответа: Static Maps при проблемах с ключом отдает HTML со статусом 200
+    expect_content_type: str | None = None
+
+
+SERVICES: dict[str, ServiceConfig] = {
+    "default": ServiceConfig(),
+    "google": ServiceConfig(timeout_s=15, max_connections=20, max_keepalive=10),
+    "static_maps": ServiceConfig(
+        timeout_s=5, max_connections=10, max_keepalive=5, breaker_fails=3, fail_on_4xx=True, expect_content_type="image"
+    ),
+    "kudago": ServiceConfig(
+        timeout_s=8,
+        max_connections=10,
+        max_keepalive=10,
+        headers={
+            "User-Agent": "events-bot/1.0 (+ok)",
+            "Accept": "application/json",
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+            "Referer": "https://kudago.com/",
+        },
+        # Как и раньше без HTTP/2; частоту ограничивает RateLimiter источника, таймауты — safe mode
+        http2=False,
+        breaker_fails=0,
+    ),
+    "baliforum": ServiceConfig(
+        timeout_s=15,
+        max_connections=int(os.getenv("BALIFORUM_CONCURRENCY", "6")),
+        max_keepalive=int(os.getenv("BALIFORUM_CONCURRENCY", "6")),
+        follow_redirects=True,
+        # Общий на процесс: параллельные прогоны «сегодня» и «завтра» делят один лимит
+        min_interval_s=float(os.getenv("BALIFORUM_MIN_INTERVAL_S", "0.1")),
+    ),
+    "meetup": ServiceConfig(timeout_s=30, max_connections=5, max_keepalive=5),
+    "ics": ServiceConfig(timeout_s=20, max_connections=10, max_keepalive=5, follow_redirects=True, breaker_fails=0),
+    "nexudus": ServiceConfig(timeout_s=20, max_connections=4, max_keepalive=4, follow_redirects=True),
+    # Политика Nominatim: не больше одного запроса в секунду
+    "nominatim": ServiceConfig(timeout_s=15, max_connections=2, max_keepalive=2, min_interval_s=1.0),
+    "ai_ingest": ServiceConfig(timeout_s=30, follow_redirects=True, breaker_fails=0),
+}
+
+
+def service_config(service: str) -> ServiceConfig:
+    return SERVICES.get(service) or SERVICES["default"]
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Запрос не отправлен: circuit breaker сервиса открыт."""
+
+
+class CircuitBreaker:
+    """Предохранитель по числу ошибок подряд; потокобезопасный, общий для всех клиентов сервиса."""
+
+    def __init__(self, fail_threshold: int = 5, cooldown_s: float = 60.0):
+        self.fail_threshold = fail_threshold
+        self.cooldown_s = cooldown_s
+        self._lock = threading.Lock()
+        self.fails = 0
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        """Закрыт или истек cooldown (тогда пропускаем пробный запрос)."""
+        return self.fail_threshold <= 0 or time.time() >= self.open_until
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.fails = 0
+
+    def record_failure(self) -> None:
+        if self.fail_threshold <= 0:
+            return
+        with self._lock:
+            self.fails += 1
+            if self.fails >= self.fail_threshold:
+                self.open_until = time.time() + self.cooldown_s
+                logger.warning("Circuit breaker открыт на %.0f с после %s ошибок подряд", self.cooldown_s, self.fails)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.fails = 0
+            self.open_until = 0.0
+
+    def status(self) -> dict[str, Any]:
+        now = time.time()
+        return {
+            "is_open": self.open_until > now,
+            "fails_count": self.fails,
+            "open_until": self.open_until,
+            "seconds_until_reset": max(0, int(self.open_until - now)),
+        }
+
+
+class HostRateLimiter:
+    """
+    Не чаще одного запроса в min_interval_s на хост (паузы между стартами запросов, не между ответами).
+
+    Слот резервируется под threading.Lock, а ждут уже снаружи, поэтому один лимитер можно
+    делить между event loop'ами и потоками.
+    """
+
+    def __init__(self, min_interval_s: float = 0.0):
+        self.min_interval_s = min_interval_s
+        self._next_at: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host: str) -> float:
+        """Занимает ближайший слот хоста; возвращает, сколько секунд до него ждать."""
+        if self.min_interval_s <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_at.get(host, now))
+            self._next_at[host] = start_at + self.min_interval_s
+        return start_at - now
+
+    async def wait(self, host: str) -> None:
+        delay = self.reserve(host)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def wait_sync(self, host: str) -> None:
+        delay = self.reserve(host)
+        if delay > 0:
+            time.sleep(delay)
+
+
+HTTP_REQUESTS = registry.counter("http_client_requests_total", "Исходящие HTTP-запросы", ("service", "status"))
+HTTP_SECONDS = registry.histogram("http_client_request_duration_seconds", "Исходящий HTTP-запрос", ("service",))
+HTTP_REJECTED = registry.counter("http_client_breaker_rejected_total", "Запросы, отклоненные breaker'ом", ("service",))
+
+
+class UpstreamMetrics:
+    """Счетчики и окно последних задержек одного сервиса (дублируются в utils.metrics для /metrics)."""
+
+    def __init__(self, service: str = "default"):
+        self.service = service
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.rate_limit_wait_s = 0.0
+        self.status_counts: dict[str, int] = {}
+        self._latencies_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, latency_ms: float, status: int | None, failed: bool, waited_s: float) -> None:
+        with self._lock:
+            self.requests += 1
+            if failed:
+                self.errors += 1
+            bucket = f"{status // 100}xx" if status else "network_error"
+            self.status_counts[bucket] = self.status_counts.get(bucket, 0) + 1
+            self.rate_limit_wait_s += waited_s
+            self._latencies_ms.append(latency_ms)
+        HTTP_REQUESTS.labels(self.service, bucket).inc()
+        HTTP_SECONDS.labels(self.service).observe(latency_ms / 1000)
+        observe_call("http", self.service, latency_ms / 1000)
+
+    def record_rejected(self) -> None:
+        with self._lock:
+            self.rejected += 1
+        HTTP_REJECTED.labels(self.service).inc()
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies_ms)
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected_by_breaker": self.rejected,
+                "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+                "status": dict(self.status_counts),
+                "rate_limit_wait_s": round(self.rate_limit_wait_s, 3),
+                "latency_avg_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+                "latency_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+            }
+
+
+class _Upstream:
+    """Общее состояние сервиса: breaker, лимитер и метрики (одни на процесс)."""
+
+    def __init__(self, service: str, config: ServiceConfig):
+        self.breaker = CircuitBreaker(config.breaker_fails, config.breaker_cooldown_s)
+        self.limiter = HostRateLimiter(config.min_interval_s)
+        self.metrics = UpstreamMetrics(service)
+        self.fail_on_4xx = config.fail_on_4xx
+        self.expect_content_type = config.expect_content_type
+
+    def is_failure(self, response: httpx.Response) -> bool:
+        status = response.status_code
+        if status >= 500 or status == 429 or (self.fail_on_4xx and 400 <= status < 500):
+            return True
+        if self.expect_content_type and status == 200:
+            return self.expect_content_type not in response.headers.get("content-type", "").lower()
+        return False
+
+    def before(self) -> None:
+        if not self.breaker.allow():
+            self.metrics.record_rejected()
+            raise CircuitOpenError("circuit breaker is open")
+
+    def after(self, started: float, waited_s: float, response: httpx.Response | None) -> None:
+        failed = response is None or self.is_failure(response)
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        status = response.status_code if response is not None else None
+        self.metrics.record((time.perf_counter() - started) * 1000, status, failed, waited_s)
+
+
+_upstreams: dict[str, _Upstream] = {}
+_upstreams_lock = threading.Lock()
+
+
+def _upstream(service: str) -> _Upstream:
+    upstream = _upstreams.get(service)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.setdefault(service, _Upstream(service, service_config(service)))
+    return upstream
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    return _upstream(service).breaker
+
+
+class InstrumentedAsyncTransport(httpx.AsyncBaseTransport):
+    """Транспорт-обертка: breaker → лимит на хост → запрос → метрики."""
+
+    def __init__(self, service: str, inner: httpx.AsyncBaseTransport):
+        self.service = service
+        self._inner = inner
+        self._upstream = _upstream(service)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = self._upstream
+        upstream.before()
+        waited = time.perf_counter()
+        await upstream.limiter.wait(request.url.host)
+        started = time.perf_counter()
+        try:
+            response = await self._inner.handle_async_request(request)
+        except Exception:
+            upstream.after(started, started - waited, None)
+            raise
+        upstream.after(started, started - waited, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+class InstrumentedTransport(httpx.BaseTransport):
+    """Синхронный вариант InstrumentedAsyncTransport."""
+
+    def __init__(self, service: str, inner: httpx.BaseTransport):
+        self.service = service
+        self._inner = inner
+        self._upstream = _upstream(service)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = self._upstream
+        upstream.before()
+        waited = time.perf_counter()
+        upstream.limiter.wait_sync(request.url.host)
+        started = time.perf_counter()
+        try:
+            response = self._inner.handle_request(request)
+        except Exception:
+            upstream.after(started, started - waited, None)
+            raise
+        upstream.after(started, started - waited, response)
+        return response
+
+    def close(self) -> None:
+        self._inner.close()
+
+
+def _client_kwargs(config: ServiceConfig, overrides: dict[str, Any]) -> tuple[dict[str, Any], httpx.Limits]:
+    limits = overrides.pop("limits", None) or httpx.Limits(
+        max_connections=config.max_connections, max_keepalive_connections=config.max_keepalive
+    )
+    kwargs = {
+        "timeout": config.timeout_s,
+        "follow_redirects": config.follow_redirects,
+        "headers": {**config.headers, **(overrides.pop("headers", None) or {})},
+    }
+    kwargs.update(overrides)
+    return kwargs, limits
+
+
+def new_async_client(
+    service: str, *, transport: httpx.AsyncBaseTransport | None = None, **overrides: Any
+) -> httpx.AsyncClient:
+    """Новый клиент сервиса (закрывает вызывающий); overrides — аргументы httpx.AsyncClient поверх конфига."""
+    config = service_config(service)
+    kwargs, limits = _client_kwargs(config, overrides)
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(http2=config.http2 and HTTP2_AVAILABLE, limits=limits)
+    return httpx.AsyncClient(transport=InstrumentedAsyncTransport(service, transport), **kwargs)
+
+
+def new_sync_client(service: str, *, transport: httpx.BaseTransport | None = None, **overrides: Any) -> httpx.Client:
+    config = service_config(service)
+    kwargs, limits = _client_kwargs(config, overrides)
+    if transport is None:
+        transport = httpx.HTTPTransport(http2=config.http2 and HTTP2_AVAILABLE, limits=limits)
+    return httpx.Client(transport=InstrumentedTransport(service, transport), **kwargs)
+
+
+# loop -> {service: client}
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_sync_clients: dict[str, httpx.Client] = {}
+_sync_lock = threading.Lock()
+
+
+def get_async_client(service: str) -> httpx.AsyncClient:
+    """Общий клиент сервиса для текущего event loop (вызывать из корутины)."""
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(service)
+    if client is None or client.is_closed:
+        client = new_async_client(service)
+        clients[service] = client
+    return client
+
+
+def get_sync_client(service: str) -> httpx.Client:
+    """Общий синхронный клиент сервиса на процесс (httpx.Client потокобезопасен)."""
+    client = _sync_clients.get(service)
+    if client is None or client.is_closed:
+        with _sync_lock:
+            client = _sync_clients.get(service)
+            if client is None or client.is_closed:
+                client = new_sync_client(service)
+                _sync_clients[service] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """Закрыть общие клиенты текущего event loop (при остановке бота/API)."""
+    clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_sync_clients() -> None:
+    with _sync_lock:
+        clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in clients:
+        client.close()
+
+
+def upstream_stats() -> dict[str, dict[str, Any]]:
+    """Метрики и состояние breaker'а по каждому сервису, к которому были запросы (для /health)."""
+    return {
+        service: {**upstream.metrics.snapshot(), "breaker": upstream.breaker.status()}
+        for service, upstream in sorted(_upstreams.items())
+    }
+
+
+def _collect_breakers():
+    samples = [
+        ({"service": service}, 1 if upstream.breaker.status()["is_open"] else 0)
+        for service, upstream in sorted(_upstreams.items())
+    ]
+    return [("http_client_breaker_open", "gauge", "Breaker сервиса открыт (1) или закрыт (0)", samples)]
+
+
+registry.register_collector(_collect_breakers)
@@ -0,0 +1,263 @@
+"""
+Аренда задач планировщика через таблицу scheduler_jobs.
+
+APScheduler крутится в каждом процессе, где запущен ModernEventScheduler (бот, воркер
+workers/scheduler.py, их реплики), а выполняет срабатывание только тот процесс, которому
+удался условный UPDATE строки задачи:
+  - аренды нет или она истекла (упавший процесс не держит задачу дольше JOB_LEASE_TTL_S);
+  - с прошлого старта прошло не меньше min_interval_s — реплика, у которой интервальный
+    таймер сработал на пару минут позже, этот период пропускает.
+Пока задача идет, поток-heartbeat продлевает аренду каждые JOB_LEASE_TTL_S / 3.
+Все сроки (аренда, старт, финиш) считаются по часам сервера БД: расхождение часов реплик
+не дает перехватить чужую аренду раньше времени.
+
+По завершении в scheduler_jobs пишется итог (длительность, статус, последняя ошибка, счетчики),
+в scheduler_job_runs — строка истории. Задачи сами ловят и логируют свои исключения, поэтому
+ошибкой считается и ERROR в логе из потока задачи: статус "errors" (задача дошла до конца)
+или "failed" (вылетело исключение).
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import DateTime, delete, func, insert, or_, select, type_coerce, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import SchedulerJob, SchedulerJobRun
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+JOB_LEASE_TTL_S = float(os.getenv("JOB_LEASE_TTL_S", "600"))
+JOB_RUNS_KEEP_DAYS = int(os.getenv("JOB_RUNS_KEEP_DAYS", "30"))
+
+_JOBS = SchedulerJob.__table__
+_RUNS = SchedulerJobRun.__table__
+_ERROR_MAX_LEN = 2000
+
+JOB_RUNS = registry.counter(
+    "scheduler_job_runs_total", "Срабатывания задач планировщика: ok / errors / failed / skipped", ("job", "result")
+)
+JOB_SECONDS = registry.histogram(
+    "scheduler_job_duration_seconds",
+    "Длительность задач планировщика",
+    ("job",),
+    buckets=(1, 5, 15, 60, 300, 900, 1800, 3600),
+)
+
+
+def _default_engine():
+    import database
+
+    return database.engine
+
+
+def _db_now(dialect_name: str, offset_s: float = 0.0):
+    """Время сервера БД со сдвигом offset_s секунд (SQL-выражение)."""
+    if dialect_name == "postgresql":
+        if not offset_s:
+            return func.now()
+        return func.now() + timedelta(seconds=offset_s)  # timedelta уходит в БД как interval
+    # sqlite (тесты): UTC в том же формате, в котором SQLAlchemy хранит DateTime
+    now = func.strftime("%Y-%m-%d %H:%M:%f000", "now", f"{offset_s:+.6f} seconds")
+    return type_coerce(now, DateTime(timezone=True))
+
+
+def _aware(value: datetime | None) -> datetime | None:
+    """sqlite возвращает naive datetime (в UTC)."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class _ErrorCapture(logging.Handler):
+    """Последняя ERROR-запись из потока задачи (исключения задачи обычно только логируются)."""
+
+    def __init__(self, thread_id: int):
+        super().__init__(logging.ERROR)
+        self.thread_id = thread_id
+        self.last: str | None = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread == self.thread_id:
+            try:
+                self.last = record.getMessage()
+            except Exception:
+                self.last = str(record.msg)
+
+
+class JobLeases:
+    """Запуск задач под арендой в scheduler_jobs и запись их истории."""
+
+    def __init__(
+        self,
+        engine_getter=_default_engine,
+        owner: str | None = None,
+        lease_ttl_s: float = JOB_LEASE_TTL_S,
+        keep_days: int = JOB_RUNS_KEEP_DAYS,
+    ):
+        self._engine_getter = engine_getter
+        self.owner = owner or default_owner()
+        self.lease_ttl_s = lease_ttl_s
+        self.keep_days = keep_days
+
+    # ---- аренда ------------------------------------------------------------
+
+    def try_acquire(self, job_id: str, min_interval_s: float = 0.0) -> datetime | None:
+        """Взять задачу; возвращает время старта (часы БД) или None, если ее выполняет/выполнил другой процесс."""
+        with self._engine_getter().begin() as conn:
+            name = conn.dialect.name
+            dialect = postgresql if name == "postgresql" else sqlite
+            conn.execute(dialect.insert(_JOBS).values(job_id=job_id).on_conflict_do_nothing(index_elements=["job_id"]))
+            now = _db_now(name)
+            started_at = conn.execute(
+                update(_JOBS)
+                .where(
+                    _JOBS.c.job_id == job_id,
+                    or_(_JOBS.c.lease_until.is_(None), _JOBS.c.lease_until < now),
+                    or_(
+                        _JOBS.c.last_started_at.is_(None),
+                        _JOBS.c.last_started_at <= _db_now(name, -min_interval_s),
+                    ),
+                )
+                .values(
+                    lease_owner=self.owner,
+                    lease_until=_db_now(name, self.lease_ttl_s),
+                    last_started_at=now,
+                )
+                .returning(_JOBS.c.last_started_at)
+            ).scalar()
+        return _aware(started_at)
+
+    def renew(self, job_id: str) -> bool:
+        with self._engine_getter().begin() as conn:
+            result = conn.execute(
+                update(_JOBS)
+                .where(_JOBS.c.job_id == job_id, _JOBS.c.lease_owner == self.owner)
+                .values(lease_until=_db_now(conn.dialect.name, self.lease_ttl_s))
+            )
+        return result.rowcount == 1
+
+    def release(self, job_id: str, started_at: datetime, status: str, error: str | None) -> float:
+        """Снять аренду и записать итог запуска; возвращает длительность в секундах."""
+        if error is not None:
+            error = error[:_ERROR_MAX_LEN]
+        failed = status != "ok"
+        with self._engine_getter().begin() as conn:
+            finished_at = _aware(conn.execute(select(_db_now(conn.dialect.name))).scalar())
+            duration_s = (finished_at - started_at).total_seconds()
+            conn.execute(
+                update(_JOBS)
+                .where(_JOBS.c.job_id == job_id, _JOBS.c.lease_owner == self.owner)
+                .values(
+                    lease_owner=None,
+                    lease_until=None,
+                    last_finished_at=finished_at,
+                    last_duration_s=duration_s,
+                    last_status=status,
+                    last_error=error,
+                    run_count=_JOBS.c.run_count + 1,
+                    fail_count=_JOBS.c.fail_count + (1 if failed else 0),
+                )
+            )
+            conn.execute(
+                insert(_RUNS).values(
+                    job_id=job_id,
+                    owner=self.owner,
+                    started_at=started_at,
+                    finished_at=finished_at,
+                    duration_s=duration_s,
+                    status=status,
+                    error=error,
+                )
+            )
+            conn.execute(
+                delete(_RUNS).where(
+                    _RUNS.c.job_id == job_id, _RUNS.c.started_at < finished_at - timedelta(days=self.keep_days)
+                )
+            )
+        return duration_s
+
+    # ---- запуск ------------------------------------------------------------
+
+    def run(self, job_id: str, func: Callable[[], Any], min_interval_s: float = 0.0) -> bool:
+        """Выполнить func под арендой; False — задачу выполняет или уже выполнил другой процесс."""
+        try:
+            started_at = self.try_acquire(job_id, min_interval_s)
+        except Exception as e:
+            # Без БД аренду не проверить — лучше пропустить срабатывание, чем выполнить его дважды
+            logger.error("❌ Аренда задачи %s недоступна, пропускаем запуск: %s", job_id, e)
+            JOB_RUNS.labels(job_id, "skipped").inc()
+            return False
+        if started_at is None:
+            logger.info("⏭️ Задачу %s выполняет или уже выполнил другой процесс", job_id)
+            JOB_RUNS.labels(job_id, "skipped").inc()
+            return False
+
+        started = time.monotonic()
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stop), name=f"lease-{job_id}", daemon=True)
+        heartbeat.start()
+        capture = _ErrorCapture(threading.get_ident())
+        logging.getLogger().addHandler(capture)
+        status, error = "ok", None
+        try:
+            func()
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+            logger.exception("❌ Задача %s завершилась исключением", job_id)
+        finally:
+            logging.getLogger().removeHandler(capture)
+            stop.set()
+        if status == "ok" and capture.last is not None:
+            status, error = "errors", capture.last
+
+        try:
+            duration_s = self.release(job_id, started_at, status, error)
+        except Exception as e:
+            # Аренда истечет сама через lease_ttl_s
+            logger.error("❌ Не удалось записать итог задачи %s: %s", job_id, e)
+            duration_s = time.monotonic() - started
+        JOB_RUNS.labels(job_id, status).inc()
+        JOB_SECONDS.labels(job_id).observe(duration_s)
+        logger.info("🏁 Задача %s: %s за %.1f с", job_id, status, duration_s)
+        return True
+
+    def wrap(self, job_id: str, func: Callable[[], Any], min_interval_s: float = 0.0) -> Callable[[], bool]:
+        """Обертка для APScheduler.add_job."""
+
+        def leased() -> bool:
+            return self.run(job_id, func, min_interval_s)
+
+        leased.__name__ = f"leased_{job_id}"
+        return leased
+
+    def _heartbeat(self, job_id: str, stop: threading.Event) -> None:
+        while not stop.wait(self.lease_ttl_s / 3):
+            try:
+                if not self.renew(job_id):
+                    logger.warning("⚠️ Аренда задачи %s потеряна (истекла и перехвачена?)", job_id)
+                    return
+            except Exception as e:
+                logger.warning("⚠️ Не удалось продлить аренду задачи %s: %s", job_id, e)
+
+    # ---- состояние ---------------------------------------------------------
+
+    def status(self) -> list[dict[str, Any]]:
+        """Строки scheduler_jobs для диагностики (check_scheduler_status.py)."""
+        with self._engine_getter().connect() as conn:
+            rows = conn.execute(select(_JOBS).order_by(_JOBS.c.job_id)).mappings().all()
+        return [dict(row) for row in rows]
+
+
+job_leases = JobLeases()
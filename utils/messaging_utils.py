@@ -3,19 +3,18 @@
 Утилиты для работы с сообщениями бота в группах (изолированный модуль)
 """
 
-import asyncio
 import logging
-from datetime import UTC, datetime, timedelta
 from typing import Any
 
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.types import InlineKeyboardMarkup
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import BotMessage, ChatSettings, async_session_maker
+from database import BotMessage, ChatSettings
+from utils.auto_delete import AUTO_DELETE_TAGS, auto_deleter
+from utils.chat_admins import chat_admins
 
 logger = logging.getLogger(__name__)
 
@@ -56,121 +55,6 @@ async def mark_bot_removed(session: AsyncSession | Session, chat_id: int) -> Non
             logger.warning(f"🚫 Бот помечен как удаленный из группы {chat_id}")
 
 
-async def auto_delete_message(bot: Bot, chat_id: int, message_id: int, delay_seconds: int):
-    """Автоудаление сообщения через указанное количество секунд (только для групповых чатов)"""
-    try:
-        import asyncio
-
-        logger.info(f"🕐 Запущено автоудаление сообщения {message_id} в чате {chat_id} через {delay_seconds}с")
-        await asyncio.sleep(delay_seconds)
-
-        # Проверяем, что сообщение еще не удалено (помечаем в БД как удаленное при успешном удалении)
-        from sqlalchemy import select
-
-        from database import BotMessage
-
-        if async_session_maker is not None:
-            async with async_session_maker() as check_session:
-                result = await check_session.execute(
-                    select(BotMessage).where(
-                        BotMessage.chat_id == chat_id,
-                        BotMessage.message_id == message_id,
-                    )
-                )
-                bot_msg = result.scalar_one_or_none()
-                if bot_msg and bot_msg.deleted:
-                    logger.info(f"ℹ️ Сообщение {message_id} уже помечено как удаленное, пропускаем автоудаление")
-                    return
-
-        # Проверяем права бота перед удалением
-        try:
-            bot_member = await bot.get_chat_member(chat_id, bot.id)
-            status = bot_member.status
-            can_delete = getattr(bot_member, "can_delete_messages", False)
-
-            logger.info(
-                f"🔍 Права бота в чате {chat_id}: status={status}, "
-                f"can_delete_messages={can_delete}, type={type(bot_member)}"
-            )
-
-            # Проверяем статус: может быть "administrator", "member", "left", "kicked", "restricted"
-            # Для администраторов проверяем can_delete_messages
-            # Для обычных участников (member) тоже можем попробовать удалить (если это их сообщение)
-            is_admin = status == "administrator"
-
-            if is_admin and not can_delete:
-                logger.warning(
-                    f"⚠️ Бот - администратор, но не имеет права удалять сообщения в чате {chat_id}: "
-                    f"status={status}, can_delete={can_delete}"
-                )
-                # Всё равно пробуем удалить - возможно, проверка прав не точная
-            elif not is_admin:
-                logger.info(
-                    f"ℹ️ Бот не является администратором (status={status}), "
-                    f"но попробуем удалить сообщение {message_id}"
-                )
-                # Пробуем удалить - возможно, это сообщение бота и его можно удалить
-        except Exception as perm_error:
-            logger.warning(
-                f"⚠️ Не удалось проверить права бота в чате {chat_id}: {perm_error}. "
-                f"Попробуем удалить сообщение {message_id} без проверки прав."
-            )
-            # Продолжаем попытку удаления даже если проверка прав не удалась
-
-        # Пытаемся удалить сообщение
-        try:
-            await bot.delete_message(chat_id=chat_id, message_id=message_id)
-            logger.info(f"✅ Сообщение {message_id} автоматически удалено из чата {chat_id} через {delay_seconds}с")
-
-            # Помечаем сообщение как удаленное в БД
-            if async_session_maker is not None:
-                from sqlalchemy import select
-
-                async with async_session_maker() as update_session:
-                    result = await update_session.execute(
-                        select(BotMessage).where(
-                            BotMessage.chat_id == chat_id,
-                            BotMessage.message_id == message_id,
-                        )
-                    )
-                    bot_msg = result.scalar_one_or_none()
-                    if bot_msg:
-                        bot_msg.deleted = True
-                        await update_session.commit()
-                        logger.info(f"✅ Сообщение {message_id} помечено как удаленное в БД")
-        except Exception as delete_error:
-            error_str = str(delete_error).lower()
-            if "message to delete not found" in error_str or "message can't be deleted" in error_str:
-                logger.info(f"ℹ️ Сообщение {message_id} уже удалено или недоступно для удаления: {delete_error}")
-                # Помечаем как удаленное в БД, так как сообщение уже удалено
-                try:
-                    if async_session_maker is not None:
-                        from sqlalchemy import select
-
-                        async with async_session_maker() as update_session:
-                            result = await update_session.execute(
-                                select(BotMessage).where(
-                                    BotMessage.chat_id == chat_id,
-                                    BotMessage.message_id == message_id,
-                                )
-                            )
-                            bot_msg = result.scalar_one_or_none()
-                            if bot_msg and not bot_msg.deleted:
-                                bot_msg.deleted = True
-                                await update_session.commit()
-                                logger.info(f"✅ Сообщение {message_id} помечено как удаленное в БД (уже было удалено)")
-                except Exception as db_error:
-                    logger.warning(f"⚠️ Не удалось пометить сообщение как удаленное в БД: {db_error}")
-            elif "not enough rights" in error_str or "can't delete" in error_str:
-                logger.warning(
-                    f"⚠️ Недостаточно прав для удаления сообщения {message_id} в чате {chat_id}: {delete_error}"
-                )
-            else:
-                logger.warning(f"⚠️ Ошибка при удалении сообщения {message_id}: {delete_error}")
-    except Exception as e:
-        logger.warning(f"⚠️ Не удалось автоматически удалить сообщение {message_id}: {e}")
-
-
 # === SYNC ВЕРСИИ (для синхронной SQLAlchemy session) ===
 
 
@@ -268,8 +152,8 @@ def send_tracked_sync(
     logger.info(f"✅ Отправлено tracked сообщение в чат {chat_id}, message_id={msg.message_id}, tag={tag}")
 
     # Автоудаление через 2 минуты для определенных тегов (кроме важных уведомлений)
-    if tag in ["service", "panel", "list"]:  # Не удаляем "notification" (новые события)
-        asyncio.create_task(auto_delete_message(bot, chat_id, msg.message_id, 120))  # 2 минуты
+    if tag in AUTO_DELETE_TAGS:  # Не удаляем "notification" (новые события)
+        auto_deleter.schedule(chat_id, msg.message_id)
 
     return msg
 
@@ -364,10 +248,7 @@ async def ensure_panel(bot: Bot, session: AsyncSession, *, chat_id: int, text: s
         admin_ids = []
         admin_count = 0
         try:
-            from utils.community_events_service import CommunityEventsService
-
-            community_service = CommunityEventsService()
-            admin_ids = await community_service.get_cached_admin_ids(bot, chat_id)
+            admin_ids = await chat_admins.get_admin_ids(bot, chat_id)
             admin_count = len(admin_ids)
             logger.info(f"✅ Получены админы для нового чата {chat_id}: count={admin_count}, ids={admin_ids}")
         except Exception as e:
@@ -485,26 +366,8 @@ async def send_tracked(
     logger.info(f"✅ Отправлено tracked сообщение в чат {chat_id}, message_id={msg.message_id}, tag={tag}")
 
     # Автоудаление через 2 минуты для определенных тегов (кроме важных уведомлений)
-    if tag in ["service", "panel", "list"]:  # Не удаляем "notification" (новые события)
-        logger.info(f"🕐 Запуск автоудаления для сообщения {msg.message_id} с тегом '{tag}' в чате {chat_id}")
-
-        # Создаем задачу с обработкой исключений
-        async def safe_auto_delete():
-            try:
-                await auto_delete_message(bot, chat_id, msg.message_id, 120)  # 2 минуты
-            except Exception as e:
-                logger.error(f"❌ Критическая ошибка в задаче автоудаления для сообщения {msg.message_id}: {e}")
-                import traceback
-
-                logger.error(traceback.format_exc())
-
-        task = asyncio.create_task(safe_auto_delete())
-        # Добавляем callback для обработки исключений в задаче
-        task.add_done_callback(
-            lambda t: logger.error(f"❌ Задача автоудаления завершилась с ошибкой: {t.exception()}")
-            if t.exception()
-            else None
-        )
+    if tag in AUTO_DELETE_TAGS:  # Не удаляем "notification" (новые события)
+        auto_deleter.schedule(chat_id, msg.message_id)
 
     return msg
 
@@ -609,8 +472,8 @@ async def is_chat_admin(bot: Bot, chat_id: int, user_id: int) -> bool:
         True если пользователь - админ, False иначе
     """
     try:
-        member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in ("creator", "administrator")
+        # Проверка по памяти процесса; в Telegram — только промах или перепроверка отказа (utils.chat_admins)
+        return await chat_admins.is_admin(bot, chat_id, user_id)
     except Exception as e:
         logger.error(f"❌ Ошибка проверки прав админа: {e}")
         return False
@@ -695,89 +558,3 @@ async def get_chat_creator(bot: Bot, chat_id: int) -> dict | None:
     except Exception as e:
         logger.error(f"❌ Ошибка получения создателя чата {chat_id}: {e}")
         return None
-
-
-async def restore_auto_delete_on_startup(bot: Bot):
-    """
-    Восстанавливает автоудаление для сообщений после перезапуска бота.
-    Удаляет старые сообщения (старше 120 секунд) и запускает автоудаление для новых.
-    """
-    AUTO_DELETE_DELAY = 120  # 2 минуты
-    TAGS_TO_AUTO_DELETE = ["service", "panel", "list"]
-
-    try:
-        logger.info("🔄 Восстановление автоудаления после перезапуска бота...")
-
-        if async_session_maker is None:
-            logger.warning("⚠️ async_session_maker не инициализирован, пропускаем восстановление автоудаления")
-            return
-
-        async with async_session_maker() as session:
-            # Находим все неудаленные сообщения с нужными тегами
-            cutoff_time = datetime.now(UTC) - timedelta(seconds=AUTO_DELETE_DELAY)
-
-            result = await session.execute(
-                select(BotMessage).where(
-                    BotMessage.deleted.is_(False),
-                    BotMessage.tag.in_(TAGS_TO_AUTO_DELETE),
-                    BotMessage.created_at < cutoff_time,
-                )
-            )
-            old_messages = result.scalars().all()
-
-            # Удаляем старые сообщения сразу
-            deleted_count = 0
-            for bot_msg in old_messages:
-                try:
-                    await bot.delete_message(chat_id=bot_msg.chat_id, message_id=bot_msg.message_id)
-                    bot_msg.deleted = True
-                    deleted_count += 1
-                    logger.debug(f"✅ Удалено старое сообщение {bot_msg.message_id} (tag: {bot_msg.tag})")
-                except Exception as e:
-                    # Если сообщение уже удалено или недоступно, помечаем как удаленное
-                    logger.debug(f"ℹ️ Не удалось удалить старое сообщение {bot_msg.message_id}: {e}")
-                    bot_msg.deleted = True
-
-            if deleted_count > 0:
-                await session.commit()
-                logger.info(f"✅ Удалено {deleted_count} старых сообщений при восстановлении автоудаления")
-
-            # Находим новые сообщения (созданные менее 120 секунд назад) и запускаем для них автоудаление
-            now = datetime.now(UTC)
-            result = await session.execute(
-                select(BotMessage).where(
-                    BotMessage.deleted.is_(False),
-                    BotMessage.tag.in_(TAGS_TO_AUTO_DELETE),
-                    BotMessage.created_at >= cutoff_time,
-                )
-            )
-            new_messages = result.scalars().all()
-
-            restored_count = 0
-            for bot_msg in new_messages:
-                # Вычисляем оставшееся время до автоудаления
-                elapsed = (now - bot_msg.created_at).total_seconds()
-                remaining_seconds = max(1, int(AUTO_DELETE_DELAY - elapsed))
-
-                # Запускаем автоудаление с оставшимся временем
-                async def safe_auto_delete_for_msg(chat_id: int, message_id: int, delay: int):
-                    try:
-                        await auto_delete_message(bot, chat_id, message_id, delay)
-                    except Exception as e:
-                        logger.error(f"❌ Ошибка автоудаления для сообщения {message_id}: {e}")
-
-                asyncio.create_task(safe_auto_delete_for_msg(bot_msg.chat_id, bot_msg.message_id, remaining_seconds))
-                restored_count += 1
-
-            if restored_count > 0:
-                logger.info(f"✅ Восстановлено автоудаление для {restored_count} сообщений")
-
-            total_processed = deleted_count + restored_count
-            if total_processed == 0:
-                logger.info("ℹ️ Нет сообщений, требующих восстановления автоудаления")
-
-    except Exception as e:
-        logger.error(f"❌ Ошибка при восстановлении автоудаления: {e}")
-        import traceback
-
-        logger.error(traceback.format_exc())
@@ -0,0 +1,440 @@
+"""
+Метрики процесса в фиксированной памяти: счетчики, gauge и гистограммы с корзинами.
+
+Метрика — серия значений по набору меток (labels). Гистограмма хранит только счетчики
+корзин, сумму и количество, поэтому память не растет с числом наблюдений; число серий
+одной метрики ограничено METRICS_MAX_SERIES (лишние метки сворачиваются в "other").
+
+registry.render() отдает текстовый формат Prometheus (exposition 0.0.4) — его публикуют
+/metrics в FastAPI (web/health.py) и в aiohttp-сервере бота. Сторонние счетчики
+(KudaGo METRICS, http_clients) подключаются через register_collector и читаются при рендере.
+
+Пример:
+    SEARCH_SECONDS = registry.histogram("search_duration_seconds", "Поиск событий", ("region",))
+    SEARCH_SECONDS.labels("bali").observe(0.012)
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterable, Sequence
+from functools import lru_cache
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+METRICS_MAX_SERIES = int(os.getenv("METRICS_MAX_SERIES", "500"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Корзины по умолчанию: от 1 мс до 30 с — подходит и для SQL, и для внешних API
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+OVERFLOW_LABEL = "other"
+
+# (имя, тип, help, [(метки, значение)]) — то, что возвращает коллектор
+CollectedMetric = tuple[str, str, str, list[tuple[dict[str, Any], float]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        with self._lock:
+            self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self, lock: threading.Lock):
+        self._lock = lock
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_buckets", "counts", "sum", "count")
+
+    def __init__(self, lock: threading.Lock, buckets: tuple[float, ...]):
+        self._lock = lock
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        idx = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        """with HIST.labels(...).time(): ... — наблюдает длительность блока в секундах."""
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float | None:
+        """Оценка квантиля по корзинам (линейная интерполяция внутри корзины)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for idx, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if idx == len(self._buckets):
+                    return self._buckets[-1] if self._buckets else None
+                lower = self._buckets[idx - 1] if idx else 0.0
+                upper = self._buckets[idx]
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return None
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child: _HistogramChild):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: dict[tuple[str, ...], Any] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: Any, **kwargs: Any):
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {values}")
+        key = tuple("" if v is None else str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    if len(self._children) >= METRICS_MAX_SERIES:
+                        key = (OVERFLOW_LABEL,) * len(self.labelnames)
+                        child = self._children.get(key)
+                    if child is None:
+                        child = self._children[key] = self._new_child()
+        return child
+
+    def series(self) -> list[tuple[tuple[str, ...], Any]]:
+        with self._lock:
+            return list(self._children.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self.series(), key=lambda item: item[0]):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild(self._lock)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != math.inf))
+
+    def _new_child(self):
+        return _HistogramChild(self._lock, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self.series(), key=lambda item: item[0]):
+            with self._lock:
+                counts, total, count = list(child.counts), child.sum, child.count
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса. Повторная регистрация с тем же именем возвращает ту же метрику."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[CollectedMetric]]] = []
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"metric {name} already registered as {metric.kind}{metric.labelnames}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Callable[[], Iterable[CollectedMetric]]) -> None:
+        """Коллектор вызывается при каждом render() и отдает готовые значения чужих счетчиков."""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+            collectors = list(self._collectors)
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logger.warning("Коллектор метрик %r упал: %s", collector, e)
+                continue
+            for name, kind, documentation, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    rendered = _format_labels(list(labels), [str(v) for v in labels.values()])
+                    lines.append(f"{name}{rendered} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+async def aiohttp_metrics_handler(request):
+    """GET /metrics для aiohttp-сервера бота."""
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+# --- окно последних минут (для JSON health-эндпоинтов) --------------------------
+
+
+class RollingWindow:
+    """
+    Суммы полей по слотам фиксированной длины (кольцо из slots слотов по slot_s секунд).
+
+    Заменяет списки временных меток: память постоянна, totals(seconds) суммирует
+    только слоты, попадающие в окно.
+    """
+
+    def __init__(self, fields: Sequence[str], slot_s: int = 60, slots: int = 60, clock=time.time):
+        self.fields = tuple(fields)
+        self.slot_s = slot_s
+        self.slots = slots
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stamps = [-1] * slots
+        self._values = [[0.0] * len(self.fields) for _ in range(slots)]
+        self._index = {name: i for i, name in enumerate(self.fields)}
+
+    def add(self, **values: float) -> None:
+        slot = int(self._clock() // self.slot_s)
+        idx = slot % self.slots
+        with self._lock:
+            if self._stamps[idx] != slot:
+                self._stamps[idx] = slot
+                self._values[idx] = [0.0] * len(self.fields)
+            row = self._values[idx]
+            for name, value in values.items():
+                row[self._index[name]] += value
+
+    def totals(self, seconds: float) -> dict[str, float]:
+        current = int(self._clock() // self.slot_s)
+        oldest = current - max(1, math.ceil(seconds / self.slot_s)) + 1
+        sums = [0.0] * len(self.fields)
+        with self._lock:
+            for stamp, row in zip(self._stamps, self._values):
+                if oldest <= stamp <= current:
+                    for i, value in enumerate(row):
+                        sums[i] += value
+        return dict(zip(self.fields, sums))
+
+
+# --- наблюдатели отдельных вызовов (SQL, HTTP) -------------------------------------
+
+_call_observers: list[Callable[[str, str, float], None]] = []
+
+
+def add_call_observer(observer: Callable[[str, str, float], None]) -> None:
+    """observer(kind, name, duration_s) вызывается на каждый SQL-запрос и исходящий HTTP (utils/tracing)."""
+    if observer not in _call_observers:
+        _call_observers.append(observer)
+
+
+def observe_call(kind: str, name: str, duration_s: float) -> None:
+    for observer in _call_observers:
+        observer(kind, name, duration_s)
+
+
+# --- SQLAlchemy ---------------------------------------------------------------------
+
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL по типу запроса и первой таблице",
+    ("statement",),
+)
+
+_STATEMENT_OP_RE = re.compile(r"^\s*(?:/\*.*?\*/\s*)?(\w+)", re.S)
+_STATEMENT_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|JOIN)\s+\"?([A-Za-z_][\w.]*)", re.I)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(statement: str) -> str:
+    """'SELECT ... FROM events WHERE ...' -> 'select events'. Метка с ограниченным числом значений."""
+    op = _STATEMENT_OP_RE.match(statement)
+    table = _STATEMENT_TABLE_RE.search(statement)
+    label = op.group(1).lower() if op else "unknown"
+    return f"{label} {table.group(1).lower()}" if table else label
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started"].pop()
+    label = statement_label(statement)
+    DB_QUERY_SECONDS.labels(label).observe(duration)
+    observe_call("sql", label, duration)
+
+
+def _handle_error(context):
+    stack = context.connection.info.get("query_started") if context.connection is not None else None
+    if stack:
+        stack.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Вешает на engine (sync или AsyncEngine) замер времени каждого SQL в DB_QUERY_SECONDS."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
@@ -2,6 +2,7 @@
 Интеграция парсеров с базой данных
 """
 
+import asyncio
 import logging
 from datetime import UTC, datetime
 from typing import Any
@@ -33,6 +34,7 @@ class ParserIntegration:
             Количество сохраненных событий
         """
         saved_count = 0
+        prepared = []
 
         for event in events:
             try:
@@ -109,28 +111,34 @@ class ParserIntegration:
                     except Exception as e:
                         logger.warning(f"⚠️ Ошибка при reverse geocoding: {e}")
 
-                # Сохраняем событие
-                event_id = self.events_service.save_parser_event(
-                    source=source,
-                    external_id=external_id,
-                    title=title,
-                    description=description,
-                    starts_at_utc=starts_at_utc,
-                    city=city,
-                    lat=lat,
-                    lng=lng,
-                    location_name=location_name,
-                    location_url=location_url,
-                    url=url,
+                prepared.append(
+                    {
+                        "source": source,
+                        "external_id": external_id,
+                        "title": title,
+                        "description": description,
+                        "starts_at_utc": starts_at_utc,
+                        "city": city,
+                        "lat": lat,
+                        "lng": lng,
+                        "location_name": location_name,
+                        "location_url": location_url,
+                        "url": url,
+                    }
                 )
 
-                saved_count += 1
-                logger.info(f"Сохранено событие ID {event_id}: {title}")
-
             except Exception as e:
-                logger.error(f"Ошибка при сохранении события '{event.get('title', 'Unknown')}': {e}")
+                logger.error(f"Ошибка при подготовке события '{event.get('title', 'Unknown')}': {e}")
                 continue
 
+        # Сохраняем одним пакетом: одна выборка существующих/дубликатов и многострочный upsert
+        if prepared:
+            try:
+                ids = await asyncio.to_thread(self.events_service.save_parser_events_batch, prepared)
+                saved_count = sum(1 for event_id in ids if event_id)
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении событий источника {source}: {e}")
+
         logger.info(f"Сохранено {saved_count} событий из источника {source}")
         return saved_count
 
@@ -0,0 +1,340 @@
+"""
+Общий планировщик исходящих сообщений в Telegram.
+
+SendRateMiddleware (request-middleware сессии бота, install_send_scheduler) пропускает каждый
+sendMessage/sendPhoto/copyMessage/... через два лимита:
+  - token bucket на чат: личка — SEND_CHAT_RATE сообщений/с, группы и каналы —
+    SEND_GROUP_PER_MIN в минуту (с запасом SEND_CHAT_BURST / SEND_GROUP_BURST подряд);
+  - общий token bucket бота (SEND_GLOBAL_RATE/с) с очередью по приоритетам: ответы на
+    действия пользователя ("interactive", по умолчанию) получают слот раньше уведомлений
+    ("notify") и рассылок ("bulk"). Приоритет задается контекстом: with send_priority("bulk").
+
+429 Too Many Requests: чат ставится на паузу retry_after, запрос повторяется до
+SEND_MAX_RETRIES раз. Ожидание в очереди, очередь по приоритетам и ответы 429 видны в /metrics
+(telegram_send_*). Лимиты общие для всех ботов и event loop'ов процесса.
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    CopyMessages,
+    ForwardMessage,
+    ForwardMessages,
+    SendAnimation,
+    SendAudio,
+    SendContact,
+    SendDice,
+    SendDocument,
+    SendLocation,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    SendPoll,
+    SendSticker,
+    SendVenue,
+    SendVideo,
+    SendVideoNote,
+    SendVoice,
+)
+
+from utils.cache import TTLCache
+from utils.metrics import registry
+
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_GLOBAL_BURST = float(os.getenv("SEND_GLOBAL_BURST", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_GROUP_PER_MIN = float(os.getenv("SEND_GROUP_PER_MIN", "20"))
+SEND_GROUP_BURST = float(os.getenv("SEND_GROUP_BURST", "5"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+SEND_MAX_CHATS = int(os.getenv("SEND_MAX_CHATS", "50000"))
+
+# Порядок — приоритет: раньше в кортеже — раньше получает слот общего лимита
+PRIORITIES = ("interactive", "notify", "bulk")
+
+_GATED_METHODS = (
+    SendMessage,
+    SendPhoto,
+    SendVideo,
+    SendAnimation,
+    SendAudio,
+    SendDocument,
+    SendVoice,
+    SendVideoNote,
+    SendSticker,
+    SendLocation,
+    SendVenue,
+    SendContact,
+    SendPoll,
+    SendDice,
+    SendMediaGroup,
+    CopyMessage,
+    CopyMessages,
+    ForwardMessage,
+    ForwardMessages,
+)
+
+SEND_REQUESTS = registry.counter(
+    "telegram_send_total", "Исходящие сообщения через планировщик: ok / error / retry_after", ("priority", "result")
+)
+SEND_WAIT = registry.histogram(
+    "telegram_send_wait_seconds", "Ожидание слота (лимит чата + общая очередь)", ("priority",)
+)
+
+_PRIORITY: ContextVar[str] = ContextVar("send_priority", default="interactive")
+
+
+@contextmanager
+def send_priority(priority: str) -> Iterator[None]:
+    """Приоритет отправок внутри блока (и в задачах, созданных из него)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown send priority: {priority}")
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+class TokenBucket:
+    """Token bucket с резервированием в долг: reserve() всегда занимает токен и говорит, сколько ждать."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "_clock")
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        self._refill()
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds: float) -> None:
+        """Следующий reserve() подождет не меньше seconds (ответ 429 с retry_after)."""
+        self._refill()
+        self.tokens = min(self.tokens, 1.0) - seconds * self.rate
+
+    def seconds_to_full(self) -> float:
+        return max(0.0, (self.capacity - self.tokens) / self.rate)
+
+
+class _PriorityQueue:
+    """Очередь одного event loop на общий лимит: слот получает самый приоритетный ожидающий."""
+
+    def __init__(self, scheduler: "SendScheduler"):
+        self._scheduler = scheduler
+        self._waiters: dict[str, deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def waiting(self, priority: str) -> int:
+        return len(self._waiters[priority])
+
+    async def acquire(self, priority: str) -> None:
+        if self._task is None and self._scheduler._try_take_global():
+            return  # очереди нет, токен есть
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await future  # отмененный future диспетчер пропустит
+
+    def _pop(self) -> asyncio.Future | None:
+        for waiters in self._waiters.values():
+            while waiters:
+                future = waiters.popleft()
+                if not future.done():
+                    return future
+        return None
+
+    def _has_waiters(self) -> bool:
+        for waiters in self._waiters.values():
+            while waiters and waiters[0].done():
+                waiters.popleft()
+            if waiters:
+                return True
+        return False
+
+    async def _run(self) -> None:
+        try:
+            while self._has_waiters():
+                delay = self._scheduler._reserve_global()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Слот — тому, кто сейчас приоритетнее всех (мог прийти, пока ждали токен)
+                future = self._pop()
+                if future is not None:
+                    future.set_result(None)
+        finally:
+            self._task = None
+
+
+class SendScheduler:
+    """Лимиты на чат и общий лимит бота; потокобезопасен, очередь приоритетов — своя у каждого loop."""
+
+    def __init__(
+        self,
+        global_rate: float = SEND_GLOBAL_RATE,
+        global_burst: float = SEND_GLOBAL_BURST,
+        chat_rate: float = SEND_CHAT_RATE,
+        chat_burst: float = SEND_CHAT_BURST,
+        group_per_min: float = SEND_GROUP_PER_MIN,
+        group_burst: float = SEND_GROUP_BURST,
+        max_retries: int = SEND_MAX_RETRIES,
+        max_chats: int = SEND_MAX_CHATS,
+        clock=time.monotonic,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_min / 60
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        # Бакет живет, пока не наполнится снова: полный бакет ничем не отличается от нового
+        self._chats = TTLCache("send_chat_buckets", maxsize=max_chats, clock=clock)
+        self._queues: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _PriorityQueue] = weakref.WeakKeyDictionary()
+        _schedulers.add(self)
+
+    # ---- лимиты ------------------------------------------------------------
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, self._clock)
+            else:  # группы, супергруппы, каналы (в т.ч. @username)
+                bucket = TokenBucket(self.group_rate, self.group_burst, self._clock)
+        return bucket
+
+    def _reserve_chat(self, chat_id: int | str) -> float:
+        with self._lock:
+            bucket = self._chat_bucket(chat_id)
+            delay = bucket.reserve()
+            self._chats.set(chat_id, bucket, ttl_s=bucket.seconds_to_full())
+            return delay
+
+    def pause_chat(self, chat_id: int | str, seconds: float) -> None:
+        with self._lock:
+            bucket = self._chat_bucket(chat_id)
+            bucket.pause(seconds)
+            self._chats.set(chat_id, bucket, ttl_s=bucket.seconds_to_full())
+
+    def _reserve_global(self) -> float:
+        with self._lock:
+            return self._global.reserve()
+
+    def _try_take_global(self) -> bool:
+        with self._lock:
+            return self._global.try_take()
+
+    def _queue(self) -> _PriorityQueue:
+        loop = asyncio.get_running_loop()
+        queue = self._queues.get(loop)
+        if queue is None:
+            queue = self._queues[loop] = _PriorityQueue(self)
+        return queue
+
+    def waiting(self) -> dict[str, int]:
+        return {
+            priority: sum(queue.waiting(priority) for queue in list(self._queues.values())) for priority in PRIORITIES
+        }
+
+    # ---- отправка ----------------------------------------------------------
+
+    async def acquire(self, chat_id: int | str, priority: str | None = None) -> float:
+        """Дождаться слота для сообщения в chat_id; возвращает время ожидания в секундах."""
+        priority = priority or _PRIORITY.get()
+        started = self._clock()
+        delay = self._reserve_chat(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self._queue().acquire(priority)
+        waited = self._clock() - started
+        SEND_WAIT.labels(priority).observe(waited)
+        return waited
+
+    async def send(self, make_request, bot: Bot, method):
+        priority = _PRIORITY.get()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(method.chat_id, priority)
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                SEND_REQUESTS.labels(priority, "retry_after").inc()
+                self.pause_chat(method.chat_id, e.retry_after)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            except Exception:
+                SEND_REQUESTS.labels(priority, "error").inc()
+                raise
+            SEND_REQUESTS.labels(priority, "ok").inc()
+            return response
+
+
+class SendRateMiddleware(BaseRequestMiddleware):
+    """Request-middleware: отправка сообщений — через SendScheduler, остальные методы — напрямую."""
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        if not isinstance(method, _GATED_METHODS):
+            return await make_request(bot, method)
+        return await self.scheduler.send(make_request, bot, method)
+
+
+def install_send_scheduler(bot: Bot, scheduler: SendScheduler | None = None) -> Bot:
+    """Подключить планировщик к сессии бота (повторный вызов ничего не меняет)."""
+    if not any(isinstance(middleware, SendRateMiddleware) for middleware in bot.session.middleware):
+        bot.session.middleware(SendRateMiddleware(scheduler or send_scheduler))
+    return bot
+
+
+_schedulers: "weakref.WeakSet[SendScheduler]" = weakref.WeakSet()
+
+
+def _collect_send_queue():
+    totals = dict.fromkeys(PRIORITIES, 0)
+    for scheduler in list(_schedulers):
+        for priority, count in scheduler.waiting().items():
+            totals[priority] += count
+    samples = [({"priority": priority}, count) for priority, count in totals.items()]
+    return [("telegram_send_queue", "gauge", "Сообщения в очереди на общий лимит", samples)]
+
+
+registry.register_collector(_collect_send_queue)
+
+send_scheduler = SendScheduler()
@@ -0,0 +1,429 @@
+"""
+Хранилище состояния бота вне памяти процесса: user_state (результаты поиска по chat_id) и FSM aiogram.
+
+Бэкенды (STATE_BACKEND):
+  - postgres — таблица bot_state (миграция 059), переживает рестарты и деплои, общая для инстансов;
+  - sqlite — локальный файл (STATE_SQLITE_PATH), переживает рестарт процесса;
+  - memory — utils.cache.TTLCache с лимитом записей (для тестов и локального запуска без БД).
+
+Значения хранятся компактно: JSON без пробелов, в sqlite и memory — zlib для больших значений
+(в Postgres — jsonb без zlib, большие значения сжимает TOAST; см. атрибут бэкенда compress).
+datetime/date восстанавливаются при чтении (в prepared лежат события со starts_at), EventRecord
+упаковывается списком значений без имен полей.
+
+merge() дописывает поля верхнего уровня за один шаг: в Postgres — одним INSERT ... ON CONFLICT
+с data || patch, в sqlite и memory — под блокировкой бэкенда. Параллельные нажатия не затирают
+поля друг друга.
+
+Если бэкенд недоступен при старте (нет таблицы, нет файла), используется memory с предупреждением в логе.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import text
+
+from utils.cache import TTLCache
+from utils.event_record import EventRecord
+
+logger = logging.getLogger(__name__)
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "postgres").lower()
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH", "data/bot_state.sqlite3")
+USER_STATE_TTL_S = int(os.getenv("USER_STATE_TTL_S", "900"))  # 15 минут, как у прежнего словаря
+FSM_STATE_TTL_S = int(os.getenv("FSM_STATE_TTL_S", str(7 * 86400)))
+# Лимит записей на namespace для memory-бэкенда (остальные бэкенды ограничены только TTL)
+MEMORY_STATE_MAX_ENTRIES = int(os.getenv("MEMORY_STATE_MAX_ENTRIES", "200"))
+# FSM — незаконченные формы (создание события): вытеснять их ради результатов поиска нельзя
+MEMORY_FSM_MAX_ENTRIES = int(os.getenv("MEMORY_FSM_MAX_ENTRIES", "100000"))
+
+# Значения меньше порога не сжимаем: zlib на коротком JSON не выигрывает
+_COMPRESS_MIN_BYTES = 512
+_RAW_PREFIX = b"j"
+_ZLIB_PREFIX = b"z"
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, EventRecord):
+        # Значения по фиксированному порядку полей, без повторения ключей в каждом событии
+        return {"__ev__": value.to_packed()}
+    if isinstance(value, datetime):
+        return {"__dt__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__d__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, set | tuple):
+        return list(value)
+    return str(value)
+
+
+def _json_object_hook(obj: dict) -> Any:
+    if len(obj) == 1:
+        if "__dt__" in obj:
+            return datetime.fromisoformat(obj["__dt__"])
+        if "__d__" in obj:
+            return date.fromisoformat(obj["__d__"])
+        if "__ev__" in obj:
+            return EventRecord.from_packed(obj["__ev__"])
+    return obj
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _raw_json(data: bytes) -> bytes:
+    data = bytes(data)
+    return zlib.decompress(data[1:]) if data[:1] == _ZLIB_PREFIX else data[1:]
+
+
+def pack_state(value: Any, compress: bool = True) -> bytes:
+    """Сериализует состояние в компактные байты (JSON, при большом размере и compress=True — zlib)."""
+    raw = _dumps(value)
+    if compress and len(raw) >= _COMPRESS_MIN_BYTES:
+        return _ZLIB_PREFIX + zlib.compress(raw, 6)
+    return _RAW_PREFIX + raw
+
+
+def unpack_state(data: bytes) -> Any:
+    return json.loads(_raw_json(data), object_hook=_json_object_hook)
+
+
+def _merge_packed(data: bytes | None, fields: dict, create: bool) -> bytes | None:
+    """Упакованное состояние с дописанными полями; None — состояния нет и create=False."""
+    if data is None:
+        if not create:
+            return None
+        state = {}
+    else:
+        state = unpack_state(data)
+    state.update(fields)
+    return pack_state(state)
+
+
+class MemoryStateBackend:
+    """Байты в TTLCache с TTL; в каждом namespace не больше max_entries записей (LRU), у fsm — свой лимит."""
+
+    name = "memory"
+    compress = True
+
+    def __init__(self, max_entries: int = MEMORY_STATE_MAX_ENTRIES, fsm_max_entries: int = MEMORY_FSM_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.namespace_max_entries = {StateStoreFSMStorage.namespace: fsm_max_entries}
+        self._lock = threading.RLock()
+        self._data: dict[str, TTLCache] = {}
+
+    def _namespace(self, namespace: str) -> TTLCache:
+        entries = self._data.get(namespace)
+        if entries is None:
+            with self._lock:
+                maxsize = self.namespace_max_entries.get(namespace, self.max_entries)
+                entries = self._data.setdefault(namespace, TTLCache(f"state_{namespace}", maxsize=maxsize, sizeof=len))
+        return entries
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        return self._namespace(namespace).get(key)
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_s: int) -> None:
+        with self._lock:
+            self._namespace(namespace).set(key, value, ttl_s=ttl_s)
+
+    def merge(self, namespace: str, key: str, fields: dict, ttl_s: int, create: bool = False) -> bool:
+        with self._lock:
+            entries = self._namespace(namespace)
+            value = _merge_packed(entries.get(key), fields, create)
+            if value is None:
+                return False
+            entries.set(key, value, ttl_s=ttl_s)
+            return True
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._namespace(namespace).pop(key)
+
+    def purge_expired(self) -> int:
+        return sum(entries.purge_expired() for entries in list(self._data.values()))
+
+    def count(self, namespace: str) -> int:
+        return len(self._namespace(namespace))
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStateBackend:
+    """Локальный файл SQLite; одно соединение на процесс под блокировкой."""
+
+    name = "sqlite"
+    compress = True
+
+    def __init__(self, path: str = STATE_SQLITE_PATH):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS bot_state (
+                namespace TEXT NOT NULL,
+                state_key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, state_key)
+            ) WITHOUT ROWID
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bot_state_expires_at ON bot_state(expires_at)")
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM bot_state WHERE namespace = ? AND state_key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_s: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bot_state (namespace, state_key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time() + ttl_s),
+            )
+
+    def merge(self, namespace: str, key: str, fields: dict, ttl_s: int, create: bool = False) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM bot_state WHERE namespace = ? AND state_key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+            value = _merge_packed(row[0] if row else None, fields, create)
+            if value is None:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bot_state (namespace, state_key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time() + ttl_s),
+            )
+            return True
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM bot_state WHERE namespace = ? AND state_key = ?", (namespace, key))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM bot_state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM bot_state WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresStateBackend:
+    """Таблица bot_state в основной БД (миграция 059); значение — в jsonb-колонке data."""
+
+    name = "postgres"
+    compress = False  # jsonb хранит JSON как есть, zlib пришлось бы тут же распаковывать
+
+    def __init__(self, engine):
+        self.engine = engine
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1 FROM bot_state LIMIT 1"))
+
+    def get(self, namespace: str, key: str) -> bytes | None:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text("""
+                    SELECT data::text FROM bot_state
+                    WHERE namespace = :namespace AND state_key = :key AND expires_at > NOW()
+                """),
+                {"namespace": namespace, "key": key},
+            ).fetchone()
+        return _RAW_PREFIX + row[0].encode("utf-8") if row else None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl_s: int) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO bot_state (namespace, state_key, data, expires_at)
+                    VALUES (:namespace, :key, CAST(:data AS jsonb), NOW() + make_interval(secs => :ttl_s))
+                    ON CONFLICT (namespace, state_key) DO UPDATE SET
+                        data = EXCLUDED.data,
+                        expires_at = EXCLUDED.expires_at,
+                        updated_at = NOW()
+                """),
+                {"namespace": namespace, "key": key, "data": _raw_json(value).decode("utf-8"), "ttl_s": ttl_s},
+            )
+
+    def merge(self, namespace: str, key: str, fields: dict, ttl_s: int, create: bool = False) -> bool:
+        params = {"namespace": namespace, "key": key, "patch": _dumps(fields).decode("utf-8"), "ttl_s": ttl_s}
+        with self.engine.begin() as conn:
+            if create:
+                # Просроченная строка (еще не удаленная очисткой) — как отсутствующая
+                conn.execute(
+                    text("""
+                        INSERT INTO bot_state (namespace, state_key, data, expires_at)
+                        VALUES (:namespace, :key, CAST(:patch AS jsonb), NOW() + make_interval(secs => :ttl_s))
+                        ON CONFLICT (namespace, state_key) DO UPDATE SET
+                            data = CASE
+                                WHEN bot_state.expires_at > NOW()
+                                    THEN bot_state.data || EXCLUDED.data
+                                ELSE EXCLUDED.data
+                            END,
+                            expires_at = EXCLUDED.expires_at,
+                            updated_at = NOW()
+                    """),
+                    params,
+                )
+                return True
+            result = conn.execute(
+                text("""
+                    UPDATE bot_state SET
+                        data = data || CAST(:patch AS jsonb),
+                        expires_at = NOW() + make_interval(secs => :ttl_s),
+                        updated_at = NOW()
+                    WHERE namespace = :namespace AND state_key = :key AND expires_at > NOW()
+                """),
+                params,
+            )
+            return result.rowcount == 1
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("DELETE FROM bot_state WHERE namespace = :namespace AND state_key = :key"),
+                {"namespace": namespace, "key": key},
+            )
+
+    def purge_expired(self) -> int:
+        with self.engine.begin() as conn:
+            return conn.execute(text("DELETE FROM bot_state WHERE expires_at <= NOW()")).rowcount
+
+    def count(self, namespace: str) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT COUNT(*) FROM bot_state WHERE namespace = :namespace AND expires_at > NOW()"),
+                {"namespace": namespace},
+            ).scalar()
+
+    def close(self) -> None:
+        pass
+
+
+def create_state_backend(kind: str = STATE_BACKEND, engine=None):
+    """Бэкенд по STATE_BACKEND; при ошибке инициализации — memory (бот продолжает работать)."""
+    try:
+        if kind == "postgres":
+            if engine is None:
+                raise RuntimeError("engine не инициализирован")
+            return PostgresStateBackend(engine)
+        if kind == "sqlite":
+            return SQLiteStateBackend(STATE_SQLITE_PATH)
+        if kind != "memory":
+            logger.warning(f"⚠️ Неизвестный STATE_BACKEND={kind!r}, используем memory")
+    except Exception as e:
+        logger.warning(f"⚠️ Хранилище состояния {kind} недоступно, используем memory: {e}")
+    return MemoryStateBackend()
+
+
+class UserStateStore:
+    """
+    Состояние поиска по chat_id (prepared, counts, lat/lng, radius, page, message_id карты/списка).
+
+    Методы асинхронные: запрос к бэкенду и (рас)паковка идут в потоке, event loop не ждет БД.
+    get() возвращает копию: изменения нужно сохранить через set() или update().
+    Каждая запись продлевает TTL.
+    """
+
+    namespace = "user_state"
+
+    def __init__(self, backend, ttl_s: int = USER_STATE_TTL_S):
+        self.backend = backend
+        self.ttl_s = ttl_s
+
+    def _get(self, chat_id: int) -> dict | None:
+        data = self.backend.get(self.namespace, str(chat_id))
+        return unpack_state(data) if data is not None else None
+
+    def _set(self, chat_id: int, state: dict) -> None:
+        self.backend.set(self.namespace, str(chat_id), pack_state(state, self.backend.compress), self.ttl_s)
+
+    async def get(self, chat_id: int) -> dict | None:
+        return await asyncio.to_thread(self._get, chat_id)
+
+    async def set(self, chat_id: int, state: dict) -> None:
+        await asyncio.to_thread(self._set, chat_id, state)
+
+    async def update(self, chat_id: int, create: bool = False, **fields) -> bool:
+        """Дописывает поля в состояние за один шаг; без create=True отсутствующее состояние не создается."""
+        return await asyncio.to_thread(self.backend.merge, self.namespace, str(chat_id), fields, self.ttl_s, create)
+
+    async def delete(self, chat_id: int) -> None:
+        await asyncio.to_thread(self.backend.delete, self.namespace, str(chat_id))
+
+    def __len__(self) -> int:
+        """Число записей (синхронно: вызывать из потока, см. log_memory_stats)."""
+        return self.backend.count(self.namespace)
+
+
+class StateStoreFSMStorage(BaseStorage):
+    """FSM-хранилище aiogram поверх того же бэкенда (замена MemoryStorage)."""
+
+    namespace = "fsm"
+
+    def __init__(self, backend, ttl_s: int = FSM_STATE_TTL_S):
+        self.backend = backend
+        self.ttl_s = ttl_s
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _load(self, key: StorageKey) -> dict:
+        data = self.backend.get(self.namespace, self._key(key))
+        return unpack_state(data) if data is not None else {}
+
+    def _store(self, key: StorageKey, record: dict) -> None:
+        if record.get("state") is None and not record.get("data"):
+            self.backend.delete(self.namespace, self._key(key))
+        else:
+            self.backend.set(self.namespace, self._key(key), pack_state(record, self.backend.compress), self.ttl_s)
+
+    def _set_field(self, key: StorageKey, field: str, value: Any) -> None:
+        record = self._load(key)
+        record[field] = value
+        self._store(key, record)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(self._set_field, key, "state", value)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = await asyncio.to_thread(self._load, key)
+        return record.get("state")
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await asyncio.to_thread(self._set_field, key, "data", dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = await asyncio.to_thread(self._load, key)
+        return dict(record.get("data") or {})
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.backend.close)
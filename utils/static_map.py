@@ -5,23 +5,12 @@
 """
 
 import logging
-import time
 from typing import Any
 
-try:
-    import httpx
-except ImportError:
-    httpx = None
-
+from utils.http_clients import CircuitOpenError, get_async_client, get_breaker
 
 logger = logging.getLogger(__name__)
 
-# Circuit breaker для Google Maps
-_MAP_CB = {
-    "open_until": 0,  # Время до которого предохранитель "открыт"
-    "fails": 0,  # Количество последовательных ошибок
-}
-
 
 # Настройки загружаются из config
 def _get_settings():
@@ -87,10 +76,6 @@ async def fetch_static_map(url: str, timeout_s: float = None) -> bytes | None:
     Returns:
         bytes изображения или None при ошибке
     """
-    if httpx is None:
-        logger.warning("httpx не установлен, карты недоступны")
-        return None
-
     # Загружаем настройки
     settings = _get_settings()
     if not settings.maps_enabled:
@@ -100,16 +85,11 @@ async def fetch_static_map(url: str, timeout_s: float = None) -> bytes | None:
     if timeout_s is None:
         timeout_s = settings.maps_timeout_s
 
-    now = time.time()
-
-    # Circuit breaker: если недавно падало — сразу возвращаем None
-    if _MAP_CB["open_until"] > now:
-        logger.debug(f"Circuit breaker открыт до {_MAP_CB['open_until']}")
-        return None
-
+    # Circuit breaker общего клиента static_maps: сетевые ошибки, 4xx/5xx и ответы не-картинкой
+    # учитывает транспорт (utils/http_clients.py)
+    breaker = _breaker(settings)
     try:
-        async with httpx.AsyncClient(timeout=timeout_s) as client:
-            response = await client.get(url)
+        response = await get_async_client("static_maps").get(url, timeout=timeout_s)
 
         if response.status_code != 200:
             raise RuntimeError(f"HTTP {response.status_code}")
@@ -123,53 +103,44 @@ async def fetch_static_map(url: str, timeout_s: float = None) -> bytes | None:
         if not content:
             raise RuntimeError("Пустой ответ")
 
-        # Успех — сбрасываем счётчик ошибок
-        _MAP_CB["fails"] = 0
-
         # Логируем успех
         logger.info(f"✅ Карта загружена успешно: {len(content)} байт, {content_type}")
 
         return content
 
-    except Exception as e:
-        _MAP_CB["fails"] += 1
-
-        # Если подряд N+ падений — "открываем" предохранитель
-        settings = _get_settings()
-        if _MAP_CB["fails"] >= settings.maps_cb_fails:
-            _MAP_CB["open_until"] = now + (settings.maps_cb_cooldown_min * 60)
-            logger.warning(
-                f"Circuit breaker открыт на {settings.maps_cb_cooldown_min} минут " f"после {_MAP_CB['fails']} ошибок"
-            )
+    except CircuitOpenError:
+        logger.debug(f"Circuit breaker открыт до {breaker.open_until}")
+        return None
 
+    except Exception as e:
         # Логируем ошибку (но не показываем пользователю)
         logger.debug(
-            f"static_map_fail: {str(e)}, fails={_MAP_CB['fails']}, "
-            f"type={type(e).__name__}, cb_open={_MAP_CB['open_until'] > now}"
+            f"static_map_fail: {str(e)}, fails={breaker.fails}, "
+            f"type={type(e).__name__}, cb_open={not breaker.allow()}"
         )
-
-        logger.debug(f"Ошибка получения карты: {e}")
         return None
 
 
+def _breaker(settings=None):
+    """Breaker сервиса static_maps с порогами из настроек (MAPS_CB_FAILS, MAPS_CB_COOLDOWN_MIN)."""
+    settings = settings or _get_settings()
+    breaker = get_breaker("static_maps")
+    breaker.fail_threshold = settings.maps_cb_fails
+    breaker.cooldown_s = settings.maps_cb_cooldown_min * 60
+    return breaker
+
+
 def get_circuit_breaker_status() -> dict[str, Any]:
     """Возвращает статус circuit breaker для мониторинга"""
-    now = time.time()
-    return {
-        "is_open": _MAP_CB["open_until"] > now,
-        "fails_count": _MAP_CB["fails"],
-        "open_until": _MAP_CB["open_until"],
-        "seconds_until_reset": max(0, int(_MAP_CB["open_until"] - now)),
-    }
+    return get_breaker("static_maps").status()
 
 
 def reset_circuit_breaker():
     """Принудительно сбрасывает circuit breaker (для админки)"""
-    global _MAP_CB
-    _MAP_CB = {"open_until": 0, "fails": 0}
+    get_breaker("static_maps").reset()
     logger.info("Circuit breaker принудительно сброшен")
 
 
 def is_maps_available() -> bool:
     """Проверяет, доступны ли карты (для предварительной проверки)"""
-    return time.time() > _MAP_CB["open_until"]
+    return get_breaker("static_maps").allow()
@@ -5,11 +5,16 @@
 
 import json
 import logging
+import os
 import time
+from collections import Counter
 from datetime import UTC, datetime
 
 logger = logging.getLogger(__name__)
 
+# Сколько debug-строк каждого вида пишет один запрос на горячем пути; остальные только считаются
+HOT_PATH_DEBUG_SAMPLES = int(os.getenv("HOT_PATH_DEBUG_SAMPLES", "3"))
+
 
 class StructuredLogger:
     """Логгер для структурированных JSON логов"""
@@ -147,3 +152,44 @@ class TimingContext:
                 StructuredLogger.log_ingest(**self.kwargs)
             elif self.operation == "search":
                 StructuredLogger.log_search(**self.kwargs)
+
+
+class HotPathLog:
+    """
+    Логирование горячих путей (подготовка ленты, поиск, геокодирование) в рамках одного запроса.
+
+    Вместо строки на каждое событие: счетчики по видам, первые HOT_PATH_DEBUG_SAMPLES
+    примеров каждого вида в DEBUG (ленивое %-форматирование) и одна сводка в конце.
+    Уровень логгера проверяется один раз при создании, поэтому на INFO цикл по событиям
+    платит только за инкремент счетчика.
+    """
+
+    __slots__ = ("logger", "name", "debug", "samples", "counts", "suppressed")
+
+    def __init__(self, log: logging.Logger, name: str, samples: int | None = None):
+        self.logger = log
+        self.name = name
+        self.debug = log.isEnabledFor(logging.DEBUG)
+        self.samples = HOT_PATH_DEBUG_SAMPLES if samples is None else samples
+        self.counts: Counter[str] = Counter()
+        self.suppressed = 0
+
+    def event(self, kind: str, msg: str = "", *args) -> None:
+        """Считает событие вида kind; в DEBUG пишет первые samples примеров"""
+        self.counts[kind] += 1
+        if not self.debug:
+            return
+        if self.counts[kind] > self.samples:
+            self.suppressed += 1
+            return
+        self.logger.debug("%s %s: " + msg, self.name, kind, *args)
+
+    def summary(self, msg: str = "", *args, level: int = logging.INFO) -> None:
+        """Одна итоговая строка на запрос: сообщение + счетчики по видам"""
+        if not self.logger.isEnabledFor(level):
+            return
+        counts = " ".join(f"{kind}={n}" for kind, n in self.counts.items()) or "-"
+        if self.suppressed:
+            counts += f" debug_suppressed={self.suppressed}"
+        fmt = "%s: " + msg + " | events: %s" if msg else "%s: events: %s"
+        self.logger.log(level, fmt, self.name, *args, counts)
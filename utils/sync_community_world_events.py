@@ -154,6 +154,8 @@ def sync_world_event_to_community(world_event_id: int, session_factory) -> bool:
             community.starts_at = starts_at_naive
             community.location_name = event.location_name or community.location_name
             community.location_url = event.location_url
+            # Время/ссылка могли измениться — starts_at_utc пересчитает планировщик напоминаний
+            community.starts_at_utc = None
             community.status = event.status
 
             session.commit()
@@ -1,4 +1,4 @@
-"""PR2 pipeline: LLM → geo → save_parser_event → optional moderation notify."""
+"""PR2 pipeline: LLM → geo → save_parser_events_batch → optional moderation notify."""
 
 from __future__ import annotations
 
@@ -218,39 +218,43 @@ async def process_telegram_post(
     referral_code = _get_referral_code(engine, source.partner_id)
 
     def _save() -> int:
-        return events_service.save_parser_event(
-            source="telegram",
-            external_id=external_id,
-            title=data["title"],
-            description=data["description"],
-            title_en=data.get("title_en"),
-            description_en=data.get("description_en"),
-            starts_at_utc=starts_at,
-            ends_at_utc=ends_at,
-            city=source.default_city,
-            lat=geo.lat,
-            lng=geo.lng,
-            location_name=geo.resolved_name or data.get("location_name"),
-            location_url=geo.location_url,
-            url=event_url,
-            place_id=geo.place_id,
-            status=status,
-            community_name=source.title,
-            community_link=_community_link(source),
-            chat_id=chat_id,
-            organizer_id=organizer_id,
-            organizer_username=organizer,
-            referral_code=referral_code,
-            category_event_data={
+        event = {
+            "source": "telegram",
+            "external_id": external_id,
+            "title": data["title"],
+            "description": data["description"],
+            "title_en": data.get("title_en"),
+            "description_en": data.get("description_en"),
+            "starts_at_utc": starts_at,
+            "ends_at_utc": ends_at,
+            "city": source.default_city,
+            "lat": geo.lat,
+            "lng": geo.lng,
+            "location_name": geo.resolved_name or data.get("location_name"),
+            "location_url": geo.location_url,
+            "url": event_url,
+            "place_id": geo.place_id,
+            "status": status,
+            "community_name": source.title,
+            "community_link": _community_link(source),
+            "chat_id": chat_id,
+            "organizer_id": organizer_id,
+            "organizer_username": organizer,
+            "referral_code": referral_code,
+            "category_event_data": {
                 "categories": data.get("categories") or [],
                 "default_categories": source.default_categories,
             },
-        )
+        }
+        event_id = events_service.save_parser_events_batch([event])[0]
+        if event_id is None:
+            raise RuntimeError("event was not written")
+        return event_id
 
     try:
         event_id = await asyncio.to_thread(_save)
     except Exception as e:
-        logger.exception("save_parser_event failed chat=%s msg=%s", chat_id, message_id)
+        logger.exception("save_parser_events_batch failed chat=%s msg=%s", chat_id, message_id)
         service.log_reject(
             chat_id=chat_id,
             message_id=message_id,
@@ -12,6 +12,7 @@ from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 from config import load_settings
+from utils.send_scheduler import send_priority
 from utils.telegram_sources_service import TelegramSourcesService
 
 logger = logging.getLogger(__name__)
@@ -161,13 +162,14 @@ async def send_moderation_card(
 
     from bot_enhanced_v3 import bot
 
-    await bot.send_message(
-        mod_chat_id,
-        card_text,
-        parse_mode="HTML",
-        reply_markup=moderation_keyboard(event_id),
-        disable_web_page_preview=True,
-    )
+    with send_priority("notify"):
+        await bot.send_message(
+            mod_chat_id,
+            card_text,
+            parse_mode="HTML",
+            reply_markup=moderation_keyboard(event_id),
+            disable_web_page_preview=True,
+        )
     logger.info("Moderation card sent event_id=%s chat=%s", event_id, mod_chat_id)
     return True
 
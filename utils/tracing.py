@@ -0,0 +1,281 @@
+"""
+Трассировка обработки апдейтов бота: дерево span'ов на каждый апдейт.
+
+TracingMiddleware (outer-middleware dp.update) открывает трассу; traced_middleware() оборачивает
+middleware диспетчера, HandlerTracingMiddleware — хендлеры, а каждый SQL-запрос и исходящий
+HTTP-запрос попадают в трассу листом через utils.metrics.add_call_observer. Трасса живет в
+contextvars, поэтому вне апдейта (планировщик, фоновые задачи) span() ничего не стоит.
+
+Самые медленные апдейты за TRACE_WINDOW_S хранятся в slow_updates (TRACE_TOP_N штук вместе с
+деревом span'ов) — их показывает админская /diag_slow и коллектор /metrics.
+Длительности апдейтов и хендлеров, число SQL на апдейт — гистограммы в utils.metrics.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from aiogram import BaseMiddleware
+
+from utils.metrics import add_call_observer, registry
+
+TRACE_TOP_N = int(os.getenv("TRACE_TOP_N", "20"))
+TRACE_WINDOW_S = float(os.getenv("TRACE_WINDOW_S", "3600"))
+# Ограничение дерева одного апдейта: массовые SQL в цикле не раздувают память
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "200"))
+
+UPDATE_SECONDS = registry.histogram("bot_update_duration_seconds", "Обработка апдейта целиком", ("kind",))
+HANDLER_SECONDS = registry.histogram("bot_handler_duration_seconds", "Время хендлера", ("handler",))
+MIDDLEWARE_SECONDS = registry.histogram(
+    "bot_middleware_self_seconds", "Собственное время middleware (без вложенных)", ("middleware",)
+)
+UPDATE_SQL = registry.histogram(
+    "bot_update_sql_statements", "SQL-запросов на апдейт", ("kind",), buckets=(0, 1, 2, 5, 10, 20, 50, 100)
+)
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "children")
+
+    def __init__(self, name: str, start: float, duration: float | None = None):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.children: list[Span] = []
+
+    def self_time(self) -> float:
+        return (self.duration or 0.0) - sum(child.duration or 0.0 for child in self.children)
+
+
+class Trace:
+    """Один апдейт: корневой span, счетчики SQL/HTTP и имя хендлера."""
+
+    __slots__ = (
+        "update_id",
+        "kind",
+        "started_at",
+        "root",
+        "handler",
+        "sql_count",
+        "sql_s",
+        "http_count",
+        "http_s",
+        "span_count",
+        "dropped_spans",
+        "finished",
+    )
+
+    def __init__(self, update_id: int | None, kind: str):
+        self.update_id = update_id
+        self.kind = kind
+        self.started_at = time.time()
+        self.root = Span(f"update:{kind}", time.perf_counter())
+        self.handler: str | None = None
+        self.sql_count = 0
+        self.sql_s = 0.0
+        self.http_count = 0
+        self.http_s = 0.0
+        self.span_count = 0
+        self.dropped_spans = 0
+        self.finished = False
+
+    @property
+    def duration(self) -> float:
+        return self.root.duration or 0.0
+
+    def attach(self, parent: Span, child: Span) -> bool:
+        if self.finished:
+            return False
+        if self.span_count >= TRACE_MAX_SPANS:
+            self.dropped_spans += 1
+            return False
+        parent.children.append(child)
+        self.span_count += 1
+        return True
+
+    def finish(self) -> None:
+        self.root.duration = time.perf_counter() - self.root.start
+        self.finished = True
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("bot_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("bot_trace_span", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """Вложенный span текущей трассы; вне трассы — пустой контекст."""
+    trace = _current_trace.get()
+    if trace is None or trace.finished:
+        yield None
+        return
+    node = Span(name, time.perf_counter())
+    trace.attach(_current_span.get() or trace.root, node)
+    token = _current_span.set(node)
+    try:
+        yield node
+    finally:
+        node.duration = time.perf_counter() - node.start
+        _current_span.reset(token)
+
+
+def record_call(kind: str, name: str, duration_s: float) -> None:
+    """Лист трассы для SQL/HTTP-вызова (зовется из utils.metrics, в том числе из потоков to_thread)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    if kind == "sql":
+        trace.sql_count += 1
+        trace.sql_s += duration_s
+    elif kind == "http":
+        trace.http_count += 1
+        trace.http_s += duration_s
+    trace.attach(
+        _current_span.get() or trace.root,
+        Span(f"{kind} {name}", time.perf_counter() - duration_s, duration_s),
+    )
+
+
+add_call_observer(record_call)
+
+
+class SlowUpdates:
+    """Топ-N самых медленных апдейтов за скользящее окно."""
+
+    def __init__(self, size: int = TRACE_TOP_N, window_s: float = TRACE_WINDOW_S, clock=time.time):
+        self.size = size
+        self.window_s = window_s
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._traces: list[Trace] = []
+
+    def add(self, trace: Trace) -> None:
+        cutoff = self._clock() - self.window_s
+        with self._lock:
+            self._traces = [t for t in self._traces if t.started_at >= cutoff]
+            if len(self._traces) < self.size:
+                self._traces.append(trace)
+            else:
+                fastest = min(range(len(self._traces)), key=lambda i: self._traces[i].duration)
+                if trace.duration <= self._traces[fastest].duration:
+                    return
+                self._traces[fastest] = trace
+            self._traces.sort(key=lambda t: t.duration, reverse=True)
+
+    def top(self, limit: int | None = None) -> list[Trace]:
+        cutoff = self._clock() - self.window_s
+        with self._lock:
+            traces = [t for t in self._traces if t.started_at >= cutoff]
+        return traces[:limit] if limit else traces
+
+    def clear(self) -> None:
+        with self._lock:
+            self._traces.clear()
+
+
+slow_updates = SlowUpdates()
+
+
+def _collect_slow_updates():
+    samples = [
+        ({"rank": rank, "kind": trace.kind, "handler": trace.handler or "-"}, round(trace.duration, 4))
+        for rank, trace in enumerate(slow_updates.top(), start=1)
+    ]
+    return [("bot_slow_update_seconds", "gauge", f"Топ-{TRACE_TOP_N} медленных апдейтов за окно", samples)]
+
+
+registry.register_collector(_collect_slow_updates)
+
+
+def format_trace(trace: Trace, min_ms: float = 1.0) -> str:
+    """Текстовое дерево трассы; span'ы короче min_ms без потомков не показываются."""
+    header = (
+        f"{trace.duration * 1000:.0f} ms update={trace.update_id} {trace.kind} → {trace.handler or '-'} | "
+        f"sql={trace.sql_count} ({trace.sql_s * 1000:.0f} ms) http={trace.http_count} ({trace.http_s * 1000:.0f} ms)"
+    )
+    lines = [header]
+
+    def walk(node: Span, depth: int) -> None:
+        for child in node.children:
+            ms = (child.duration or 0.0) * 1000
+            if ms < min_ms and not child.children:
+                continue
+            own = f" (self {child.self_time() * 1000:.0f} ms)" if child.children else ""
+            lines.append(f"{'  ' * depth}{child.name} {ms:.0f} ms{own}")
+            walk(child, depth + 1)
+
+    walk(trace.root, 1)
+    if trace.dropped_spans:
+        lines.append(f"  … ещё {trace.dropped_spans} span'ов не записано")
+    return "\n".join(lines)
+
+
+def _update_kind(event: Any) -> str:
+    return getattr(event, "event_type", None) or type(event).__name__.lower()
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Outer-middleware dp.update: трасса на апдейт, метрики и топ медленных."""
+
+    async def __call__(
+        self, handler: Callable[[Any, dict[str, Any]], Awaitable[Any]], event: Any, data: dict[str, Any]
+    ) -> Any:
+        trace = Trace(getattr(event, "update_id", None), _update_kind(event))
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+        try:
+            return await handler(event, data)
+        finally:
+            trace.finish()
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            UPDATE_SECONDS.labels(trace.kind).observe(trace.duration)
+            UPDATE_SQL.labels(trace.kind).observe(trace.sql_count)
+            slow_updates.add(trace)
+
+
+def traced_middleware(middleware: Callable, name: str | None = None) -> Callable:
+    """Оборачивает middleware: span "middleware:<name>" и собственное время в метриках."""
+    name = name or type(middleware).__name__
+
+    async def wrapper(handler, event, data):
+        with span(f"middleware:{name}") as node:
+            try:
+                return await middleware(handler, event, data)
+            finally:
+                if node is not None:
+                    node.duration = time.perf_counter() - node.start
+                    MIDDLEWARE_SECONDS.labels(name).observe(node.self_time())
+
+    wrapper.__name__ = f"traced_{name}"
+    return wrapper
+
+
+class HandlerTracingMiddleware(BaseMiddleware):
+    """Inner-middleware (message, callback_query, ...): span и гистограмма по имени хендлера."""
+
+    async def __call__(
+        self, handler: Callable[[Any, dict[str, Any]], Awaitable[Any]], event: Any, data: dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__name__", None) or "unknown"
+        trace = _current_trace.get()
+        if trace is not None and trace.handler is None:
+            trace.handler = name
+        started = time.perf_counter()
+        try:
+            with span(f"handler:{name}"):
+                return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.labels(name).observe(time.perf_counter() - started)
@@ -0,0 +1,596 @@
+"""
+Единый сервис перевода событий (events, events_community) с очередью заданий в Postgres.
+
+Кто угодно (парсеры, create_user_event, события сообществ, догоняющий backfill) только ставит
+задание в translation_jobs (миграция 060) — перевод делает один фоновый воркер:
+
+  1. забирает пачку заданий (FOR UPDATE SKIP LOCKED — несколько процессов не мешают друг другу);
+  2. собирает названия и описания, которым нужен перевод, и убирает повторы;
+  3. ищет их в памяти переводов translation_memory по sha256 исходного текста — еженедельные
+     события с тем же текстом повторно в OpenAI не отправляются;
+  4. остальное упаковывает в запросы translate_texts_batch под бюджет токенов;
+  5. пишет результат одним UPDATE ... FROM jsonb_to_recordset на таблицу.
+
+Язык события определяет detect_event_language: RU → title_en/description_en; EN-оригинал копируется
+в _en, а у пользовательских событий (event_source='user') title/description переводятся на русский.
+location_name не переводится — location_name_en заполняется оригиналом.
+
+Задание, по которому перевод не получен, повторяется с паузой (user — 30 сек, parser — 10 мин);
+после TRANSLATION_MAX_ATTEMPTS попыток остается в статусе failed и больше не берется.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+
+from sqlalchemy import text
+
+from utils.event_translation import detect_event_language, translate_texts_batch
+from utils.events_snapshot import events_snapshot
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_BATCH_TOKEN_BUDGET = int(os.getenv("TRANSLATION_BATCH_TOKEN_BUDGET", "6000"))
+TRANSLATION_BATCH_MAX_ITEMS = int(os.getenv("TRANSLATION_BATCH_MAX_ITEMS", "40"))
+TRANSLATION_JOBS_PER_CLAIM = int(os.getenv("TRANSLATION_JOBS_PER_CLAIM", "50"))
+TRANSLATION_WORKER_INTERVAL_S = float(os.getenv("TRANSLATION_WORKER_INTERVAL_S", "60"))
+TRANSLATION_MAX_ATTEMPTS = 3
+# Задание в работе дольше этого считается брошенным (процесс упал) и снова доступно
+TRANSLATION_LOCK_S = 600
+
+PRIORITY_USER = 0
+PRIORITY_PARSER = 1
+# Пауза перед повтором: пользовательские события — короткое окно, парсерные — длинное
+RETRY_DELAY_S = {PRIORITY_USER: 30, PRIORITY_PARSER: 600}
+
+TARGET_TABLES = ("events", "events_community")
+
+TRANSLATION_CALLS = registry.counter(
+    "translation_api_calls_total", "Пакетные запросы перевода к OpenAI", ("lang", "result")
+)
+TRANSLATION_CALL_SECONDS = registry.histogram(
+    "translation_api_call_duration_seconds", "Запрос перевода к OpenAI", ("lang",)
+)
+TRANSLATION_QUEUE = registry.gauge("translation_queue_jobs", "Задания в translation_jobs по статусу", ("status",))
+TRANSLATION_TEXTS = registry.counter("translation_texts_total", "Переведенные тексты по источнику перевода", ("via",))
+
+
+def text_hash(source: str) -> str:
+    return hashlib.sha256(source.strip().encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(source: str) -> int:
+    """Грубая оценка без токенизатора: кириллица — около 2 символов на токен, плюс разметка JSON."""
+    return len(source) // 2 + 4
+
+
+def pack_batches(
+    texts: list[str],
+    token_budget: int = TRANSLATION_BATCH_TOKEN_BUDGET,
+    max_items: int = TRANSLATION_BATCH_MAX_ITEMS,
+) -> list[list[str]]:
+    """Жадно режет тексты на пачки под бюджет токенов; текст больше бюджета идет отдельной пачкой."""
+    batches: list[list[str]] = []
+    current: list[str] = []
+    used = 0
+    for source in texts:
+        cost = estimate_tokens(source)
+        if current and (used + cost > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(source)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+_ENQUEUE_SQL = text("""
+    INSERT INTO translation_jobs (target_table, target_id, priority)
+    SELECT :target_table, v.target_id, :priority
+    FROM unnest(CAST(:ids AS BIGINT[])) AS v(target_id)
+    ON CONFLICT (target_table, target_id) DO UPDATE SET
+        status = 'pending',
+        attempts = 0,
+        priority = LEAST(translation_jobs.priority, EXCLUDED.priority),
+        available_at = NOW(),
+        last_error = NULL
+""")
+
+# Догоняющий обход: события без перевода, которых еще нет в очереди (failed-задания не воскрешаются)
+_SWEEP_SQL = {
+    "events": text("""
+        INSERT INTO translation_jobs (target_table, target_id, priority)
+        SELECT 'events', id, CASE WHEN event_source = 'user' THEN 0 ELSE 1 END
+        FROM events
+        WHERE TRIM(COALESCE(title, '')) != ''
+          AND (
+              COALESCE(title_en, '') = ''
+              OR (TRIM(COALESCE(description, '')) != '' AND COALESCE(description_en, '') = '')
+          )
+          AND COALESCE(translation_failed, false) = false
+          AND (CAST(:priority AS SMALLINT) IS NULL
+               OR (CASE WHEN event_source = 'user' THEN 0 ELSE 1 END) = CAST(:priority AS SMALLINT))
+        ORDER BY id
+        LIMIT :limit
+        ON CONFLICT (target_table, target_id) DO NOTHING
+    """),
+    "events_community": text("""
+        INSERT INTO translation_jobs (target_table, target_id, priority)
+        SELECT 'events_community', id, 0
+        FROM events_community
+        WHERE TRIM(COALESCE(title, '')) != ''
+          AND (
+              COALESCE(title_en, '') = ''
+              OR (TRIM(COALESCE(description, '')) != '' AND COALESCE(description_en, '') = '')
+          )
+          AND (CAST(:priority AS SMALLINT) IS NULL OR CAST(:priority AS SMALLINT) = 0)
+        ORDER BY id
+        LIMIT :limit
+        ON CONFLICT (target_table, target_id) DO NOTHING
+    """),
+}
+
+_CLAIM_SQL = text("""
+    UPDATE translation_jobs j
+    SET attempts = j.attempts + 1,
+        locked_until = NOW() + make_interval(secs => :lock_s)
+    FROM (
+        SELECT id
+        FROM translation_jobs
+        WHERE status = 'pending'
+          AND available_at <= NOW()
+          AND (locked_until IS NULL OR locked_until < NOW())
+          AND (CAST(:priority AS SMALLINT) IS NULL OR priority = CAST(:priority AS SMALLINT))
+        ORDER BY priority, id
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    ) AS picked
+    WHERE j.id = picked.id
+    RETURNING j.id, j.target_table, j.target_id, j.priority, j.attempts
+""")
+
+_RETRY_SQL = text("""
+    UPDATE translation_jobs j
+    SET attempts = v.attempts,
+        status = CASE WHEN v.attempts >= :max_attempts THEN 'failed' ELSE 'pending' END,
+        available_at = NOW() + make_interval(secs => v.delay_s),
+        locked_until = NULL,
+        last_error = v.error
+    FROM jsonb_to_recordset(CAST(:rows AS JSONB)) AS v(id BIGINT, attempts INT, delay_s INT, error TEXT)
+    WHERE j.id = v.id
+""")
+
+_LOAD_SQL = {
+    "events": text("""
+        SELECT id, title, description, location_name, title_en, description_en, event_source, city
+        FROM events
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+    """),
+    "events_community": text("""
+        SELECT id, title, description, NULL AS location_name, title_en, description_en,
+               'community' AS event_source, NULL AS city
+        FROM events_community
+        WHERE id = ANY(CAST(:ids AS BIGINT[]))
+    """),
+}
+
+_UPDATE_SQL = {
+    "events": text("""
+        UPDATE events e
+        SET title = COALESCE(v.title, e.title),
+            description = COALESCE(v.description, e.description),
+            title_en = COALESCE(v.title_en, e.title_en),
+            description_en = COALESCE(v.description_en, e.description_en),
+            location_name_en = COALESCE(e.location_name_en, e.location_name),
+            translation_retry_count = 0
+        FROM jsonb_to_recordset(CAST(:rows AS JSONB))
+            AS v(id BIGINT, title TEXT, description TEXT, title_en TEXT, description_en TEXT)
+        WHERE e.id = v.id
+    """),
+    "events_community": text("""
+        UPDATE events_community e
+        SET title_en = COALESCE(v.title_en, e.title_en),
+            description_en = COALESCE(v.description_en, e.description_en)
+        FROM jsonb_to_recordset(CAST(:rows AS JSONB)) AS v(id BIGINT, title_en TEXT, description_en TEXT)
+        WHERE e.id = v.id
+    """),
+}
+
+# Исчерпанные попытки по events видны и в самой таблице (как раньше делал backfill)
+_MARK_FAILED_SQL = text("""
+    UPDATE events
+    SET translation_failed = true, translation_retry_count = :max_attempts
+    WHERE id = ANY(CAST(:ids AS BIGINT[]))
+""")
+
+_MEMORY_GET_SQL = text("""
+    UPDATE translation_memory
+    SET hits = hits + 1, last_used_at = NOW()
+    WHERE target_lang = :target_lang AND source_hash = ANY(CAST(:hashes AS TEXT[]))
+    RETURNING source_hash, translated_text
+""")
+
+_MEMORY_SET_SQL = text("""
+    INSERT INTO translation_memory (target_lang, source_hash, translated_text)
+    SELECT :target_lang, v.source_hash, v.translated_text
+    FROM unnest(CAST(:hashes AS TEXT[]), CAST(:translations AS TEXT[])) AS v(source_hash, translated_text)
+    ON CONFLICT (target_lang, source_hash) DO UPDATE SET
+        translated_text = EXCLUDED.translated_text,
+        last_used_at = NOW()
+""")
+
+_QUEUE_DEPTH_SQL = text("""
+    SELECT COUNT(*) FILTER (WHERE status = 'pending'), COUNT(*) FILTER (WHERE status = 'failed')
+    FROM translation_jobs
+""")
+
+
+def _default_engine():
+    import database
+
+    return database.engine
+
+
+def _clean(value: str | None) -> str | None:
+    return (value or "").strip() or None
+
+
+class TranslationService:
+    """Очередь заданий перевода, память переводов и воркер, который их обрабатывает."""
+
+    def __init__(self, engine_getter=_default_engine, translator=translate_texts_batch):
+        self._engine_getter = engine_getter
+        self._translator = translator
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._worker: threading.Thread | None = None
+        self.jobs_done = 0
+        self.jobs_retried = 0
+        self.jobs_failed = 0
+        self.texts_requested = 0
+        self.memory_hits = 0
+        self.api_texts = 0
+        self.api_calls = 0
+        self.busy_s = 0.0
+        self.queue_pending: int | None = None
+        self.queue_failed: int | None = None
+
+    # --- очередь ---------------------------------------------------------------
+
+    def enqueue(self, target_table: str, ids: list[int], priority: int = PRIORITY_PARSER) -> None:
+        """
+        Ставит события в очередь перевода одной вставкой и будит воркер этого процесса.
+        Ошибка записи в очередь не мешает вызывающему: событие подберет догоняющий обход.
+        """
+        if target_table not in TARGET_TABLES:
+            raise ValueError(f"unknown translation target: {target_table}")
+        ids = [int(i) for i in ids if i is not None]
+        if not ids:
+            return
+        try:
+            with self._engine_getter().begin() as conn:
+                conn.execute(_ENQUEUE_SQL, {"target_table": target_table, "ids": ids, "priority": priority})
+        except Exception as e:
+            logger.warning("[TRANSLATION] Не удалось поставить %s %s в очередь: %s", target_table, ids[:5], e)
+            return
+        self.kick()
+
+    def enqueue_missing(self, priority: int | None = None, limit: int = 5000) -> int:
+        """Догоняющий обход: ставит в очередь события без перевода. Возвращает число новых заданий."""
+        added = 0
+        with self._engine_getter().begin() as conn:
+            for sql in _SWEEP_SQL.values():
+                added += conn.execute(sql, {"priority": priority, "limit": limit}).rowcount or 0
+        if added:
+            logger.info("[TRANSLATION] Догоняющий обход: в очередь добавлено %s событий", added)
+        return added
+
+    def refresh_queue_depth(self) -> None:
+        with self._engine_getter().connect() as conn:
+            pending, failed = conn.execute(_QUEUE_DEPTH_SQL).fetchone()
+        with self._lock:
+            self.queue_pending, self.queue_failed = int(pending), int(failed)
+        TRANSLATION_QUEUE.labels("pending").set(pending)
+        TRANSLATION_QUEUE.labels("failed").set(failed)
+
+    # --- память переводов и пакетные запросы -------------------------------------
+
+    def translate_texts(self, texts: list[str], target_lang: str) -> tuple[dict[str, str], bool]:
+        """
+        Переводит тексты через память переводов и пакетные запросы к OpenAI.
+        Возвращает ({исходный текст: перевод}, api_failed); непереведенных текстов в словаре нет.
+        """
+        unique = list(dict.fromkeys(t for t in (_clean(t) for t in texts) if t))
+        if not unique:
+            return {}, False
+        hashes = {source: text_hash(source) for source in unique}
+
+        with self._engine_getter().begin() as conn:
+            remembered = {
+                row.source_hash: row.translated_text
+                for row in conn.execute(_MEMORY_GET_SQL, {"target_lang": target_lang, "hashes": list(hashes.values())})
+            }
+        found = {source: remembered[h] for source, h in hashes.items() if h in remembered}
+        misses = [source for source in unique if source not in found]
+        with self._lock:
+            self.texts_requested += len(unique)
+            self.memory_hits += len(found)
+        TRANSLATION_TEXTS.labels("memory").inc(len(found))
+
+        translated: dict[str, str] = {}
+        api_failed = False
+        pending = pack_batches(misses)
+        while pending:
+            batch = pending.pop(0)
+            with TRANSLATION_CALL_SECONDS.labels(target_lang).time():
+                results = self._translator(batch, target_lang)
+            with self._lock:
+                self.api_calls += 1
+            if results is None:
+                TRANSLATION_CALLS.labels(target_lang, "failed").inc()
+                api_failed = True
+                break
+            TRANSLATION_CALLS.labels(target_lang, "ok").inc()
+            TRANSLATION_TEXTS.labels("api").inc(len(batch))
+            if len(batch) > 1 and not any(results):
+                # Модель сбилась на длинной пачке (не та длина массива) — пробуем половинами
+                middle = len(batch) // 2
+                pending[:0] = [batch[:middle], batch[middle:]]
+                continue
+            for source, result in zip(batch, results):
+                if result:
+                    translated[source] = result
+            with self._lock:
+                self.api_texts += len(batch)
+
+        if translated:
+            with self._engine_getter().begin() as conn:
+                conn.execute(
+                    _MEMORY_SET_SQL,
+                    {
+                        "target_lang": target_lang,
+                        "hashes": [hashes[source] for source in translated],
+                        "translations": list(translated.values()),
+                    },
+                )
+        return found | translated, api_failed
+
+    # --- обработка заданий -------------------------------------------------------
+
+    def _plan(self, row) -> dict[str, Any]:
+        """Что нужно сделать со строкой: копии EN-оригинала и тексты для перевода по языкам."""
+        title, description = _clean(row.title), _clean(row.description)
+        plan: dict[str, Any] = {"id": row.id, "copy": {}, "need": {}, "optional": {}}
+        if not title:
+            return plan
+        needs_title = not _clean(row.title_en)
+        needs_description = bool(description) and not _clean(row.description_en)
+        if detect_event_language(title, description or "") == "en":
+            if needs_title:
+                plan["copy"]["title_en"] = title
+            if needs_description:
+                plan["copy"]["description_en"] = description
+            if row.event_source == "user" and needs_title:
+                # EN-оригинал пользователя: основные поля переводим на русский, при неудаче остается EN
+                plan["optional"] = {"title": ("ru", title), "description": ("ru", description)}
+        else:
+            if needs_title:
+                plan["need"]["title_en"] = ("en", title)
+            if needs_description:
+                plan["need"]["description_en"] = ("en", description)
+        return plan
+
+    def _process_table(self, target_table: str, jobs: list) -> tuple[list, list, bool]:
+        """Переводит события одной таблицы. Возвращает (выполненные задания, неудачные, api_failed)."""
+        with self._engine_getter().connect() as conn:
+            rows = {row.id: row for row in conn.execute(_LOAD_SQL[target_table], {"ids": [j.target_id for j in jobs]})}
+
+        plans = {event_id: self._plan(row) for event_id, row in rows.items()}
+        texts: dict[str, list[str]] = {"en": [], "ru": []}
+        for plan in plans.values():
+            for lang, source in [*plan["need"].values(), *plan["optional"].values()]:
+                if source:
+                    texts[lang].append(source)
+
+        translations: dict[str, dict[str, str]] = {}
+        api_failed = False
+        for lang, sources in texts.items():
+            translations[lang], failed = self.translate_texts(sources, lang) if sources else ({}, False)
+            api_failed = api_failed or failed
+
+        updates = []
+        done, retry = [], []
+        cities = set()
+        for job in jobs:
+            plan = plans.get(job.target_id)
+            if plan is None:
+                done.append(job)  # событие уже удалено
+                continue
+            values = dict(plan["copy"])
+            missing = False
+            for field, (lang, source) in plan["need"].items():
+                result = translations[lang].get(source)
+                if result:
+                    values[field] = result
+                else:
+                    missing = True
+            for field, (lang, source) in plan["optional"].items():
+                if source and translations[lang].get(source):
+                    values[field] = translations[lang][source]
+            if values:
+                updates.append({"id": job.target_id, **values})
+            (retry if missing else done).append(job)
+            if values and target_table == "events":
+                cities.add(rows[job.target_id].city)
+
+        if updates:
+            with self._engine_getter().begin() as conn:
+                conn.execute(_UPDATE_SQL[target_table], {"rows": _json(updates)})
+        for city in cities:
+            events_snapshot.invalidate(city)
+        return done, retry, api_failed
+
+    def process_once(self, priority: int | None = None, limit: int = TRANSLATION_JOBS_PER_CLAIM) -> dict[str, int]:
+        """Забирает одну пачку заданий и обрабатывает ее. Возвращает счетчики пачки."""
+        started = time.monotonic()
+        with self._engine_getter().begin() as conn:
+            jobs = conn.execute(
+                _CLAIM_SQL, {"priority": priority, "limit": limit, "lock_s": TRANSLATION_LOCK_S}
+            ).fetchall()
+        if not jobs:
+            return {"claimed": 0, "done": 0, "retried": 0, "failed": 0, "api_failed": False}
+
+        done, retry, api_failed = [], [], False
+        for target_table in TARGET_TABLES:
+            table_jobs = [job for job in jobs if job.target_table == target_table]
+            if not table_jobs:
+                continue
+            try:
+                table_done, table_retry, failed = self._process_table(target_table, table_jobs)
+            except Exception as e:
+                logger.warning("[TRANSLATION] Пачка %s не обработана: %s", target_table, e)
+                table_done, table_retry, failed = [], table_jobs, False
+            done += table_done
+            retry += table_retry
+            api_failed = api_failed or failed
+
+        dead = self._finish(done, retry, api_failed)
+        with self._lock:
+            self.jobs_done += len(done)
+            self.jobs_retried += len(retry) - len(dead)
+            self.jobs_failed += len(dead)
+            self.busy_s += time.monotonic() - started
+        return {
+            "claimed": len(jobs),
+            "done": len(done),
+            "retried": len(retry) - len(dead),
+            "failed": len(dead),
+            "api_failed": api_failed,
+        }
+
+    def _finish(self, done: list, retry: list, api_failed: bool) -> list:
+        """Удаляет выполненные задания, остальные откладывает. Возвращает задания с исчерпанными попытками."""
+        rows = []
+        dead = []
+        for job in retry:
+            # Недоступность API — не вина задания: попытку не засчитываем
+            attempts = job.attempts - 1 if api_failed else job.attempts
+            rows.append(
+                {
+                    "id": job.id,
+                    "attempts": attempts,
+                    "delay_s": RETRY_DELAY_S.get(job.priority, RETRY_DELAY_S[PRIORITY_PARSER]),
+                    "error": "openai unavailable" if api_failed else "translation missing",
+                }
+            )
+            if attempts >= TRANSLATION_MAX_ATTEMPTS:
+                dead.append(job)
+        with self._engine_getter().begin() as conn:
+            if done:
+                conn.execute(
+                    text("DELETE FROM translation_jobs WHERE id = ANY(CAST(:ids AS BIGINT[]))"),
+                    {"ids": [job.id for job in done]},
+                )
+            if rows:
+                conn.execute(_RETRY_SQL, {"rows": _json(rows), "max_attempts": TRANSLATION_MAX_ATTEMPTS})
+            dead_events = [job.target_id for job in dead if job.target_table == "events"]
+            if dead_events:
+                conn.execute(_MARK_FAILED_SQL, {"ids": dead_events, "max_attempts": TRANSLATION_MAX_ATTEMPTS})
+        return dead
+
+    def run_pending(self, priority: int | None = None, max_jobs: int | None = None) -> dict[str, int]:
+        """
+        Обрабатывает очередь, пока она не опустеет, не кончится max_jobs или не откажет API.
+        Возвращает {"processed", "translated", "skipped"} — как прежний run_backfill.
+        """
+        processed = translated = skipped = 0
+        while max_jobs is None or processed < max_jobs:
+            limit = TRANSLATION_JOBS_PER_CLAIM
+            if max_jobs is not None:
+                limit = min(limit, max_jobs - processed)
+            result = self.process_once(priority=priority, limit=limit)
+            if not result["claimed"]:
+                break
+            processed += result["claimed"]
+            translated += result["done"]
+            skipped += result["retried"] + result["failed"]
+            if result["api_failed"]:
+                logger.warning("[TRANSLATION] OpenAI недоступен, очередь продолжим позже")
+                break
+        try:
+            self.refresh_queue_depth()
+        except Exception as e:
+            logger.debug("[TRANSLATION] Не удалось посчитать глубину очереди: %s", e)
+        if processed:
+            stats = self.stats()
+            logger.info(
+                "[TRANSLATION] processed=%s translated=%s skipped=%s | hit_rate=%.0f%% api_calls=%s "
+                "throughput=%.1f jobs/s queue=%s failed=%s",
+                processed,
+                translated,
+                skipped,
+                stats["memory_hit_rate"] * 100,
+                stats["api_calls"],
+                stats["throughput_jobs_per_s"],
+                stats["queue_pending"],
+                stats["queue_failed"],
+            )
+        return {"processed": processed, "translated": translated, "skipped": skipped}
+
+    # --- фоновый воркер -------------------------------------------------------
+
+    def start_worker(self) -> None:
+        """Запускает фоновый поток, который разбирает очередь по kick() и раз в TRANSLATION_WORKER_INTERVAL_S."""
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(target=self._worker_loop, name="translation-worker", daemon=True)
+        self._worker.start()
+        logger.info("[TRANSLATION] Воркер перевода запущен")
+
+    def stop_worker(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+
+    def kick(self) -> None:
+        """Будит воркер сразу после постановки задания (в процессе без воркера — ничего не делает)."""
+        self._wakeup.set()
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.warning("[TRANSLATION] Ошибка воркера: %s", e)
+            self._wakeup.wait(TRANSLATION_WORKER_INTERVAL_S)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "jobs_done": self.jobs_done,
+                "jobs_retried": self.jobs_retried,
+                "jobs_failed": self.jobs_failed,
+                "texts_requested": self.texts_requested,
+                "memory_hits": self.memory_hits,
+                "memory_hit_rate": self.memory_hits / self.texts_requested if self.texts_requested else 0.0,
+                "api_calls": self.api_calls,
+                "api_texts": self.api_texts,
+                "throughput_jobs_per_s": self.jobs_done / self.busy_s if self.busy_s else 0.0,
+                "queue_pending": self.queue_pending,
+                "queue_failed": self.queue_failed,
+            }
+
+
+def _json(rows: list[dict]) -> str:
+    return json.dumps(rows, ensure_ascii=False)
+
+
+translation_service = TranslationService()
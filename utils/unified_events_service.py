@@ -4,24 +4,40 @@
 
 import json
 import logging
-import threading
 import time
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timedelta
 
 from sqlalchemy import text
 
 from utils.event_category_manager import EventCategoryManager
-from utils.event_dedupe import compute_dedupe_key, dedupe_events_for_display, find_duplicate_event_id
-from utils.event_translation import (
-    detect_event_language,
-    translate_event_to_english,
-    translate_event_to_russian,
+from utils.event_dedupe import (
+    compute_dedupe_key,
+    dedupe_events_for_display,
+    events_look_same,
+    find_duplicate_event_ids,
 )
+from utils.event_record import EventRecord
+from utils.events_snapshot import RegionSnapshot, events_snapshot
+from utils.geo_utils import bbox_around
+from utils.metrics import registry
 from utils.simple_timezone import get_today_start_utc, get_tomorrow_start_utc
-from utils.structured_logging import StructuredLogger
+from utils.structured_logging import HotPathLog, StructuredLogger
+from utils.translation_service import PRIORITY_PARSER, PRIORITY_USER, translation_service
 
 logger = logging.getLogger(__name__)
 
+SEARCH_SECONDS = registry.histogram("search_duration_seconds", "Поиск событий рядом/на сегодня", ("region",))
+SEARCH_RESULTS = registry.histogram(
+    "search_results", "Найдено событий за поиск", ("region",), buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500)
+)
+INGEST_EVENTS = registry.counter(
+    "ingest_events_total", "Парсерные события на записи: written / duplicate / failed", ("source", "result")
+)
+INGEST_BATCH_SECONDS = registry.histogram(
+    "ingest_batch_duration_seconds", "Запись пакета парсерных событий", ("source",)
+)
+
 _SEARCH_EVENT_SELECT = """
     source, id, title, description, title_en, description_en, location_name_en,
     starts_at, city, lat, lng, location_name,
@@ -31,7 +47,7 @@ _SEARCH_EVENT_SELECT = """
     community_name, community_link, chat_id, location_name as venue_name,
     location_name as address, place_id,
     '' as geo_hash, starts_at as starts_at_normalized, ends_at, time_mode,
-    categories, raw_category, referral_code
+    categories, raw_category, referral_code, dedupe_key
 """
 
 
@@ -55,51 +71,524 @@ def _parse_categories_value(value) -> list:
     return []
 
 
-def _search_row_to_event_dict(row) -> dict:
+def _search_row_to_event_record(row) -> EventRecord:
+    """Строка поиска -> EventRecord (один объект на событие вместо словаря на ~35 ключей)."""
     source_type = "user" if row[0] == "user" else "parser"
+    return EventRecord(
+        source_type=source_type,
+        source=row[0],
+        id=row[1],
+        title=row[2],
+        description=row[3],
+        title_en=row[4] if len(row) > 4 else None,
+        description_en=row[5] if len(row) > 5 else None,
+        location_name_en=row[6] if len(row) > 6 else None,
+        starts_at=row[7],
+        city=row[8],
+        lat=row[9],
+        lng=row[10],
+        location_name=row[11],
+        location_url=row[12],
+        event_url=row[13],
+        organizer_id=row[14],
+        organizer_username=row[15],
+        max_participants=row[16],
+        current_participants=row[17],
+        status=row[18],
+        created_at_utc=row[19],
+        community_name=row[20] if len(row) > 20 else None,
+        community_link=row[21] if len(row) > 21 else None,
+        chat_id=row[22] if len(row) > 22 else None,
+        venue_name=row[23] if len(row) > 23 else None,
+        address=row[24] if len(row) > 24 else None,
+        place_id=row[25] if len(row) > 25 else None,
+        ends_at=row[28] if len(row) > 28 else None,
+        time_mode=row[29] if len(row) > 29 else None,
+        categories=_parse_categories_value(row[30] if len(row) > 30 else None),
+        raw_category=row[31] if len(row) > 31 else None,
+        tags=_parse_raw_category_tags(row[31] if len(row) > 31 else None),
+        referral_code=row[32] if len(row) > 32 else None,
+        dedupe_key=row[33] if len(row) > 33 else None,
+    )
+
+
+def _search_window(city: str | None, date_offset: int) -> tuple[datetime, datetime]:
+    """Границы дня [start_utc, end_utc) для города с учетом смещения даты (0 = сегодня, 1 = завтра)."""
+    if date_offset == 0:
+        # Сегодня
+        return get_today_start_utc(city), get_tomorrow_start_utc(city)
+    if date_offset == 1:
+        # Завтра; конец завтрашнего дня = начало послезавтрашнего дня
+        start_utc = get_tomorrow_start_utc(city)
+        return start_utc, start_utc + timedelta(days=1)
+    # Для других значений используем общую формулу
+    start_utc = get_today_start_utc(city) + timedelta(days=date_offset)
+    return start_utc, start_utc + timedelta(days=1)
+
+
+def _build_nearby_query(
+    user_lat: float,
+    user_lng: float,
+    radius_km: float,
+    start_utc: datetime,
+    end_utc: datetime,
+    city: str | None = None,
+):
+    """
+    SQL для поиска в радиусе: сначала рамка (bbox) по индексированным lat/lng,
+    затем точная дистанция только для попавших в рамку строк.
+    Возвращает (query, params); в строках есть колонка distance_km.
+    """
+    min_lat, max_lat, min_lng, max_lng = bbox_around(user_lat, user_lng, radius_km)
+    params = {
+        "start_utc": start_utc,
+        "end_utc": end_utc,
+        "user_lat": user_lat,
+        "user_lng": user_lng,
+        "radius_km": radius_km,
+        "min_lat": min_lat,
+        "max_lat": max_lat,
+        "min_lng": min_lng,
+        "max_lng": max_lng,
+    }
+    city_filter = ""
+    if city:
+        city_filter = "AND city = :city"
+        params["city"] = city
+
+    # Важно: фильтруем события, которые начались не более 3 часов назад
+    # (starts_at >= NOW() - INTERVAL '3 hours')
+    # и события в пределах запрошенного дня (starts_at >= start_utc AND starts_at < end_utc)
+    # Это позволяет видеть события в течение 3 часов после начала
+    # (для долгих событий: вечеринки, выставки)
+    query = text(f"""
+        WITH candidates AS (
+            SELECT {_SEARCH_EVENT_SELECT}
+            FROM events
+            WHERE starts_at >= :start_utc
+            AND starts_at < :end_utc
+            AND (
+                (ends_at IS NOT NULL AND ends_at >= NOW())
+                OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
+            )
+            AND lat IS NOT NULL AND lng IS NOT NULL
+            AND lat BETWEEN :min_lat AND :max_lat
+            AND lng BETWEEN :min_lng AND :max_lng
+            AND status NOT IN ('closed', 'canceled', 'draft')
+            {city_filter}
+        ),
+        measured AS (
+            SELECT candidates.*,
+                6371 * acos(
+                    GREATEST(-1, LEAST(1,
+                        cos(radians(:user_lat)) * cos(radians(lat)) *
+                        cos(radians(lng) - radians(:user_lng)) +
+                        sin(radians(:user_lat)) * sin(radians(lat))
+                    ))
+                ) AS distance_km
+            FROM candidates
+        )
+        SELECT * FROM measured
+        WHERE distance_km <= :radius_km
+        ORDER BY starts_at, distance_km
+    """)
+    return query, params
+
+
+def _build_window_query(start_utc: datetime, end_utc: datetime, city: str | None = None):
+    """SQL для поиска без координат: все активные события города за окно [start_utc, end_utc)."""
+    params = {
+        "start_utc": start_utc,
+        "end_utc": end_utc,
+    }
+    city_filter = ""
+    if city:
+        city_filter = "AND city = :city"
+        params["city"] = city
+
+    query = text(f"""
+        SELECT {_SEARCH_EVENT_SELECT}
+        FROM events
+        WHERE starts_at >= :start_utc
+        AND starts_at < :end_utc
+        AND (
+            (ends_at IS NOT NULL AND ends_at >= NOW())
+            OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
+        )
+        AND status NOT IN ('closed', 'canceled', 'draft')
+        {city_filter}
+        ORDER BY starts_at
+    """)
+    return query, params
+
+
+def _build_snapshot_query(start_utc: datetime, end_utc: datetime, city: str):
+    """
+    SQL загрузки снапшота: все события города с координатами за окно [start_utc, end_utc).
+    Фильтр по NOW() сюда не входит — снапшот живет дольше одного запроса, он применяется в памяти.
+    """
+    query = text(f"""
+        SELECT {_SEARCH_EVENT_SELECT}
+        FROM events
+        WHERE starts_at >= :start_utc
+        AND starts_at < :end_utc
+        AND lat IS NOT NULL AND lng IS NOT NULL
+        AND status NOT IN ('closed', 'canceled', 'draft')
+        AND city = :city
+    """)
+    return query, {"start_utc": start_utc, "end_utc": end_utc, "city": city}
+
+
+# Fallback: поиск без радиуса по временным границам региона
+_REGION_FALLBACK_QUERY = text(f"""
+    SELECT {_SEARCH_EVENT_SELECT}
+    FROM events
+    WHERE starts_at >= :start_utc
+    AND starts_at < :end_utc
+    AND (
+        (ends_at IS NOT NULL AND ends_at >= NOW())
+        OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
+    )
+    AND status NOT IN ('closed', 'canceled', 'draft')
+    ORDER BY starts_at
+    LIMIT 50
+""")
+
+
+def _collect_search_events(rows, with_distance: bool) -> tuple[list[dict], int, int]:
+    """Строки поиска -> (события, найдено пользовательских, найдено парсерных)."""
+    events = []
+    found_user = 0
+    found_parser = 0
+    hot = HotPathLog(logger, "search_rows")
+
+    for row in rows:
+        if row[0] == "user":
+            found_user += 1
+            hot.event("user", "'%s', organizer_id=%s, organizer_username='%s'", row[2], row[14], row[15])
+        else:
+            found_parser += 1
+            hot.event("parser")
+
+        event_data = _search_row_to_event_record(row)
+        if with_distance:
+            event_data["distance_km"] = round(row.distance_km, 2)
+
+        events.append(event_data)
+
+    # Одна строка на запрос; отбрасывание (радиус, дубли) считает сводка prepare_events_for_feed
+    hot.summary("rows=%s with_distance=%s", len(events), with_distance)
+    return events, found_user, found_parser
+
+
+def _search_snapshot(snapshot: RegionSnapshot, user_lat, user_lng, radius_km) -> tuple[list[dict], int, int]:
+    """Радиусный поиск по снапшоту -> (события, найдено пользовательских, найдено парсерных)."""
+    events = snapshot.search(user_lat, user_lng, radius_km)
+    found_user = sum(1 for event in events if event["source"] == "user")
+    return events, found_user, len(events) - found_user
+
+
+def _needs_region_fallback(events: list[dict], city: str | None, user_lat, user_lng) -> bool:
+    """
+    Если не найдено событий с координатами, проверяем соответствие координат региону:
+    fallback поиск только если координаты определены и не соответствуют региону.
+    """
+    if events or not (user_lat and user_lng):
+        return False
+
+    from utils.simple_timezone import get_city_from_coordinates
+
+    detected_city = get_city_from_coordinates(user_lat, user_lng)
+    if detected_city is not None and detected_city != city:
+        logger.warning(
+            f"⚠️ Координаты пользователя ({user_lat}, {user_lng}) не соответствуют региону '{city}'. "
+            f"Определен регион: '{detected_city}'. Пробуем поиск без радиуса..."
+        )
+        return True
+    return False
+
+
+def _finish_search(
+    events: list[dict],
+    *,
+    city: str | None,
+    user_lat,
+    user_lng,
+    radius_km: float,
+    found_user: int,
+    found_parser: int,
+    message_id: str | None,
+    start_time: float,
+) -> list[dict]:
+    """Логирует результат поиска и убирает дубли для показа."""
+    empty_reason = None
+    if not events:
+        if user_lat and user_lng:
+            empty_reason = "no_events_in_radius"
+        else:
+            empty_reason = "no_events_today"
+
+    # Распределение по городам считаем только для DEBUG — на INFO это лишний проход по событиям
+    if logger.isEnabledFor(logging.DEBUG):
+        cities_found = Counter(event.get("city", "unknown") for event in events)
+        logger.debug("🔍 SEARCH RESULT: city=%s, cities_found=%s", city, dict(cities_found))
+
+    duration_s = time.time() - start_time
+    SEARCH_SECONDS.labels(city or "none").observe(duration_s)
+    SEARCH_RESULTS.labels(city or "none").observe(len(events))
+
+    StructuredLogger.log_search(
+        region=city,
+        radius_km=radius_km if user_lat and user_lng else 0,
+        user_lat=user_lat or 0,
+        user_lng=user_lng or 0,
+        found_total=len(events),
+        found_user=found_user,
+        found_parser=found_parser,
+        message_id=message_id,
+        empty_reason=empty_reason,
+        duration_ms=duration_s * 1000,
+    )
+
+    before_dedupe = len(events)
+    events = dedupe_events_for_display(events)
+    if before_dedupe != len(events):
+        logger.info(
+            "Deduped nearby events for display: %s -> %s (city=%s)",
+            before_dedupe,
+            len(events),
+            city,
+        )
+
+    return events
+
+
+def _log_search_start(city, user_lat, user_lng, radius_km, date_offset) -> None:
+    date_label = "сегодня" if date_offset == 0 else "завтра" if date_offset == 1 else f"+{date_offset} дней"
+    logger.debug(
+        "🔍 SEARCH: city=%s, user_lat=%s, user_lng=%s, radius_km=%s, date=%s",
+        city,
+        user_lat,
+        user_lng,
+        radius_km,
+        date_label,
+    )
+
+
+_PARSER_EVENT_DEFAULTS = {
+    "location_name": None,
+    "location_url": None,
+    "url": None,
+    "place_id": None,
+    "title_en": None,
+    "description_en": None,
+    "location_name_en": None,
+    "ends_at_utc": None,
+    "time_mode": None,
+    "tags": None,
+    "raw_api_category": None,
+    "category_event_data": None,
+    "status": "open",
+    "community_name": None,
+    "community_link": None,
+    "chat_id": None,
+    "organizer_id": None,
+    "organizer_username": None,
+    "referral_code": None,
+    "referral_param": None,
+}
+
+# Колонки строки пакета в jsonb_to_recordset (порядок не важен, типы — как в events)
+_PARSER_ROW_COLUMNS = """
+    source text, external_id text, title text, title_en text, description text, description_en text,
+    starts_at timestamptz, ends_at timestamptz, time_mode text, city text, lat double precision,
+    lng double precision, location_name text, location_name_en text, location_url text, url text,
+    country text, is_ai boolean, status text, place_id text, organizer_id bigint, categories jsonb,
+    raw_category text, community_name text, community_link text, chat_id bigint,
+    organizer_username text, referral_code text, referral_param text, dedupe_key text
+"""
+
+_PARSER_UPSERT_INSERT = f"""
+    INSERT INTO events
+    (source, external_id, event_source, title, title_en, description, description_en,
+     starts_at, ends_at, time_mode, city, lat, lng, location_name, location_name_en,
+     location_url, url, country, is_generated_by_ai, status,
+     current_participants, place_id, organizer_id, categories, raw_category,
+     community_name, community_link, chat_id, organizer_username, referral_code, referral_param, dedupe_key)
+    SELECT r.source, r.external_id, 'parser', r.title, r.title_en, r.description, r.description_en,
+           r.starts_at, r.ends_at, r.time_mode, r.city, r.lat, r.lng, r.location_name, r.location_name_en,
+           r.location_url, r.url, r.country, r.is_ai, r.status,
+           0, r.place_id, r.organizer_id, r.categories, r.raw_category,
+           r.community_name, r.community_link, r.chat_id, r.organizer_username, r.referral_code,
+           COALESCE(r.referral_param, 'ref'), r.dedupe_key
+    FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r({_PARSER_ROW_COLUMNS})
+    ON CONFLICT (source, external_id) DO UPDATE SET
+"""
+
+_PARSER_UPSERT_RETURNING = """
+    RETURNING id, source, external_id, (xmax = 0) AS inserted
+"""
+
+# Поля сообщества/организатора/реферала никогда не затираются NULL
+_PARSER_UPSERT_KEEP_FIELDS = """
+        community_name = COALESCE(EXCLUDED.community_name, events.community_name),
+        community_link = COALESCE(EXCLUDED.community_link, events.community_link),
+        chat_id = COALESCE(EXCLUDED.chat_id, events.chat_id),
+        organizer_id = COALESCE(EXCLUDED.organizer_id, events.organizer_id),
+        organizer_username = COALESCE(EXCLUDED.organizer_username, events.organizer_username),
+        referral_code = COALESCE(EXCLUDED.referral_code, events.referral_code),
+        dedupe_key = COALESCE(EXCLUDED.dedupe_key, events.dedupe_key),
+        event_source = 'parser',
+        updated_at_utc = NOW()
+"""
+
+_PARSER_UPSERT_SQL = text(
+    _PARSER_UPSERT_INSERT
+    + """
+        title = EXCLUDED.title,
+        title_en = EXCLUDED.title_en,
+        description = EXCLUDED.description,
+        description_en = EXCLUDED.description_en,
+        location_name = EXCLUDED.location_name,
+        location_name_en = EXCLUDED.location_name_en,
+        starts_at = EXCLUDED.starts_at,
+        ends_at = EXCLUDED.ends_at,
+        time_mode = EXCLUDED.time_mode,
+        city = EXCLUDED.city,
+        lat = EXCLUDED.lat,
+        lng = EXCLUDED.lng,
+        location_url = EXCLUDED.location_url,
+        url = EXCLUDED.url,
+        country = EXCLUDED.country,
+        place_id = EXCLUDED.place_id,
+        categories = EXCLUDED.categories,
+        raw_category = EXCLUDED.raw_category,
+"""
+    + _PARSER_UPSERT_KEEP_FIELDS
+    + _PARSER_UPSERT_RETURNING
+)
+
+# Режим ingest/upsert: пустое значение источника не затирает заполненное поле
+_PARSER_UPSERT_KEEP_SQL = text(
+    _PARSER_UPSERT_INSERT
+    + """
+        title = COALESCE(EXCLUDED.title, events.title),
+        title_en = COALESCE(EXCLUDED.title_en, events.title_en),
+        description = COALESCE(EXCLUDED.description, events.description),
+        description_en = COALESCE(EXCLUDED.description_en, events.description_en),
+        location_name = COALESCE(EXCLUDED.location_name, events.location_name),
+        location_name_en = COALESCE(EXCLUDED.location_name_en, events.location_name_en),
+        starts_at = COALESCE(EXCLUDED.starts_at, events.starts_at),
+        ends_at = COALESCE(EXCLUDED.ends_at, events.ends_at),
+        time_mode = COALESCE(EXCLUDED.time_mode, events.time_mode),
+        city = COALESCE(EXCLUDED.city, events.city),
+        lat = COALESCE(EXCLUDED.lat, events.lat),
+        lng = COALESCE(EXCLUDED.lng, events.lng),
+        location_url = COALESCE(EXCLUDED.location_url, events.location_url),
+        url = EXCLUDED.url,
+        country = COALESCE(EXCLUDED.country, events.country),
+        place_id = COALESCE(EXCLUDED.place_id, events.place_id),
+        categories = COALESCE(EXCLUDED.categories, events.categories),
+        raw_category = COALESCE(EXCLUDED.raw_category, events.raw_category),
+        referral_param = COALESCE(EXCLUDED.referral_param, events.referral_param),
+"""
+    + _PARSER_UPSERT_KEEP_FIELDS
+    + _PARSER_UPSERT_RETURNING
+)
+
+_EXISTING_PARSER_EVENTS_SQL = text("""
+    SELECT e.id, e.source, e.external_id, e.title_en, e.description_en, e.location_name_en
+    FROM events e
+    JOIN unnest(CAST(:sources AS text[]), CAST(:external_ids AS text[])) AS k(source, external_id)
+      ON e.source = k.source AND e.external_id = k.external_id
+""")
+
+
+def _prepare_parser_event(event: dict) -> dict:
+    """Нормализует событие пакета: значения по умолчанию, категории, dedupe_key, страна."""
+    item = {**_PARSER_EVENT_DEFAULTS, **event}
+    category_manager = EventCategoryManager()
+    category_ctx = dict(item["category_event_data"] or {})
+    if item["tags"] is not None:
+        category_ctx["tags"] = item["tags"]
+    if item["raw_api_category"] is not None:
+        category_ctx["raw_api_category"] = item["raw_api_category"]
+    item["categories"] = category_manager.assign_categories(category_ctx, item["source"])
+    item["raw_category"] = category_manager.resolve_raw_category(category_ctx, item["source"])
+    item["dedupe_key"] = (
+        compute_dedupe_key(item["title"], item["starts_at_utc"], item["lat"], item["lng"], item["city"])
+        if item["starts_at_utc"]
+        else None
+    )
+    if "country" not in event:
+        item["country"] = "ID" if item["city"] == "bali" else "RU"
+    return item
+
+
+def _dedupe_candidate(item: dict) -> dict:
     return {
-        "source_type": source_type,
-        "source": row[0],
-        "id": row[1],
-        "title": row[2],
-        "description": row[3],
-        "title_en": row[4] if len(row) > 4 else None,
-        "description_en": row[5] if len(row) > 5 else None,
-        "location_name_en": row[6] if len(row) > 6 else None,
-        "starts_at": row[7],
-        "city": row[8],
-        "lat": row[9],
-        "lng": row[10],
-        "location_name": row[11],
-        "location_url": row[12],
-        "event_url": row[13],
-        "organizer_id": row[14],
-        "organizer_username": row[15],
-        "max_participants": row[16],
-        "current_participants": row[17],
-        "status": row[18],
-        "created_at_utc": row[19],
-        "community_name": row[20] if len(row) > 20 else None,
-        "community_link": row[21] if len(row) > 21 else None,
-        "chat_id": row[22] if len(row) > 22 else None,
-        "venue_name": row[23] if len(row) > 23 else None,
-        "address": row[24] if len(row) > 24 else None,
-        "place_id": row[25] if len(row) > 25 else None,
-        "ends_at": row[28] if len(row) > 28 else None,
-        "time_mode": row[29] if len(row) > 29 else None,
-        "categories": _parse_categories_value(row[30] if len(row) > 30 else None),
-        "raw_category": row[31] if len(row) > 31 else None,
-        "tags": _parse_raw_category_tags(row[31] if len(row) > 31 else None),
-        "referral_code": row[32] if len(row) > 32 else None,
-        "dedupe_key": row[33] if len(row) > 33 else None,
+        "dedupe_key": item["dedupe_key"],
+        "title": item["title"],
+        "starts_at": item["starts_at_utc"],
+        "lat": item["lat"],
+        "lng": item["lng"],
+        "city": item["city"],
+        "source": item["source"],
+        "external_id": item["external_id"],
     }
 
 
+def _parser_rows_json(items: list[dict]) -> str:
+    rows = []
+    for item in items:
+        rows.append(
+            {
+                "source": item["source"],
+                "external_id": item["external_id"],
+                "title": item["title"],
+                "title_en": item["title_en"],
+                "description": item["description"],
+                "description_en": item["description_en"],
+                "starts_at": item["starts_at_utc"].isoformat() if item["starts_at_utc"] else None,
+                "ends_at": item["ends_at_utc"].isoformat() if item["ends_at_utc"] else None,
+                "time_mode": item["time_mode"],
+                "city": item["city"],
+                "lat": item["lat"],
+                "lng": item["lng"],
+                "location_name": item["location_name"],
+                "location_name_en": item["location_name_en"],
+                "location_url": item["location_url"],
+                "url": item["url"],
+                "country": item["country"],
+                "is_ai": item["source"] == "ai",
+                "status": item["status"],
+                "place_id": item["place_id"],
+                "organizer_id": item["organizer_id"],
+                "categories": item["categories"],
+                "raw_category": item["raw_category"],
+                "community_name": item["community_name"],
+                "community_link": item["community_link"],
+                "chat_id": item["chat_id"],
+                "organizer_username": item["organizer_username"],
+                "referral_code": item["referral_code"],
+                "referral_param": item["referral_param"],
+                "dedupe_key": item["dedupe_key"],
+            }
+        )
+    return json.dumps(rows, ensure_ascii=False)
+
+
 class UnifiedEventsService:
     """Унифицированный сервис для работы с единой таблицей events"""
 
-    def __init__(self, engine):
+    def __init__(self, engine, snapshot=None):
+        """
+        Args:
+            engine: SQLAlchemy engine
+            snapshot: EventsSnapshotCache для радиусного поиска «сегодня/завтра» из памяти (None — всегда SQL)
+        """
         self.engine = engine
+        self.snapshot = snapshot
 
     def search_events_today(
         self,
@@ -121,210 +610,78 @@ class UnifiedEventsService:
             date_offset: Смещение даты (0 = сегодня, 1 = завтра, по умолчанию 0)
             message_id: ID сообщения для логирования
         """
-        from datetime import timedelta
-
         start_time = time.time()
-
-        # Получаем временные границы для города с учетом смещения даты
-        if date_offset == 0:
-            # Сегодня
-            start_utc = get_today_start_utc(city)
-            end_utc = get_tomorrow_start_utc(city)
-        elif date_offset == 1:
-            # Завтра
-            start_utc = get_tomorrow_start_utc(city)
-            # Конец завтрашнего дня = начало послезавтрашнего дня
-            end_utc = get_tomorrow_start_utc(city) + timedelta(days=1)
-        else:
-            # Для других значений используем общую формулу
-            base_start = get_today_start_utc(city)
-            start_utc = base_start + timedelta(days=date_offset)
-            end_utc = start_utc + timedelta(days=1)
-
-        date_label = "сегодня" if date_offset == 0 else "завтра" if date_offset == 1 else f"+{date_offset} дней"
-        logger.debug(
-            "🔍 SEARCH: city=%s, user_lat=%s, user_lng=%s, radius_km=%s, date=%s",
-            city,
-            user_lat,
-            user_lng,
-            radius_km,
-            date_label,
-        )
-
-        with self.engine.connect() as conn:
-            # Важно: фильтруем события, которые начались не более 3 часов назад
-            # (starts_at >= NOW() - INTERVAL '3 hours')
-            # и события в пределах запрошенного дня (starts_at >= start_utc AND starts_at < end_utc)
-            # Это позволяет видеть события в течение 3 часов после начала
-            # (для долгих событий: вечеринки, выставки)
-            if user_lat and user_lng:
-                # Поиск с координатами и радиусом
-                # Добавляем фильтр по city, если указан
-                city_filter = ""
-                params = {
-                    "start_utc": start_utc,
-                    "end_utc": end_utc,
-                    "user_lat": user_lat,
-                    "user_lng": user_lng,
-                    "radius_km": radius_km,
-                }
-                if city:
-                    city_filter = "AND city = :city"
-                    params["city"] = city
-
-                query = text(f"""
-                    SELECT {_SEARCH_EVENT_SELECT}
-                    FROM events
-                    WHERE starts_at >= :start_utc
-                    AND starts_at < :end_utc
-                    AND (
-                        (ends_at IS NOT NULL AND ends_at >= NOW())
-                        OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
-                    )
-                    AND lat IS NOT NULL AND lng IS NOT NULL
-                    AND status NOT IN ('closed', 'canceled', 'draft')
-                    {city_filter}
-                    AND 6371 * acos(
-                        GREATEST(-1, LEAST(1,
-                            cos(radians(:user_lat)) * cos(radians(lat)) *
-                            cos(radians(lng) - radians(:user_lng)) +
-                            sin(radians(:user_lat)) * sin(radians(lat))
-                        ))
-                    ) <= :radius_km
-                    ORDER BY starts_at
-                """)
-
-                result = conn.execute(query, params)
-            else:
-                # Поиск без координат
-                # Добавляем фильтр по city, если указан
-                city_filter = ""
-                params = {
-                    "start_utc": start_utc,
-                    "end_utc": end_utc,
-                }
-                if city:
-                    city_filter = "AND city = :city"
-                    params["city"] = city
-
-                query = text(f"""
-                    SELECT {_SEARCH_EVENT_SELECT}
-                    FROM events
-                    WHERE starts_at >= :start_utc
-                    AND starts_at < :end_utc
-                    AND (
-                        (ends_at IS NOT NULL AND ends_at >= NOW())
-                        OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
-                    )
-                    AND status NOT IN ('closed', 'canceled', 'draft')
-                    {city_filter}
-                    ORDER BY starts_at
-                """)
-
-                result = conn.execute(query, params)
-
-            events = []
-            found_user = 0
-            found_parser = 0
-
-            for row in result:
-                if row[0] == "user":
-                    found_user += 1
+        start_utc, end_utc = _search_window(city, date_offset)
+        _log_search_start(city, user_lat, user_lng, radius_km, date_offset)
+
+        with_distance = bool(user_lat and user_lng)
+        use_snapshot = with_distance and self.snapshot is not None and self.snapshot.supports(city, date_offset)
+
+        snapshot = self.snapshot.get(city, date_offset, start_utc) if use_snapshot else None
+
+        if snapshot is None:
+            with self.engine.connect() as conn:
+                if use_snapshot:
+                    # Промах снапшота: загружаем окно региона целиком и ищем уже по нему
+                    generation = self.snapshot.generation(city)
+                    query, params = _build_snapshot_query(start_utc, end_utc, city)
+                    rows = [_search_row_to_event_record(row) for row in conn.execute(query, params)]
+                    snapshot = self.snapshot.build(city, date_offset, start_utc, end_utc, rows, generation)
                 else:
-                    found_parser += 1
-
-                event_data = _search_row_to_event_dict(row)
-
-                if row[0] == "user":
-                    logger.info(
-                        f"🔍 DB EVENT: title='{row[2]}', source='{row[0]}', "
-                        f"organizer_id={row[14]}, organizer_username='{row[15]}'"
+                    if with_distance:
+                        # Поиск с координатами и радиусом: bbox по индексу lat/lng + точная дистанция
+                        query, params = _build_nearby_query(user_lat, user_lng, radius_km, start_utc, end_utc, city)
+                    else:
+                        # Поиск без координат
+                        query, params = _build_window_query(start_utc, end_utc, city)
+                    events, found_user, found_parser = _collect_search_events(
+                        conn.execute(query, params), with_distance
                     )
 
-                events.append(event_data)
-
-            # Если не найдено событий с координатами, проверяем соответствие координат региону
-            # и если координаты не соответствуют региону, пробуем поиск без радиуса
-            if not events and user_lat and user_lng:
-                from utils.simple_timezone import get_city_from_coordinates
-
-                detected_city = get_city_from_coordinates(user_lat, user_lng)
-                # Fallback поиск только если координаты определены и не соответствуют региону
-                if detected_city is not None and detected_city != city:
-                    logger.warning(
-                        f"⚠️ Координаты пользователя ({user_lat}, {user_lng}) не соответствуют региону '{city}'. "
-                        f"Определен регион: '{detected_city}'. Пробуем поиск без радиуса..."
-                    )
-                    # Fallback: поиск без радиуса по временным границам региона
-                    fallback_query = text(f"""
-                        SELECT {_SEARCH_EVENT_SELECT}
-                        FROM events
-                        WHERE starts_at >= :start_utc
-                        AND starts_at < :end_utc
-                        AND (
-                            (ends_at IS NOT NULL AND ends_at >= NOW())
-                            OR (ends_at IS NULL AND starts_at >= NOW() - INTERVAL '3 hours')
-                        )
-                        AND status NOT IN ('closed', 'canceled', 'draft')
-                        ORDER BY starts_at
-                        LIMIT 50
-                    """)
-                    fallback_result = conn.execute(
-                        fallback_query,
-                        {
-                            "start_utc": start_utc,
-                            "end_utc": end_utc,
-                        },
-                    )
-                    # Обрабатываем результаты fallback поиска
-                    for row in fallback_result:
-                        events.append(_search_row_to_event_dict(row))
-                    if events:
-                        logger.info(
-                            f"✅ Fallback поиск нашел {len(events)} событий для региона '{city}' "
-                            f"(координаты пользователя не соответствуют региону)"
-                        )
-
-            # Логируем результат поиска
-            empty_reason = None
-            if not events:
-                if user_lat and user_lng:
-                    empty_reason = "no_events_in_radius"
-                else:
-                    empty_reason = "no_events_today"
-
-            # Логируем результаты поиска по городам
-            cities_found = {}
-            for event in events:
-                event_city = event.get("city", "unknown")
-                cities_found[event_city] = cities_found.get(event_city, 0) + 1
-
-            logger.debug("🔍 SEARCH RESULT: city=%s, cities_found=%s", city, cities_found)
-
-            StructuredLogger.log_search(
-                region=city,
-                radius_km=radius_km if user_lat and user_lng else 0,
-                user_lat=user_lat or 0,
-                user_lng=user_lng or 0,
-                found_total=len(events),
-                found_user=found_user,
-                found_parser=found_parser,
-                message_id=message_id,
-                empty_reason=empty_reason,
-                duration_ms=(time.time() - start_time) * 1000,
-            )
+        if snapshot is not None:
+            # Радиус по снапшоту региона в памяти
+            events, found_user, found_parser = _search_snapshot(snapshot, user_lat, user_lng, radius_km)
 
-            before_dedupe = len(events)
-            events = dedupe_events_for_display(events)
-            if before_dedupe != len(events):
+        if _needs_region_fallback(events, city, user_lat, user_lng):
+            with self.engine.connect() as conn:
+                fallback_result = conn.execute(_REGION_FALLBACK_QUERY, {"start_utc": start_utc, "end_utc": end_utc})
+                events.extend(_search_row_to_event_record(row) for row in fallback_result)
+            if events:
                 logger.info(
-                    "Deduped nearby events for display: %s -> %s (city=%s)",
-                    before_dedupe,
-                    len(events),
-                    city,
+                    f"✅ Fallback поиск нашел {len(events)} событий для региона '{city}' "
+                    f"(координаты пользователя не соответствуют региону)"
                 )
 
-            return events
+        return _finish_search(
+            events,
+            city=city,
+            user_lat=user_lat,
+            user_lng=user_lng,
+            radius_km=radius_km,
+            found_user=found_user,
+            found_parser=found_parser,
+            message_id=message_id,
+            start_time=start_time,
+        )
+
+    def search_events_nearby(
+        self,
+        user_lat: float,
+        user_lng: float,
+        radius_km: float,
+        start_utc: datetime,
+        end_utc: datetime,
+        city: str | None = None,
+    ) -> list[dict]:
+        """
+        Поиск событий в радиусе за произвольное окно [start_utc, end_utc).
+
+        Общая реализация для бота и API: события упорядочены по starts_at, затем по distance_km.
+        """
+        query, params = _build_nearby_query(user_lat, user_lng, radius_km, start_utc, end_utc, city)
+        with self.engine.connect() as conn:
+            events, _, _ = _collect_search_events(conn.execute(query, params), with_distance=True)
+        return events
 
     def get_events_stats(self, city: str) -> dict:
         """Статистика событий из единой таблицы"""
@@ -396,7 +753,7 @@ class UnifiedEventsService:
         """
         Создание пользовательского события в единую таблицу events.
         Если переданы title_en/description_en (например после перевода в боте), они сохраняются сразу;
-        иначе запускается фоновый перевод RU→EN/EN→RU с последующим UPDATE.
+        иначе событие ставится в очередь перевода RU→EN/EN→RU (utils/translation_service.py).
         """
         with self.engine.begin() as conn:
             # Создаем событие напрямую в events (с EN-полями, если уже переведено)
@@ -470,6 +827,8 @@ class UnifiedEventsService:
 
             print(f"✅ Создано пользовательское событие ID {user_event_id}: '{title}'")
 
+        events_snapshot.invalidate(city)
+
         # Автоперевод только если EN-поля не переданы (перевод уже сделан в боте до сохранения)
         en_provided = (title_en is not None and (title_en or "").strip()) or (
             description_en is not None and (description_en or "").strip()
@@ -478,90 +837,8 @@ class UnifiedEventsService:
             logger.debug("create_user_event: EN-поля переданы, фоновый перевод не запускаем (id=%s)", user_event_id)
             return user_event_id
 
-        # Автоперевод пользовательского события: RU→EN или EN→RU в фоне
-        def _translate_and_update():
-            try:
-                lang = detect_event_language(title, description or "")
-                if lang == "ru":
-                    trans = translate_event_to_english(
-                        title,
-                        description=(description or "").strip() or None,
-                        location_name=(location_name or "").strip() or None,
-                    )
-                    # Локация не переводится — в _en пишем оригинал
-                    loc_en = (location_name or "").strip() or trans.get("location_name_en")
-                    if trans.get("title_en") or trans.get("description_en") or loc_en:
-                        with self.engine.begin() as conn:
-                            conn.execute(
-                                text("""
-                                    UPDATE events
-                                    SET title_en = COALESCE(:title_en, title_en),
-                                        description_en = COALESCE(:description_en, description_en),
-                                        location_name_en = COALESCE(:location_name_en, location_name_en)
-                                    WHERE id = :event_id
-                                """),
-                                {
-                                    "event_id": user_event_id,
-                                    "title_en": trans.get("title_en"),
-                                    "description_en": trans.get("description_en"),
-                                    "location_name_en": loc_en,
-                                },
-                            )
-                        logger.debug(
-                            "Пользовательское событие переведено: [RU] -> [EN] (id=%s)",
-                            user_event_id,
-                        )
-                        logger.info(
-                            "create_user_event: обновлены EN-поля для события id=%s (title_en=%s)",
-                            user_event_id,
-                            bool(trans.get("title_en")),
-                        )
-                    else:
-                        logger.debug(
-                            "create_user_event: перевод для id=%s не получен (API недоступен или пустой ответ)",
-                            user_event_id,
-                        )
-                else:
-                    trans_ru = translate_event_to_russian(
-                        title,
-                        description=(description or "").strip() or None,
-                        location_name=(location_name or "").strip() or None,
-                    )
-                    with self.engine.begin() as conn:
-                        conn.execute(
-                            text("""
-                                UPDATE events
-                                SET title = COALESCE(:title_ru, title),
-                                    description = COALESCE(:description_ru, description),
-                                    location_name = COALESCE(:location_name_ru, location_name),
-                                    title_en = :title_en,
-                                    description_en = :description_en,
-                                    location_name_en = :location_name_en
-                                WHERE id = :event_id
-                            """),
-                            {
-                                "event_id": user_event_id,
-                                "title_ru": trans_ru.get("title"),
-                                "description_ru": trans_ru.get("description"),
-                                "location_name_ru": trans_ru.get("location_name"),
-                                "title_en": title,
-                                "description_en": description or None,
-                                "location_name_en": location_name or None,
-                            },
-                        )
-                    logger.debug(
-                        "Пользовательское событие переведено: [EN] -> [RU] (id=%s)",
-                        user_event_id,
-                    )
-                    logger.info(
-                        "create_user_event: обновлены поля (EN: оригинал в _en, RU: перевод в title/description) id=%s",
-                        user_event_id,
-                    )
-            except Exception as e:
-                logger.warning("create_user_event: фоновый перевод для id=%s не удался: %s", user_event_id, e)
-
-        t = threading.Thread(target=_translate_and_update, daemon=True)
-        t.start()
+        # Перевод RU→EN или EN→RU делает воркер translation_service (пользовательская очередь — первой)
+        translation_service.enqueue("events", [user_event_id], priority=PRIORITY_USER)
 
         return user_event_id
 
@@ -596,232 +873,171 @@ class UnifiedEventsService:
         referral_code: str | None = None,
     ) -> int:
         """
-        Сохранение парсерного события в единую таблицу events.
-        При создании или при изменении текста вызывается перевод RU→EN (title_en, description_en, location_name_en).
-        При ошибке API перевода _en остаются NULL.
+        Сохранение одного парсерного события в единую таблицу events (см. save_parser_events_batch).
+        Если перевода нет ни в аргументах, ни в БД, событие ставится в очередь перевода RU→EN;
+        до перевода _en остаются NULL.
         """
-        category_manager = EventCategoryManager()
-        category_ctx = dict(category_event_data or {})
-        if tags is not None:
-            category_ctx["tags"] = tags
-        if raw_api_category is not None:
-            category_ctx["raw_api_category"] = raw_api_category
-        categories = category_manager.assign_categories(category_ctx, source)
-        raw_category = category_manager.resolve_raw_category(category_ctx, source)
-        categories_json = json.dumps(categories, ensure_ascii=False)
-        dedupe_key = compute_dedupe_key(title, starts_at_utc, lat, lng, city)
+        event = {key: value for key, value in locals().items() if key != "self"}
+        return self.save_parser_events_batch([event])[0]
 
-        with self.engine.begin() as conn:
-            existing_row = conn.execute(
-                text("""
-                SELECT id, title, description, title_en, description_en, location_name_en
-                FROM events
-                WHERE source = :source AND external_id = :external_id
-            """),
-                {"source": source, "external_id": external_id},
-            ).fetchone()
+    def save_parser_events_batch(
+        self,
+        events: list[dict],
+        *,
+        keep_existing_on_null: bool = False,
+    ) -> list[int | None]:
+        """
+        Пакетное сохранение парсерных событий. Ключи словарей — аргументы save_parser_event.
+
+        Возвращает id в порядке входного списка: id сохраненного события, id найденного дубликата
+        (событие не пишется) или None, если строку не удалось записать.
+
+        Порядок работы:
+          1. одним запросом читаются существующие строки по (source, external_id),
+             одним запросом — кандидаты в дубликаты для новых событий (find_duplicate_event_ids);
+             дубликаты внутри пакета сворачиваются в первое событие;
+          2. перевод из БД переиспользуется; события без перевода после записи ставятся
+             одним запросом в очередь translation_service (перевод делает фоновый воркер);
+          3. одна транзакция: многострочный INSERT ... ON CONFLICT DO UPDATE.
+             keep_existing_on_null=True не затирает поля в БД пустыми значениями (режим ingest/upsert).
+
+        Если многострочная запись упала, строки пишутся по одной (упавшие → None);
+        для пакета из одного события исключение пробрасывается.
+        """
+        if not events:
+            return []
+        started = time.perf_counter()
 
-            country = "ID" if city == "bali" else "RU"
-            is_ai = source == "ai"
-
-            # Ленивый перевод (ТЗ): переводим только один раз — когда title_en в базе ещё NULL.
-            # Если title_en передан снаружи (например из batch), используем его и не вызываем API.
-            passed_en = title_en is not None
-            existing_title_en = existing_row[3] if existing_row and len(existing_row) > 3 else None
-            existing_has_title_en = bool(existing_title_en and (existing_title_en or "").strip())
-            need_translation = not passed_en and (not existing_row or not existing_has_title_en)
-
-            if passed_en:
-                # Передан title_en снаружи (batch) — description/location оставляем из БД при наличии
-                if description_en is None and existing_row and len(existing_row) > 4:
-                    description_en = existing_row[4]
-                if location_name_en is None and existing_row and len(existing_row) > 5:
-                    location_name_en = existing_row[5]
-            elif existing_row and existing_has_title_en:
-                # В базе уже есть перевод — никогда не вызываем OpenAI повторно
-                logger.debug("[TRANSLATION-SKIP] Using existing EN for external_id=%s", external_id)
-                title_en = existing_row[3]
-            elif need_translation:
-                # Новая запись или существующая с title_en NULL — вызываем перевод (догоняющий для старых)
-                trans = translate_event_to_english(
-                    title=title or "",
-                    description=description,
-                    location_name=location_name,
-                )
-                # Пустой ответ не пишем в БД — оставляем NULL для повтора
-                title_en = (
-                    trans.get("title_en") if trans.get("title_en") else (existing_row[3] if existing_row else None)
-                )
-                description_en = (
-                    trans.get("description_en")
-                    if trans.get("description_en")
-                    else (existing_row[4] if existing_row and len(existing_row) > 4 else None)
-                )
-                # Локация не переводится — всегда оригинал (Google Maps style)
-                location_name_en = location_name or (
-                    existing_row[5] if existing_row and len(existing_row) > 5 else None
+        # Повторы (source, external_id) внутри пакета: побеждает последний, id общий
+        items: dict[tuple[str, str], dict] = {}
+        keys = []
+        for event in events:
+            item = _prepare_parser_event(event)
+            key = (item["source"], item["external_id"])
+            items[key] = item
+            keys.append(key)
+
+        with self.engine.connect() as conn:
+            existing = {
+                (row.source, row.external_id): row
+                for row in conn.execute(
+                    _EXISTING_PARSER_EVENTS_SQL,
+                    {"sources": [k[0] for k in items], "external_ids": [k[1] for k in items]},
                 )
-            else:
-                title_en = existing_row[3] if existing_row else None
-                description_en = existing_row[4] if existing_row and len(existing_row) > 4 else None
-                location_name_en = existing_row[5] if existing_row and len(existing_row) > 5 else None
-
-            if not existing_row:
-                duplicate_id = find_duplicate_event_id(
-                    conn,
-                    dedupe_key=dedupe_key,
-                    title=title,
-                    starts_at=starts_at_utc,
-                    lat=lat,
-                    lng=lng,
-                    city=city,
-                    exclude_source=source,
-                    exclude_external_id=external_id,
+            }
+            new_keys = [key for key in items if key not in existing]
+            candidates = [_dedupe_candidate(items[key]) for key in new_keys]
+            db_duplicates = find_duplicate_event_ids(conn, candidates)
+
+        resolved: dict[tuple[str, str], int] = {}
+        same_as: dict[tuple[str, str], tuple[str, str]] = {}
+        accepted_new: list[tuple[tuple[str, str], dict]] = []
+        for idx, key in enumerate(new_keys):
+            item = items[key]
+            if idx in db_duplicates:
+                resolved[key] = db_duplicates[idx]
+                logger.info(
+                    "Duplicate parser event skipped: source=%s external_id=%s -> existing id=%s title=%r",
+                    key[0],
+                    key[1],
+                    db_duplicates[idx],
+                    (item["title"] or "")[:80],
                 )
-                if duplicate_id:
-                    logger.info(
-                        "Duplicate parser event skipped: source=%s external_id=%s -> existing id=%s title=%r",
-                        source,
-                        external_id,
-                        duplicate_id,
-                        (title or "")[:80],
+                continue
+            candidate = candidates[idx]
+            twin = next((k for k, c in accepted_new if events_look_same(candidate, c)), None)
+            if twin is not None:
+                same_as[key] = twin
+                continue
+            accepted_new.append((key, candidate))
+
+        accepted_keys = {key for key, _ in accepted_new}
+        to_write = [item for key, item in items.items() if key in existing or key in accepted_keys]
+        self._reuse_parser_translations(to_write, existing)
+
+        written = self._write_parser_events(to_write, keep_existing_on_null)
+        resolved.update(written)
+        untranslated = [
+            event_id
+            for key, event_id in written.items()
+            if items[key]["title_en"] is None
+            or ((items[key]["description"] or "").strip() and items[key]["description_en"] is None)
+        ]
+        translation_service.enqueue("events", untranslated, priority=PRIORITY_PARSER)
+        for key, twin in same_as.items():
+            resolved[key] = written.get(twin)
+            logger.info(
+                "Duplicate parser event skipped: source=%s external_id=%s -> same batch as %s/%s",
+                key[0],
+                key[1],
+                twin[0],
+                twin[1],
+            )
+
+        for city in {item["city"] for item in to_write if (item["source"], item["external_id"]) in written}:
+            events_snapshot.invalidate(city)
+
+        for key in items:
+            result = "written" if key in written else "duplicate" if resolved.get(key) else "failed"
+            INGEST_EVENTS.labels(key[0], result).inc()
+        for source in {key[0] for key in items}:
+            INGEST_BATCH_SECONDS.labels(source).observe(time.perf_counter() - started)
+        return [resolved.get(key) for key in keys]
+
+    def _reuse_parser_translations(self, items: list[dict], existing: dict) -> None:
+        """
+        Переносит в items перевод, который уже есть в БД (ленивый перевод, ТЗ): переданный снаружи
+        или сохраненный title_en не перезапрашивается, description/location_name_en берутся из БД.
+        """
+        for item in items:
+            row = existing.get((item["source"], item["external_id"]))
+            if row is None:
+                continue
+            if item["title_en"] is None and (row.title_en or "").strip():
+                logger.debug("[TRANSLATION-SKIP] Using existing EN for external_id=%s", item["external_id"])
+                item["title_en"] = row.title_en
+            if item["title_en"] is not None:
+                if item["description_en"] is None:
+                    item["description_en"] = row.description_en
+                if item["location_name_en"] is None:
+                    item["location_name_en"] = row.location_name_en
+
+    def _write_parser_events(self, items: list[dict], keep_existing_on_null: bool) -> dict[tuple[str, str], int]:
+        """Многострочный upsert; при ошибке — построчно. Возвращает {(source, external_id): id}."""
+        if not items:
+            return {}
+        sql = _PARSER_UPSERT_KEEP_SQL if keep_existing_on_null else _PARSER_UPSERT_SQL
+        # Единый порядок строк — одинаковый порядок блокировок у параллельных пакетов
+        items = sorted(items, key=lambda item: (item["source"], item["external_id"]))
+        try:
+            with self.engine.begin() as conn:
+                rows = conn.execute(sql, {"rows": _parser_rows_json(items)}).fetchall()
+        except Exception as e:
+            if len(items) == 1:
+                raise
+            logger.warning("Пакетная запись %s парсерных событий не удалась (%s), пишем по одному", len(items), e)
+            rows = []
+            for item in items:
+                try:
+                    with self.engine.begin() as conn:
+                        rows.extend(conn.execute(sql, {"rows": _parser_rows_json([item])}).fetchall())
+                except Exception:
+                    logger.exception(
+                        "Не удалось сохранить парсерное событие source=%s external_id=%s",
+                        item["source"],
+                        item["external_id"],
                     )
-                    return duplicate_id
-
-            if existing_row:
-                event_id = existing_row[0]
-                conn.execute(
-                    text("""
-                    UPDATE events
-                    SET title = :title, title_en = :title_en,
-                        description = :description, description_en = :description_en,
-                        location_name = :location_name, location_name_en = :location_name_en,
-                        starts_at = :starts_at, ends_at = :ends_at, time_mode = :time_mode,
-                        city = :city, lat = :lat, lng = :lng,
-                        location_url = :location_url, url = :url, country = :country,
-                        place_id = :place_id, categories = CAST(:categories AS jsonb),
-                        raw_category = :raw_category, event_source = 'parser',
-                        community_name = COALESCE(:community_name, community_name),
-                        community_link = COALESCE(:community_link, community_link),
-                        chat_id = COALESCE(:chat_id, chat_id),
-                        organizer_id = COALESCE(:organizer_id, organizer_id),
-                        organizer_username = COALESCE(:organizer_username, organizer_username),
-                        referral_code = COALESCE(:referral_code, referral_code),
-                        dedupe_key = :dedupe_key,
-                        updated_at_utc = NOW()
-                    WHERE source = :source AND external_id = :external_id
-                """),
-                    {
-                        "title": title,
-                        "title_en": title_en,
-                        "description": description,
-                        "description_en": description_en,
-                        "location_name": location_name,
-                        "location_name_en": location_name_en,
-                        "starts_at": starts_at_utc,
-                        "ends_at": ends_at_utc,
-                        "time_mode": time_mode,
-                        "city": city,
-                        "lat": lat,
-                        "lng": lng,
-                        "location_url": location_url,
-                        "url": url,
-                        "country": country,
-                        "place_id": place_id,
-                        "categories": categories_json,
-                        "raw_category": raw_category,
-                        "community_name": community_name,
-                        "community_link": community_link,
-                        "chat_id": chat_id,
-                        "organizer_id": organizer_id,
-                        "organizer_username": organizer_username,
-                        "referral_code": referral_code,
-                        "dedupe_key": dedupe_key,
-                        "source": source,
-                        "external_id": external_id,
-                    },
-                )
-                print(f"🔄 Обновлено парсерное событие ID {event_id}: '{title}'")
-            else:
-                result = conn.execute(
-                    text("""
-                    INSERT INTO events
-                    (source, external_id, event_source, title, title_en, description, description_en,
-                     starts_at, ends_at, time_mode, city, lat, lng, location_name, location_name_en,
-                     location_url, url, country, is_generated_by_ai, status,
-                     current_participants, place_id, organizer_id, categories, raw_category,
-                     community_name, community_link, chat_id, organizer_username, referral_code, dedupe_key)
-                    VALUES
-                    (:source, :external_id, 'parser', :title, :title_en, :description, :description_en,
-                     :starts_at, :ends_at, :time_mode, :city, :lat, :lng, :location_name, :location_name_en,
-                     :location_url, :url, :country, :is_ai, :status, 0, :place_id, :organizer_id,
-                     CAST(:categories AS jsonb), :raw_category,
-                     :community_name, :community_link, :chat_id, :organizer_username, :referral_code, :dedupe_key)
-                    ON CONFLICT (source, external_id) DO UPDATE SET
-                        title = EXCLUDED.title,
-                        title_en = EXCLUDED.title_en,
-                        description = EXCLUDED.description,
-                        description_en = EXCLUDED.description_en,
-                        location_name = EXCLUDED.location_name,
-                        location_name_en = EXCLUDED.location_name_en,
-                        event_source = 'parser',
-                        starts_at = EXCLUDED.starts_at,
-                        ends_at = EXCLUDED.ends_at,
-                        time_mode = EXCLUDED.time_mode,
-                        city = EXCLUDED.city,
-                        lat = EXCLUDED.lat,
-                        lng = EXCLUDED.lng,
-                        location_url = EXCLUDED.location_url,
-                        url = EXCLUDED.url,
-                        country = EXCLUDED.country,
-                        place_id = EXCLUDED.place_id,
-                        categories = EXCLUDED.categories,
-                        raw_category = EXCLUDED.raw_category,
-                        community_name = COALESCE(EXCLUDED.community_name, events.community_name),
-                        community_link = COALESCE(EXCLUDED.community_link, events.community_link),
-                        chat_id = COALESCE(EXCLUDED.chat_id, events.chat_id),
-                        organizer_id = COALESCE(EXCLUDED.organizer_id, events.organizer_id),
-                        organizer_username = COALESCE(EXCLUDED.organizer_username, events.organizer_username),
-                        referral_code = COALESCE(EXCLUDED.referral_code, events.referral_code),
-                        dedupe_key = COALESCE(EXCLUDED.dedupe_key, events.dedupe_key)
-                    RETURNING id
-                """),
-                    {
-                        "source": source,
-                        "external_id": external_id,
-                        "title": title,
-                        "title_en": title_en,
-                        "description": description,
-                        "description_en": description_en,
-                        "starts_at": starts_at_utc,
-                        "ends_at": ends_at_utc,
-                        "time_mode": time_mode,
-                        "city": city,
-                        "lat": lat,
-                        "lng": lng,
-                        "location_name": location_name,
-                        "location_name_en": location_name_en,
-                        "location_url": location_url,
-                        "url": url,
-                        "country": country,
-                        "is_ai": is_ai,
-                        "status": status,
-                        "place_id": place_id,
-                        "categories": categories_json,
-                        "raw_category": raw_category,
-                        "community_name": community_name,
-                        "community_link": community_link,
-                        "chat_id": chat_id,
-                        "organizer_id": organizer_id,
-                        "organizer_username": organizer_username,
-                        "referral_code": referral_code,
-                        "dedupe_key": dedupe_key,
-                    },
-                )
-                event_id = result.fetchone()[0]
-                print(f"✅ Создано парсерное событие ID {event_id}: '{title}'")
 
-        return event_id
+        titles = {(item["source"], item["external_id"]): item["title"] for item in items}
+        written = {}
+        for row in rows:
+            key = (row.source, row.external_id)
+            written[key] = row.id
+            if row.inserted:
+                print(f"✅ Создано парсерное событие ID {row.id}: '{titles[key]}'")
+            else:
+                print(f"🔄 Обновлено парсерное событие ID {row.id}: '{titles[key]}'")
+        return written
 
     def cleanup_old_events(self, city: str) -> int:
         """Очистка старых событий из единой таблицы events
@@ -893,4 +1109,96 @@ class UnifiedEventsService:
                 f"удалено {events_deleted} событий (включая парсерные) из единой таблицы events"
             )
 
-            return events_deleted
+        events_snapshot.invalidate(city)
+        return events_deleted
+
+
+class AsyncUnifiedEventsService:
+    """
+    Асинхронный (asyncpg) поиск по единой таблице events для хендлеров aiogram.
+
+    Те же запросы и тот же формат результата, что у UnifiedEventsService, но без блокировки event loop:
+    параллельные поиски выполняются одновременно, а не в очереди.
+    """
+
+    def __init__(self, async_engine, snapshot=None):
+        self.engine = async_engine
+        self.snapshot = snapshot
+
+    async def search_events_today(
+        self,
+        city: str,
+        user_lat: float | None = None,
+        user_lng: float | None = None,
+        radius_km: float = 15,
+        date_offset: int = 0,
+        message_id: str | None = None,
+    ) -> list[dict]:
+        """Асинхронная версия UnifiedEventsService.search_events_today (аргументы и результат те же)."""
+        start_time = time.time()
+        start_utc, end_utc = _search_window(city, date_offset)
+        _log_search_start(city, user_lat, user_lng, radius_km, date_offset)
+
+        with_distance = bool(user_lat and user_lng)
+        use_snapshot = with_distance and self.snapshot is not None and self.snapshot.supports(city, date_offset)
+
+        snapshot = self.snapshot.get(city, date_offset, start_utc) if use_snapshot else None
+
+        if snapshot is None:
+            async with self.engine.connect() as conn:
+                if use_snapshot:
+                    generation = self.snapshot.generation(city)
+                    query, params = _build_snapshot_query(start_utc, end_utc, city)
+                    result = await conn.execute(query, params)
+                    rows = [_search_row_to_event_record(row) for row in result]
+                    snapshot = self.snapshot.build(city, date_offset, start_utc, end_utc, rows, generation)
+                else:
+                    if with_distance:
+                        query, params = _build_nearby_query(user_lat, user_lng, radius_km, start_utc, end_utc, city)
+                    else:
+                        query, params = _build_window_query(start_utc, end_utc, city)
+                    result = await conn.execute(query, params)
+                    events, found_user, found_parser = _collect_search_events(result, with_distance)
+
+        if snapshot is not None:
+            events, found_user, found_parser = _search_snapshot(snapshot, user_lat, user_lng, radius_km)
+
+        if _needs_region_fallback(events, city, user_lat, user_lng):
+            async with self.engine.connect() as conn:
+                fallback_result = await conn.execute(
+                    _REGION_FALLBACK_QUERY, {"start_utc": start_utc, "end_utc": end_utc}
+                )
+                events.extend(_search_row_to_event_record(row) for row in fallback_result)
+            if events:
+                logger.info(
+                    f"✅ Fallback поиск нашел {len(events)} событий для региона '{city}' "
+                    f"(координаты пользователя не соответствуют региону)"
+                )
+
+        return _finish_search(
+            events,
+            city=city,
+            user_lat=user_lat,
+            user_lng=user_lng,
+            radius_km=radius_km,
+            found_user=found_user,
+            found_parser=found_parser,
+            message_id=message_id,
+            start_time=start_time,
+        )
+
+    async def search_events_nearby(
+        self,
+        user_lat: float,
+        user_lng: float,
+        radius_km: float,
+        start_utc: datetime,
+        end_utc: datetime,
+        city: str | None = None,
+    ) -> list[dict]:
+        """Асинхронная версия UnifiedEventsService.search_events_nearby."""
+        query, params = _build_nearby_query(user_lat, user_lng, radius_km, start_utc, end_utc, city)
+        async with self.engine.connect() as conn:
+            result = await conn.execute(query, params)
+            events, _, _ = _collect_search_events(result, with_distance=True)
+        return events
@@ -3,13 +3,46 @@
 Сервис для аналитики взаимодействий пользователей с событиями
 """
 
+import asyncio
 import logging
+import os
 
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 
 logger = logging.getLogger(__name__)
 
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "200"))
+ANALYTICS_FLUSH_INTERVAL_S = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_S", "2"))
+ANALYTICS_QUEUE_MAX = int(os.getenv("ANALYTICS_QUEUE_MAX", "10000"))
+
+# Многострочный upsert: флаги только включаются (OR), group_chat_id пишется при вставке —
+# та же семантика, что у построчных record_* ниже. JOIN с events отбрасывает строки
+# по уже удаленным событиям, чтобы одна такая строка не валила всю пачку по FK.
+_BATCH_UPSERT_SQL = text("""
+    INSERT INTO user_participation (
+        user_id, event_id, group_chat_id, list_view, click_source, click_route, participation_type
+    )
+    SELECT v.user_id, v.event_id, v.group_chat_id, v.list_view, v.click_source, v.click_route, NULL
+    FROM unnest(
+        CAST(:user_ids AS BIGINT[]),
+        CAST(:event_ids AS INTEGER[]),
+        CAST(:group_chat_ids AS BIGINT[]),
+        CAST(:list_views AS BOOLEAN[]),
+        CAST(:click_sources AS BOOLEAN[]),
+        CAST(:click_routes AS BOOLEAN[])
+    ) AS v(user_id, event_id, group_chat_id, list_view, click_source, click_route)
+    JOIN events e ON e.id = v.event_id
+    ON CONFLICT (user_id, event_id)
+    DO UPDATE SET
+        list_view = user_participation.list_view OR EXCLUDED.list_view,
+        click_source = user_participation.click_source OR EXCLUDED.click_source,
+        click_route = user_participation.click_route OR EXCLUDED.click_route,
+        updated_at = NOW()
+""")
+
+_STOP = object()
+
 
 class UserParticipationAnalytics:
     """Сервис для отслеживания взаимодействий пользователей с событиями"""
@@ -155,3 +188,128 @@ class UserParticipationAnalytics:
         except Exception as e:
             logger.error(f"❌ Ошибка записи click_route: {e}")
             return False
+
+
+def _merge_batch(batch: list[tuple]) -> dict:
+    """
+    Схлопывает пачку (user_id, event_id, group_chat_id, kind) в одну строку на пару user_id+event_id:
+    ON CONFLICT не может обновить одну и ту же строку дважды в одном INSERT.
+    """
+    rows: dict[tuple[int, int], list] = {}
+    for user_id, event_id, group_chat_id, kind in batch:
+        row = rows.setdefault((user_id, event_id), [None, False, False, False])
+        if kind == "list_view":
+            row[1] = True
+            if row[0] is None:
+                row[0] = group_chat_id
+        elif kind == "click_source":
+            row[2] = True
+        elif kind == "click_route":
+            row[3] = True
+
+    return {
+        "user_ids": [key[0] for key in rows],
+        "event_ids": [key[1] for key in rows],
+        "group_chat_ids": [row[0] for row in rows.values()],
+        "list_views": [row[1] for row in rows.values()],
+        "click_sources": [row[2] for row in rows.values()],
+        "click_routes": [row[3] for row in rows.values()],
+    }
+
+
+class ParticipationAnalyticsWriter:
+    """
+    Буферизованная запись аналитики (list_view, click_source, click_route).
+
+    record_* только кладут событие в asyncio-очередь и не ходят в БД; фоновая задача
+    пишет пачки одним многострочным upsert — по достижении batch_size или раз в flush_interval_s.
+    close() дописывает все, что осталось в очереди.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        batch_size: int = ANALYTICS_BATCH_SIZE,
+        flush_interval_s: float = ANALYTICS_FLUSH_INTERVAL_S,
+        max_queue: int = ANALYTICS_QUEUE_MAX,
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: asyncio.Task | None = None
+        self.written = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """Запустить фоновую запись (вызывать из работающего event loop)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def record_list_view(self, user_id: int, event_id: int, group_chat_id: int | None = None) -> None:
+        self._enqueue(user_id, event_id, group_chat_id, "list_view")
+
+    def record_click_source(self, user_id: int, event_id: int) -> None:
+        self._enqueue(user_id, event_id, None, "click_source")
+
+    def record_click_route(self, user_id: int, event_id: int) -> None:
+        self._enqueue(user_id, event_id, None, "click_route")
+
+    def _enqueue(self, user_id: int, event_id: int, group_chat_id: int | None, kind: str) -> None:
+        try:
+            self._queue.put_nowait((user_id, event_id, group_chat_id, kind))
+        except asyncio.QueueFull:
+            # Аналитика не должна тормозить ответ пользователю: при переполнении теряем событие
+            self.dropped += 1
+            logger.warning(f"⚠️ Очередь аналитики переполнена, {kind} потерян: user_id={user_id}, event_id={event_id}")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: list[tuple]) -> None:
+        params = _merge_batch(batch)
+        try:
+            await asyncio.to_thread(self._execute, params)
+            self.written += len(batch)
+            logger.debug(f"✅ Записана пачка аналитики: {len(batch)} событий, {len(params['user_ids'])} строк")
+        except Exception as e:
+            logger.error(f"❌ Ошибка записи пачки аналитики ({len(batch)} событий): {e}")
+
+    def _execute(self, params: dict) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(_BATCH_UPSERT_SQL, params)
+
+    async def close(self) -> None:
+        """Дописать очередь и остановить фоновую запись."""
+        if self._task is None or self._task.done():
+            # Фоновая задача не запускалась: пишем остаток напрямую
+            batch = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    batch.append(item)
+            if batch:
+                await self._write(batch)
+            return
+        await self._queue.put(_STOP)
+        await self._task
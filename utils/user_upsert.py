@@ -0,0 +1,161 @@
+"""
+Регистрация пользователей бота пачками.
+
+EnsureUserMiddleware зовет observe() на каждом апдейте. Пользователь, которого недавно видели
+с теми же username/full_name (USER_SEEN_TTL_S), не порождает ни задачи, ни запроса. Новые и
+изменившиеся копятся в словаре по user_id и раз в USER_UPSERT_FLUSH_INTERVAL_S уходят одним
+многострочным INSERT ... ON CONFLICT DO UPDATE. language_code не трогается: это выбор пользователя
+в боте, а не язык клиента Telegram.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+
+from database import User
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+USER_SEEN_TTL_S = float(os.getenv("USER_SEEN_TTL_S", "3600"))
+USER_SEEN_MAX = int(os.getenv("USER_SEEN_MAX", "100000"))
+USER_UPSERT_FLUSH_INTERVAL_S = float(os.getenv("USER_UPSERT_FLUSH_INTERVAL_S", "0.3"))
+USER_UPSERT_BATCH_SIZE = int(os.getenv("USER_UPSERT_BATCH_SIZE", "500"))
+
+# Радиус новых пользователей — как при прежней регистрации по одному
+DEFAULT_RADIUS_KM = 5
+
+USER_UPSERTS = registry.counter(
+    "bot_user_upserts_total", "Регистрация пользователей: пропущено по кэшу / записано / ошибки", ("result",)
+)
+
+_USERS = User.__table__
+_CACHED = USER_UPSERTS.labels("cached")
+
+
+class UserUpsertBatcher:
+    """Кэш недавно виденных пользователей и фоновый пакетный upsert в users."""
+
+    def __init__(
+        self,
+        engine: Engine,
+        seen_ttl_s: float = USER_SEEN_TTL_S,
+        seen_max: int = USER_SEEN_MAX,
+        flush_interval_s: float = USER_UPSERT_FLUSH_INTERVAL_S,
+        batch_size: int = USER_UPSERT_BATCH_SIZE,
+        clock=time.monotonic,
+    ):
+        self.engine = engine
+        self.seen_ttl_s = seen_ttl_s
+        self.seen_max = seen_max
+        self.flush_interval_s = flush_interval_s
+        self.batch_size = batch_size
+        self._clock = clock
+        # user_id -> (username, full_name, expires_at); порядок — по последней записи
+        self._seen: OrderedDict[int, tuple[str | None, str, float]] = OrderedDict()
+        self._pending: dict[int, tuple[str | None, str]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._closing = False
+        self.written = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        """Запустить фоновую запись (вызывать из работающего event loop)."""
+        if self._task is None or self._task.done():
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def observe(self, user_id: int, username: str | None, full_name: str) -> bool:
+        """Отметить пользователя; True — он поставлен в очередь на запись."""
+        cached = self._seen.get(user_id)
+        if cached is not None and cached[0] == username and cached[1] == full_name and cached[2] > self._clock():
+            _CACHED.inc()
+            return False
+        if self._pending.get(user_id) == (username, full_name):
+            return False
+        self._pending[user_id] = (username, full_name)
+        self._wakeup.set()
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Короткая пауза собирает всех, кто написал за интервал, в одну пачку
+                await asyncio.sleep(self.flush_interval_s)
+            self._wakeup.clear()
+            await self.flush()
+            if self._closing:
+                return
+
+    async def flush(self) -> int:
+        """Записать все накопленное; возвращает число отправленных строк."""
+        total = 0
+        while self._pending:
+            batch = dict(list(self._pending.items())[: self.batch_size])
+            for user_id in batch:
+                del self._pending[user_id]
+            try:
+                await asyncio.to_thread(self._execute, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                USER_UPSERTS.labels("failed").inc(len(batch))
+                logger.error(f"❌ Ошибка записи пачки пользователей ({len(batch)}): {e}")
+                # Вернем в очередь то, что не перекрыто более свежими данными, — повторим в следующий раз
+                for user_id, values in batch.items():
+                    self._pending.setdefault(user_id, values)
+                return total
+            self._remember(batch)
+            self.written += len(batch)
+            USER_UPSERTS.labels("written").inc(len(batch))
+            total += len(batch)
+            logger.debug(f"✅ Записана пачка пользователей: {len(batch)}")
+        return total
+
+    def _remember(self, batch: dict[int, tuple[str | None, str]]) -> None:
+        expires_at = self._clock() + self.seen_ttl_s
+        for user_id, (username, full_name) in batch.items():
+            self._seen[user_id] = (username, full_name, expires_at)
+            self._seen.move_to_end(user_id)
+        while len(self._seen) > self.seen_max:
+            self._seen.popitem(last=False)
+
+    def _execute(self, batch: dict[int, tuple[str | None, str]]) -> None:
+        rows = [
+            {"id": user_id, "username": username, "full_name": full_name, "default_radius_km": DEFAULT_RADIUS_KM}
+            for user_id, (username, full_name) in sorted(batch.items())  # порядок id — без взаимных блокировок
+        ]
+        with self.engine.begin() as conn:
+            dialect = postgresql if conn.dialect.name == "postgresql" else sqlite
+            stmt = dialect.insert(_USERS)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[_USERS.c.id],
+                set_={
+                    "username": stmt.excluded.username,
+                    "full_name": stmt.excluded.full_name,
+                    "updated_at_utc": func.now(),
+                },
+                # Не меняем строку (и updated_at_utc), если данные те же
+                where=or_(
+                    _USERS.c.username.is_distinct_from(stmt.excluded.username),
+                    _USERS.c.full_name.is_distinct_from(stmt.excluded.full_name),
+                ),
+            )
+            # executemany: SQLAlchemy склеивает строки в многострочный VALUES (insertmanyvalues)
+            conn.execute(stmt, rows)
+
+    async def close(self) -> None:
+        """Дописать очередь и остановить фоновую запись."""
+        self._closing = True
+        if self._task is not None and not self._task.done():
+            self._wakeup.set()
+            await self._task
+        self._task = None
+        await self.flush()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-Health-страница для мониторинга KudaGo источника
+Health-страница для мониторинга KudaGo источника и /metrics процесса (utils/metrics.py)
 """
 
 import logging
@@ -9,118 +9,74 @@ from datetime import UTC, datetime
 from typing import Any
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import CONTENT_TYPE, RollingWindow, registry
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Глобальные метрики (в реальном проекте лучше использовать Redis/DB)
-# ОГРАНИЧЕНИЕ РАЗМЕРА для защиты от OOM
-_MAX_METRICS_SIZE = 1000  # Максимум записей в каждом списке метрик
-_METRICS_CLEANUP_INTERVAL = 100  # Очистка каждые N записей
-
-_metrics_store: dict[str, Any] = {
-    "requests": [],
-    "errors": [],
-    "events_received": [],
-    "events_after_geo": [],
-    "cache_hits": [],
-    "latencies": [],
-    "last_success_ts": 0,
-    "rps_estimate": 0.0,
-    "_record_count": 0,  # Счетчик для периодической очистки
-}
-
-
-def _cleanup_metrics(now: float):
-    """Очищает старые метрики и ограничивает размер списков"""
-    cutoff = now - 3600  # Старше 1 часа
-
-    # Очищаем устаревшие данные
-    _metrics_store["requests"] = [ts for ts in _metrics_store["requests"] if ts > cutoff]
-    _metrics_store["errors"] = [ts for ts in _metrics_store["errors"] if ts > cutoff]
-    _metrics_store["events_received"] = [(ts, count) for ts, count in _metrics_store["events_received"] if ts > cutoff]
-    _metrics_store["events_after_geo"] = [
-        (ts, count) for ts, count in _metrics_store["events_after_geo"] if ts > cutoff
-    ]
-    _metrics_store["cache_hits"] = [ts for ts in _metrics_store["cache_hits"] if ts > cutoff]
-    _metrics_store["latencies"] = [(ts, lat) for ts, lat in _metrics_store["latencies"] if ts > cutoff]
-
-    # Ограничиваем размер списков (оставляем последние N записей)
-    for key in ["requests", "errors", "cache_hits"]:
-        if len(_metrics_store[key]) > _MAX_METRICS_SIZE:
-            _metrics_store[key] = _metrics_store[key][-_MAX_METRICS_SIZE:]
-
-    for key in ["events_received", "events_after_geo", "latencies"]:
-        if len(_metrics_store[key]) > _MAX_METRICS_SIZE:
-            _metrics_store[key] = _metrics_store[key][-_MAX_METRICS_SIZE:]
+# Окно последних 60 минут по минутным слотам: память постоянна, в отличие от списков меток времени
+_kudago_window = RollingWindow(("requests", "errors", "events", "events_after_geo", "cache_hits", "latency_ms"))
+_last_success_ts = 0.0
+
+KUDAGO_REQUESTS = registry.counter("kudago_requests_total", "Запросы к KudaGo API", ("result",))
+KUDAGO_EVENTS = registry.counter("kudago_events_total", "События KudaGo по этапам", ("stage",))
+KUDAGO_CACHE_HITS = registry.counter("kudago_cache_hits_total", "Ответы KudaGo из кэша")
+KUDAGO_LATENCY = registry.histogram("kudago_request_duration_seconds", "Время запроса к KudaGo API")
 
 
 def record_request(
     success: bool, latency_ms: float, events_count: int = 0, events_after_geo: int = 0, cache_hit: bool = False
 ):
     """Записывает метрику запроса"""
-    now = time.time()
-
-    # Записываем запрос
-    _metrics_store["requests"].append(now)
+    global _last_success_ts
 
+    now = time.time()
     if success:
-        _metrics_store["last_success_ts"] = now
-        _metrics_store["events_received"].append((now, events_count))
-        _metrics_store["events_after_geo"].append((now, events_after_geo))
-    else:
-        _metrics_store["errors"].append(now)
-
+        _last_success_ts = now
+        KUDAGO_EVENTS.labels("received").inc(events_count)
+        KUDAGO_EVENTS.labels("after_geo").inc(events_after_geo)
     if cache_hit:
-        _metrics_store["cache_hits"].append(now)
-
-    _metrics_store["latencies"].append((now, latency_ms))
-
-    # Периодическая очистка (каждые N записей)
-    _metrics_store["_record_count"] = _metrics_store.get("_record_count", 0) + 1
-    if _metrics_store["_record_count"] % _METRICS_CLEANUP_INTERVAL == 0:
-        _cleanup_metrics(now)
-    elif _metrics_store["_record_count"] == 1:
-        # Первая запись - сразу очищаем
-        _cleanup_metrics(now)
+        KUDAGO_CACHE_HITS.inc()
+    KUDAGO_REQUESTS.labels("ok" if success else "error").inc()
+    KUDAGO_LATENCY.observe(latency_ms / 1000)
 
-    # Обновляем RPS
-    recent_requests = [ts for ts in _metrics_store["requests"] if ts > now - 60]
-    _metrics_store["rps_estimate"] = len(recent_requests) / 60.0
+    _kudago_window.add(
+        requests=1,
+        errors=0 if success else 1,
+        events=events_count if success else 0,
+        events_after_geo=events_after_geo if success else 0,
+        cache_hits=1 if cache_hit else 0,
+        latency_ms=latency_ms,
+    )
 
 
 def window_stats(minutes: int = 5) -> dict[str, Any]:
     """Возвращает статистику за указанное окно времени"""
-    now = time.time()
-    cutoff = now - (minutes * 60)
-
-    # Запросы и ошибки за окно
-    window_requests = [ts for ts in _metrics_store["requests"] if ts > cutoff]
-    window_errors = [ts for ts in _metrics_store["errors"] if ts > cutoff]
-
-    # События за окно
-    window_events = [count for ts, count in _metrics_store["events_received"] if ts > cutoff]
-    window_events_after_geo = [count for ts, count in _metrics_store["events_after_geo"] if ts > cutoff]
-
-    # Кэш-хиты за окно
-    window_cache_hits = [ts for ts in _metrics_store["cache_hits"] if ts > cutoff]
-
-    # Латентность за окно
-    window_latencies = [lat for ts, lat in _metrics_store["latencies"] if ts > cutoff]
+    totals = _kudago_window.totals(minutes * 60)
+    last_minute = _kudago_window.totals(60)
+    requests = int(totals["requests"])
 
     return {
-        "errors": len(window_errors),
-        "requests": len(window_requests),
-        "avg_ms": sum(window_latencies) / len(window_latencies) if window_latencies else 0,
-        "cache_hits": len(window_cache_hits),
-        "events": sum(window_events),
-        "events_after_geo": sum(window_events_after_geo),
-        "last_success_ts": _metrics_store["last_success_ts"],
-        "rps": _metrics_store["rps_estimate"],
+        "errors": int(totals["errors"]),
+        "requests": requests,
+        "avg_ms": totals["latency_ms"] / requests if requests else 0,
+        "cache_hits": int(totals["cache_hits"]),
+        "events": int(totals["events"]),
+        "events_after_geo": int(totals["events_after_geo"]),
+        "last_success_ts": _last_success_ts,
+        "rps": last_minute["requests"] / 60.0,
     }
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
+
+
 @router.get("/health/kudago")
 def health_kudago():
     """Health-эндпоинт для KudaGo источника"""
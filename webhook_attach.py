@@ -191,9 +191,12 @@ def attach_bot_to_app(app: FastAPI) -> None:
                 # Запускаем планировщик в отдельном потоке, чтобы не блокировать основной поток
                 import threading
 
-                from modern_scheduler import start_modern_scheduler
+                from modern_scheduler import scheduler_in_bot_enabled, start_modern_scheduler
 
                 def start_scheduler_thread():
+                    if not scheduler_in_bot_enabled():
+                        logger.info("⏭️ SCHEDULER_IN_BOT=0 — задачи планировщика выполняет workers/scheduler.py")
+                        return
                     try:
                         start_modern_scheduler()
                         logger.info("✅ Планировщик запущен в отдельном потоке")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Scheduler Worker: задачи ModernEventScheduler (инжест, backfill переводов, очистка,
+напоминания) вне процесса бота.
+
+Каждое срабатывание выполняет одна реплика — та, что взяла аренду в scheduler_jobs
+(utils/job_leases.py), поэтому воркеров и ботов можно запускать сколько угодно. Чтобы бот
+не выполнял задачи сам, выставьте ему SCHEDULER_IN_BOT=0.
+
+Запуск: python workers/scheduler.py
+Env: DATABASE_URL, TELEGRAM_TOKEN (напоминания), PORT (health/metrics)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    stream=sys.stdout,
+)
+logger = logging.getLogger("scheduler_worker")
+
+
+def _start_health_server() -> None:
+    """Railway healthcheck (/health) и метрики задач (/metrics)."""
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    from utils.metrics import registry
+
+    port = int(os.getenv("PORT", "8080"))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path in ("/health", "/"):
+                body, content_type = b"ok", "text/plain"
+            elif self.path == "/metrics":
+                body, content_type = registry.render().encode(), "text/plain; charset=utf-8"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    def serve():
+        server = HTTPServer(("0.0.0.0", port), Handler)
+        logger.info("Health server listening on 0.0.0.0:%s", port)
+        server.serve_forever()
+
+    threading.Thread(target=serve, daemon=True).start()
+
+
+def main() -> None:
+    _start_health_server()
+
+    from modern_scheduler import get_modern_scheduler
+
+    stopping = threading.Event()
+
+    def handle_signal(sig, frame):
+        logger.info("Received signal %s, stopping scheduler...", sig)
+        stopping.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    scheduler = get_modern_scheduler()
+    logger.info("Starting scheduler worker...")
+    scheduler.start()
+    stopping.wait()
+    scheduler.stop()
+
+
+if __name__ == "__main__":
+    main()